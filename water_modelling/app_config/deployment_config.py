@@ -22,4 +22,69 @@ CONFIG_FILE_PATH = os.path.join(CONFIG_FOLDER_PATH, CONFIG_FILE_NAME)
 ALLOWED_UPLOAD_TYPES = ["ZIP"]
 WORKSPACE_DIR = os.path.join(PROJECT_ROOT, 'workspace')
 
+# Hydrus outputs are read concurrently in the passing stage - reading is I/O bound (NFS on Kubernetes),
+# so there can be more workers than CPUs
+HYDRUS_OUTPUT_READ_WORKERS = 16
+
+# Pipelined simulations pass Hydrus outputs to Modflow as soon as Hydrus models finish (instead of after all of them),
+# so the passing stage overlaps with the slowest Hydrus simulations
+PIPELINED_SIMULATION = False
+
+# Results of successful simulations are cached in the workspace (by hash of all inputs), the least recently used
+# ones are removed when the cache exceeds this size - 0 disables the cache
+SIMULATION_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+
+# Simulations are queued and run by a bounded pool of workers. A simulation is admitted only while its user runs
+# fewer than SIMULATION_MAX_PER_USER simulations and its slots (one per Hydrus model, at most SIMULATION_SLOTS)
+# fit into the free part of SIMULATION_SLOTS. The scheduler keeps states of the latest SIMULATION_MAX_FINISHED
+# finished simulations
+SIMULATION_WORKERS = 2
+SIMULATION_QUEUE_SIZE = 50
+SIMULATION_MAX_PER_USER = 1
+SIMULATION_SLOTS = os.cpu_count() or 1
+SIMULATION_MAX_FINISHED = 1000
+
+# Progress events of simulations are kept in memory for clients of the event stream - the latest
+# SIMULATION_EVENTS_HISTORY events of the latest SIMULATION_EVENTS_MAX_SIMULATIONS simulations. The stream sends
+# a keep-alive comment after SIMULATION_EVENTS_KEEPALIVE seconds without events
+SIMULATION_EVENTS_HISTORY = 1000
+SIMULATION_EVENTS_MAX_SIMULATIONS = 200
+SIMULATION_EVENTS_KEEPALIVE = 15
+
+# Maximal amount of scenarios of one ensemble passed and simulated by Modflow at once
+ENSEMBLE_SCENARIO_WORKERS = 4
+
+# Maximal amount of Hydrus processes run at once by the desktop deployer (the longest models start first) -
+# None means the amount of physical CPU cores
+DESKTOP_HYDRUS_PROCESSES = None
+
+# Every stage (and Hydrus model) of a successful simulation records a checkpoint in the project directory -
+# a resumed simulation starts from the first stage whose checkpoint is invalid and reruns only failed Hydrus models
+SIMULATION_CHECKPOINTS = True
+
+# Docker deployer keeps this many long-lived worker containers per engine and runs models in them with `docker exec`
+# (instead of a container per model) - a worker is replaced after DOCKER_WORKER_MAX_RUNS runs or after a failed run.
+# None means a container per model
+DOCKER_WORKER_POOL_SIZE = None
+DOCKER_WORKER_MAX_RUNS = 50
+
+# CPU cores and memory (in bytes) of a single Hydrus and Modflow container run by the Docker deployer - containers are
+# limited to them and start only while their sum fits the host budget (None means all CPUs and memory of the host).
+# Resources of DOCKER_MODFLOW_RESERVED_RUNS Modflow containers are reserved, so Modflow isn't starved by Hydrus
+DOCKER_HYDRUS_CPUS = 1
+DOCKER_HYDRUS_MEMORY = 1024 * 1024 * 1024
+DOCKER_MODFLOW_CPUS = 2
+DOCKER_MODFLOW_MEMORY = 4 * 1024 * 1024 * 1024
+DOCKER_HOST_CPUS = None
+DOCKER_HOST_MEMORY = None
+DOCKER_MODFLOW_RESERVED_RUNS = 1
+
+# Time limits (in seconds) of single Hydrus and Modflow models and of whole simulation stages - a model or stage
+# which exceeds its limit is stopped (process killed, container removed, job deleted) and the simulation fails.
+# None means no limit
+HYDRUS_MODEL_TIMEOUT = None
+HYDRUS_STAGE_TIMEOUT = None
+MODFLOW_MODEL_TIMEOUT = None
+MODFLOW_STAGE_TIMEOUT = None
+
 DEPLOYER = desktop_deployer.create()
@@ -0,0 +1,280 @@
+"""
+Benchmark of the passing stage on synthetic Modflow models and T_Level.out files - Shape loading
+(hydrus_output_loader), get_shapes_from_rch, HydrusModflowPassing.update_rch and RCH writing. update_rch is measured
+on the uploaded model and after a previous passing when Hydrus output of one shape changed (without and with
+the passing cache).
+Every benchmark runs in a separate process, results (wall time, peak RSS, throughput in cells * stress periods / s)
+are printed and saved as JSON. Run from water_modelling directory:
+    python -m benchmarks.passing_benchmark [--grids 100x100 500x500] [--periods 12] [--shapes 10]
+                                           [--output results.json] [--compare previous_results.json]
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Optional, Tuple
+
+import flopy
+import numpy as np
+
+from benchmarks.t_level_reader_benchmark import BUNDLED_T_LEVEL, create_synthetic_t_level
+from datapassing import hydrus_output_loader, passing_cache, recharge_engine
+from datapassing.hydrus_modflow_passing import HydrusModflowPassing
+from datapassing.shape_data import Shape
+from modflow import modflow_utils, rch_writer
+
+MODEL_NAME = "synthetic"
+NAM_FILE = MODEL_NAME + ".nam"
+BENCHMARKS = ["shape_loading", "get_shapes_from_rch", "update_rch", "update_rch_rerun", "update_rch_incremental",
+              "write_rch"]
+
+
+@dataclass
+class BenchmarkCase:
+    rows: int                               # rows of the model grid
+    cols: int                               # columns of the model grid
+    nper: int                               # amount of stress periods
+    perlen: int                             # length of every stress period (in days)
+    shapes: int                             # amount of shapes (recharge zones with Hydrus models)
+    t_level_files: int                      # amount of distinct T_Level.out files (shared by shapes)
+
+    def get_size(self) -> int:
+        """
+        @return: Amount of recharge values of the model - cells * stress periods
+        """
+        return self.rows * self.cols * self.nper
+
+
+@dataclass
+class BenchmarkResult:
+    benchmark: str
+    case: BenchmarkCase
+    wall_times: List[float]                 # wall time of every repeat (in seconds)
+    wall_time: float                        # best wall time (in seconds)
+    peak_rss_mb: Optional[float]            # peak resident memory of the benchmark process, None if unknown
+    baseline_rss_mb: Optional[float]        # peak resident memory before the benchmark (imports, input data)
+    throughput: float                       # cells * stress periods per second (of the best repeat)
+
+
+def create_zones(case: BenchmarkCase) -> np.ndarray:
+    """
+    @return: 2D array (rows, cols) of shape indices - the grid is split into rectangular tiles
+    """
+    tile_rows = max(1, int(np.sqrt(case.shapes)))
+    tile_cols = int(np.ceil(case.shapes / tile_rows))
+    row_tiles = np.arange(case.rows) * tile_rows // case.rows
+    col_tiles = np.arange(case.cols) * tile_cols // case.cols
+    return (row_tiles[:, None] * tile_cols + col_tiles[None, :]) % case.shapes
+
+
+def create_model(case: BenchmarkCase, model_dir: str) -> None:
+    """
+    Create Modflow model with DIS and RCH packages - every shape is a recharge zone with its own recharge value.
+    """
+    model = flopy.modflow.Modflow(MODEL_NAME, model_ws=model_dir)
+    flopy.modflow.ModflowDis(model, nlay=1, nrow=case.rows, ncol=case.cols, nper=case.nper,
+                             perlen=[float(case.perlen)] * case.nper, steady=[False] * case.nper)
+    model.write_input()
+
+    zone_recharge = (1e-4 * (create_zones(case) + 1)).astype(np.float32)
+    rch_writer.write_rch(os.path.join(model_dir, MODEL_NAME + ".rch"), nrchop=3, ipakcb=0,
+                         recharge=[zone_recharge] * case.nper)
+    with open(os.path.join(model_dir, NAM_FILE), 'a') as nam_file:
+        nam_file.write(f"RCH             24 {MODEL_NAME}.rch\n")
+
+
+def create_t_level_files(case: BenchmarkCase, hydrus_dir: str) -> List[str]:
+    """
+    Create T_Level.out of every shape - shapes share case.t_level_files distinct files (hard links if possible).
+    @return: Paths to T_Level.out files of consecutive shapes
+    """
+    rows = recharge_engine.required_values_count([case.perlen] * case.nper)
+    distinct_paths = []
+    for idx in range(min(case.t_level_files, case.shapes)):
+        distinct_paths.append(os.path.join(hydrus_dir, f"T_Level_{idx}.out"))
+        create_synthetic_t_level(BUNDLED_T_LEVEL, distinct_paths[-1], rows, first_row=37 * idx)
+
+    paths = []
+    for idx in range(case.shapes):
+        model_dir = os.path.join(hydrus_dir, f"model_{idx}")
+        os.makedirs(model_dir)
+        paths.append(os.path.join(model_dir, "T_Level.out"))
+        source_path = distinct_paths[idx % len(distinct_paths)]
+        try:
+            os.link(source_path, paths[-1])
+        except OSError:
+            shutil.copy(source_path, paths[-1])
+    return paths
+
+
+def run_benchmark(benchmark: str, case: BenchmarkCase, workspace: str, t_level_paths: List[str],
+                  repeats: int) -> Tuple[List[float], Optional[float], Optional[float]]:
+    """
+    Run the benchmark - called in a separate process, so its peak RSS isn't affected by other benchmarks.
+    @return: Tuple (wall times of repeats, peak RSS, baseline RSS)
+    """
+    model_dir = os.path.join(workspace, "model")
+    required_values = recharge_engine.required_values_count([case.perlen] * case.nper)
+    zones = create_zones(case)
+    masks = [(zones == idx).astype(np.float64) for idx in range(case.shapes)]
+    outputs = hydrus_output_loader.load_sum_v_bot(t_level_paths, required_values, workers=16)
+    recharge = None
+    if benchmark == "write_rch":
+        recharge = np.random.default_rng(0).random((case.nper, case.rows, case.cols), dtype=np.float32)
+    baseline_rss = get_peak_rss_mb()
+
+    wall_times = []
+    for repeat in range(repeats):
+        repeat_dir = os.path.join(workspace, f"repeat_{repeat}")
+        shutil.copytree(model_dir, repeat_dir)
+        modflow_utils.invalidate_model_cache()
+
+        if benchmark == "shape_loading":
+            start = time.perf_counter()
+            loaded = hydrus_output_loader.load_sum_v_bot(t_level_paths, required_values, workers=16)
+            [Shape(mask, path, loaded.get_values(idx)) for idx, (mask, path) in enumerate(zip(masks, t_level_paths))]
+            wall_times.append(time.perf_counter() - start)
+
+        elif benchmark == "get_shapes_from_rch":
+            start = time.perf_counter()
+            modflow_utils.get_shapes_from_rch(repeat_dir, NAM_FILE, (case.rows, case.cols))
+            wall_times.append(time.perf_counter() - start)
+
+        elif benchmark in ["update_rch", "update_rch_rerun", "update_rch_incremental"]:
+            shapes = [Shape(mask, path, outputs.get_values(idx))
+                      for idx, (mask, path) in enumerate(zip(masks, t_level_paths))]
+            shape_keys = None
+            if benchmark != "update_rch":
+                # previous passing (cached if incremental), then Hydrus output of one shape changes
+                if benchmark == "update_rch_incremental":
+                    shape_keys = passing_cache.get_shape_keys(t_level_paths, masks, 0, workers=16)
+                HydrusModflowPassing(repeat_dir, NAM_FILE, shapes, shape_keys).update_rch()
+                modflow_utils.invalidate_model_cache()
+                shapes[0] = Shape(masks[0], t_level_paths[0], outputs.get_values(0) * 2)
+                if shape_keys is not None:
+                    shape_keys[0] = passing_cache.ShapeKey("changed", shape_keys[0].mask_fingerprint, 0)
+
+            start = time.perf_counter()
+            HydrusModflowPassing(repeat_dir, NAM_FILE, shapes, shape_keys).update_rch()
+            wall_times.append(time.perf_counter() - start)
+
+        elif benchmark == "write_rch":
+            start = time.perf_counter()
+            rch_writer.write_rch(os.path.join(repeat_dir, MODEL_NAME + ".rch"), nrchop=3, ipakcb=0,
+                                 recharge=recharge)
+            wall_times.append(time.perf_counter() - start)
+
+        shutil.rmtree(repeat_dir)
+    return wall_times, get_peak_rss_mb(), baseline_rss
+
+
+def get_peak_rss_mb() -> Optional[float]:
+    """
+    @return: Peak resident memory of the current process (in MB), None if it's unknown (Windows)
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss / 1024 ** 2 if sys.platform == "darwin" else max_rss / 1024  # bytes on macOS, KB on Linux
+
+
+def run_case(case: BenchmarkCase, benchmarks: List[str], repeats: int) -> List[BenchmarkResult]:
+    results = []
+    with tempfile.TemporaryDirectory() as workspace:
+        create_model(case, os.path.join(workspace, "model"))
+        os.makedirs(os.path.join(workspace, "hydrus"))
+        t_level_paths = create_t_level_files(case, os.path.join(workspace, "hydrus"))
+
+        context = multiprocessing.get_context("spawn")
+        for benchmark in benchmarks:
+            with context.Pool(1) as pool:
+                wall_times, peak_rss, baseline_rss = pool.apply(run_benchmark,
+                                                                (benchmark, case, workspace, t_level_paths, repeats))
+            results.append(BenchmarkResult(benchmark, case, wall_times, min(wall_times), peak_rss, baseline_rss,
+                                           case.get_size() / min(wall_times)))
+            print_result(results[-1])
+    return results
+
+
+def print_result(result: BenchmarkResult) -> None:
+    case = result.case
+    peak_rss = f"{result.peak_rss_mb:9.1f} MB" if result.peak_rss_mb is not None else f"{'-':>12}"
+    print(f"{result.benchmark:<24}{case.rows:>6}x{case.cols:<6}{case.nper:>6} periods{case.shapes:>5} shapes"
+          f"{result.wall_time * 1000:12.1f} ms{peak_rss}{result.throughput:14.3e} cells*periods/s")
+
+
+def compare_results(results: List[dict], previous_results: List[dict]) -> None:
+    """
+    Print speedup of every benchmark against previous results (of the same benchmark and case).
+    """
+    previous = {(result["benchmark"], json.dumps(result["case"], sort_keys=True)): result
+                for result in previous_results}
+    print("\nComparison with previous results (speedup > 1 - faster now):")
+    for result in results:
+        previous_result = previous.get((result["benchmark"], json.dumps(result["case"], sort_keys=True)))
+        if previous_result is None:
+            continue
+        case = result["case"]
+        print(f"{result['benchmark']:<24}{case['rows']:>6}x{case['cols']:<6}{case['nper']:>6} periods"
+              f"{case['shapes']:>5} shapes    speedup {previous_result['wall_time'] / result['wall_time']:6.2f}x")
+
+
+def get_environment() -> Dict[str, str]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+    return {"commit": commit, "python": platform.python_version(), "numpy": np.__version__,
+            "flopy": flopy.__version__, "platform": platform.platform(), "cpus": str(os.cpu_count())}
+
+
+def parse_grid(grid: str) -> Tuple[int, int]:
+    rows, cols = grid.lower().split("x")
+    return int(rows), int(cols)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the passing stage on synthetic models")
+    parser.add_argument("--grids", nargs="*", default=["100x100", "500x500"], help="grid sizes (ROWSxCOLS)")
+    parser.add_argument("--periods", type=int, nargs="*", default=[12], help="amounts of stress periods")
+    parser.add_argument("--perlen", type=int, default=30, help="length of stress periods (in days)")
+    parser.add_argument("--shapes", type=int, nargs="*", default=[10], help="amounts of shapes")
+    parser.add_argument("--t-level-files", type=int, default=16,
+                        help="amount of distinct T_Level.out files (shared by shapes)")
+    parser.add_argument("--benchmarks", nargs="*", default=BENCHMARKS, choices=BENCHMARKS)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output", help="path to JSON file with results")
+    parser.add_argument("--compare", help="path to JSON file with previous results")
+    args = parser.parse_args()
+
+    results = []
+    for grid, nper, shapes in itertools.product(args.grids, args.periods, args.shapes):
+        rows, cols = parse_grid(grid)
+        case = BenchmarkCase(rows, cols, nper, args.perlen, shapes, args.t_level_files)
+        results.extend(asdict(result) for result in run_case(case, args.benchmarks, args.repeats))
+
+    report = {"environment": get_environment(), "results": results}
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare) as previous_file:
+            compare_results(results, json.load(previous_file)["results"])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Benchmark of T_Level.out readers - datapassing.t_level_reader (buffered and memory-mapped) against phydrus
+(if installed). Run from water_modelling directory:
+    python -m benchmarks.t_level_reader_benchmark [--rows 100000 200000] [--repeats 5]
+"""
+import argparse
+import os
+import tempfile
+import timeit
+from typing import Callable, List
+
+import numpy as np
+
+from datapassing import t_level_reader
+
+BUNDLED_T_LEVEL = os.path.join(os.path.dirname(__file__), "..", "..", "hydrus_docker", "Chojnice_vg_sand",
+                               "T_Level.out")
+
+
+def create_synthetic_t_level(source_path: str, target_path: str, rows: int, first_row: int = 0) -> None:
+    """
+    Create T_Level.out with given amount of daily rows - header and data rows are copied from the source file
+    (repeated if needed, starting from its first_row data row), time column is renumbered.
+    """
+    with open(source_path) as source:
+        lines = source.readlines()
+    header_end = next(i for i, line in enumerate(lines) if line.split()[:1] == [t_level_reader.TIME_COLUMN]) + 3
+    data_lines = [line for line in lines[header_end:] if line.strip() and line.strip() != "end"]
+
+    with open(target_path, 'w') as target:
+        target.writelines(lines[:header_end])
+        for row in range(rows):
+            tokens = data_lines[(first_row + row) % len(data_lines)].split(maxsplit=1)
+            target.write(f"{row + 1:13.4f} {tokens[1]}")
+        target.write("end\n")
+
+
+def read_with_phydrus(path: str) -> np.ndarray:
+    import phydrus
+    return phydrus.read.read_tlevel(path=path)[t_level_reader.SUM_V_BOT_COLUMN].to_numpy()
+
+
+def measure(reader: Callable[[str], np.ndarray], path: str, repeats: int) -> str:
+    try:
+        return f"{min(timeit.repeat(lambda: reader(path), number=1, repeat=repeats)) * 1000:10.1f} ms"
+    except Exception as err:
+        return f"{'failed':>13} ({type(err).__name__}: {err})"
+
+
+def run_benchmark(paths: List[str], repeats: int) -> None:
+    readers = {
+        "t_level_reader": t_level_reader.read_sum_v_bot,
+        "t_level_reader (mmap)": lambda path: t_level_reader.read_sum_v_bot(path, use_mmap=True),
+        "phydrus": read_with_phydrus
+    }
+    for path in paths:
+        print(f"{os.path.basename(path)} - {os.path.getsize(path) / 1024 ** 2:.1f} MB")
+        for name, reader in readers.items():
+            print(f"    {name:<24}{measure(reader, path, repeats)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark T_Level.out readers")
+    parser.add_argument("--rows", type=int, nargs="*", default=[36500, 365000],
+                        help="amounts of rows of synthetic T_Level.out files")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workspace:
+        paths = [BUNDLED_T_LEVEL]
+        for rows in args.rows:
+            paths.append(os.path.join(workspace, f"T_Level_{rows}.out"))
+            create_synthetic_t_level(BUNDLED_T_LEVEL, paths[-1], rows)
+        run_benchmark(paths, args.repeats)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,33 +1,151 @@
-from typing import List, Optional
+from typing import List, Optional, Sequence
 
 import flopy.utils.util_array as flopy_array
 import numpy as np
 import flopy
 
+from datapassing import passing_cache, recharge_engine
+from datapassing.passing_cache import ShapeKey
 from datapassing.shape_data import Shape
+from modflow import modflow_utils, rch_writer
 
 
 class HydrusModflowPassing:
 
-    def __init__(self, modflow_workspace_path: str, nam_file: str, shapes: List[Shape]):
-
+    def __init__(self, modflow_workspace_path: str, nam_file: str, shapes: List[Shape],
+                 shape_keys: Optional[List[Optional[ShapeKey]]] = None):
+        """
+        @param modflow_workspace_path: Path to Modflow project main directory
+        @param nam_file: Name of .nam file inside the Modflow project
+        @param shapes: Shapes with Hydrus results
+        @param shape_keys: Keys of consecutive shapes (see passing_cache.get_shape_keys()) - if given, averages of
+            the shapes are cached and the next passing recalculates only shapes whose Hydrus output changed
+        """
         self.modflow_workspace_path = modflow_workspace_path
         self.nam_file = nam_file
         self.shapes = shapes
+        self.shape_keys = shape_keys
+        self._cache = passing_cache.read(modflow_workspace_path) if shape_keys is not None else None
+
+    def get_uncached_shapes(self, perlen: Sequence[float], spin_up=0) -> List[int]:
+        """
+        @param perlen: Lengths of Modflow stress periods
+        @param spin_up: hydrus spin up period (in days)
+        @return: Indices of shapes without cached average recharge - only their Hydrus outputs are used by update_rch()
+        """
+        return [idx for (idx, averages) in enumerate(self._get_cached_averages(perlen, spin_up)) if averages is None]
 
     def update_rch(self, spin_up=0) -> Optional[flopy_array.Transient2d]:
         """
         Update recharge based on shapes containing results of Hydrus simulations.
+        If RCH file was written by the previous passing with cached averages, only cells covered by shapes whose
+        averages changed are recalculated and only stress periods which changed are written again.
+        @param spin_up: hydrus spin up period (in days)
+        @return: Numpy array representing recharge (in case if it's needed)
+        """
+        if len(self.shapes) < 1:
+            return None
+
+        # load MODFLOW model - basic info and RCH package (taken out of the cache, since its files are rewritten)
+        modflow_model = modflow_utils.load_model(self.modflow_workspace_path, self.nam_file, load_only=["rch"],
+                                                 exclusive=True)
+        perlen = modflow_model.modeltime.perlen
+        rch_package = modflow_model.get_package("rch")  # get the RCH package
+
+        # average sum(vBot) of every shape in every stress period
+        averages = self._get_averages(perlen, spin_up)
+
+        # whole recharge (stress periods, rows, cols) at once - layer dimension is dropped
+        base_recharge = rch_package.rech.array[:, 0]
+        masks = [shape.mask_array for shape in self.shapes]
+        changed_shapes = self._get_changed_shapes(perlen, averages, rch_package.fn_path)
+        if changed_shapes is None:
+            new_recharge = recharge_engine.assemble_recharge(base_recharge, masks, averages)
+            changed_periods = None
+        else:
+            new_recharge = recharge_engine.update_recharge(base_recharge, masks, self._cache.averages, averages,
+                                                           changed_shapes)
+            changed_periods = np.any(new_recharge != base_recharge, axis=(1, 2))
+
+        irch = rch_package.irch.array[:, 0] + 1 if rch_package.nrchop == 2 else None  # flopy keeps 0-based layers
+
+        # model files are modified below - models cached meanwhile are outdated
+        modflow_utils.invalidate_model_cache(self.modflow_workspace_path, self.nam_file)
+
+        # save new RCH (same properties, different recharge)
+        if changed_periods is None or np.any(changed_periods):
+            rch_writer.write_rch(rch_package.fn_path, nrchop=rch_package.nrchop, ipakcb=rch_package.ipakcb or 0,
+                                 recharge=new_recharge, irch=irch, changed_periods=changed_periods)
+        self._save_cache(perlen, averages, rch_package.fn_path)
+
+        return flopy_array.Transient2d(modflow_model, base_recharge.shape[1:], np.float32,
+                                       {idx: new_recharge[idx] for idx in range(modflow_model.nper)}, "rech_")
+
+    def _get_cached_averages(self, perlen: Sequence[float], spin_up: int) -> List[Optional[np.ndarray]]:
+        """
+        @return: Cached average recharge of every shape, None for shapes which aren't cached
+        """
+        if self._cache is None:
+            return [None] * len(self.shapes)
+        return [self._cache.get_averages(shape_key, perlen)
+                if shape_key is not None and shape_key.spin_up == spin_up else None
+                for shape_key in self.shape_keys]
+
+    def _get_averages(self, perlen: Sequence[float], spin_up: int) -> np.ndarray:
+        """
+        @return: 2D array (shapes, stress periods) of average recharge - cached or calculated from Hydrus outputs
+        """
+        averages = np.empty((len(self.shapes), len(perlen)))
+        uncached_shapes = []
+        for idx, cached_averages in enumerate(self._get_cached_averages(perlen, spin_up)):
+            if cached_averages is None:
+                uncached_shapes.append(idx)
+            else:
+                averages[idx] = cached_averages
+
+        if uncached_shapes:
+            averages[uncached_shapes] = recharge_engine.stress_period_averages(
+                [self.shapes[idx].recharge for idx in uncached_shapes], perlen, spin_up)
+        return averages
+
+    def _get_changed_shapes(self, perlen: Sequence[float], averages: np.ndarray, rch_path: str) -> Optional[List[int]]:
+        """
+        @return: Indices of shapes whose averages differ from the ones used to write current RCH file,
+            None if RCH file wasn't written with cached averages of the same shapes (it has to be assembled again)
+        """
+        cache = self._cache
+        if cache is None or len(cache.shape_keys) != len(self.shapes) or list(perlen) != cache.perlen:
+            return None
+        for shape_key, cached_key in zip(self.shape_keys, cache.shape_keys):
+            if shape_key is None or shape_key.mask_fingerprint != cached_key.mask_fingerprint:
+                return None
+        # NaN spreads over the whole grid (see assemble_recharge) - it can't be subtracted
+        if not np.all(np.isfinite(averages)) or not np.all(np.isfinite(cache.averages)):
+            return None
+        if passing_cache.hash_file(rch_path) != cache.rch_hash:
+            return None
+        return [idx for idx in range(len(self.shapes)) if not np.array_equal(averages[idx], cache.averages[idx])]
+
+    def _save_cache(self, perlen: Sequence[float], averages: np.ndarray, rch_path: str) -> None:
+        if self.shape_keys is None or any(shape_key is None for shape_key in self.shape_keys):
+            return
+        self._cache = passing_cache.PassingCache(self.shape_keys, averages, [float(duration) for duration in perlen],
+                                                 passing_cache.hash_file(rch_path))
+        passing_cache.save(self.modflow_workspace_path, self._cache)
+
+    def update_rch_reference(self, spin_up=0) -> Optional[flopy_array.Transient2d]:
+        """
+        Reference implementation of update_rch() - iterates over every stress period and every shape.
+        Kept to verify results of the vectorized implementation, not used in simulations.
         @param spin_up: hydrus spin up period (in days)
         @return: Numpy array representing recharge (in case if it's needed)
         """
         if len(self.shapes) < 1:
             return None
 
-        # load MODFLOW model - basic info and RCH package
-        modflow_model = flopy.modflow.Modflow.load(self.nam_file, model_ws=self.modflow_workspace_path,
-                                                   load_only=["rch"],
-                                                   forgive=True)
+        # load MODFLOW model - basic info and RCH package (taken out of the cache, since it's modified below)
+        modflow_model = modflow_utils.load_model(self.modflow_workspace_path, self.nam_file, load_only=["rch"],
+                                                 exclusive=True)
 
         # zero all recharge values present in hydrus masks (in all stress periods)
         for idx in range(modflow_model.nper):  # i in stress periods
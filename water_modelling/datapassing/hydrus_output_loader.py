@@ -0,0 +1,55 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from datapassing import t_level_reader
+
+
+@dataclass
+class HydrusOutputs:
+    sum_v_bot: np.ndarray                   # 2D array (shapes, values) - sum(vBot) of every shape, padded with NaN
+    lengths: np.ndarray                     # amount of values read for every shape
+    timings: Dict[str, float] = field(default_factory=dict)    # path -> read and parse time (in seconds)
+    errors: Dict[str, str] = field(default_factory=dict)       # path -> description of the error
+
+    def get_values(self, shape_idx: int) -> np.ndarray:
+        """
+        @param shape_idx: Index of the shape (same as index of its T_Level.out path)
+        @return: sum(vBot) values read for the shape (view of sum_v_bot array)
+        """
+        return self.sum_v_bot[shape_idx, :self.lengths[shape_idx]]
+
+
+def load_sum_v_bot(t_level_paths: List[str], max_values: int, workers: int) -> HydrusOutputs:
+    """
+    Read sum(vBot) of many Hydrus models concurrently - every file is read by a worker thread straight into
+    its row of a preallocated array.
+    @param t_level_paths: Paths to T_Level.out files
+    @param max_values: Amount of values to read from every file (at most)
+    @param workers: Maximal amount of files read at once
+    @return: HydrusOutputs - values, read times and errors (files which couldn't be read have no values)
+    """
+    outputs = HydrusOutputs(sum_v_bot=np.full((len(t_level_paths), max_values), np.nan),
+                            lengths=np.zeros(len(t_level_paths), dtype=np.int64))
+
+    def load(shape_idx: int) -> Optional[str]:
+        path = t_level_paths[shape_idx]
+        start = time.perf_counter()
+        try:
+            values = t_level_reader.read_sum_v_bot(path, max_rows=max_values)
+        except (OSError, ValueError) as err:
+            return str(err)
+        outputs.sum_v_bot[shape_idx, :len(values)] = values
+        outputs.lengths[shape_idx] = len(values)
+        outputs.timings[path] = time.perf_counter() - start
+        return None
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(t_level_paths)))) as executor:
+        for path, error in zip(t_level_paths, executor.map(load, range(len(t_level_paths)))):
+            if error is not None:
+                outputs.errors[path] = error
+
+    return outputs
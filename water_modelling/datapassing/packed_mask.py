@@ -0,0 +1,96 @@
+import json
+import struct
+import zlib
+from dataclasses import dataclass
+from typing import Tuple
+
+import numpy as np
+
+# Mask file format: magic, length of the header, JSON header (shape, dtype, encoding, checksum) padded
+# to HEADER_ALIGNMENT bytes and the payload. Binary masks (the usual case) are bit-packed - 1 bit per cell instead
+# of 64 bits of float64 mask, other masks keep raw values.
+
+MAGIC = b"HMSEMASK"
+VERSION = 1
+BITS_ENCODING = "bits"
+RAW_ENCODING = "raw"
+HEADER_ALIGNMENT = 16
+_HEADER_LENGTH_FORMAT = "<I"
+
+
+@dataclass
+class PackedMask:
+    path: str                               # path to the mask file
+    shape: Tuple[int, ...]                  # shape of the mask
+    dtype: np.dtype                         # dtype of the mask
+    encoding: str                           # BITS_ENCODING or RAW_ENCODING
+    checksum: int                           # CRC32 of the payload
+    offset: int                             # offset of the payload in the file
+    payload_size: int                       # size of the payload (in bytes)
+
+    def unpack(self) -> np.ndarray:
+        """
+        Read the mask - the payload is memory-mapped, so only packed bytes are read from the file.
+        @return: Mask array with its original shape and dtype
+        """
+        if self.payload_size == 0:
+            return np.zeros(self.shape, dtype=self.dtype)
+
+        payload = np.memmap(self.path, dtype=np.uint8, mode='r', offset=self.offset, shape=(self.payload_size,))
+        if zlib.crc32(payload) != self.checksum:
+            raise ValueError(f"Mask file {self.path} is corrupted (checksum mismatch)")
+
+        cells_count = int(np.prod(self.shape))
+        if self.encoding == BITS_ENCODING:
+            return np.unpackbits(payload, count=cells_count).reshape(self.shape).astype(self.dtype)
+        return np.frombuffer(payload, dtype=self.dtype, count=cells_count).reshape(self.shape).copy()
+
+
+def save(path: str, mask: np.ndarray) -> None:
+    """
+    Save the mask - bit-packed if it contains only 0 and 1 values.
+    @param path: Path to the mask file
+    @param mask: Mask array
+    """
+    mask = np.asarray(mask)
+    if np.all((mask == 0) | (mask == 1)):
+        encoding = BITS_ENCODING
+        payload = np.packbits(mask.ravel() != 0).tobytes()
+    else:
+        encoding = RAW_ENCODING
+        payload = np.ascontiguousarray(mask).tobytes()
+
+    header = json.dumps({"version": VERSION, "shape": list(mask.shape), "dtype": mask.dtype.str,
+                         "encoding": encoding, "checksum": zlib.crc32(payload)}).encode()
+    prefix_length = len(MAGIC) + struct.calcsize(_HEADER_LENGTH_FORMAT)
+    header += b" " * (-(prefix_length + len(header)) % HEADER_ALIGNMENT)
+
+    with open(path, 'wb') as mask_file:
+        mask_file.write(MAGIC)
+        mask_file.write(struct.pack(_HEADER_LENGTH_FORMAT, len(header)))
+        mask_file.write(header)
+        mask_file.write(payload)
+
+
+def open_mask(path: str) -> PackedMask:
+    """
+    Read the header of the mask file.
+    @param path: Path to the mask file
+    @return: PackedMask - the mask itself is read by its unpack()
+    """
+    with open(path, 'rb') as mask_file:
+        if mask_file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a mask file")
+        header_length, = struct.unpack(_HEADER_LENGTH_FORMAT,
+                                       mask_file.read(struct.calcsize(_HEADER_LENGTH_FORMAT)))
+        try:
+            header = json.loads(mask_file.read(header_length))
+        except ValueError:
+            raise ValueError(f"Invalid header of mask file {path}")
+        offset = mask_file.tell()
+        payload_size = mask_file.seek(0, 2) - offset
+
+    if header.get("version") != VERSION or header.get("encoding") not in (BITS_ENCODING, RAW_ENCODING):
+        raise ValueError(f"Unsupported mask file {path}: {header}")
+    return PackedMask(path, tuple(header["shape"]), np.dtype(header["dtype"]), header["encoding"],
+                      header["checksum"], offset, payload_size)
@@ -0,0 +1,125 @@
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+# Cache of the passing stage - stored next to the Modflow model files, it keeps average recharge of every shape
+# used to write current RCH file, so the next passing recalculates only shapes whose Hydrus output changed.
+CACHE_FILE_NAME = "passing_cache.npz"
+HASH_CHUNK_SIZE = 1 << 20
+
+
+@dataclass(frozen=True)
+class ShapeKey:
+    t_level_hash: str                       # content hash of T_Level.out of the shape
+    mask_fingerprint: str                   # hash of the shape mask
+    spin_up: int                            # hydrus spin up period (in days)
+
+
+@dataclass
+class PassingCache:
+    shape_keys: List[ShapeKey]              # keys of consecutive shapes
+    averages: np.ndarray                    # 2D array (shapes, stress periods) of average recharge of every shape
+    perlen: List[float]                     # lengths of stress periods the averages were calculated for
+    rch_hash: str                           # content hash of RCH file written with these averages
+
+    def get_averages(self, shape_key: ShapeKey, perlen: Sequence[float]) -> Optional[np.ndarray]:
+        """
+        @param shape_key: Key of the shape
+        @param perlen: Lengths of current Modflow stress periods
+        @return: Cached average recharge of the shape in every stress period, None if it isn't cached
+        """
+        if list(perlen) != self.perlen:
+            return None
+        for idx, cached_key in enumerate(self.shape_keys):
+            if cached_key == shape_key:
+                return self.averages[idx]
+        return None
+
+
+def hash_file(path: str) -> str:
+    """
+    @param path: Path to the file
+    @return: Hash of the file content
+    """
+    file_hash = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b""):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def get_mask_fingerprint(mask: np.ndarray) -> str:
+    """
+    @param mask: Shape mask
+    @return: Hash of mask values (and its shape)
+    """
+    mask = np.ascontiguousarray(mask, dtype=np.float64)
+    mask_hash = hashlib.blake2b(str(mask.shape).encode(), digest_size=16)
+    mask_hash.update(mask.tobytes())
+    return mask_hash.hexdigest()
+
+
+def get_shape_keys(t_level_paths: List[str], masks: List[np.ndarray], spin_up: int,
+                   workers: int) -> List[Optional[ShapeKey]]:
+    """
+    Calculate keys of many shapes - T_Level.out files are hashed concurrently (hashing doesn't hold the GIL).
+    @param t_level_paths: Paths to T_Level.out files of consecutive shapes
+    @param masks: Masks of consecutive shapes
+    @param spin_up: Hydrus spin up period (in days)
+    @param workers: Maximal amount of files hashed at once
+    @return: Key of every shape, None for shapes whose T_Level.out can't be read
+    """
+    def get_key(shape_idx: int) -> Optional[ShapeKey]:
+        try:
+            t_level_hash = hash_file(t_level_paths[shape_idx])
+        except OSError:
+            return None
+        return ShapeKey(t_level_hash, get_mask_fingerprint(masks[shape_idx]), spin_up)
+
+    if not t_level_paths:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(t_level_paths)))) as executor:
+        return list(executor.map(get_key, range(len(t_level_paths))))
+
+
+def read(project_path: str) -> Optional[PassingCache]:
+    """
+    @param project_path: Path to Modflow project main directory
+    @return: Cache saved by the last passing, None if there is no (valid) cache
+    """
+    cache_path = os.path.join(project_path, CACHE_FILE_NAME)
+    if not os.path.isfile(cache_path):
+        return None
+
+    try:
+        with np.load(cache_path) as cache_file:
+            return PassingCache(
+                shape_keys=[ShapeKey(str(t_level_hash), str(mask_fingerprint), int(spin_up))
+                            for (t_level_hash, mask_fingerprint, spin_up)
+                            in zip(cache_file["t_level_hashes"], cache_file["mask_fingerprints"],
+                                   cache_file["spin_ups"])],
+                averages=cache_file["averages"],
+                perlen=cache_file["perlen"].tolist(),
+                rch_hash=str(cache_file["rch_hash"])
+            )
+    except (OSError, ValueError, KeyError):
+        print("Invalid passing cache, it will be recreated: " + cache_path)  # TODO: Logger
+        return None
+
+
+def save(project_path: str, cache: PassingCache) -> None:
+    """
+    @param project_path: Path to Modflow project main directory
+    @param cache: Cache describing current RCH file of the model
+    """
+    np.savez(os.path.join(project_path, CACHE_FILE_NAME),
+             t_level_hashes=np.array([key.t_level_hash for key in cache.shape_keys], dtype=str),
+             mask_fingerprints=np.array([key.mask_fingerprint for key in cache.shape_keys], dtype=str),
+             spin_ups=np.array([key.spin_up for key in cache.shape_keys], dtype=np.int64),
+             averages=cache.averages, perlen=np.array(cache.perlen, dtype=np.float64),
+             rch_hash=np.array(cache.rch_hash))
+
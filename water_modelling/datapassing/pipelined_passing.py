@@ -0,0 +1,164 @@
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from datapassing import passing_cache, recharge_engine, t_level_reader
+from datapassing.recharge_engine import RechargeAccumulator
+from modflow import modflow_utils, rch_writer
+
+
+@dataclass
+class _PreloadedModel:
+    accumulator: RechargeAccumulator        # recharge assembled from outputs of finished Hydrus models
+    rch_path: str                           # path to RCH file of the model
+    nrchop: int                             # recharge option of RCH package
+    ipakcb: int                             # cell-by-cell budget unit of RCH package
+    irch: Optional[np.ndarray]              # 1-based layers receiving recharge (if nrchop == 2)
+
+
+class PipelinedPassing:
+
+    def __init__(self, modflow_workspace_path: str, nam_file: str, model_names: List[str], masks: List[np.ndarray],
+                 t_level_paths: List[str], perlen: List[float], spin_up: int, workers: int):
+        """
+        Passing done while Hydrus simulations are running - Modflow RCH package is loaded in the background and
+        every Hydrus output is read and added to the recharge as soon as its simulation finishes, so only
+        the write of RCH file is left after the last simulation. Result is the same as of
+        HydrusModflowPassing.update_rch().
+
+        @param modflow_workspace_path: Path to Modflow project main directory
+        @param nam_file: Name of .nam file inside the Modflow project
+        @param model_names: Names of Hydrus models of consecutive shapes
+        @param masks: Masks of consecutive shapes
+        @param t_level_paths: Paths to T_Level.out of consecutive shapes
+        @param perlen: Lengths of Modflow stress periods
+        @param spin_up: hydrus spin up period (in days)
+        @param workers: Maximal amount of Hydrus outputs read at once
+        """
+        self.modflow_workspace_path = modflow_workspace_path
+        self.nam_file = nam_file
+        self.model_names = model_names
+        self.masks = masks
+        self.t_level_paths = t_level_paths
+        self.perlen = perlen
+        self.spin_up = spin_up
+
+        self.timings: Dict[str, float] = {}     # model name -> read and add time, "preload" and "write" (in seconds)
+        self.errors: Dict[str, str] = {}       # model name -> description of the error
+
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers))
+        self._preload: Optional[Future] = None
+        self._shape_futures: Dict[str, Future] = {}
+        self._shape_keys: List[Optional[passing_cache.ShapeKey]] = [None] * len(model_names)
+        self._cache = passing_cache.read(modflow_workspace_path)
+
+    def start(self) -> None:
+        """
+        Start loading the Modflow model in the background.
+        """
+        self._preload = self._executor.submit(self._preload_model)
+
+    def add_hydrus_output(self, model_name: str) -> None:
+        """
+        Read output of the finished Hydrus model and add it to the recharge (in the background).
+        @param model_name: Name of the Hydrus model
+        """
+        shape_idx = self.model_names.index(model_name)
+        self._shape_futures[model_name] = self._executor.submit(self._add_shape, shape_idx)
+
+    def finish(self) -> bool:
+        """
+        Wait for all added outputs and write RCH file - called after all Hydrus models finished.
+        @return: True if RCH file was written, False if Modflow model couldn't be loaded or any Hydrus output couldn't
+            be read (see errors)
+        @raise Exception: Unexpected error of passing a Hydrus output (also recorded in errors)
+        """
+        try:
+            try:
+                preloaded_model = self._preload.result()
+            except Exception as err:  # ex. missing or invalid RCH package
+                self.errors[self.nam_file] = "Loading Modflow model failed: " + str(err)
+                return False
+            for model_name in self.model_names:
+                if model_name not in self._shape_futures:
+                    self.errors[model_name] = "Hydrus output wasn't passed"
+                else:
+                    self._shape_futures[model_name].result()
+            if self.errors:
+                return False
+
+            start = time.perf_counter()
+            new_recharge = preloaded_model.accumulator.finish()
+            # model files are modified below - cached model is outdated
+            modflow_utils.invalidate_model_cache(self.modflow_workspace_path, self.nam_file)
+            rch_writer.write_rch(preloaded_model.rch_path, nrchop=preloaded_model.nrchop,
+                                 ipakcb=preloaded_model.ipakcb, recharge=new_recharge, irch=preloaded_model.irch)
+            self._save_cache(preloaded_model)
+            self.timings["write"] = time.perf_counter() - start
+            return True
+        finally:
+            self._executor.shutdown(wait=False)
+
+    def cancel(self) -> None:
+        """
+        Stop the passing without writing RCH file (e.g. when Hydrus simulations failed).
+        """
+        for future in [self._preload, *self._shape_futures.values()]:
+            if future is not None:
+                future.cancel()  # only not started ones are cancelled (Python 3.8 can't cancel them on shutdown)
+        self._executor.shutdown(wait=False)
+
+    def _preload_model(self) -> _PreloadedModel:
+        start = time.perf_counter()
+        modflow_model = modflow_utils.load_model(self.modflow_workspace_path, self.nam_file, load_only=["rch"])
+        rch_package = modflow_model.get_package("rch")
+        preloaded_model = _PreloadedModel(
+            accumulator=RechargeAccumulator(rch_package.rech.array[:, 0], self.masks),
+            rch_path=rch_package.fn_path,
+            nrchop=rch_package.nrchop,
+            ipakcb=rch_package.ipakcb or 0,
+            irch=rch_package.irch.array[:, 0] + 1 if rch_package.nrchop == 2 else None  # flopy keeps 0-based layers
+        )
+        self.timings["preload"] = time.perf_counter() - start
+        return preloaded_model
+
+    def _add_shape(self, shape_idx: int) -> None:
+        model_name = self.model_names[shape_idx]
+        t_level_path = self.t_level_paths[shape_idx]
+        start = time.perf_counter()
+        try:
+            shape_key = passing_cache.ShapeKey(passing_cache.hash_file(t_level_path),
+                                               passing_cache.get_mask_fingerprint(self.masks[shape_idx]),
+                                               self.spin_up)
+            averages = self._cache.get_averages(shape_key, self.perlen) if self._cache is not None else None
+            if averages is None:
+                sum_v_bot = t_level_reader.read_sum_v_bot(
+                    t_level_path, max_rows=recharge_engine.required_values_count(self.perlen, self.spin_up))
+                averages = recharge_engine.stress_period_averages([sum_v_bot], self.perlen, self.spin_up)[0]
+        except (OSError, ValueError) as err:
+            self.errors[model_name] = "Reading hydrus output failed: " + str(err)
+            return
+        except Exception as err:  # unexpected error - recorded and raised again by finish()
+            self.errors[model_name] = "Passing hydrus output failed: " + str(err)
+            raise
+
+        self._shape_keys[shape_idx] = shape_key
+        if self._preload.exception() is not None:
+            return  # error of Modflow model is reported by finish()
+        try:
+            self._preload.result().accumulator.add_shape(shape_idx, averages)
+        except Exception as err:
+            self.errors[model_name] = "Passing hydrus output failed: " + str(err)
+            raise
+        self.timings[model_name] = time.perf_counter() - start
+
+    def _save_cache(self, preloaded_model: _PreloadedModel) -> None:
+        """
+        Save averages of the shapes, so the next (not pipelined) passing can be incremental.
+        """
+        passing_cache.save(self.modflow_workspace_path, passing_cache.PassingCache(
+            self._shape_keys, preloaded_model.accumulator.get_averages(), [float(d) for d in self.perlen],
+            passing_cache.hash_file(preloaded_model.rch_path)))
@@ -0,0 +1,225 @@
+import threading
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+# Vectorized implementation of the Hydrus -> Modflow recharge passing. The reference (loop based) implementation is
+# kept in HydrusModflowPassing.update_rch_reference and both are expected to produce the same RCH arrays.
+
+MASK_VALUE = 1
+NO_SHAPE_LABEL = -1
+
+
+def stress_period_averages(sum_v_bot_values: Sequence[np.ndarray], perlen: Sequence[float],
+                           spin_up: int = 0) -> np.ndarray:
+    """
+    Calculate average daily recharge of every shape in every stress period.
+    @param sum_v_bot_values: Cumulative bottom flux - sum(vBot) - read from T_Level.out of each shape
+    @param perlen: Lengths of Modflow stress periods (in days)
+    @param spin_up: Hydrus spin up period (in days)
+    @return: 2D array (shapes, stress periods) of average recharge values
+    """
+    period_ends = np.cumsum([int(duration) for duration in perlen], dtype=np.int64)
+    period_begins = period_ends - np.array([int(duration) for duration in perlen], dtype=np.int64)
+    days_needed = int(period_ends[-1]) if len(period_ends) > 0 else 0
+
+    # check every shape before doing any calculations, errors are raised in the same order as in the reference
+    for sum_v_bot in sum_v_bot_values:
+        if spin_up >= len(sum_v_bot):
+            raise ValueError('Spin up is longer than hydrus model time')
+        daily_values_count = len(sum_v_bot) - 1 - spin_up
+        out_of_time = np.nonzero(period_ends >= daily_values_count)[0]
+        if len(out_of_time) > 0:
+            raise ValueError("Stress period " + str(out_of_time[0] + 1) + " is out of hydrus model time")
+
+    # daily recharge (excluding spin_up period) - only days covered by stress periods are needed
+    daily_recharge = np.empty((len(sum_v_bot_values), days_needed), dtype=np.float64)
+    for i, sum_v_bot in enumerate(sum_v_bot_values):
+        sum_v_bot = np.asarray(sum_v_bot, dtype=np.float64)[spin_up:spin_up + days_needed + 1]
+        np.negative(np.diff(sum_v_bot), out=daily_recharge[i])
+
+    # sum each stress period at once, empty stress periods have no average (as np.average of empty slice)
+    period_lengths = period_ends - period_begins
+    averages = np.full((len(sum_v_bot_values), len(period_lengths)), np.nan)
+    non_empty = period_lengths > 0
+    if daily_recharge.size > 0 and non_empty.any():
+        period_sums = np.add.reduceat(daily_recharge, period_begins[non_empty], axis=1)
+        averages[:, non_empty] = period_sums / period_lengths[non_empty]
+    return averages
+
+
+def required_values_count(perlen: Sequence[float], spin_up: int = 0) -> int:
+    """
+    @param perlen: Lengths of Modflow stress periods (in days)
+    @param spin_up: Hydrus spin up period (in days)
+    @return: Amount of sum(vBot) values of every shape needed by stress_period_averages() - further values change
+        neither the result nor the validation of hydrus model time
+    """
+    return spin_up + sum(int(duration) for duration in perlen) + 2
+
+
+def label_cells(masks: Sequence[np.ndarray]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Merge flattened shape masks into one raster, where each cell holds index of the shape covering it.
+    @param masks: Flattened masks of the shapes
+    @return: Tuple of flat arrays:
+        (label raster - index of the last shape covering given cell, NO_SHAPE_LABEL for cells outside of shapes,
+         mask value of that shape in given cell,
+         count of shapes covering given cell,
+         True for cells where original recharge is replaced - cells having MASK_VALUE in any mask)
+    """
+    cells_count = len(masks[0])
+    label_raster = np.full(cells_count, NO_SHAPE_LABEL, dtype=np.int32)
+    weights = np.zeros(cells_count, dtype=np.float64)
+    shapes_count = np.zeros(cells_count, dtype=np.int32)
+    replaced = np.zeros(cells_count, dtype=bool)
+    for i, mask in enumerate(masks):
+        in_shape = (mask != 0)
+        label_raster[in_shape] = i
+        weights[in_shape] = mask[in_shape]
+        shapes_count += in_shape
+        replaced |= (mask == MASK_VALUE)
+    return label_raster, weights, shapes_count, replaced
+
+
+def assemble_recharge(base_recharge: np.ndarray, masks: List[np.ndarray], averages: np.ndarray) -> np.ndarray:
+    """
+    Create recharge of all stress periods - cells covered by shapes get average recharge of the shape,
+    other cells keep recharge of the original Modflow model.
+    @param base_recharge: 3D array (stress periods, rows, cols) of original Modflow recharge
+    @param masks: Bitmasks of the shapes
+    @param averages: 2D array (shapes, stress periods) returned by stress_period_averages()
+    @return: 3D array (stress periods, rows, cols) of new recharge, same dtype as base_recharge
+    """
+    nper = base_recharge.shape[0]
+    recharge = base_recharge.reshape(nper, -1).copy()
+    if len(masks) == 0:
+        return recharge.reshape(base_recharge.shape)
+
+    flat_masks = [np.ravel(mask) for mask in masks]
+    label_raster, weights, shapes_count, replaced = label_cells(flat_masks)
+    recharge[:, replaced] = 0.0
+
+    # NaN/inf average spreads over the whole grid (0 * NaN) - then every cell has to be summed shape by shape
+    if np.all(np.isfinite(averages)):
+        single_shape = shapes_count == 1
+        multiple_shapes = shapes_count > 1
+    else:
+        single_shape = np.zeros_like(replaced)
+        multiple_shapes = np.ones_like(replaced)
+
+    # cells covered by exactly one shape (usual case) - a single lookup in the table of averages
+    recharge[:, single_shape] = recharge[:, single_shape] + \
+        weights[single_shape] * averages.T[:, label_raster[single_shape]]
+
+    # overlapping shapes - add contributions one by one (same order and rounding as the reference implementation)
+    if np.any(multiple_shapes):
+        overlapping_recharge = recharge[:, multiple_shapes]
+        for i, mask in enumerate(flat_masks):
+            overlapping_recharge += np.outer(averages[i], mask[multiple_shapes])
+        recharge[:, multiple_shapes] = overlapping_recharge
+
+    return recharge.reshape(base_recharge.shape)
+
+
+def update_recharge(recharge: np.ndarray, masks: List[np.ndarray], previous_averages: np.ndarray,
+                    averages: np.ndarray, changed_shapes: Sequence[int]) -> np.ndarray:
+    """
+    Update recharge created by assemble_recharge() after averages of some shapes changed - in cells covered by changed
+    shapes previous contributions are subtracted and recharge is assembled again, other cells are not touched.
+    Cells replaced by shapes get the same values as if the whole recharge was assembled again.
+    @param recharge: 3D array (stress periods, rows, cols) of recharge assembled with previous_averages
+    @param masks: Bitmasks of the shapes (the same as used to assemble recharge)
+    @param previous_averages: 2D array (shapes, stress periods) of averages used to assemble recharge
+    @param averages: 2D array (shapes, stress periods) of current averages, all have to be finite
+    @param changed_shapes: Indices of shapes whose averages changed
+    @return: 3D array (stress periods, rows, cols) of new recharge, same dtype as recharge
+    """
+    nper = recharge.shape[0]
+    new_recharge = recharge.reshape(nper, -1).copy()
+    flat_masks = [np.ravel(mask) for mask in masks]
+
+    affected = np.zeros(new_recharge.shape[1], dtype=bool)
+    for i in changed_shapes:
+        affected |= (flat_masks[i] != 0)
+    if not np.any(affected):
+        return new_recharge.reshape(recharge.shape)
+
+    # original recharge of affected cells (it's zeroed anyway in cells replaced by shapes)
+    base_recharge = new_recharge[:, affected]
+    for i in range(len(flat_masks)):
+        base_recharge -= np.outer(previous_averages[i], flat_masks[i][affected])
+
+    new_recharge[:, affected] = assemble_recharge(base_recharge, [mask[affected] for mask in flat_masks], averages)
+    return new_recharge.reshape(recharge.shape)
+
+
+class RechargeAccumulator:
+
+    def __init__(self, base_recharge: np.ndarray, masks: List[np.ndarray]):
+        """
+        Assembles recharge shape by shape, as averages of the shapes become available (in any order) - the result
+        is the same as of assemble_recharge() called with averages of all shapes. Shapes can be added concurrently.
+        @param base_recharge: 3D array (stress periods, rows, cols) of original Modflow recharge
+        @param masks: Bitmasks of the shapes
+        """
+        nper = base_recharge.shape[0]
+        self._base_recharge = base_recharge
+        self._flat_masks = [np.ravel(mask) for mask in masks]
+        self._recharge = base_recharge.reshape(nper, -1).copy()
+        self._averages = np.full((len(masks), nper), np.nan)
+        self._added = np.zeros(len(masks), dtype=bool)
+        self._lock = threading.Lock()
+
+        self._weights = np.zeros(self._recharge.shape[1])
+        self._single_shape_cells: List[np.ndarray] = []
+        self._multiple_shapes = np.zeros(self._recharge.shape[1], dtype=bool)
+        if len(masks) > 0:
+            label_raster, self._weights, shapes_count, replaced = label_cells(self._flat_masks)
+            self._recharge[:, replaced] = 0.0
+            self._multiple_shapes = shapes_count > 1
+
+            # cells covered only by given shape, grouped by shape
+            single_shape_cells = np.flatnonzero(shapes_count == 1)
+            order = np.argsort(label_raster[single_shape_cells], kind='stable')
+            single_shape_cells = single_shape_cells[order]
+            bounds = np.searchsorted(label_raster[single_shape_cells], np.arange(len(masks) + 1))
+            self._single_shape_cells = [single_shape_cells[bounds[i]:bounds[i + 1]] for i in range(len(masks))]
+
+    def add_shape(self, shape_idx: int, averages: np.ndarray) -> None:
+        """
+        Add contribution of the shape to cells covered only by this shape (other cells are summed by finish()).
+        @param shape_idx: Index of the shape (its mask)
+        @param averages: Average recharge of the shape in every stress period (row of stress_period_averages())
+        """
+        cells = self._single_shape_cells[shape_idx]
+        with self._lock:
+            self._recharge[:, cells] = self._recharge[:, cells] + self._weights[cells] * averages[:, np.newaxis]
+            self._averages[shape_idx] = averages
+            self._added[shape_idx] = True
+
+    def get_averages(self) -> np.ndarray:
+        """
+        @return: 2D array (shapes, stress periods) of added averages (NaN for shapes not added yet)
+        """
+        return self._averages
+
+    def finish(self) -> np.ndarray:
+        """
+        Sum contributions in cells covered by many shapes - called once, after all shapes were added.
+        @return: 3D array (stress periods, rows, cols) of new recharge, same dtype as base recharge
+        """
+        if not np.all(self._added):
+            raise ValueError(f"Averages of shapes {np.flatnonzero(~self._added).tolist()} weren't added")
+
+        # NaN/inf average spreads over the whole grid (see assemble_recharge)
+        if not np.all(np.isfinite(self._averages)):
+            return assemble_recharge(self._base_recharge, self._flat_masks, self._averages)
+
+        # overlapping shapes - contributions added in order of the shapes (as in assemble_recharge)
+        if np.any(self._multiple_shapes):
+            overlapping_recharge = self._recharge[:, self._multiple_shapes]
+            for i, mask in enumerate(self._flat_masks):
+                overlapping_recharge += np.outer(self._averages[i], mask[self._multiple_shapes])
+            self._recharge[:, self._multiple_shapes] = overlapping_recharge
+        return self._recharge.reshape(self._base_recharge.shape)
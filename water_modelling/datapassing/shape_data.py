@@ -1,8 +1,10 @@
+import weakref
 from dataclasses import dataclass
-from typing import List
+from typing import Callable, Optional
 
 import numpy as np
-import phydrus as ph
+
+from datapassing import t_level_reader
 
 
 @dataclass
@@ -12,26 +14,90 @@ class ShapeMetadata:    # shape on which hydrus model will be applied
     hydrus_model_name: str
 
 
+class LazyShapeMetadata(ShapeMetadata):     # shape whose mask is kept in a file and read when it's used
+
+    def __init__(self, mask_loader: Callable[[], np.ndarray], project_name: str, hydrus_model_name: str):
+        """
+        @param mask_loader: Function reading the mask - called on access of shape_mask, unless the loaded mask
+            is still used elsewhere (it isn't kept by the shape)
+        @param project_name: Name of the project
+        @param hydrus_model_name: Name of the Hydrus model applied on the shape
+        """
+        self._mask_loader = mask_loader
+        self._loaded_mask: Optional[weakref.ref] = None     # reference to the mask read by mask_loader
+        super().__init__(None, project_name, hydrus_model_name)
+
+    @property
+    def shape_mask(self) -> np.ndarray:
+        if self._mask is not None:
+            return self._mask
+        mask = self._loaded_mask() if self._loaded_mask is not None else None
+        if mask is None:
+            mask = self._mask_loader()
+            self._loaded_mask = weakref.ref(mask)
+        return mask
+
+    @shape_mask.setter
+    def shape_mask(self, shape_mask: Optional[np.ndarray]) -> None:
+        self._mask = shape_mask     # set mask isn't saved yet - it's kept until set_mask_loader() is called
+
+    def set_mask_loader(self, mask_loader: Callable[[], np.ndarray]) -> None:
+        """
+        Read the mask with mask_loader from now on (ex. after it was saved) - the set or loaded mask is dropped.
+        @param mask_loader: Function reading the mask
+        """
+        self._mask_loader = mask_loader
+        self._loaded_mask = None
+        self._mask = None
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, ShapeMetadata):
+            return NotImplemented
+        return (self.project_name, self.hydrus_model_name) == (other.project_name, other.hydrus_model_name) \
+            and np.array_equal(self.shape_mask, other.shape_mask)
+
+    def __repr__(self) -> str:
+        # the mask isn't read just to be printed
+        return f"{type(self).__name__}(project_name={self.project_name!r}, " \
+               f"hydrus_model_name={self.hydrus_model_name!r})"
+
+
 class Shape:
 
-    def __init__(self, mask_array: np.ndarray, hydrus_output_filepath: str):
+    def __init__(self, mask_array: np.ndarray, hydrus_output_filepath: Optional[str],
+                 recharge: Optional[np.ndarray] = None):
         """
         This class contains shape data used for passing output of Hydrus (recharge) as an input of Modflow.
         @param mask_array: NumPy 2D array representing bitmask of a particular shape
         @param hydrus_output_filepath: Path to the Hydrus output file - T_Level.out containing 'sum vBot' (recharge)
+        @param recharge: Already loaded 'sum vBot' values - the file is not read if given
         """
         self.mask_array = mask_array
-        self.recharge = Shape._read_hydrus_output(hydrus_output_filepath)
+        self.hydrus_output_filepath = hydrus_output_filepath
+        self._recharge = recharge
+
+    @property
+    def recharge(self) -> Optional[np.ndarray]:
+        """
+        'sum vBot' values of the shape - the file is read on first use (it's not read at all if the passing
+        stage has average recharge of the shape cached)
+        """
+        if self._recharge is None:
+            self._recharge = Shape._read_hydrus_output(self.hydrus_output_filepath)
+        return self._recharge
+
+    @recharge.setter
+    def recharge(self, recharge: Optional[np.ndarray]) -> None:
+        self._recharge = recharge
 
     @staticmethod
-    def _read_hydrus_output(hydrus_output_filepath: str) -> List[float]:
+    def _read_hydrus_output(hydrus_output_filepath: str) -> Optional[np.ndarray]:
         """
         Read Hydrus simulation output from file T_Level.out (read all entries of sum(vBot))
         @param hydrus_output_filepath: Path to T_Level.out
-        @return:
+        @return: Array of sum(vBot) values, None if the file doesn't exist
         """
         try:
-            t_level = ph.read.read_tlevel(path=hydrus_output_filepath)
-            return t_level['sum(vBot)']
+            return t_level_reader.read_sum_v_bot(hydrus_output_filepath)
         except FileNotFoundError as err:
             print(f"No file found containing hydrus output: {err}") # TODO: Logger
@@ -4,11 +4,13 @@ from typing import Dict, Optional
 import numpy as np
 
 from app_config import deployment_config
-from datapassing.shape_data import ShapeMetadata
+from datapassing import packed_mask
+from datapassing.shape_data import LazyShapeMetadata, ShapeMetadata
 
 HydrusModelName = str
 
-MASK_FILETYPE = ".npy"
+MASK_FILETYPE = ".mask"
+LEGACY_MASK_FILETYPE = ".npy"   # dense masks saved by older versions, converted on first read
 
 
 def wipe_all_masks(project_name: str):
@@ -33,23 +35,44 @@ def scan_for_mask_in_project(project_name: str) -> Dict[HydrusModelName, ShapeMe
 
 
 def get(project_name: str, hydrus_model_name: str) -> ShapeMetadata:
-    mask = np.load(_get_mask_filename(project_name, hydrus_model_name))
-    return ShapeMetadata(mask, project_name, hydrus_model_name)
+    """
+    @return: Shape metadata with lazily loaded mask - only the header of the mask file is read here
+    """
+    path = _get_mask_filename(project_name, hydrus_model_name)
+    legacy_path = _get_mask_filename(project_name, hydrus_model_name, LEGACY_MASK_FILETYPE)
+    if not os.path.exists(path) and os.path.exists(legacy_path):
+        packed_mask.save(path, np.load(legacy_path))
+        os.remove(legacy_path)
+
+    mask = packed_mask.open_mask(path)
+    return LazyShapeMetadata(mask.unpack, project_name, hydrus_model_name)
 
 
 def save_or_update(mask: ShapeMetadata):
     path = _get_mask_filename(mask.project_name, mask.hydrus_model_name)
-    np.save(path, mask.shape_mask)
+    packed_mask.save(path, mask.shape_mask)
+    if isinstance(mask, LazyShapeMetadata):
+        mask.set_mask_loader(packed_mask.open_mask(path).unpack)  # the loaded mask is read again from the new file
+
+    legacy_path = _get_mask_filename(mask.project_name, mask.hydrus_model_name, LEGACY_MASK_FILETYPE)
+    if os.path.exists(legacy_path):
+        os.remove(legacy_path)
 
 
 def delete(project_name: str, hydrus_model_name: str):
-    os.remove(_get_mask_filename(project_name, hydrus_model_name))
+    path = _get_mask_filename(project_name, hydrus_model_name)
+    legacy_path = _get_mask_filename(project_name, hydrus_model_name, LEGACY_MASK_FILETYPE)
+    if os.path.exists(legacy_path):
+        os.remove(legacy_path)
+        if not os.path.exists(path):
+            return
+    os.remove(path)
 
 
-def _get_mask_filename(project_name: str, hydrus_model_name: str) -> str:
-    # workspace/<project>/hydrus/<model>/<model>.npy
+def _get_mask_filename(project_name: str, hydrus_model_name: str, filetype: str = MASK_FILETYPE) -> str:
+    # workspace/<project>/hydrus/<model>/<model>.mask
     return os.path.join(deployment_config.WORKSPACE_DIR,
                         project_name,
                         "hydrus",
                         hydrus_model_name,
-                        hydrus_model_name + MASK_FILETYPE)
+                        hydrus_model_name + filetype)
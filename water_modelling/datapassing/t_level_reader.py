@@ -0,0 +1,103 @@
+import mmap
+from itertools import islice
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+# Reader of Hydrus T_Level.out files - only requested columns are parsed, the file is processed in chunks of lines
+# so the whole table is never kept in memory as text.
+
+TIME_COLUMN = "Time"
+SUM_V_BOT_COLUMN = "sum(vBot)"
+END_MARKER = b"end"
+CHUNK_LINES = 65536
+
+
+def read_sum_v_bot(path: str, use_mmap: bool = False, max_rows: Optional[int] = None) -> np.ndarray:
+    """
+    Read all entries of sum(vBot) (cumulative bottom flux) from T_Level.out.
+    @param path: Path to T_Level.out
+    @param use_mmap: Memory-map the file instead of reading it through a buffer
+    @param max_rows: Read at most that many rows (from the beginning of the table), all rows if None
+    @return: 1D float64 array of sum(vBot) values
+    """
+    return read_columns(path, [SUM_V_BOT_COLUMN], use_mmap, max_rows)[SUM_V_BOT_COLUMN]
+
+
+def read_columns(path: str, columns: Sequence[str] = (TIME_COLUMN, SUM_V_BOT_COLUMN),
+                 use_mmap: bool = False, max_rows: Optional[int] = None) -> Dict[str, np.ndarray]:
+    """
+    Read chosen columns of T_Level.out - all rows between the header (with units row) and the 'end' line.
+    @param path: Path to T_Level.out
+    @param columns: Names of the columns, as in the header of the file
+    @param use_mmap: Memory-map the file instead of reading it through a buffer
+    @param max_rows: Read at most that many rows (from the beginning of the table), all rows if None
+    @return: Dictionary - column name -> 1D float64 array of its values
+    """
+    with open(path, 'rb') as file:
+        if use_mmap:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+                return _read_table(_iterate_lines(mapped_file), path, columns, max_rows)
+        return _read_table(file, path, columns, max_rows)
+
+
+def _iterate_lines(mapped_file: mmap.mmap) -> Iterable[bytes]:
+    line = mapped_file.readline()
+    while line:
+        yield line
+        line = mapped_file.readline()
+
+
+def _read_table(lines: Iterable[bytes], path: str, columns: Sequence[str],
+                max_rows: Optional[int]) -> Dict[str, np.ndarray]:
+    lines = iter(lines)
+    header = _find_header(lines, path)
+    try:
+        indices = [header.index(column) for column in columns]
+    except ValueError:
+        raise ValueError(f"T_Level file {path} doesn't contain columns {list(columns)}, found: {header}")
+
+    chunks: List[np.ndarray] = []
+    rows_left = max_rows if max_rows is not None else np.inf
+    finished = rows_left <= 0
+    while not finished:
+        chunk_lines = []
+        lines_read = 0
+        for line in islice(lines, int(min(CHUNK_LINES, rows_left))):
+            lines_read += 1
+            stripped_line = line.strip()
+            if stripped_line == END_MARKER:
+                finished = True
+                break
+            if stripped_line:
+                chunk_lines.append(line)
+        finished = finished or lines_read < min(CHUNK_LINES, rows_left)  # end of file without 'end' line
+        if chunk_lines:
+            chunks.append(_parse_chunk(chunk_lines, indices, path))
+            rows_left -= len(chunk_lines)
+            finished = finished or rows_left <= 0
+
+    table = np.concatenate(chunks) if chunks else np.zeros((0, len(columns)))
+    return {column: np.ascontiguousarray(table[:, i]) for (i, column) in enumerate(columns)}
+
+
+def _find_header(lines: Iterable[bytes], path: str) -> List[str]:
+    """
+    Skip lines up to the header and the units row following it.
+    @return: Names of the columns
+    """
+    for line in lines:
+        tokens = line.split()
+        if tokens and tokens[0] == TIME_COLUMN.encode():
+            for units_line in lines:
+                if units_line.strip():
+                    break
+            return [token.decode() for token in tokens]
+    raise ValueError(f"T_Level file {path} doesn't contain table header")
+
+
+def _parse_chunk(chunk_lines: List[bytes], indices: List[int], path: str) -> np.ndarray:
+    try:
+        return np.loadtxt(chunk_lines, usecols=indices, ndmin=2, dtype=np.float64)
+    except (ValueError, IndexError) as err:
+        raise ValueError(f"Invalid row in T_Level file {path}: {err}")
@@ -0,0 +1,23 @@
+import unittest
+
+import numpy as np
+
+from datapassing import hydrus_output_loader, t_level_reader
+
+
+class HydrusOutputLoaderTest(unittest.TestCase):
+
+    def test_load_sum_v_bot(self):
+        paths = ["hydrus_out/t_level" + str(i) + ".out" for i in range(1, 6)] + ["hydrus_out/missing.out"]
+        outputs = hydrus_output_loader.load_sum_v_bot(paths, max_values=100, workers=3)
+
+        self.assertEqual(outputs.sum_v_bot.shape, (6, 100))
+        np.testing.assert_array_equal(outputs.lengths, [100, 100, 100, 100, 4, 0])
+        for idx, path in enumerate(paths[:5]):
+            np.testing.assert_array_equal(outputs.get_values(idx), t_level_reader.read_sum_v_bot(path)[:100])
+        self.assertEqual(sorted(outputs.timings), sorted(paths[:5]))
+        self.assertEqual(list(outputs.errors), paths[5:])
+
+
+if __name__ == '__main__':
+    unittest.main()
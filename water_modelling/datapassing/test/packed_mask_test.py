@@ -0,0 +1,79 @@
+import gc
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from datapassing import packed_mask
+from datapassing.shape_data import LazyShapeMetadata, ShapeMetadata
+
+
+class PackedMaskTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workspace = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.workspace.name, "model.mask")
+
+    def tearDown(self):
+        self.workspace.cleanup()
+
+    def test_binary_mask(self):
+        rng = np.random.default_rng(0)
+        for mask in [np.load("mask1.npy"), (rng.random((123, 77)) < 0.3).astype(np.float64), np.zeros((0, 5))]:
+            packed_mask.save(self.path, mask)
+            mask_file = packed_mask.open_mask(self.path)
+            self.assertEqual(mask_file.encoding, packed_mask.BITS_ENCODING)
+            self.assertEqual(mask_file.payload_size, (mask.size + 7) // 8)
+            self.assertEqual(mask_file.offset % packed_mask.HEADER_ALIGNMENT, 0)
+
+            unpacked = mask_file.unpack()
+            self.assertEqual(unpacked.dtype, mask.dtype)
+            np.testing.assert_array_equal(unpacked, mask)
+
+    def test_weighted_mask(self):
+        mask = np.array([[0.0, 0.5], [1.0, 0.25]])
+        packed_mask.save(self.path, mask)
+        mask_file = packed_mask.open_mask(self.path)
+        self.assertEqual(mask_file.encoding, packed_mask.RAW_ENCODING)
+        np.testing.assert_array_equal(mask_file.unpack(), mask)
+
+    def test_invalid_files(self):
+        np.save(self.path, np.zeros((2, 2)))
+        os.rename(self.path + ".npy", self.path)
+        self.assertRaises(ValueError, packed_mask.open_mask, self.path)
+
+        packed_mask.save(self.path, np.ones((10, 10)))
+        with open(self.path, 'r+b') as mask_file:
+            mask_file.seek(-1, os.SEEK_END)
+            mask_file.write(b"\x00")
+        self.assertRaisesRegex(ValueError, "checksum", packed_mask.open_mask(self.path).unpack)
+
+    def test_lazy_shape_doesnt_keep_mask(self):
+        loads = []
+        shape_metadata = LazyShapeMetadata(lambda: loads.append(1) or np.ones((3, 3)), "project", "model")
+        mask = shape_metadata.shape_mask
+        self.assertIs(shape_metadata.shape_mask, mask)  # the mask is used - it isn't read again
+        self.assertEqual(len(loads), 1)
+        del mask
+        gc.collect()
+        np.testing.assert_array_equal(shape_metadata.shape_mask, np.ones((3, 3)))
+        self.assertEqual(len(loads), 2)
+
+        shape_metadata.shape_mask = np.zeros((3, 3))
+        gc.collect()
+        np.testing.assert_array_equal(shape_metadata.shape_mask, np.zeros((3, 3)))
+        shape_metadata.set_mask_loader(lambda: loads.append(1) or np.ones((3, 3)))
+        np.testing.assert_array_equal(shape_metadata.shape_mask, np.ones((3, 3)))
+        self.assertEqual(len(loads), 3)
+
+    def test_lazy_shape_equality(self):
+        shape_metadata = LazyShapeMetadata(lambda: np.ones((3, 3)), "project", "model")
+        self.assertEqual(shape_metadata, LazyShapeMetadata(lambda: np.ones((3, 3)), "project", "model"))
+        self.assertEqual(shape_metadata, ShapeMetadata(np.ones((3, 3)), "project", "model"))
+        self.assertNotEqual(shape_metadata, LazyShapeMetadata(lambda: np.zeros((3, 3)), "project", "model"))
+        self.assertNotEqual(shape_metadata, LazyShapeMetadata(lambda: np.ones((3, 3)), "project", "other"))
+        self.assertEqual(repr(shape_metadata), "LazyShapeMetadata(project_name='project', hydrus_model_name='model')")
+
+if __name__ == '__main__':
+    unittest.main()
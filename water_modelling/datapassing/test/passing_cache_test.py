@@ -0,0 +1,65 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from datapassing import passing_cache
+from datapassing.hydrus_modflow_passing import HydrusModflowPassing
+from datapassing.shape_data import Shape
+from modflow import modflow_utils
+
+
+class PassingCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workspace = tempfile.mkdtemp()
+        for model in ["incremental", "full"]:
+            shutil.copytree("./simple1", os.path.join(self.workspace, model))
+
+    def tearDown(self):
+        shutil.rmtree(self.workspace)
+
+    def _pass(self, model: str, t_level_paths, masks, use_cache: bool):
+        model_path = os.path.join(self.workspace, model)
+        shapes = [Shape(mask, t_level_path) for (mask, t_level_path) in zip(masks, t_level_paths)]
+        shape_keys = passing_cache.get_shape_keys(t_level_paths, masks, 105, workers=2) if use_cache else None
+        passing = HydrusModflowPassing(model_path, "simple1.nam", shapes, shape_keys)
+        perlen = modflow_utils.load_model(model_path, "simple1.nam", load_only=["rch"]).modeltime.perlen
+        uncached_shapes = passing.get_uncached_shapes(perlen, 105)
+        return passing.update_rch(spin_up=105).array, uncached_shapes
+
+    def test_incremental_passing(self):
+        rng = np.random.default_rng(0)
+        masks = [(rng.random((10, 10)) < 0.3).astype(np.float64) for _ in range(3)]
+        t_level_paths = ["hydrus_out/t_level" + str(i) + ".out" for i in range(1, 4)]
+
+        _, uncached_shapes = self._pass("incremental", t_level_paths, masks, use_cache=True)
+        self.assertEqual(uncached_shapes, [0, 1, 2])
+        self._pass("full", t_level_paths, masks, use_cache=False)
+
+        # the same shapes - nothing is read again
+        _, uncached_shapes = self._pass("incremental", t_level_paths, masks, use_cache=True)
+        self.assertEqual(uncached_shapes, [])
+
+        # Hydrus output of one shape changed - only it is read, result is the same as of the full passing
+        t_level_paths[1] = "hydrus_out/t_level4.out"
+        recharge, uncached_shapes = self._pass("incremental", t_level_paths, masks, use_cache=True)
+        self.assertEqual(uncached_shapes, [1])
+        expected, _ = self._pass("full", t_level_paths, masks, use_cache=False)
+        np.testing.assert_allclose(recharge, expected, rtol=1e-6)  # unchanged cells are read from E15.6 file
+
+        load_rech = (lambda model: modflow_utils.load_model(os.path.join(self.workspace, model), "simple1.nam",
+                                                            load_only=["rch"]).rch.rech.array)
+        np.testing.assert_array_equal(load_rech("incremental"), load_rech("full"))
+
+    def test_invalid_cache(self):
+        self.assertIsNone(passing_cache.read(self.workspace))
+        with open(os.path.join(self.workspace, passing_cache.CACHE_FILE_NAME), 'w') as cache_file:
+            cache_file.write("invalid")
+        self.assertIsNone(passing_cache.read(self.workspace))
+
+
+if __name__ == '__main__':
+    unittest.main()
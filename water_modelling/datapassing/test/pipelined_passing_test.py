@@ -0,0 +1,124 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from datapassing import passing_cache, t_level_reader
+from datapassing.hydrus_modflow_passing import HydrusModflowPassing
+from datapassing.pipelined_passing import PipelinedPassing
+from datapassing.shape_data import Shape
+from modflow import modflow_utils
+
+
+class PipelinedPassingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workspace = tempfile.mkdtemp()
+        for model in ["pipelined", "sequential"]:
+            shutil.copytree("./simple1", os.path.join(self.workspace, model))
+        rng = np.random.default_rng(0)
+        self.model_names = ["model" + str(i) for i in range(1, 5)]
+        self.masks = [(rng.random((10, 10)) < 0.3).astype(np.float64) for _ in self.model_names]
+        self.t_level_paths = ["hydrus_out/t_level" + str(i) + ".out" for i in range(1, 5)]
+
+    def tearDown(self):
+        shutil.rmtree(self.workspace)
+
+    def _create_passing(self, t_level_paths) -> PipelinedPassing:
+        model_path = os.path.join(self.workspace, "pipelined")
+        perlen = modflow_utils.load_model(model_path, "simple1.nam", load_only=["rch"]).modeltime.perlen
+        return PipelinedPassing(model_path, "simple1.nam", self.model_names, self.masks, t_level_paths,
+                                perlen, spin_up=105, workers=2)
+
+    def _read_recharge(self, model: str) -> np.ndarray:
+        model_path = os.path.join(self.workspace, model)
+        modflow_utils.invalidate_model_cache(model_path, "simple1.nam")
+        return modflow_utils.load_model(model_path, "simple1.nam", load_only=["rch"]).rch.rech.array
+
+    def test_same_result_as_update_rch(self):
+        passing = self._create_passing(self.t_level_paths)
+        passing.start()
+        for model_name in reversed(self.model_names):  # order of completion of Hydrus models
+            passing.add_hydrus_output(model_name)
+        self.assertTrue(passing.finish())
+        self.assertEqual(passing.errors, {})
+        self.assertIn("preload", passing.timings)
+        self.assertIn("write", passing.timings)
+
+        shapes = [Shape(mask, t_level_path) for (mask, t_level_path) in zip(self.masks, self.t_level_paths)]
+        HydrusModflowPassing(os.path.join(self.workspace, "sequential"), "simple1.nam", shapes).update_rch(spin_up=105)
+        np.testing.assert_array_equal(self._read_recharge("pipelined"), self._read_recharge("sequential"))
+
+        # cache is saved - the next passing doesn't read any Hydrus output
+        shape_keys = passing_cache.get_shape_keys(self.t_level_paths, self.masks, 105, workers=2)
+        next_passing = HydrusModflowPassing(os.path.join(self.workspace, "pipelined"), "simple1.nam", shapes,
+                                            shape_keys)
+        self.assertEqual(next_passing.get_uncached_shapes(passing.perlen, 105), [])
+
+    def test_missing_output(self):
+        t_level_paths = self.t_level_paths[:3] + ["hydrus_out/missing.out"]
+        rch_path = os.path.join(self.workspace, "pipelined", "simple1.rch")
+        with open(rch_path) as rch_file:
+            rch_content = rch_file.read()
+
+        passing = self._create_passing(t_level_paths)
+        passing.start()
+        for model_name in self.model_names[1:]:
+            passing.add_hydrus_output(model_name)
+        self.assertFalse(passing.finish())
+        self.assertEqual(sorted(passing.errors), ["model1", "model4"])
+        with open(rch_path) as rch_file:
+            self.assertEqual(rch_file.read(), rch_content)
+
+    def test_modflow_model_not_loaded(self):
+        model_path = os.path.join(self.workspace, "pipelined")
+        passing = PipelinedPassing(model_path, "missing.nam", self.model_names, self.masks, self.t_level_paths,
+                                   [1.0], spin_up=105, workers=2)
+        passing.start()
+        for model_name in self.model_names:
+            passing.add_hydrus_output(model_name)
+        self.assertFalse(passing.finish())
+        self.assertEqual(list(passing.errors), ["missing.nam"])
+
+    def test_unexpected_error(self):
+        passing = self._create_passing(self.t_level_paths)
+        passing.start()
+        with mock.patch.object(t_level_reader, "read_sum_v_bot", side_effect=RuntimeError("unexpected")):
+            for model_name in self.model_names:
+                passing.add_hydrus_output(model_name)
+            with self.assertRaises(RuntimeError):
+                passing.finish()
+        self.assertIn("Passing hydrus output failed: unexpected", passing.errors["model1"])
+
+    def test_cancel(self):
+        rch_path = os.path.join(self.workspace, "pipelined", "simple1.rch")
+        with open(rch_path) as rch_file:
+            rch_content = rch_file.read()
+        model_path = os.path.join(self.workspace, "pipelined")
+        perlen = modflow_utils.load_model(model_path, "simple1.nam", load_only=["rch"]).modeltime.perlen
+        passing = PipelinedPassing(model_path, "simple1.nam", self.model_names, self.masks, self.t_level_paths,
+                                   perlen, spin_up=105, workers=1)
+
+        # the only worker is busy loading the Modflow model until the passing is cancelled
+        cancelled = threading.Event()
+        preload_model = passing._preload_model
+        passing._preload_model = lambda: cancelled.wait(10) and preload_model()
+        passing.start()
+        for model_name in self.model_names:
+            passing.add_hydrus_output(model_name)
+        passing.cancel()
+        cancelled.set()
+        passing._executor.shutdown(wait=True)
+
+        self.assertEqual([name for name in passing.timings if name in self.model_names], [])
+        self.assertEqual(passing.errors, {})
+        with open(rch_path) as rch_file:
+            self.assertEqual(rch_file.read(), rch_content)
+
+
+if __name__ == '__main__':
+    unittest.main()
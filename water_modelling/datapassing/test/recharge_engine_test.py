@@ -0,0 +1,95 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from datapassing import recharge_engine
+from datapassing.hydrus_modflow_passing import HydrusModflowPassing
+from datapassing.shape_data import Shape
+
+
+class RechargeEngineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workspace = tempfile.mkdtemp()
+        self.model_path = os.path.join(self.workspace, "simple1")
+        shutil.copytree("./simple1", self.model_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.workspace)
+
+    def test_stress_period_averages(self):
+        sum_v_bot = np.array([0.0, -1.0, -3.0, -6.0, -10.0, -15.0, -21.0])
+        averages = recharge_engine.stress_period_averages([sum_v_bot, 2 * sum_v_bot], [2, 3], spin_up=0)
+        np.testing.assert_array_almost_equal(averages, [[1.5, 4.0], [3.0, 8.0]])
+
+    def test_stress_period_out_of_hydrus_time(self):
+        sum_v_bot = np.zeros(5)
+        self.assertRaisesRegex(ValueError, "Stress period 2", recharge_engine.stress_period_averages,
+                               [sum_v_bot], [2, 3], 0)
+        self.assertRaisesRegex(ValueError, "Spin up", recharge_engine.stress_period_averages,
+                               [sum_v_bot], [1], 5)
+
+    def test_overlapping_masks(self):
+        base_recharge = np.full((2, 2, 2), 0.5, dtype=np.float32)
+        masks = [np.array([[1, 1], [0, 0]]), np.array([[0, 1], [0, 0.5]])]
+        averages = np.array([[1.0, 2.0], [10.0, 20.0]])
+        recharge = recharge_engine.assemble_recharge(base_recharge, masks, averages)
+        np.testing.assert_array_almost_equal(recharge[0], [[1.0, 11.0], [0.5, 5.5]])
+        np.testing.assert_array_almost_equal(recharge[1], [[2.0, 22.0], [0.5, 10.5]])
+
+    def test_update_recharge(self):
+        rng = np.random.default_rng(0)
+        base_recharge = rng.random((3, 6, 6)).astype(np.float32)
+        masks = [(rng.random((6, 6)) < 0.4).astype(np.float64) for _ in range(3)] + [np.full((6, 6), 0.5)]
+        previous_averages = rng.random((4, 3))
+        averages = previous_averages.copy()
+        averages[1] = rng.random(3)
+
+        previous_recharge = recharge_engine.assemble_recharge(base_recharge, masks, previous_averages)
+        recharge = recharge_engine.update_recharge(previous_recharge, masks, previous_averages, averages, [1])
+        expected = recharge_engine.assemble_recharge(base_recharge, masks, averages)
+
+        replaced = np.any([mask == recharge_engine.MASK_VALUE for mask in masks], axis=0)
+        np.testing.assert_array_equal(recharge[:, replaced], expected[:, replaced])
+        np.testing.assert_allclose(recharge, expected, rtol=1e-6)
+        np.testing.assert_array_equal(recharge_engine.update_recharge(previous_recharge, masks, previous_averages,
+                                                                      previous_averages, []), previous_recharge)
+
+    def test_recharge_accumulator(self):
+        rng = np.random.default_rng(0)
+        base_recharge = rng.random((3, 6, 6)).astype(np.float32)
+        masks = [(rng.random((6, 6)) < 0.4).astype(np.float64) for _ in range(3)] + [np.full((6, 6), 0.5)]
+        averages = rng.random((4, 3))
+
+        accumulator = recharge_engine.RechargeAccumulator(base_recharge, masks)
+        for shape_idx in rng.permutation(len(masks)):
+            accumulator.add_shape(shape_idx, averages[shape_idx])
+        np.testing.assert_array_equal(accumulator.finish(),
+                                      recharge_engine.assemble_recharge(base_recharge, masks, averages))
+        np.testing.assert_array_equal(accumulator.get_averages(), averages)
+
+        averages[2, 1] = np.nan
+        accumulator = recharge_engine.RechargeAccumulator(base_recharge, masks)
+        self.assertRaises(ValueError, accumulator.finish)
+        for shape_idx in reversed(range(len(masks))):
+            accumulator.add_shape(shape_idx, averages[shape_idx])
+        np.testing.assert_array_equal(accumulator.finish(),
+                                      recharge_engine.assemble_recharge(base_recharge, masks, averages))
+
+    def test_same_result_as_reference(self):
+        rng = np.random.default_rng(0)
+        hydrus_output = ["hydrus_out/t_level" + str(i) + ".out" for i in range(1, 5)]
+        masks = [(rng.random((10, 10)) < 0.3).astype(np.float64) for _ in hydrus_output]
+        shapes = [Shape(mask, t_level_file) for (mask, t_level_file) in zip(masks, hydrus_output)]
+        passing = HydrusModflowPassing(self.model_path, "simple1.nam", shapes)
+
+        for spin_up in [0, 105]:
+            expected = passing.update_rch_reference(spin_up=spin_up).array
+            np.testing.assert_array_equal(passing.update_rch(spin_up=spin_up).array, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from datapassing import t_level_reader
+
+
+class TLevelReaderTest(unittest.TestCase):
+
+    def test_read_sum_v_bot(self):
+        expected = np.array([-0.12403, -0.13737, -0.14488, -0.14991])
+        np.testing.assert_array_equal(t_level_reader.read_sum_v_bot("hydrus_out/t_level5.out"), expected)
+        np.testing.assert_array_equal(t_level_reader.read_sum_v_bot("hydrus_out/t_level5.out", use_mmap=True),
+                                      expected)
+
+    def test_read_columns(self):
+        columns = t_level_reader.read_columns("hydrus_out/t_level1.out", ["Time", "sum(vBot)", "vBot"])
+        self.assertEqual(len(columns["Time"]), 3656)
+        np.testing.assert_array_equal(columns["Time"][:3], [1.0, 2.0, 3.0])
+        self.assertTrue(all(len(values) == 3656 for values in columns.values()))
+
+    def test_file_without_end_line(self):
+        with open("hydrus_out/t_level5.out") as source:
+            content = source.read().replace("end", "")
+        with tempfile.TemporaryDirectory() as workspace:
+            path = os.path.join(workspace, "T_Level.out")
+            with open(path, 'w') as target:
+                target.write(content)
+            self.assertEqual(len(t_level_reader.read_sum_v_bot(path)), 4)
+            self.assertEqual(len(t_level_reader.read_sum_v_bot(path, use_mmap=True)), 4)
+
+    def test_missing_column(self):
+        self.assertRaises(ValueError, t_level_reader.read_columns, "hydrus_out/t_level5.out", ["sum(vTop)x"])
+
+
+if __name__ == '__main__':
+    unittest.main()
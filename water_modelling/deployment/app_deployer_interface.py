@@ -1,12 +1,22 @@
-from typing import List, Optional
+from typing import Callable, Dict, List, Optional
 
 from simulation.simulation_error import SimulationError
 
+# Called as soon as a Hydrus model finishes - with the name of the model and its error (None if it succeeded)
+HydrusCompletionCallback = Callable[[str, Optional[SimulationError]], None]
+# Called when a Hydrus model is deployed (ex. its process, container or job starts) - with the name of the model
+HydrusStartCallback = Callable[[str], None]
+
 
 class IAppDeployer:
 
-    def run_hydrus(self, hydrus_dir: str, hydrus_projects: List[str], sim_id: int) -> List[SimulationError]:
+    def run_hydrus(self, hydrus_dir: str, hydrus_projects: List[str], sim_id: int,
+                   on_model_finished: Optional[HydrusCompletionCallback] = None,
+                   on_model_started: Optional[HydrusStartCallback] = None) -> List[SimulationError]:
         raise Exception("Unimplemented method!")
 
     def run_modflow(self, modflow_dir: str, nam_file: str, sim_id: int) -> Optional[SimulationError]:
         raise Exception("Unimplemented method!")
+
+    def get_engine_versions(self) -> Dict[str, str]:
+        raise Exception("Unimplemented method!")
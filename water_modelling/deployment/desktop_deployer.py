@@ -1,48 +1,50 @@
+import functools
 import os
 from concurrent.futures import ThreadPoolExecutor
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 from modflow.modflow_desktop_deployer import ModflowDesktopDeployer
-from deployment.app_deployer_interface import IAppDeployer
+from deployment.app_deployer_interface import HydrusCompletionCallback, HydrusStartCallback, IAppDeployer
 
-from hydrus.desktop.hydrus_multi_deployer import HydrusLocalMultiDeployer
+from hydrus.desktop import hydrus_process_pool
 
 import server.local_configuration_dao as lcd
+from app_config import deployment_config
+from simulation import cancellation, simulation_metrics
 from simulation.simulation_error import SimulationError
+from simulation.simulation_metrics import Measurement
+from simulation.simulation_registry import HYDRUS_STAGE, MODFLOW_STAGE
+from utils import process_utils
 
 
 class DesktopDeployer(IAppDeployer):
 
-    def run_hydrus(self, hydrus_dir: str, hydrus_projects: List[str], sim_id: int) -> List[SimulationError]:
+    def run_hydrus(self, hydrus_dir: str, hydrus_projects: List[str], sim_id: int,
+                   on_model_finished: Optional[HydrusCompletionCallback] = None,
+                   on_model_started: Optional[HydrusStartCallback] = None) -> List[SimulationError]:
         """
-        Run all hydrus simulations in system shell processes
+        Run hydrus simulations as a bounded amount of processes (see deployment_config.DESKTOP_HYDRUS_PROCESSES)
         @param hydrus_dir: Directory containing projects inside main project
         @param hydrus_projects: Name of projects inside hydrus_dir
         @param sim_id: ID of the simulation
+        @param on_model_finished: Called when a simulation finishes (in order of completion)
+        @param on_model_started: Called when the process of a simulation starts
         @return: List of errors that occurred during Hydrus simulations (one per simulation)
         """
-        hydrus_count = len(hydrus_projects)
-        hydrus_volumes_paths = []
-        for project_name in hydrus_projects:
-            hydrus_project_path = os.path.join(hydrus_dir, project_name)
-            hydrus_volumes_paths.append(hydrus_project_path)
-
         hydrus_exe_path = lcd.read_configuration()["hydrus_exe"]
-        multi_deployer = HydrusLocalMultiDeployer(hydrus_exe_path, hydrus_volumes_paths)
-
-        multi_deployer.run()  # run all hydrus instances
-        hydrus_instances = multi_deployer.get_hydrus_instances()
-        with ThreadPoolExecutor(max_workers=hydrus_count) as exe:
-            potential_simulation_errors = []
-            for instance in hydrus_instances:
-                potential_simulation_errors.append(exe.submit(instance.wait_for_termination))
+        max_processes = deployment_config.DESKTOP_HYDRUS_PROCESSES or process_utils.get_physical_cpu_count()
+        process_pool = hydrus_process_pool.HydrusProcessPool(hydrus_exe_path, max_processes)
 
-            simulation_errors = []
-            for future in potential_simulation_errors:
-                error = future.result()
-                if error:
-                    simulation_errors.append(error)
-            return simulation_errors
+        metrics = simulation_metrics.get_metrics()
+        with metrics.measure(sim_id, HYDRUS_STAGE, "run"):
+            simulation_errors = process_pool.run(hydrus_dir, hydrus_projects, on_model_finished,
+                                                 cancellation.get_token(sim_id), deployment_config.HYDRUS_MODEL_TIMEOUT,
+                                                 on_model_started)
+        for project_name, seconds in process_pool.durations.items():
+            # CPU time of the Hydrus process is known if it was reaped by the pool (not on Windows)
+            metrics.record(sim_id, Measurement(HYDRUS_STAGE, "wait_for_termination", project_name, seconds,
+                                               process_pool.cpu_seconds.get(project_name), None, None))
+        return simulation_errors
 
     def run_modflow(self, modflow_dir: str, nam_file: str, sim_id) -> Optional[SimulationError]:
         """
@@ -54,14 +56,35 @@ class DesktopDeployer(IAppDeployer):
         """
         modflow_exe_path = lcd.read_configuration()["modflow_exe"]
         modflow_deployer = ModflowDesktopDeployer(modflow_exe_path, modflow_dir, nam_file)
-        modflow_deployer.run()  # run modflow simulation
+        cancellation_token = cancellation.get_token(sim_id)
+        metrics = simulation_metrics.get_metrics()
+        with metrics.measure(sim_id, MODFLOW_STAGE, "run"):
+            modflow_deployer.run()  # run modflow simulation
         with ThreadPoolExecutor(max_workers=1) as exe:
-            error_future = exe.submit(modflow_deployer.wait_for_termination)
+            error_future = exe.submit(metrics.measured(
+                functools.partial(modflow_deployer.wait_for_termination, cancellation_token,
+                                  deployment_config.MODFLOW_MODEL_TIMEOUT),
+                sim_id, MODFLOW_STAGE, "wait_for_termination", nam_file))
             error = error_future.result()
             if error:
                 return error
         return None
 
+    def get_engine_versions(self) -> Dict[str, str]:
+        """
+        @return: Identity of Hydrus and Modflow executables (path, size and modification time)
+        """
+        configuration = lcd.read_configuration()
+        return {engine: DesktopDeployer._describe_executable(configuration[engine + "_exe"])
+                for engine in ["hydrus", "modflow"]}
+
+    @staticmethod
+    def _describe_executable(exe_path: Optional[str]) -> str:
+        if not exe_path or not os.path.isfile(exe_path):
+            return str(exe_path)
+        stat = os.stat(exe_path)
+        return f"{exe_path}:{stat.st_size}:{stat.st_mtime_ns}"
+
 
 def create() -> DesktopDeployer:
     return DesktopDeployer()
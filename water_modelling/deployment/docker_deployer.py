@@ -1,14 +1,23 @@
+import functools
 import os
 import uuid
-from concurrent.futures import ThreadPoolExecutor
-from typing import List, Optional
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional, Union
 
 import docker
 
-from deployment.app_deployer_interface import IAppDeployer
+from app_config import deployment_config
+from deployment.app_deployer_interface import HydrusCompletionCallback, HydrusStartCallback, IAppDeployer
+from deployment.docker_worker_pool import WORKER_WORKSPACE_MOUNT, DockerWorkerPool, WorkerRun
+from deployment.resource_packer import ResourcePacker, ResourceRequest
+from hydrus import hydrus_log_analyzer, hydrus_utils
+from hydrus.docker.hydrus_docker_deployer import HydrusDockerContainerDeployer
 from hydrus.docker.hydrus_multi_docker_deployer import HydrusDockerMultiContainerDeployer
+from modflow import modflow_log_analyzer
 from modflow.modflow_docker_deployer import ModflowContainerDeployer
+from simulation import cancellation, simulation_metrics
 from simulation.simulation_error import SimulationError
+from simulation.simulation_registry import HYDRUS_STAGE, MODFLOW_STAGE
 from utils import path_formatter
 
 
@@ -18,6 +27,12 @@ class DockerDeployer(IAppDeployer):
 
     HYDRUS_IMAGES = ["watermodelling/hydrus-modflow-synergy-engine:hydrus1d_linux"]
 
+    # Hydrus reads the model directory from LEVEL_01.DIR in its working directory - every run in a worker gets
+    # its own working directory, so runs don't depend on each other ($1 - model directory inside the worker)
+    HYDRUS_WORKER_SCRIPT = 'run_dir=$(mktemp -d) && cd "$run_dir" && echo "$1" > LEVEL_01.DIR && echo | /hydrus; ' \
+                           'status=$?; cd / && rm -rf "$run_dir"; exit $status'
+    WORKER_LOG_FILE = "simulation.log"  # log of a run in a worker, saved in the model directory
+
     def __init__(self):
         self.docker_client = docker.APIClient()
 
@@ -32,7 +47,25 @@ class DockerDeployer(IAppDeployer):
         self.hydrus_image = DockerDeployer.HYDRUS_IMAGES[0]
         self._set_modflow(0)
 
-    def run_hydrus(self, hydrus_dir: str, hydrus_projects: List[str], sim_id: int) -> List[SimulationError]:
+        self.hydrus_resources = ResourceRequest(deployment_config.DOCKER_HYDRUS_CPUS,
+                                                deployment_config.DOCKER_HYDRUS_MEMORY)
+        self.modflow_resources = ResourceRequest(deployment_config.DOCKER_MODFLOW_CPUS,
+                                                 deployment_config.DOCKER_MODFLOW_MEMORY)
+        self.packer = self._create_packer()
+
+        self.hydrus_pool: Optional[DockerWorkerPool] = None
+        self.modflow_pool: Optional[DockerWorkerPool] = None
+        if deployment_config.DOCKER_WORKER_POOL_SIZE:
+            self.hydrus_pool = self._create_worker_pool(self.hydrus_image, "hydrus", self.hydrus_resources)
+            self.modflow_pool = self._create_worker_pool(self.modflow_image, "modflow", self.modflow_resources)
+
+    def run_hydrus(self, hydrus_dir: str, hydrus_projects: List[str], sim_id: int,
+                   on_model_finished: Optional[HydrusCompletionCallback] = None,
+                   on_model_started: Optional[HydrusStartCallback] = None) -> List[SimulationError]:
+        if self.hydrus_pool:
+            return self._run_hydrus_in_workers(hydrus_dir, hydrus_projects, sim_id, on_model_finished,
+                                               on_model_started)
+
         project_name = path_formatter.extract_project_name(hydrus_dir)
         hydrus_volumes_paths = []
         hydrus_container_names = []
@@ -49,21 +82,26 @@ class DockerDeployer(IAppDeployer):
         multi_container_deployer = HydrusDockerMultiContainerDeployer(docker_deployer=self,
                                                                       hydrus_projects_paths=hydrus_volumes_paths,
                                                                       container_names=hydrus_container_names)
-        hydrus_containers = multi_container_deployer.run()  # run all hydrus containers
-
-        with ThreadPoolExecutor(max_workers=len(hydrus_containers)) as exe:
-            potential_simulation_errors = []
-            for container in hydrus_containers:
-                potential_simulation_errors.append(exe.submit(container.wait_for_termination))
+        cancellation_token = cancellation.get_token(sim_id)
+        containers = sorted(zip(multi_container_deployer.hydrus_instances, hydrus_projects), reverse=True,
+                            key=lambda container_and_name: hydrus_utils.estimate_simulation_cost(
+                                os.path.join(hydrus_dir, container_and_name[1])))  # the longest ones start first
 
-            simulation_errors = []
-            for future in potential_simulation_errors:
-                error = future.result()
-                if error:
-                    simulation_errors.append(error)
-            return simulation_errors
+        with ThreadPoolExecutor(max_workers=len(containers)) as exe:
+            potential_simulation_errors = {}
+            for container, hydrus_model_name in containers:
+                run_container = functools.partial(self._run_container, container, HYDRUS_STAGE, hydrus_model_name,
+                                                  sim_id, deployment_config.HYDRUS_MODEL_TIMEOUT)
+                potential_simulation_errors[exe.submit(
+                    self._run_packed, self.hydrus_resources, False, cancellation_token, hydrus_model_name, "Hydrus",
+                    DockerDeployer._notify_started(run_container, hydrus_model_name, on_model_started))] \
+                    = hydrus_model_name
+            return DockerDeployer._collect_hydrus_errors(potential_simulation_errors, on_model_finished)
 
     def run_modflow(self, modflow_dir: str, nam_file: str, sim_id) -> Optional[SimulationError]:
+        if self.modflow_pool:
+            return self._run_modflow_in_worker(modflow_dir, nam_file, sim_id)
+
         project_name = path_formatter.extract_project_name(modflow_dir)
         modflow_model_name = path_formatter.extract_hydrological_model_name(modflow_dir)
         modflow_container_name = f"{sim_id}-{project_name}-modflow-{modflow_model_name}-{uuid.uuid4().hex}"
@@ -74,14 +112,153 @@ class DockerDeployer(IAppDeployer):
 
         modflow_deployer = ModflowContainerDeployer(docker_deployer=self, path=modflow_volume_path,
                                                     name_file=nam_file, container_name=modflow_container_name)
-        modflow_deployer.run()  # run modflow container
-        with ThreadPoolExecutor(max_workers=1) as exe:
-            error_future = exe.submit(modflow_deployer.wait_for_termination)
-            error = error_future.result()
-            if error:
-                return error
+        run_container = functools.partial(self._run_container, modflow_deployer, MODFLOW_STAGE, nam_file, sim_id,
+                                          deployment_config.MODFLOW_MODEL_TIMEOUT)
+        return self._run_packed(self.modflow_resources, True, cancellation.get_token(sim_id), modflow_model_name,
+                                "Modflow", run_container)
+
+    def _run_container(self, deployer: Union[HydrusDockerContainerDeployer, ModflowContainerDeployer], stage: str,
+                       model_name: str, sim_id: int, timeout: Optional[float]) -> Optional[SimulationError]:
+        metrics = simulation_metrics.get_metrics()
+        with metrics.measure(sim_id, stage, "run", model_name):
+            deployer.run()  # run the container
+        with metrics.measure(sim_id, stage, "wait_for_termination", model_name):
+            return deployer.wait_for_termination(cancellation.get_token(sim_id), timeout)
+
+    def _run_packed(self, resources: ResourceRequest, priority: bool,
+                    cancellation_token: cancellation.CancellationToken, model_name: str, engine: str,
+                    run: Callable[[], Optional[SimulationError]]) -> Optional[SimulationError]:
+        """
+        Run the simulation once its resources fit the host budget (see deployment_config.DOCKER_HOST_CPUS)
+        @param priority: True for Modflow - it may use resources reserved for it and starts before waiting Hydrus models
+        @return: Error of the simulation (also if it was cancelled while waiting), None if it was successful
+        """
+        granted = self.packer.acquire(resources, priority, cancellation_token)
+        if granted is None:
+            return SimulationError(model_name, f"{engine} simulation was cancelled: {cancellation_token.reason}")
+        try:
+            return run()
+        finally:
+            self.packer.release(granted)
+
+    def _run_hydrus_in_workers(self, hydrus_dir: str, hydrus_projects: List[str], sim_id: int,
+                               on_model_finished: Optional[HydrusCompletionCallback],
+                               on_model_started: Optional[HydrusStartCallback]) -> List[SimulationError]:
+        """
+        Run hydrus simulations in warm worker containers (see deployment_config.DOCKER_WORKER_POOL_SIZE)
+        """
+        cancellation_token = cancellation.get_token(sim_id)
+        metrics = simulation_metrics.get_metrics()
+        with ThreadPoolExecutor(max_workers=self.hydrus_pool.size) as exe:
+            potential_simulation_errors = {}
+            for hydrus_model_name in hydrus_projects:
+                run_in_worker = metrics.measured(
+                    functools.partial(self._run_hydrus_model_in_worker, os.path.join(hydrus_dir, hydrus_model_name),
+                                      cancellation_token),
+                    sim_id, HYDRUS_STAGE, "run_in_worker", hydrus_model_name)
+                potential_simulation_errors[exe.submit(
+                    self._run_packed, self.hydrus_resources, False, cancellation_token, hydrus_model_name, "Hydrus",
+                    DockerDeployer._notify_started(run_in_worker, hydrus_model_name, on_model_started))] \
+                    = hydrus_model_name
+            return DockerDeployer._collect_hydrus_errors(potential_simulation_errors, on_model_finished)
+
+    def _run_hydrus_model_in_worker(self, model_dir: str, cancellation_token: cancellation.CancellationToken) \
+            -> Optional[SimulationError]:
+        model_path = WORKER_WORKSPACE_MOUNT + path_formatter.extract_path_inside_workspace(model_dir)
+        worker_run = self.hydrus_pool.run(["sh", "-c", DockerDeployer.HYDRUS_WORKER_SCRIPT, "hydrus", model_path],
+                                          cancellation_token=cancellation_token,
+                                          timeout=deployment_config.HYDRUS_MODEL_TIMEOUT)
+        return DockerDeployer._analyze_worker_run(model_dir, os.path.basename(model_dir), "Hydrus", worker_run,
+                                                  hydrus_log_analyzer.analyze_log)
+
+    def _run_modflow_in_worker(self, modflow_dir: str, nam_file: str, sim_id: int) -> Optional[SimulationError]:
+        """
+        Run modflow simulation in a warm worker container (see deployment_config.DOCKER_WORKER_POOL_SIZE)
+        """
+        cancellation_token = cancellation.get_token(sim_id)
+        model_name = path_formatter.extract_hydrological_model_name(modflow_dir)
+        run_in_worker = simulation_metrics.get_metrics().measured(
+            functools.partial(self._run_modflow_model_in_worker, modflow_dir, model_name, nam_file, cancellation_token),
+            sim_id, MODFLOW_STAGE, "run_in_worker", nam_file)
+        return self._run_packed(self.modflow_resources, True, cancellation_token, model_name, "Modflow", run_in_worker)
+
+    def _run_modflow_model_in_worker(self, modflow_dir: str, model_name: str, nam_file: str,
+                                     cancellation_token: cancellation.CancellationToken) -> Optional[SimulationError]:
+        model_path = WORKER_WORKSPACE_MOUNT + path_formatter.extract_path_inside_workspace(modflow_dir)
+        worker_run = self.modflow_pool.run([self.modflow_version, nam_file], workdir=model_path,
+                                           cancellation_token=cancellation_token,
+                                           timeout=deployment_config.MODFLOW_MODEL_TIMEOUT)
+        return DockerDeployer._analyze_worker_run(modflow_dir, model_name, "Modflow", worker_run,
+                                                  modflow_log_analyzer.analyze_log)
+
+    def _create_worker_pool(self, image: str, engine: str, resources: ResourceRequest) -> DockerWorkerPool:
+        return DockerWorkerPool(self.docker_client, image, self.workspace_volume,
+                                name=f"{os.environ['HOSTNAME']}-{engine}",
+                                size=deployment_config.DOCKER_WORKER_POOL_SIZE,
+                                max_runs=deployment_config.DOCKER_WORKER_MAX_RUNS, resources=resources)
+
+    def _create_packer(self) -> ResourcePacker:
+        """
+        @return: Packer of containers on the Docker host - its budget defaults to all CPUs and memory of the host
+        """
+        host_info = self.docker_client.info()
+        budget = ResourceRequest(deployment_config.DOCKER_HOST_CPUS or host_info["NCPU"],
+                                 deployment_config.DOCKER_HOST_MEMORY or host_info["MemTotal"])
+        reserved = ResourceRequest(self.modflow_resources.cpus * deployment_config.DOCKER_MODFLOW_RESERVED_RUNS,
+                                   self.modflow_resources.memory * deployment_config.DOCKER_MODFLOW_RESERVED_RUNS)
+        print(f"Docker host budget: {budget.cpus} CPUs, {budget.memory} bytes of memory")  # TODO: Logger
+        return ResourcePacker(budget, reserved)
+
+    @staticmethod
+    def _analyze_worker_run(model_dir: str, model_name: str, engine: str, worker_run: WorkerRun,
+                            analyze_log: Callable[[str, List[str]], Optional[SimulationError]]) \
+            -> Optional[SimulationError]:
+        """
+        Save the log of the run in the model directory and check it for errors
+        @return: Error of the simulation (also if the run failed), None if it was successful
+        """
+        try:
+            with open(os.path.join(model_dir, DockerDeployer.WORKER_LOG_FILE), 'w') as handle:
+                handle.write(worker_run.log)
+        except OSError as err:
+            print(f"Log of {engine} simulation can't be saved: {err}")  # TODO: Logger
+        if worker_run.error:
+            return SimulationError(model_name, f"{engine} simulation {worker_run.error}")
+
+        simulation_error = analyze_log(model_name, worker_run.log.split('\n'))
+        if simulation_error:
+            print(f"{model_dir}: error occurred: {simulation_error.error_description}")
+            return simulation_error
+        print(f"{model_dir}: calculations completed successfully")
         return None
 
+    @staticmethod
+    def _notify_started(run: Callable[[], Optional[SimulationError]], model_name: str,
+                        on_model_started: Optional[HydrusStartCallback]) -> Callable[[], Optional[SimulationError]]:
+        """
+        @return: Function calling on_model_started before the run - when the model got its resources and starts
+        """
+        def notified_run() -> Optional[SimulationError]:
+            if on_model_started:
+                on_model_started(model_name)
+            return run()
+        return notified_run
+
+    @staticmethod
+    def _collect_hydrus_errors(potential_simulation_errors: Dict[Future, str],
+                               on_model_finished: Optional[HydrusCompletionCallback]) -> List[SimulationError]:
+        simulation_errors = []
+        for future in as_completed(potential_simulation_errors):
+            error = future.result()
+            if error:
+                simulation_errors.append(error)
+            if on_model_finished:
+                on_model_finished(potential_simulation_errors[future], error)
+        return simulation_errors
+
+    def get_engine_versions(self) -> Dict[str, str]:
+        return {"hydrus": self.hydrus_image, "modflow": self.modflow_image}
+
     def _set_modflow(self, i: int):
         self.modflow_version = DockerDeployer.MODFLOW_VERSIONS[i]
         self.modflow_image = DockerDeployer.MODFLOW_IMAGES[i]
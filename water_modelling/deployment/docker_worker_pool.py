@@ -0,0 +1,200 @@
+import threading
+import uuid
+from dataclasses import dataclass
+from typing import List, Optional
+
+from docker import APIClient
+from docker.errors import APIError
+from requests.exceptions import RequestException
+
+from deployment import resource_packer
+from deployment.resource_packer import ResourceRequest
+from simulation.cancellation import CancellationToken
+
+# Warm Docker workers - long-lived containers with the whole workspace mounted, which run models with
+# `docker exec` instead of a container created, started and removed for every model. A worker is recycled
+# (removed and lazily replaced) after max_runs runs or after a run which failed.
+WORKER_WORKSPACE_MOUNT = "/workspace"  # workspace directory inside workers
+WORKER_LABEL = "hydrus-modflow-synergy-engine.worker"  # label of worker containers, its value is the pool name
+ACQUIRE_CHECK_INTERVAL = 1  # seconds between checks whether a simulation waiting for a worker was cancelled
+
+
+@dataclass
+class WorkerRun:
+    log: str                                # output of the command (stdout and stderr)
+    exit_code: Optional[int]                # None if the command didn't finish
+    error: Optional[str]                    # why the run failed (ex. "timed out after 60 seconds"), None if it finished
+
+
+class DockerWorker:
+
+    def __init__(self, container_id: str, name: str):
+        self.container_id = container_id
+        self.name = name
+        self.runs = 0
+
+
+class DockerWorkerPool:
+
+    def __init__(self, docker_client: APIClient, image: str, workspace_volume: str, name: str, size: int,
+                 max_runs: int, resources: Optional[ResourceRequest] = None):
+        """
+        @param docker_client: Docker client
+        @param image: Image of workers - it needs the tail command to keep a worker alive
+        @param workspace_volume: Path to the workspace on Docker host, mounted as WORKER_WORKSPACE_MOUNT
+        @param name: Name of the pool (unique for the application instance) - workers left by a previous instance
+            of the pool are removed
+        @param size: Maximal amount of workers
+        @param max_runs: Amount of runs after which a worker is recycled
+        @param resources: CPU and memory limits of a worker, no limits if None
+        """
+        self.docker_client = docker_client
+        self.image = image
+        self.workspace_volume = workspace_volume
+        self.name = name
+        self.size = max(1, size)
+        self.max_runs = max(1, max_runs)
+        self.resources = resources
+        self._workers: List[DockerWorker] = []  # all live workers
+        self._idle: List[DockerWorker] = []
+        self._creating = 0  # workers being created (counted against the size)
+        self._condition = threading.Condition()
+        self._remove_stale_workers()
+
+    def run(self, command: List[str], workdir: Optional[str] = None,
+            cancellation_token: Optional[CancellationToken] = None, timeout: Optional[float] = None) -> WorkerRun:
+        """
+        Run the command in a worker (blocking) - waits until a worker is free if all of them are busy.
+        @param command: Command with arguments
+        @param workdir: Working directory of the command inside the worker
+        @param cancellation_token: Token of the simulation - the worker is removed when it's cancelled
+        @param timeout: Time limit of the command (in seconds, without waiting for a worker), no limit if None
+        @return: Output and exit code of the command, or why it failed
+        """
+        cancellation_token = cancellation_token or CancellationToken()
+        try:
+            worker = self._acquire(cancellation_token)
+        except (APIError, RequestException) as err:
+            return WorkerRun("", None, f"failed, worker couldn't be started: {err}")
+        if worker is None:
+            return WorkerRun("", None, f"was cancelled: {cancellation_token.reason}")
+
+        timed_out = threading.Event()
+
+        def kill_on_timeout():
+            timed_out.set()
+            self._remove(worker)
+
+        log, exit_code, failure = "", None, None
+        timer = threading.Timer(timeout, kill_on_timeout) if timeout is not None else None
+        with cancellation_token.on_cancel(lambda: self._remove(worker)):
+            if timer:
+                timer.daemon = True
+                timer.start()
+            try:
+                exec_id = self.docker_client.exec_create(worker.container_id, command, workdir=workdir)["Id"]
+                # the output is streamed - the stream ends when the command finishes (or the worker is removed)
+                log = b"".join(self.docker_client.exec_start(exec_id, stream=True)).decode("UTF-8", "replace")
+                exit_code = self.docker_client.exec_inspect(exec_id)["ExitCode"]
+            except (APIError, RequestException) as err:
+                failure = err
+            finally:
+                if timer:
+                    timer.cancel()
+
+        self._release(worker, failed=exit_code != 0)
+        if timed_out.is_set():
+            return WorkerRun(log, None, f"timed out after {timeout} seconds")
+        if cancellation_token.is_cancelled():
+            return WorkerRun(log, None, f"was cancelled: {cancellation_token.reason}")
+        if failure is not None:
+            return WorkerRun(log, None, f"failed, worker {worker.name} stopped responding: {failure}")
+        return WorkerRun(log, exit_code, None)
+
+    def close(self) -> None:
+        """
+        Remove all workers.
+        """
+        with self._condition:
+            workers, self._workers, self._idle = self._workers, [], []
+        for worker in workers:
+            self._remove_container(worker)
+
+    def _acquire(self, cancellation_token: CancellationToken) -> Optional[DockerWorker]:
+        """
+        @return: Idle worker (created if the pool isn't full), None if the token was cancelled meanwhile
+        @raise APIError, RequestException: if a new worker can't be started
+        """
+        with self._condition:
+            while not self._idle and len(self._workers) + self._creating >= self.size:
+                if cancellation_token.is_cancelled():
+                    return None
+                self._condition.wait(ACQUIRE_CHECK_INTERVAL)
+            if cancellation_token.is_cancelled():
+                return None
+            if self._idle:
+                return self._idle.pop()
+            self._creating += 1
+
+        worker = None
+        try:
+            worker = self._create_worker()
+            return worker
+        finally:
+            with self._condition:
+                self._creating -= 1
+                if worker:
+                    self._workers.append(worker)
+                self._condition.notify()
+
+    def _release(self, worker: DockerWorker, failed: bool) -> None:
+        worker.runs += 1
+        with self._condition:
+            recycled = failed or worker.runs >= self.max_runs or worker not in self._workers
+            if not recycled:
+                self._idle.append(worker)
+            self._condition.notify()
+        if recycled:
+            self._remove(worker)
+
+    def _remove(self, worker: DockerWorker) -> None:
+        """
+        Remove the worker (killing the command it runs) - a new one is created when it's needed.
+        """
+        with self._condition:
+            if worker not in self._workers:
+                return  # already removed
+            self._workers.remove(worker)
+            if worker in self._idle:
+                self._idle.remove(worker)
+            self._condition.notify()
+        self._remove_container(worker)
+
+    def _create_worker(self) -> DockerWorker:
+        name = f"{self.name}-worker-{uuid.uuid4().hex}"
+        print(f"Starting Docker worker {name}")  # TODO: Logger
+        limits = resource_packer.get_host_config_limits(self.resources) if self.resources else {}
+        host_config = self.docker_client.create_host_config(
+            binds=[f"{self.workspace_volume}:{WORKER_WORKSPACE_MOUNT}"], **limits)
+        container = self.docker_client.create_container(image=self.image, entrypoint=["tail", "-f", "/dev/null"],
+                                                        volumes=[WORKER_WORKSPACE_MOUNT], host_config=host_config,
+                                                        labels={WORKER_LABEL: self.name}, name=name)
+        try:
+            self.docker_client.start(container)
+        except (APIError, RequestException):
+            self.docker_client.remove_container(container, force=True)
+            raise
+        return DockerWorker(container["Id"], name)
+
+    def _remove_container(self, worker: DockerWorker) -> None:
+        try:
+            self.docker_client.remove_container(worker.container_id, force=True)
+        except (APIError, RequestException) as err:
+            print(f"Removing Docker worker {worker.name} failed: {err}")  # TODO: Logger
+
+    def _remove_stale_workers(self) -> None:
+        try:
+            for container in self.docker_client.containers(all=True, filters={"label": f"{WORKER_LABEL}={self.name}"}):
+                self.docker_client.remove_container(container["Id"], force=True)
+        except (APIError, RequestException) as err:
+            print(f"Removing stale Docker workers of {self.name} failed: {err}")  # TODO: Logger
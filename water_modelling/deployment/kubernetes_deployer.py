@@ -1,19 +1,22 @@
 import os
 import uuid
-from concurrent.futures import ThreadPoolExecutor
-from typing import List, Optional
+from concurrent.futures import as_completed
+from typing import Dict, List, Optional
 
 from kubernetes import config, client
 
 from app_config import deployment_config
-from deployment.app_deployer_interface import IAppDeployer
+from deployment.app_deployer_interface import HydrusCompletionCallback, HydrusStartCallback, IAppDeployer
 from hydrus import hydrus_log_analyzer
 
 from hydrus.kubernetes.hydrus_multi_job_deployer import HydrusMultiJobDeployer
 from kubernetes_controller.job_controller import JobController
 from modflow import modflow_log_analyzer
 from modflow.modflow_job_deployer import ModflowJobDeployer
+from simulation import cancellation, simulation_metrics
 from simulation.simulation_error import SimulationError
+from simulation.simulation_metrics import Measurement
+from simulation.simulation_registry import HYDRUS_STAGE, MODFLOW_STAGE
 from utils import path_formatter
 
 LOG_LINE = str
@@ -41,15 +44,18 @@ class KubernetesDeployer(IAppDeployer):
         self.batch_api_instance = client.BatchV1Api()
         self.namespace = 'default'
 
-    def run_hydrus(self, hydrus_dir: str, hydrus_projects: List[str], sim_id: int) -> List[SimulationError]:
+    def run_hydrus(self, hydrus_dir: str, hydrus_projects: List[str], sim_id: int,
+                   on_model_finished: Optional[HydrusCompletionCallback] = None,
+                   on_model_started: Optional[HydrusStartCallback] = None) -> List[SimulationError]:
         """
         Run all hydrus simulations in kubernetes cluster
         @param hydrus_dir: Directory containing projects inside main project
         @param hydrus_projects: Name of projects inside hydrus_dir
         @param sim_id: ID of the simulation
+        @param on_model_finished: Called when a simulation finishes (in order of completion)
+        @param on_model_started: Called when the job of a simulation is created
         @return: None
         """
-        hydrus_count = len(hydrus_projects)
         hydrus_job_names = []
         hydrus_job_descriptions = []
         hydrus_volumes_sub_paths = []
@@ -70,20 +76,32 @@ class KubernetesDeployer(IAppDeployer):
                                                     hydrus_projects_paths=hydrus_volumes_sub_paths,
                                                     job_names=hydrus_job_names,
                                                     namespace=self.namespace,
-                                                    job_descriptions=hydrus_job_descriptions)
-
-        deployed_jobs = multi_job_deployer.run()  # run all hydrus jobs inside pods
-        with ThreadPoolExecutor(max_workers=hydrus_count) as exe:
-            # Returns (model_name, [log_lines]), need to preserve (model_name -> log) mapping due to concurrent flow
-            error_info_futures = exe.map(JobController.wait_for_job_termination, deployed_jobs)
-            potential_simulation_errors = [hydrus_log_analyzer.analyze_log(model_name=error_info[0],
-                                                                           log_lines=error_info[1])
-                                           for error_info in error_info_futures]
-            simulation_errors = []
-            for error in potential_simulation_errors:
-                if error:
-                    simulation_errors.append(error)
-            return simulation_errors
+                                                    job_descriptions=hydrus_job_descriptions,
+                                                    labels=JobController.get_labels(sim_id))
+
+        metrics = simulation_metrics.get_metrics()
+        with metrics.measure(sim_id, HYDRUS_STAGE, "run"):
+            deployed_jobs = multi_job_deployer.run()  # run all hydrus jobs inside pods
+        if on_model_started:
+            for _, project_name in zip(deployed_jobs, hydrus_projects):
+                on_model_started(project_name)
+
+        # one controller thread waits for all jobs
+        job_controller = self._create_job_controller(sim_id)
+        # Returns (model_name, [log_lines]), need to preserve (model_name -> log) mapping due to concurrent flow
+        error_info_futures = {job_controller.watch(job, deployment_config.HYDRUS_MODEL_TIMEOUT): project_name
+                              for job, project_name in zip(deployed_jobs, hydrus_projects)}
+        job_controller.start()
+        simulation_errors = []
+        for future in as_completed(error_info_futures):
+            error_info = future.result()
+            error = hydrus_log_analyzer.analyze_log(model_name=error_info[0], log_lines=error_info[1])
+            if error:
+                simulation_errors.append(error)
+            if on_model_finished:
+                on_model_finished(error_info_futures[future], error)
+        KubernetesDeployer._record_durations(job_controller, sim_id, HYDRUS_STAGE)
+        return simulation_errors
 
     def run_modflow(self, modflow_dir: str, nam_file: str, sim_id) -> Optional[SimulationError]:
         """
@@ -101,16 +119,36 @@ class KubernetesDeployer(IAppDeployer):
         modflow_job_description = f"Project={volume_sub_path.split('/modflow/')[0]}, sim-id={str(sim_id)}"
         modflow_deployer = ModflowJobDeployer(kubernetes_deployer=self, sub_path=volume_sub_path,
                                               name_file=nam_file, job_name=modflow_job_name,
-                                              namespace=self.namespace, description=modflow_job_description)
-        modflow_deployer.run()  # run modflow job inside pod
-        with ThreadPoolExecutor(max_workers=1) as exe:
-            error_future = exe.submit(JobController.wait_for_job_termination, modflow_deployer)
-            model_name, log_lines = error_future.result()
-            error = modflow_log_analyzer.analyze_log(model_name, log_lines)
-            if error:
-                return error
+                                              namespace=self.namespace, description=modflow_job_description,
+                                              labels=JobController.get_labels(sim_id))
+        metrics = simulation_metrics.get_metrics()
+        with metrics.measure(sim_id, MODFLOW_STAGE, "run"):
+            modflow_deployer.run()  # run modflow job inside pod
+
+        job_controller = self._create_job_controller(sim_id)
+        error_future = job_controller.watch(modflow_deployer, deployment_config.MODFLOW_MODEL_TIMEOUT)
+        job_controller.start()
+        model_name, log_lines = error_future.result()
+        KubernetesDeployer._record_durations(job_controller, sim_id, MODFLOW_STAGE)
+        error = modflow_log_analyzer.analyze_log(model_name, log_lines)
+        if error:
+            return error
         return None
 
+    def _create_job_controller(self, sim_id: int) -> JobController:
+        return JobController(self.batch_api_instance, self.core_api_instance, self.namespace, sim_id,
+                             cancellation.get_token(sim_id))
+
+    @staticmethod
+    def _record_durations(job_controller: JobController, sim_id: int, stage: str) -> None:
+        metrics = simulation_metrics.get_metrics()
+        for model_name, seconds in job_controller.durations.items():
+            # CPU time and I/O of the job aren't measured
+            metrics.record(sim_id, Measurement(stage, "wait_for_termination", model_name, seconds, None, None, None))
+
+    def get_engine_versions(self) -> Dict[str, str]:
+        return {"hydrus": self.hydrus_image, "modflow": self.modflow_image}
+
     def _set_modflow(self, i: int):
         self.modflow_version = KubernetesDeployer.MODFLOW_VERSIONS[i]
         self.modflow_image = KubernetesDeployer.MODFLOW_IMAGES[i]
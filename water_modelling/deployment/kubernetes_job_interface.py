@@ -1,5 +1,5 @@
 from __future__ import annotations
-from typing import Optional
+from typing import Dict, Optional
 
 from kubernetes.client import BatchV1Api, CoreV1Api, V1JobStatus, V1Pod, V1PodList
 
@@ -14,12 +14,13 @@ if TYPE_CHECKING:
 class IKubernetesJob(IModflowDeployer, IHydrusDeployer):
 
     def __init__(self, kubernetes_deployer: KubernetesDeployer, job_name: str,
-                 sub_path: str, description: str, namespace: str = 'default'):
+                 sub_path: str, description: str, namespace: str = 'default', labels: Optional[Dict[str, str]] = None):
         self.kubernetes_deployer = kubernetes_deployer
         self.sub_path = sub_path
         self.job_name = job_name
         self.namespace = namespace
         self.description = description
+        self.labels = labels or {}  # labels of the job and its pods
 
     def run(self):
         """
@@ -40,6 +41,13 @@ class IKubernetesJob(IModflowDeployer, IHydrusDeployer):
             return None
         return job_status.status
 
+    def delete_job(self) -> None:
+        """
+        Delete the job together with its pods (stops the simulation if it's still running).
+        """
+        self._get_k8s_batch_client().delete_namespaced_job(name=self.job_name, namespace=self.namespace,
+                                                           propagation_policy='Foreground')
+
     def _get_k8s_batch_client(self) -> BatchV1Api:
         """
         Private method used to access k8s batch client (allows for creating jobs).
@@ -0,0 +1,95 @@
+import threading
+from dataclasses import dataclass
+from typing import List, Optional
+
+from simulation.cancellation import CancellationToken
+
+# Packing of containers on the Docker host - a container starts only when its CPU and memory requests fit
+# the host budget together with containers already running. Requests are granted in order, priority requests
+# (Modflow - it's on the critical path of a simulation) first, and only priority requests can use the reserved part
+# of the budget, so Modflow starts as soon as passing finishes even when Hydrus models are waiting.
+ACQUIRE_CHECK_INTERVAL = 1  # seconds between checks whether a simulation waiting for resources was cancelled
+
+
+@dataclass
+class ResourceRequest:
+    cpus: float                             # CPU cores
+    memory: int                             # bytes
+
+    def fits(self, used: "ResourceRequest", limit: "ResourceRequest") -> bool:
+        return used.cpus + self.cpus <= limit.cpus and used.memory + self.memory <= limit.memory
+
+
+def get_host_config_limits(request: ResourceRequest) -> dict:
+    """
+    @return: Keyword arguments for docker.APIClient.create_host_config limiting the container to the request
+    """
+    return {"nano_cpus": int(request.cpus * 1e9), "mem_limit": request.memory}
+
+
+class _Ticket:
+
+    def __init__(self, request: ResourceRequest, priority: bool):
+        self.request = request
+        self.priority = priority
+
+
+class ResourcePacker:
+
+    def __init__(self, budget: ResourceRequest, reserved: ResourceRequest):
+        """
+        @param budget: Resources of the host shared by all containers
+        @param reserved: Part of the budget only priority requests can use
+        """
+        self.budget = budget
+        self.reserved = reserved
+        if reserved.cpus >= budget.cpus or reserved.memory >= budget.memory:
+            print("Reserved resources exceed the budget, nothing is reserved")  # TODO: Logger
+            self.reserved = ResourceRequest(0, 0)
+        self.used = ResourceRequest(0, 0)
+        self._queue: List[_Ticket] = []  # waiting requests in order they're granted
+        self._condition = threading.Condition()
+
+    def acquire(self, request: ResourceRequest, priority: bool = False,
+                cancellation_token: Optional[CancellationToken] = None) -> Optional[ResourceRequest]:
+        """
+        Wait until the request fits the budget (blocking) - a request bigger than the whole budget available to it
+        is reduced to that budget.
+        @param request: Resources of the container
+        @param priority: True if the request may use the reserved part of the budget (and goes before other ones)
+        @param cancellation_token: Token of the simulation - waiting stops when it's cancelled
+        @return: Granted resources (to be released with release()), None if the token was cancelled meanwhile
+        """
+        limit = self._get_limit(priority)
+        ticket = _Ticket(ResourceRequest(min(request.cpus, limit.cpus), min(request.memory, limit.memory)), priority)
+        with self._condition:
+            position = len(self._queue)
+            if priority:
+                position = next((idx for idx, queued in enumerate(self._queue) if not queued.priority), position)
+            self._queue.insert(position, ticket)
+
+            while self._queue[0] is not ticket or not ticket.request.fits(self.used, limit):
+                if cancellation_token and cancellation_token.is_cancelled():
+                    self._queue.remove(ticket)
+                    self._condition.notify_all()
+                    return None
+                self._condition.wait(ACQUIRE_CHECK_INTERVAL)
+
+            self._queue.pop(0)
+            self.used = ResourceRequest(round(self.used.cpus + ticket.request.cpus, 6),
+                                        self.used.memory + ticket.request.memory)
+            self._condition.notify_all()  # the next request may fit as well
+            return ticket.request
+
+    def release(self, granted: ResourceRequest) -> None:
+        """
+        @param granted: Resources returned by acquire()
+        """
+        with self._condition:
+            self.used = ResourceRequest(round(self.used.cpus - granted.cpus, 6), self.used.memory - granted.memory)
+            self._condition.notify_all()
+
+    def _get_limit(self, priority: bool) -> ResourceRequest:
+        if priority:
+            return self.budget
+        return ResourceRequest(self.budget.cpus - self.reserved.cpus, self.budget.memory - self.reserved.memory)
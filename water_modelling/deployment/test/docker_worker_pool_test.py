@@ -0,0 +1,117 @@
+import threading
+import time
+import unittest
+
+from docker.errors import APIError
+
+from deployment.docker_worker_pool import WORKER_LABEL, DockerWorkerPool
+from simulation.cancellation import CancellationToken
+
+
+class FakeDockerClient:
+    """
+    Stands in for docker.APIClient - commands are names of fake programs ("ok", "fail", "sleep")
+    """
+
+    def __init__(self, stale_containers=0):
+        self.containers_by_id = {f"stale{idx}": {"running": True} for idx in range(stale_containers)}
+        self.execs = {}
+        self.created = 0
+        self.lock = threading.Lock()
+
+    def containers(self, all, filters):
+        return [{"Id": container_id} for container_id in self.containers_by_id]
+
+    def create_host_config(self, binds):
+        return {"Binds": binds}
+
+    def create_container(self, image, entrypoint, volumes, host_config, labels, name):
+        assert WORKER_LABEL in labels
+        with self.lock:
+            self.created += 1
+            container_id = f"container{self.created}"
+            self.containers_by_id[container_id] = {"running": False}
+        return {"Id": container_id}
+
+    def start(self, container):
+        self.containers_by_id[container["Id"]]["running"] = True
+
+    def remove_container(self, container_id, force):
+        self.containers_by_id.pop(container_id, None)
+
+    def exec_create(self, container_id, command, workdir):
+        if container_id not in self.containers_by_id:
+            raise APIError("No such container")
+        exec_id = f"exec{len(self.execs)}"
+        self.execs[exec_id] = (container_id, command)
+        return {"Id": exec_id}
+
+    def exec_start(self, exec_id, stream):
+        container_id, command = self.execs[exec_id]
+        if command[0] == "sleep":
+            while container_id in self.containers_by_id:  # killed by removing the container
+                time.sleep(0.01)
+            return
+        yield f"{command[0]} in {container_id}\n".encode()
+
+    def exec_inspect(self, exec_id):
+        return {"ExitCode": 1 if self.execs[exec_id][1][0] == "fail" else 0}
+
+
+class DockerWorkerPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = FakeDockerClient(stale_containers=2)
+        self.pool = DockerWorkerPool(self.client, "image", "/workspace", "host-hydrus", size=2, max_runs=3)
+
+    def test_workers_are_reused(self):
+        self.assertEqual(self.client.containers_by_id, {})  # stale workers removed
+
+        runs = [self.pool.run(["ok"]) for _ in range(3)]
+
+        self.assertEqual([run.log for run in runs], ["ok in container1\n"] * 3)
+        self.assertEqual([run.exit_code for run in runs], [0] * 3)
+        self.assertEqual(self.client.created, 1)
+
+    def test_workers_are_recycled(self):
+        self.assertEqual(self.pool.run(["fail"]).exit_code, 1)
+        self.assertNotIn("container1", self.client.containers_by_id)  # failed worker removed
+
+        logs = [self.pool.run(["ok"]).log for _ in range(4)]
+        self.assertEqual(logs, ["ok in container2\n"] * 3 + ["ok in container3\n"])  # after max_runs
+
+        self.pool.close()
+        self.assertEqual(self.client.containers_by_id, {})
+
+    def test_concurrent_runs_are_bounded(self):
+        runs = []
+        threads = [threading.Thread(target=lambda: runs.append(self.pool.run(["ok"]))) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(runs), 10)
+        self.assertTrue(all(run.error is None for run in runs))
+        self.assertLessEqual(len(self.client.containers_by_id), 2)
+
+    def test_timeout(self):
+        run = self.pool.run(["sleep"], timeout=0.1)
+
+        self.assertEqual(run.error, "timed out after 0.1 seconds")
+        self.assertEqual(self.client.containers_by_id, {})
+        self.assertEqual(self.pool.run(["ok"]).log, "ok in container2\n")  # replaced
+
+    def test_cancellation(self):
+        token = CancellationToken()
+        threading.Timer(0.1, token.cancel, args=["Cancelled by user"]).start()
+
+        run = self.pool.run(["sleep"], cancellation_token=token)
+
+        self.assertEqual(run.error, "was cancelled: Cancelled by user")
+        self.assertEqual(self.client.containers_by_id, {})
+        self.assertEqual(self.pool.run(["ok"], cancellation_token=token).error, "was cancelled: Cancelled by user")
+
+
+if __name__ == '__main__':
+    unittest.main()
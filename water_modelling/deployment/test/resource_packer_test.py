@@ -0,0 +1,85 @@
+import threading
+import time
+import unittest
+
+from deployment.resource_packer import ResourcePacker, ResourceRequest, get_host_config_limits
+from simulation.cancellation import CancellationToken
+
+GB = 1024 * 1024 * 1024
+
+
+class ResourcePackerTest(unittest.TestCase):
+
+    def setUp(self):
+        # 8 CPUs and 16 GB, 2 CPUs and 4 GB reserved for priority (Modflow) requests
+        self.packer = ResourcePacker(ResourceRequest(8, 16 * GB), ResourceRequest(2, 4 * GB))
+
+    def _acquire_in_thread(self, request: ResourceRequest, priority: bool = False, token=None):
+        granted = []
+        thread = threading.Thread(target=lambda: granted.append(self.packer.acquire(request, priority, token)))
+        thread.start()
+        return thread, granted
+
+    def test_requests_fit_budget(self):
+        hydrus = ResourceRequest(2, 2 * GB)
+        granted = [self.packer.acquire(hydrus) for _ in range(3)]  # 6 CPUs - budget without the reserve
+
+        thread, waiting = self._acquire_in_thread(hydrus)
+        time.sleep(0.1)
+        self.assertEqual(waiting, [])  # doesn't fit until a request is released
+
+        self.packer.release(granted[0])
+        thread.join(1)
+        self.assertEqual(waiting, [hydrus])
+        self.assertEqual(self.packer.used, ResourceRequest(6, 6 * GB))
+
+    def test_priority_uses_reserve(self):
+        hydrus = ResourceRequest(3, 2 * GB)
+        granted = [self.packer.acquire(hydrus) for _ in range(2)]
+        hydrus_thread, hydrus_waiting = self._acquire_in_thread(hydrus)
+        time.sleep(0.1)
+
+        modflow = self.packer.acquire(ResourceRequest(2, 4 * GB), priority=True)  # doesn't wait for Hydrus
+        self.assertEqual(modflow, ResourceRequest(2, 4 * GB))
+        self.assertEqual(hydrus_waiting, [])
+
+        for request in granted + [modflow]:
+            self.packer.release(request)
+        hydrus_thread.join(1)
+        self.assertEqual(hydrus_waiting, [hydrus])
+
+    def test_priority_goes_first(self):
+        self.packer.acquire(ResourceRequest(6, 2 * GB))
+        hydrus_thread, hydrus_waiting = self._acquire_in_thread(ResourceRequest(4, 2 * GB))
+        time.sleep(0.1)
+        modflow_thread, modflow_waiting = self._acquire_in_thread(ResourceRequest(6, 4 * GB), priority=True)
+        time.sleep(0.1)
+
+        self.packer.release(ResourceRequest(6, 2 * GB))
+        modflow_thread.join(1)
+        self.assertEqual(modflow_waiting, [ResourceRequest(6, 4 * GB)])
+        self.assertEqual(hydrus_waiting, [])  # queued earlier, but Modflow goes first
+
+        self.packer.release(ResourceRequest(6, 4 * GB))
+        hydrus_thread.join(1)
+        self.assertEqual(hydrus_waiting, [ResourceRequest(4, 2 * GB)])
+
+    def test_oversized_request_is_reduced(self):
+        self.assertEqual(self.packer.acquire(ResourceRequest(32, 64 * GB)), ResourceRequest(6, 12 * GB))
+
+    def test_cancellation(self):
+        self.packer.acquire(ResourceRequest(6, 2 * GB))
+        token = CancellationToken()
+        thread, waiting = self._acquire_in_thread(ResourceRequest(1, GB), token=token)
+
+        token.cancel("Cancelled by user")
+        thread.join(5)
+        self.assertEqual(waiting, [None])
+        self.assertEqual(self.packer.used, ResourceRequest(6, 2 * GB))
+
+    def test_host_config_limits(self):
+        self.assertEqual(get_host_config_limits(ResourceRequest(1.5, GB)), {"nano_cpus": 1500000000, "mem_limit": GB})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,8 +4,9 @@ from typing import Optional
 
 from hydrus import hydrus_log_analyzer
 from hydrus.hydrus_deployer_interface import IHydrusDeployer
+from simulation.cancellation import CancellationToken
 from simulation.simulation_error import SimulationError
-from utils import path_formatter
+from utils import path_formatter, process_utils
 
 
 class _HydrusDesktopDeployer(IHydrusDeployer):
@@ -19,12 +20,44 @@ class _HydrusDesktopDeployer(IHydrusDeployer):
     def run(self):
         print(f"Starting Hydrus calculations for: {self.path}")
         with open(self._get_path_to_log(), 'w') as handle:
-            self.proc = subprocess.Popen([self.hydrus_exe_path, self.path], shell=True, text=True,
-                                         stdin=subprocess.PIPE, stdout=handle, stderr=handle)
+            self.proc = subprocess.Popen([self.hydrus_exe_path, self.path], text=True,
+                                         stdin=subprocess.PIPE, stdout=handle, stderr=handle,
+                                         **process_utils.get_process_group_options())
 
-    def wait_for_termination(self) -> Optional[SimulationError]:
-        self.proc.communicate(input="\n")  # Press enter to close program (blocking)
+    def press_enter(self) -> None:
+        """
+        Press enter in advance - Hydrus waits for it before closing, so nobody has to wait for the process to do it.
+        """
+        try:
+            self.proc.stdin.write("\n")
+            self.proc.stdin.close()
+        except OSError:
+            pass  # process already exited
 
+    def wait_for_termination(self, cancellation_token: Optional[CancellationToken] = None,
+                             timeout: Optional[float] = None) -> Optional[SimulationError]:
+        """
+        @param cancellation_token: Token of the simulation - the process is killed when it's cancelled
+        @param timeout: Time limit of the simulation (in seconds), no limit if None
+        @return: Error of the simulation (also if it was cancelled or timed out), None if it was successful
+        """
+        cancellation_token = cancellation_token or CancellationToken()
+        with cancellation_token.on_cancel(lambda: process_utils.kill_process_tree(self.proc)):
+            try:
+                self.proc.communicate(input="\n", timeout=timeout)  # Press enter to close program (blocking)
+            except subprocess.TimeoutExpired:
+                process_utils.kill_process_tree(self.proc)
+                self.proc.communicate()
+                return SimulationError(self._get_model_name(), f"Hydrus simulation timed out after {timeout} seconds")
+        if cancellation_token.is_cancelled():
+            return SimulationError(self._get_model_name(), f"Hydrus simulation was cancelled: "
+                                                           f"{cancellation_token.reason}")
+        return self.analyze_log()
+
+    def analyze_log(self) -> Optional[SimulationError]:
+        """
+        @return: Error of the finished simulation, None if it was successful
+        """
         # analyze output and return SimulationError if made
         with open(self._get_path_to_log(), 'r') as handle:
             log_lines = handle.readlines()
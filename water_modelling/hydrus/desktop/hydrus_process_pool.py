@@ -0,0 +1,122 @@
+import os
+import subprocess
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from hydrus import hydrus_utils
+from hydrus.desktop.hydrus_desktop_deployer import _HydrusDesktopDeployer
+from simulation.cancellation import CancellationToken
+from simulation.simulation_error import SimulationError
+from utils import process_utils
+
+ModelFinishedCallback = Callable[[str, Optional[SimulationError]], None]
+ModelStartedCallback = Callable[[str], None]
+
+
+class HydrusProcessPool:
+    """
+    Runs desktop Hydrus simulations as a bounded amount of processes - the simulations expected to run the longest are
+    started first (so a long one doesn't start last and extend the whole stage), and processes are reaped as
+    the system reports their exit, by the calling thread only.
+    """
+
+    def __init__(self, hydrus_exe_path: str, max_processes: int):
+        """
+        @param hydrus_exe_path: Path to Hydrus executable
+        @param max_processes: Maximal amount of Hydrus processes running at once
+        """
+        self.hydrus_exe_path = hydrus_exe_path
+        self.max_processes = max(1, max_processes)
+        self._running: Dict[str, _HydrusDesktopDeployer] = {}  # model name -> its running simulation
+        self.durations: Dict[str, float] = {}  # model name -> wall time of its process (in seconds)
+        self.cpu_seconds: Dict[str, float] = {}  # model name -> CPU time of its process (not known on Windows)
+        self._lock = threading.Lock()
+
+    def run(self, hydrus_dir: str, model_names: List[str], on_model_finished: Optional[ModelFinishedCallback] = None,
+            cancellation_token: Optional[CancellationToken] = None,
+            timeout: Optional[float] = None,
+            on_model_started: Optional[ModelStartedCallback] = None) -> List[SimulationError]:
+        """
+        Run the simulations and wait until all of them finish (blocking).
+        @param hydrus_dir: Directory containing Hydrus projects
+        @param model_names: Names of projects inside hydrus_dir to simulate
+        @param on_model_finished: Called when a simulation finishes (in order of completion)
+        @param cancellation_token: Token of the simulation - running processes are killed and the rest isn't started
+            when it's cancelled
+        @param timeout: Time limit of every simulation (in seconds), no limit if None
+        @param on_model_started: Called when the process of a simulation starts
+        @return: Errors of the simulations (one per failed simulation)
+        """
+        cancellation_token = cancellation_token or CancellationToken()
+        pending = sorted(model_names, reverse=True,
+                         key=lambda model_name: hydrus_utils.estimate_simulation_cost(
+                             os.path.join(hydrus_dir, model_name)))
+        start_times: Dict[str, float] = {}
+        process_cpu_seconds: Dict[subprocess.Popen, float] = {}
+        simulation_errors = []
+
+        def finish(model_name: str, error: Optional[SimulationError]) -> None:
+            if model_name in start_times:
+                self.durations[model_name] = time.monotonic() - start_times[model_name]
+            if error:
+                simulation_errors.append(error)
+            if on_model_finished:
+                on_model_finished(model_name, error)
+
+        with cancellation_token.on_cancel(self._kill_all):
+            while pending or self._running:
+                while pending and len(self._running) < self.max_processes and not cancellation_token.is_cancelled():
+                    model_name = pending.pop(0)
+                    instance = _HydrusDesktopDeployer(self.hydrus_exe_path, os.path.join(hydrus_dir, model_name))
+                    start_times[model_name] = time.monotonic()
+                    with self._lock:
+                        try:
+                            instance.run()
+                        except OSError as err:
+                            finish(model_name, SimulationError(model_name, f"Hydrus can't be started: {err}"))
+                            continue
+                        self._running[model_name] = instance
+                        if on_model_started:
+                            on_model_started(model_name)
+                        if cancellation_token.is_cancelled():  # cancelled while starting - missed by _kill_all()
+                            process_utils.kill_process_tree(instance.proc)
+                    instance.press_enter()
+                if not self._running:
+                    break
+
+                wait_timeout = None
+                if timeout is not None:
+                    wait_timeout = max(0.0, min(start_times[model_name] for model_name in self._running)
+                                       + timeout - time.monotonic())
+                exited = process_utils.wait_for_any([instance.proc for instance in self._running.values()],
+                                                    wait_timeout, process_cpu_seconds)
+
+                for model_name, instance in list(self._running.items()):
+                    timed_out = timeout is not None and time.monotonic() - start_times[model_name] >= timeout
+                    if instance.proc not in exited and not timed_out:
+                        continue
+                    with self._lock:
+                        del self._running[model_name]
+                    if instance.proc in process_cpu_seconds:
+                        self.cpu_seconds[model_name] = process_cpu_seconds.pop(instance.proc)
+                    if instance.proc not in exited:
+                        process_utils.kill_process_tree(instance.proc)
+                        instance.proc.wait()
+                        finish(model_name, SimulationError(model_name, f"Hydrus simulation timed out after "
+                                                                       f"{timeout} seconds"))
+                    elif cancellation_token.is_cancelled():
+                        finish(model_name, SimulationError(model_name, f"Hydrus simulation was cancelled: "
+                                                                       f"{cancellation_token.reason}"))
+                    else:
+                        finish(model_name, instance.analyze_log())
+
+        for model_name in pending:  # not started because of the cancellation
+            finish(model_name, SimulationError(model_name, f"Hydrus simulation was cancelled: "
+                                                           f"{cancellation_token.reason}"))
+        return simulation_errors
+
+    def _kill_all(self) -> None:
+        with self._lock:
+            for instance in self._running.values():
+                process_utils.kill_process_tree(instance.proc)
@@ -14,3 +14,21 @@ def validate_model(project_path: str):
         if expected_file.lower() not in input_files:
             return False
     return True
+
+
+def estimate_simulation_cost(project_path: str) -> int:
+    """
+    Relative cost of the simulation, used to start the longest simulations first - Hydrus runtime grows with the amount
+    of time-variable boundary records (ATMOSPH.IN) and of profile nodes (PROFILE.DAT), sizes of the files are
+    their cheap proxies.
+    @param project_path: Path to Hydrus project
+    @return: Estimated cost (no unit), 1 if input files can't be read
+    """
+    sizes = {}
+    try:
+        for file in os.listdir(project_path):
+            if file.lower() in ["atmosph.in", "profile.dat"]:
+                sizes[file.lower()] = os.path.getsize(os.path.join(project_path, file))
+    except OSError:
+        return 1
+    return max(1, sizes.get("atmosph.in", 1)) * max(1, sizes.get("profile.dat", 1))
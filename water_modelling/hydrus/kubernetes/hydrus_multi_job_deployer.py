@@ -1,5 +1,5 @@
 from __future__ import annotations
-from typing import List
+from typing import Dict, List, Optional
 
 from hydrus.hydrus_deployer_interface import IHydrusDeployer
 from hydrus.kubernetes.hydrus_job_deployer import _HydrusJobDeployer
@@ -13,11 +13,12 @@ if TYPE_CHECKING:
 class HydrusMultiJobDeployer(IHydrusDeployer):
 
     def __init__(self, kubernetes_deployer: KubernetesDeployer, hydrus_projects_paths: List[str], job_names: List[str],
-                 job_descriptions: List[str], namespace: str = 'default'):
+                 job_descriptions: List[str], namespace: str = 'default', labels: Optional[Dict[str, str]] = None):
         self.hydrus_instances = []
         for i, path in enumerate(hydrus_projects_paths):
             self.hydrus_instances.append(
-                _HydrusJobDeployer(kubernetes_deployer, path, job_names[i], job_descriptions[i], namespace=namespace))
+                _HydrusJobDeployer(kubernetes_deployer, path, job_names[i], job_descriptions[i], namespace=namespace,
+                                   labels=labels))
 
     def run(self):
         for job in self.hydrus_instances:
@@ -0,0 +1,108 @@
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from hydrus.desktop.hydrus_process_pool import HydrusProcessPool
+from simulation.cancellation import CancellationToken
+
+# Stands in for Hydrus - records when it ran, sleeps as long as DURATION file says and waits for enter like Hydrus
+FAKE_HYDRUS = """#!{python}
+import os, sys, time
+model_dir = sys.argv[1]
+start = time.time()
+with open(os.path.join(model_dir, "DURATION")) as duration_file:
+    time.sleep(float(duration_file.read()))
+sys.stdin.readline()
+with open(os.path.join(model_dir, "RUN"), "w") as run_file:
+    run_file.write(f"{{start}} {{time.time()}}")
+print("Calculation complete, time: 1")
+"""
+
+
+@unittest.skipIf(sys.platform == "win32", "fake Hydrus executable is a script")
+class HydrusProcessPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workspace = tempfile.mkdtemp()
+        self.hydrus_dir = os.path.join(self.workspace, "hydrus")
+        os.makedirs(self.hydrus_dir)
+        self.hydrus_exe = os.path.join(self.workspace, "hydrus_exe")
+        with open(self.hydrus_exe, "w") as exe_file:
+            exe_file.write(FAKE_HYDRUS.format(python=sys.executable))
+        os.chmod(self.hydrus_exe, os.stat(self.hydrus_exe).st_mode | stat.S_IEXEC)
+
+    def tearDown(self):
+        shutil.rmtree(self.workspace)
+
+    def _create_model(self, model_name: str, duration: float, atmosph_size: int = 1):
+        model_dir = os.path.join(self.hydrus_dir, model_name)
+        os.makedirs(model_dir)
+        with open(os.path.join(model_dir, "DURATION"), "w") as duration_file:
+            duration_file.write(str(duration))
+        with open(os.path.join(model_dir, "ATMOSPH.IN"), "w") as atmosph_file:
+            atmosph_file.write("0" * atmosph_size)
+
+    def _read_run(self, model_name: str):
+        with open(os.path.join(self.hydrus_dir, model_name, "RUN")) as run_file:
+            return [float(value) for value in run_file.read().split()]
+
+    def test_bounded_concurrency(self):
+        model_names = [f"model{idx}" for idx in range(6)]
+        for model_name in model_names:
+            self._create_model(model_name, 0.2)
+        finished = []
+        started = []
+
+        process_pool = HydrusProcessPool(self.hydrus_exe, max_processes=2)
+        errors = process_pool.run(self.hydrus_dir, model_names,
+                                  lambda model_name, error: finished.append((model_name, error)),
+                                  on_model_started=started.append)
+
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(finished), [(model_name, None) for model_name in model_names])
+        self.assertEqual(sorted(started), model_names)
+        self.assertEqual(sorted(process_pool.cpu_seconds), model_names)  # processes are reaped by the pool
+        self.assertTrue(all(seconds > 0 for seconds in process_pool.cpu_seconds.values()))
+        runs = [self._read_run(model_name) for model_name in model_names]
+        max_overlap = max(sum(start <= moment < end for start, end in runs) for moment, _ in runs)
+        self.assertLessEqual(max_overlap, 2)
+
+    def test_longest_first(self):
+        for model_name, atmosph_size in [("short", 10), ("long", 1000), ("medium", 100)]:
+            self._create_model(model_name, 0.05, atmosph_size)
+
+        HydrusProcessPool(self.hydrus_exe, max_processes=1).run(self.hydrus_dir, ["short", "long", "medium"])
+
+        starts = {model_name: self._read_run(model_name)[0] for model_name in ["short", "long", "medium"]}
+        self.assertEqual(sorted(starts, key=starts.get), ["long", "medium", "short"])
+
+    def test_cancellation(self):
+        for model_name in ["model1", "model2", "model3"]:
+            self._create_model(model_name, 60)
+        token = CancellationToken()
+        threading.Timer(0.2, token.cancel, args=["Cancelled by user"]).start()
+
+        start = time.perf_counter()
+        errors = HydrusProcessPool(self.hydrus_exe, max_processes=2).run(
+            self.hydrus_dir, ["model1", "model2", "model3"], cancellation_token=token)
+        self.assertLess(time.perf_counter() - start, 30)
+        self.assertEqual(sorted(error.model_name for error in errors), ["model1", "model2", "model3"])
+        self.assertTrue(all("cancelled" in error.error_description for error in errors))
+
+    def test_timeout(self):
+        self._create_model("slow", 60)
+        self._create_model("fast", 0)
+
+        errors = HydrusProcessPool(self.hydrus_exe, max_processes=2).run(self.hydrus_dir, ["slow", "fast"],
+                                                                         timeout=0.5)
+        self.assertEqual([error.model_name for error in errors], ["slow"])
+        self.assertIn("timed out", errors[0].error_description)
+
+
+if __name__ == '__main__':
+    unittest.main()
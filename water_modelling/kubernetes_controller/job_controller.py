@@ -1,57 +1,212 @@
-from time import sleep
-from typing import List, Tuple
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple
+
+from kubernetes import watch
+from kubernetes.client import BatchV1Api, CoreV1Api, V1Job, V1Pod
+from kubernetes.client.rest import ApiException
 
 from deployment.kubernetes_job_interface import IKubernetesJob
+from simulation.cancellation import CancellationToken
 from utils.yaml_job_generator import YamlJobGenerator
 
 LOG_LINE = str
 MODEL_NAME = str
+JobResult = Tuple[MODEL_NAME, List[LOG_LINE]]
+
+SIMULATION_LABEL = "sim-id"  # label of jobs (and their pods) with ID of the simulation they belong to
+
+
+class _WatchedJob:
+
+    def __init__(self, job_deployer: IKubernetesJob, timeout: Optional[float]):
+        self.job_deployer = job_deployer
+        self.timeout = timeout
+        self.future: Future = Future()
+        self.started = time.monotonic()
+        self.deadline = None if timeout is None else self.started + timeout
+        self.seen = False  # job was found in the cluster
+        self.completed = False  # job succeeded or failed - its logs are read once pods are watched up to this point
+        self.latest_pod: Optional[V1Pod] = None
+        self.pending_since: Optional[float] = None  # when the latest pod was first seen pending
 
 
 class JobController:
-    INITIALIZATION_MAX_RETRIES = 3
+    """
+    Waits for all jobs of a simulation with one thread - jobs and pods labeled with the simulation ID are listed once
+    and then watched (in turns, each watch request lasts WATCH_TIMEOUT), and every change is dispatched to the future
+    of its job. A watch resumes from the last seen resourceVersion, and lists again if that version expired.
+    """
     MAX_FAILED_JOBS = YamlJobGenerator.BACKOFF_LIMIT + 1
-    LATEST_POD_STATUS_CHECK_FREQUENCY = 5
+    INITIALIZATION_TIMEOUT = 6  # seconds after which a job which wasn't found in the cluster fails
+    POD_PENDING_TIMEOUT = 10  # seconds after which a job whose pod is still pending fails (ex. due to not existing PVC)
+    WATCH_TIMEOUT = 2  # seconds a single watch request lasts - also the interval of checking timeouts and cancellation
+
+    def __init__(self, batch_client: BatchV1Api, core_client: CoreV1Api, namespace: str, simulation_id: int,
+                 cancellation_token: Optional[CancellationToken] = None):
+        """
+        @param batch_client: K8s batch client
+        @param core_client: K8s core client
+        @param namespace: Namespace of the jobs
+        @param simulation_id: ID of the simulation - its jobs are labeled with get_labels()
+        @param cancellation_token: Token of the simulation - unfinished jobs are deleted when it's cancelled
+        """
+        self.batch_client = batch_client
+        self.core_client = core_client
+        self.namespace = namespace
+        self.label_selector = f"{SIMULATION_LABEL}={simulation_id}"
+        self.cancellation_token = cancellation_token or CancellationToken()
+        self.durations: Dict[MODEL_NAME, float] = {}  # model name -> time from watch() until its job finished
+        self._jobs: Dict[str, _WatchedJob] = {}  # job name -> watched job
+        self._thread: Optional[threading.Thread] = None
 
     @staticmethod
-    def wait_for_job_termination(job_deployer: IKubernetesJob) -> Tuple[MODEL_NAME, List[LOG_LINE]]:
-        initialization_retry_count = JobController.INITIALIZATION_MAX_RETRIES
-        job_status = job_deployer.get_job_status()
-
-        while not job_status and initialization_retry_count > 0:
-            sleep(2)
-            job_status = job_deployer.get_job_status()
-            initialization_retry_count -= 1
-
-        attempts_to_check_pod = JobController.LATEST_POD_STATUS_CHECK_FREQUENCY
-        if not job_status:
-            # Should not happen, possibly wrong mapping between created job and watched job
-            return (job_deployer.get_model_name(),
-                    [f"Job was not added to kubernetes cluster or job's name mismatch. Internal fatal error!"])
-
-        while True:
-            sleep(2)
-            attempts_to_check_pod -= 1
-            job_status = job_deployer.get_job_status()
-
-            if job_status.succeeded == 1 or job_status.failed == JobController.MAX_FAILED_JOBS:
-                # Success or simulation error
-                break
-
-            if not job_status.active:
-                # Job not active for unknown reasons
-                return (job_deployer.get_model_name(),
-                        [f"Job is inactive for unknown reasons. Check it's status using "
-                         f"'kubectl describe job {job_deployer.job_name}' in terminal."])
-
-            if attempts_to_check_pod < 0 and job_status.active:
+    def get_labels(simulation_id: int) -> Dict[str, str]:
+        """
+        @return: Labels of jobs of the simulation
+        """
+        return {SIMULATION_LABEL: str(simulation_id)}
+
+    def watch(self, job_deployer: IKubernetesJob, timeout: Optional[float] = None) -> "Future[JobResult]":
+        """
+        Watch the job (to be called before start()) - the job (with its pods) is deleted if the simulation is
+        cancelled or times out.
+        @param job_deployer: Deployer of the job, labeled with get_labels()
+        @param timeout: Time limit of the simulation (in seconds), no limit if None
+        @return: Future of the name of the model and lines of the log (or a description of the problem)
+        """
+        watched_job = _WatchedJob(job_deployer, timeout)
+        self._jobs[job_deployer.job_name] = watched_job
+        return watched_job.future
+
+    def start(self) -> None:
+        """
+        Start the thread watching the jobs - it finishes when all of them finish.
+        """
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        try:
+            job_version = pod_version = None
+            while self._get_unfinished_jobs():
+                job_version = self._watch(self.batch_client.list_namespaced_job, job_version, self._on_job,
+                                          self._on_jobs_listed)
+                pod_version = self._watch(self.core_client.list_namespaced_pod, pod_version, self._on_pod)
+                self._check_jobs()
+        except Exception as err:  # ex. lost connection to the cluster - waiting for the jobs fails
+            for watched_job in self._get_unfinished_jobs():
+                watched_job.future.set_exception(err)
+
+    def _watch(self, list_resources: Callable, resource_version: Optional[str], on_change: Callable,
+               on_listed: Optional[Callable[[List[str]], None]] = None) -> Optional[str]:
+        """
+        List the resources if resource_version is None, watch changes since resource_version otherwise.
+        @return: resourceVersion to watch the next changes from, None if the resources have to be listed again
+        """
+        if resource_version is None:
+            resources = list_resources(self.namespace, label_selector=self.label_selector)
+            for resource in resources.items:
+                on_change(resource, False)
+            if on_listed:
+                on_listed([resource.metadata.name for resource in resources.items])
+            return resources.metadata.resource_version
+
+        stream = watch.Watch()
+        try:
+            for event in stream.stream(list_resources, self.namespace, label_selector=self.label_selector,
+                                       resource_version=resource_version, timeout_seconds=JobController.WATCH_TIMEOUT,
+                                       allow_watch_bookmarks=True,
+                                       _request_timeout=JobController.WATCH_TIMEOUT + 30):
+                if event["type"] != "BOOKMARK":
+                    on_change(event["object"], event["type"] == "DELETED")
+                if not self._get_unfinished_jobs() or self.cancellation_token.is_cancelled():
+                    stream.stop()
+        except ApiException as err:
+            if err.status == 410:  # resourceVersion is too old
+                return None
+            raise
+        return stream.resource_version
+
+    def _on_job(self, job: V1Job, deleted: bool) -> None:
+        watched_job = self._jobs.get(job.metadata.name)
+        if watched_job is None or watched_job.future.done() or watched_job.completed:
+            return
+        watched_job.seen = True
+        status = job.status
+        if not deleted and ((status.succeeded or 0) >= 1 or (status.failed or 0) >= JobController.MAX_FAILED_JOBS):
+            # Success or simulation error
+            watched_job.completed = True
+        elif deleted or any(condition.status == "True" for condition in status.conditions or []):
+            # Job not active for unknown reasons
+            self._finish(watched_job, lambda _: [f"Job is inactive for unknown reasons. Check it's status using "
+                                                 f"'kubectl describe job {job.metadata.name}' in terminal."])
+
+    def _on_jobs_listed(self, job_names: List[str]) -> None:
+        for job_name, watched_job in self._jobs.items():
+            if watched_job.seen and job_name not in job_names and not watched_job.completed \
+                    and not watched_job.future.done():
+                self._finish(watched_job, lambda _: [f"Job is inactive for unknown reasons. Check it's status using "
+                                                     f"'kubectl describe job {job_name}' in terminal."])
+
+    def _on_pod(self, pod: V1Pod, deleted: bool) -> None:
+        watched_job = self._jobs.get((pod.metadata.labels or {}).get("job-name"))
+        if watched_job is None or watched_job.future.done() or deleted:
+            return
+        latest_pod = watched_job.latest_pod
+        if latest_pod is not None and latest_pod.metadata.name != pod.metadata.name \
+                and latest_pod.metadata.creation_timestamp > pod.metadata.creation_timestamp:
+            return  # change of an older pod of the job
+
+        if pod.status.phase != "Pending":
+            watched_job.pending_since = None
+        elif latest_pod is None or latest_pod.metadata.name != pod.metadata.name \
+                or watched_job.pending_since is None:
+            watched_job.pending_since = time.monotonic()
+        watched_job.latest_pod = pod
+
+    def _check_jobs(self) -> None:
+        now = time.monotonic()
+        for watched_job in self._get_unfinished_jobs():
+            if watched_job.completed:
+                self._finish(watched_job, self._read_logs)
+            elif self.cancellation_token.is_cancelled():
+                self._delete(watched_job)
+                self._finish(watched_job, lambda _: [f"Simulation was cancelled: {self.cancellation_token.reason}"])
+            elif watched_job.deadline is not None and now > watched_job.deadline:
+                self._delete(watched_job)
+                self._finish(watched_job, lambda job: [f"Simulation timed out after {job.timeout} seconds"])
+            elif not watched_job.seen and now - watched_job.started > JobController.INITIALIZATION_TIMEOUT:
+                # Should not happen, possibly wrong mapping between created job and watched job
+                self._finish(watched_job, lambda _: [f"Job was not added to kubernetes cluster or job's name mismatch. "
+                                                     f"Internal fatal error!"])
+            elif watched_job.pending_since is not None \
+                    and now - watched_job.pending_since > JobController.POD_PENDING_TIMEOUT:
                 # Job's pod did not start, ex. due to not existing PVC
-                attempts_to_check_pod = JobController.LATEST_POD_STATUS_CHECK_FREQUENCY
-                latest_pod = job_deployer.get_latest_pod()
+                self._finish(watched_job, lambda job: [
+                    f"Pod has pending status. Check status of pod using 'kubectl describe pod "
+                    f"{job.latest_pod.metadata.name}' in terminal. Possibly incorrect PVC."])
+
+    def _finish(self, watched_job: _WatchedJob, get_log_lines: Callable[[_WatchedJob], List[LOG_LINE]]) -> None:
+        model_name = watched_job.job_deployer.get_model_name()
+        self.durations[model_name] = time.monotonic() - watched_job.started
+        try:
+            watched_job.future.set_result((model_name, get_log_lines(watched_job)))
+        except ApiException as err:
+            watched_job.future.set_exception(err)
+
+    def _read_logs(self, watched_job: _WatchedJob) -> List[LOG_LINE]:
+        if watched_job.latest_pod is None:
+            return watched_job.job_deployer.get_latest_logs().split('\n')
+        return self.core_client.read_namespaced_pod_log(watched_job.latest_pod.metadata.name,
+                                                        self.namespace).split('\n')
 
-                if latest_pod.status.phase == "Pending":
-                    return (job_deployer.get_model_name(),
-                            [f"Pod has pending status. Check status of pod using "
-                             f"'kubectl describe pod {latest_pod.metadata.name}' in terminal. Possibly incorrect PVC."])
+    def _delete(self, watched_job: _WatchedJob) -> None:
+        try:
+            watched_job.job_deployer.delete_job()
+        except ApiException as err:
+            print(f"Deleting job {watched_job.job_deployer.job_name} failed: {err}")  # TODO: Logger
 
-        return job_deployer.get_model_name(), job_deployer.get_latest_logs().split('\n')
+    def _get_unfinished_jobs(self) -> List[_WatchedJob]:
+        return [watched_job for watched_job in self._jobs.values() if not watched_job.future.done()]
@@ -0,0 +1,204 @@
+import datetime
+import json
+import threading
+import time
+import unittest
+from concurrent.futures import wait
+
+from kubernetes.client import V1Job, V1JobList, V1JobStatus, V1ListMeta, V1ObjectMeta, V1Pod, V1PodList, V1PodStatus
+
+from kubernetes_controller.job_controller import JobController, SIMULATION_LABEL
+from simulation.cancellation import CancellationToken
+
+
+class FakeResponse:
+    status = 200
+
+    def __init__(self, lines):
+        self.lines = lines
+
+    def stream(self, amt=None, decode_content=False):
+        for line in self.lines:
+            yield (line + "\n").encode()
+
+    def close(self):
+        pass
+
+    def release_conn(self):
+        pass
+
+
+class FakeCluster:
+    """
+    Stands in for k8s batch and core clients - jobs and pods are kept as raw objects, every change is an event
+    """
+
+    def __init__(self):
+        self.version = 0
+        self.jobs = {}
+        self.pods = {}
+        self.events = []  # (kind, type, raw object)
+        self.calls = 0
+        self.expire_next_watch = False
+        self.logs = {}  # pod name -> log
+        self.lock = threading.Lock()
+
+    def set_job(self, name, **status):
+        self._change("job", self.jobs, name, {"metadata": {"name": name, "labels": {SIMULATION_LABEL: "1"}},
+                                              "status": status})
+
+    def set_pod(self, name, job_name, phase, created, log=""):
+        self.logs[name] = log
+        created = datetime.datetime.fromtimestamp(created, datetime.timezone.utc).isoformat()
+        self._change("pod", self.pods, name, {"metadata": {"name": name, "creationTimestamp": created,
+                                                           "labels": {"job-name": job_name, SIMULATION_LABEL: "1"}},
+                                              "status": {"phase": phase}})
+
+    def _change(self, kind, resources, name, raw_object):
+        with self.lock:
+            self.version += 1
+            raw_object["metadata"]["resourceVersion"] = str(self.version)
+            event_type = "MODIFIED" if name in resources else "ADDED"
+            resources[name] = raw_object
+            self.events.append((kind, event_type, raw_object))
+
+    def list_namespaced_job(self, namespace, **kwargs) -> V1JobList:
+        if kwargs.get("watch"):
+            return self._watch("job", kwargs)
+        with self.lock:
+            self.calls += 1
+            return V1JobList(items=[V1Job(metadata=V1ObjectMeta(name=raw["metadata"]["name"]),
+                                          status=V1JobStatus(**raw["status"])) for raw in self.jobs.values()],
+                             metadata=V1ListMeta(resource_version=str(self.version)))
+
+    def list_namespaced_pod(self, namespace, **kwargs) -> V1PodList:
+        if kwargs.get("watch"):
+            return self._watch("pod", kwargs)
+        with self.lock:
+            self.calls += 1
+            return V1PodList(items=[V1Pod(metadata=V1ObjectMeta(
+                name=raw["metadata"]["name"], labels=raw["metadata"]["labels"],
+                creation_timestamp=datetime.datetime.fromisoformat(raw["metadata"]["creationTimestamp"])),
+                status=V1PodStatus(phase=raw["status"]["phase"])) for raw in self.pods.values()],
+                metadata=V1ListMeta(resource_version=str(self.version)))
+
+    def read_namespaced_pod_log(self, name, namespace):
+        return self.logs[name]
+
+    def _watch(self, kind, kwargs):
+        time.sleep(0.01)  # the server keeps the request open while nothing changes
+        with self.lock:
+            self.calls += 1
+            if self.expire_next_watch:
+                self.expire_next_watch = False
+                return FakeResponse([json.dumps({"type": "ERROR", "object": {"code": 410, "reason": "Expired",
+                                                                             "message": "too old"}})])
+            since = int(kwargs["resource_version"])
+            return FakeResponse([json.dumps({"type": event_type, "object": raw_object})
+                                 for event_kind, event_type, raw_object in self.events
+                                 if event_kind == kind and int(raw_object["metadata"]["resourceVersion"]) > since])
+
+
+class FakeJob:
+
+    def __init__(self, job_name):
+        self.job_name = job_name
+        self.deleted = False
+
+    def get_model_name(self):
+        return self.job_name
+
+    def get_latest_logs(self):
+        return f"log of {self.job_name}"
+
+    def delete_job(self):
+        self.deleted = True
+
+
+class JobControllerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cluster = FakeCluster()
+        self.token = CancellationToken()
+        self.controller = JobController(self.cluster, self.cluster, "default", 1, self.token)
+
+    def test_jobs_finish(self):
+        self.cluster.set_job("job1", active=1)
+        self.cluster.set_job("job2", active=1)
+        self.cluster.set_job("job3", active=1)
+        self.cluster.set_pod("job3-old", "job3", "Failed", 1, "old log")
+        futures = [self.controller.watch(FakeJob(f"job{idx}")) for idx in range(1, 4)]
+        self.controller.start()
+
+        self.cluster.set_job("job1", succeeded=1)
+        self.cluster.set_job("job2", failed=JobController.MAX_FAILED_JOBS)
+        self.cluster.set_pod("job3-new", "job3", "Succeeded", 2, "line1\nline2")
+        self.cluster.set_job("job3", succeeded=1, failed=1)
+
+        self.assertEqual([future.result(10) for future in futures],
+                         [("job1", ["log of job1"]), ("job2", ["log of job2"]), ("job3", ["line1", "line2"])])
+
+    def test_many_jobs_one_thread(self):
+        job_names = [f"job{idx}" for idx in range(300)]
+        for job_name in job_names:
+            self.cluster.set_job(job_name, active=1)
+        threads = threading.active_count()
+        futures = [self.controller.watch(FakeJob(job_name)) for job_name in job_names]
+        self.controller.start()
+        self.assertLessEqual(threading.active_count(), threads + 1)
+
+        for job_name in job_names:
+            self.cluster.set_job(job_name, succeeded=1)
+        done, not_done = wait(futures, 10)
+
+        self.assertEqual(len(not_done), 0)
+        self.assertLess(self.cluster.calls, 20)  # not a request per job
+
+    def test_relists_when_version_expired(self):
+        self.cluster.set_job("job1", active=1)
+        future = self.controller.watch(FakeJob("job1"))
+        self.controller.start()
+        time.sleep(0.1)
+
+        self.cluster.expire_next_watch = True
+        self.cluster.set_job("job1", succeeded=1)
+
+        self.assertEqual(future.result(10), ("job1", ["log of job1"]))
+
+    def test_inactive_job(self):
+        self.cluster.set_job("job1", active=1)
+        future = self.controller.watch(FakeJob("job1"))
+        self.controller.start()
+
+        self.cluster.set_job("job1", conditions=[{"type": "Failed", "status": "True"}])
+
+        self.assertIn("Job is inactive for unknown reasons", future.result(10)[1][0])
+
+    def test_pending_pod(self):
+        JobController.POD_PENDING_TIMEOUT, pod_pending_timeout = 0, JobController.POD_PENDING_TIMEOUT
+        try:
+            self.cluster.set_job("job1", active=1)
+            self.cluster.set_pod("job1-pod", "job1", "Pending", 1)
+            future = self.controller.watch(FakeJob("job1"))
+            self.controller.start()
+
+            self.assertIn("kubectl describe pod job1-pod", future.result(10)[1][0])
+        finally:
+            JobController.POD_PENDING_TIMEOUT = pod_pending_timeout
+
+    def test_cancellation_and_timeout(self):
+        self.cluster.set_job("job1", active=1)
+        self.cluster.set_job("job2", active=1)
+        job1, job2 = FakeJob("job1"), FakeJob("job2")
+        timed_out = self.controller.watch(job1, timeout=0.1)
+        cancelled = self.controller.watch(job2)
+        self.controller.start()
+
+        self.assertEqual(timed_out.result(10), ("job1", ["Simulation timed out after 0.1 seconds"]))
+        self.token.cancel("Cancelled by user")
+        self.assertEqual(cancelled.result(10), ("job2", ["Simulation was cancelled: Cancelled by user"]))
+        self.assertTrue(job1.deleted and job2.deleted)
+
+
+if __name__ == '__main__':
+    unittest.main()
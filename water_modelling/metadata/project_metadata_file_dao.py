@@ -58,8 +58,9 @@ def read_all() -> List[ProjectName]:
 
     :return: a list of strings, the project names
     """
+    # hidden directories (ex. simulation cache) aren't projects
     return [name for name in os.listdir(deployment_config.WORKSPACE_DIR)
-            if os.path.isdir(os.path.join(deployment_config.WORKSPACE_DIR, name))]
+            if os.path.isdir(os.path.join(deployment_config.WORKSPACE_DIR, name)) and not name.startswith(".")]
 
 
 def save_or_update(project: ProjectMetadata, state: UserState):
@@ -126,7 +127,17 @@ def get_hydrus_length_unit(model_name: str, state: UserState):
     :param state: Current user's state
     :return: unit, string - "m", "cm" or "mm"
     """
-    filepath = os.path.join(state.get_hydrus_dir(), model_name, "SELECTOR.IN")
+    return read_hydrus_length_unit(os.path.join(state.get_hydrus_dir(), model_name))
+
+
+def read_hydrus_length_unit(model_dir: str):
+    """
+    Extracts the length unit used by the hydrus model in a given directory.
+
+    :param model_dir: the directory of the hydrus model
+    :return: unit, string - "m", "cm" or "mm"
+    """
+    filepath = os.path.join(model_dir, "SELECTOR.IN")
     selector_file = open(filepath, 'r')
 
     lines = selector_file.readlines()
@@ -134,7 +145,7 @@ def get_hydrus_length_unit(model_name: str, state: UserState):
 
     while True:
         if i >= len(lines):
-            raise LookupError(f"ERROR: invalid SELECTOR.IN file for model {model_name}, no length unit found")
+            raise LookupError(f"ERROR: invalid SELECTOR.IN file for model {model_dir}, no length unit found")
         curr_line = lines[i]
         if "LUnit" in curr_line:
             unit = lines[i + 1].strip()
@@ -182,8 +193,17 @@ def add_weather_to_hydrus_model(model_name: str, data: dict, state: UserState):
     :param state: Current user's state
     :return: success - boolean, true if model was updated successfully, false otherwise
     """
-    model_dir = os.path.join(state.get_hydrus_dir(), model_name)
+    return add_weather_to_model_dir(os.path.join(state.get_hydrus_dir(), model_name), data)
 
+
+def add_weather_to_model_dir(model_dir: str, data: dict):
+    """
+    Enriches the hydrus model in a given directory with weather file data.
+
+    :param model_dir: the directory of the model to modify
+    :param data: a dictionary with the loaded weather data
+    :return: success - boolean, true if model was updated successfully, false otherwise
+    """
     # modify meteo file if it exists, return if encountered issues
     if os.path.isfile(os.path.join(model_dir, "METEO.IN")):
         meteo_file_modified = modify_meteo_file(model_dir, data)
@@ -2,7 +2,7 @@ import os
 
 from deployment import daos
 from metadata.project_metadata import ProjectMetadata
-from modflow import modflow_utils
+from modflow import model_manifest
 from server.user_state import UserState
 
 
@@ -18,11 +18,8 @@ def load_metadata_to_state(state: UserState, chosen_project: ProjectMetadata) ->
 def _try_load_modflow_data(state: UserState):
     if state.loaded_project.modflow_model:
         model_path = os.path.join(state.get_modflow_dir(), state.loaded_project.modflow_model)
-        nam_file_name = modflow_utils.get_nam_file(model_path)
-        model_data = modflow_utils.get_model_data(model_path, nam_file_name)
-        state.recharge_masks = modflow_utils.get_shapes_from_rch(
-            model_path, nam_file_name, (model_data["rows"], model_data["cols"])
-        )
+        if model_manifest.read_or_create(model_path) is not None:
+            state.recharge_zones = model_manifest.read_recharge_zones(model_path)
 
 
 def _try_load_hydrus_masks(state: UserState, project_metadata: ProjectMetadata):
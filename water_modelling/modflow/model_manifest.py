@@ -0,0 +1,173 @@
+import json
+import os
+import tempfile
+from dataclasses import dataclass, field, asdict
+from typing import Callable, IO, List, Optional
+
+import numpy as np
+
+from modflow import modflow_utils
+from modflow.recharge_zones import RechargeZones, label_recharge_zones
+
+# Manifest is stored next to the Modflow model files, it describes the model so later stages don't need to load it
+MANIFEST_FILE_NAME = "model_manifest.json"
+RECHARGE_ZONES_FILE_NAME = "model_manifest_zones.npz"
+
+
+@dataclass
+class ModelManifest:
+    nam_file: str                           # name of .nam file of the model
+    rows: int                               # amount of rows in the model grid
+    cols: int                               # amount of columns in the model grid
+    nper: int                               # amount of stress periods
+    perlen: List[float]                     # lengths of consecutive stress periods
+    nrchop: int                             # recharge option of RCH package
+    ipakcb: int                             # cell-by-cell budget unit of RCH package
+    head_file: str                          # name of formatted head file (Modflow output)
+    grid_unit: str                          # unit in which the model grid size is represented
+    row_cells: List[float] = field(default_factory=list)    # heights of the model's consecutive rows
+    col_cells: List[float] = field(default_factory=list)    # widths of the model's consecutive columns
+    fingerprint: List[List] = field(default_factory=list)   # (file name, mtime, size) of every model input file
+
+    def get_model_data(self) -> dict:
+        """
+        @return: Model info in the same format as modflow_utils.get_model_data()
+        """
+        return {
+            "rows": self.rows,
+            "cols": self.cols,
+            "row_cells": self.row_cells,
+            "col_cells": self.col_cells,
+            "grid_unit": self.grid_unit
+        }
+
+    def is_up_to_date(self, project_path: str) -> bool:
+        """
+        @param project_path: Path to Modflow project main directory
+        @return: True if model files weren't modified since the manifest was created
+        """
+        current_fingerprint = modflow_utils.get_model_fingerprint(project_path, self.nam_file)
+        return [list(file_fingerprint) for file_fingerprint in current_fingerprint] == self.fingerprint
+
+
+def create(project_path: str, nam_file_name: str) -> ModelManifest:
+    """
+    Load Modflow model, describe it with a manifest and save the manifest (with recharge zones) next to the model.
+
+    @param project_path: Path to Modflow project main directory
+    @param nam_file_name: Name of .nam file inside the Modflow project
+    @return: Created manifest
+    """
+    modflow_model = modflow_utils.load_model(project_path, nam_file_name, load_only=["rch", "dis"])
+    rch_package = modflow_model.rch
+
+    manifest = ModelManifest(
+        nam_file=nam_file_name,
+        rows=modflow_model.nrow,
+        cols=modflow_model.ncol,
+        nper=modflow_model.nper,
+        perlen=[float(duration) for duration in modflow_model.modeltime.perlen],
+        nrchop=int(rch_package.nrchop),
+        ipakcb=int(rch_package.ipakcb) if rch_package.ipakcb else 0,
+        head_file=_find_head_file(project_path, nam_file_name),
+        grid_unit=modflow_model.modelgrid.units,
+        row_cells=modflow_model.dis.delc.array.tolist(),
+        col_cells=modflow_model.dis.delr.array.tolist()
+    )
+
+    zones = label_recharge_zones(rch_package.rech.array[0][0])
+    _write_atomically(os.path.join(project_path, RECHARGE_ZONES_FILE_NAME), "wb", lambda handle: np.savez(
+        handle, label_raster=zones.label_raster, values=zones.values, cells_counts=zones.cells_counts,
+        bounding_boxes=zones.bounding_boxes))
+
+    update_fingerprint(project_path, manifest)
+    return manifest
+
+
+def read(project_path: str) -> Optional[ModelManifest]:
+    """
+    @param project_path: Path to Modflow project main directory
+    @return: Manifest of the model, None if there is no manifest or model files were modified since its creation
+    """
+    manifest_path = os.path.join(project_path, MANIFEST_FILE_NAME)
+    if not os.path.isfile(manifest_path) or not os.path.isfile(os.path.join(project_path, RECHARGE_ZONES_FILE_NAME)):
+        return None
+
+    try:
+        with open(manifest_path) as handle:
+            manifest = json.load(handle, object_hook=lambda d: ModelManifest(**d))
+    except (ValueError, TypeError):
+        print("Invalid model manifest, it will be recreated: " + manifest_path)  # TODO: Logger
+        return None
+
+    if not manifest.is_up_to_date(project_path):
+        print("Modflow model was modified, manifest will be recreated: " + manifest_path)  # TODO: Logger
+        return None
+    return manifest
+
+
+def read_or_create(project_path: str) -> Optional[ModelManifest]:
+    """
+    @param project_path: Path to Modflow project main directory
+    @return: Up-to-date manifest of the model, None if the project doesn't contain .nam file
+    """
+    manifest = read(project_path)
+    if manifest is None:
+        nam_file_name = modflow_utils.get_nam_file(project_path)
+        if nam_file_name is None:
+            return None
+        manifest = create(project_path, nam_file_name)
+    return manifest
+
+
+def read_recharge_zones(project_path: str) -> RechargeZones:
+    """
+    @param project_path: Path to Modflow project main directory
+    @return: Recharge zones saved with the manifest
+    """
+    with np.load(os.path.join(project_path, RECHARGE_ZONES_FILE_NAME)) as zones_file:
+        return RechargeZones(zones_file["label_raster"], zones_file["values"], zones_file["cells_counts"],
+                             zones_file["bounding_boxes"])
+
+
+def update_fingerprint(project_path: str, manifest: ModelManifest) -> None:
+    """
+    Mark current model files as described by the manifest and save it - used after the application itself
+    modifies model files without changing facts stored in the manifest (ex. recharge values).
+
+    @param project_path: Path to Modflow project main directory
+    @param manifest: Manifest of the model
+    """
+    manifest.fingerprint = [list(file_fingerprint)
+                            for file_fingerprint in modflow_utils.get_model_fingerprint(project_path,
+                                                                                        manifest.nam_file)]
+    _write_atomically(os.path.join(project_path, MANIFEST_FILE_NAME), "w",
+                      lambda handle: json.dump(asdict(manifest), handle))
+
+
+def _write_atomically(path: str, mode: str, write: Callable[[IO], None]) -> None:
+    """
+    Write the file to a temporary file in the same directory and replace the file with it - readers (ex. other
+    simulations of the project) never see a partially written file.
+    """
+    handle = tempfile.NamedTemporaryFile(mode, dir=os.path.dirname(path), delete=False)
+    try:
+        with handle:
+            write(handle)
+        os.replace(handle.name, path)
+    except Exception:
+        if os.path.exists(handle.name):
+            os.remove(handle.name)
+        raise
+
+
+def _find_head_file(project_path: str, nam_file_name: str) -> str:
+    """
+    @return: Name of formatted head file listed in .nam file (.fhd), default name if it's not listed
+    """
+    with open(os.path.join(project_path, nam_file_name), 'r') as nam_file:
+        for line in nam_file:
+            tokens = line.split()
+            if len(tokens) >= 3 and not tokens[0].startswith('#') and tokens[2].lower().endswith(".fhd"):
+                return tokens[2]
+    return nam_file_name[:-4] + ".fhd"
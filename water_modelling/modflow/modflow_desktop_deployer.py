@@ -1,11 +1,13 @@
 import os
 import subprocess
+import uuid
 from typing import Optional
 
 from modflow import modflow_log_analyzer
 from modflow.modflow_deployer_interface import IModflowDeployer
+from simulation.cancellation import CancellationToken
 from simulation.simulation_error import SimulationError
-from utils import path_formatter
+from utils import path_formatter, process_utils
 
 
 class ModflowDesktopDeployer(IModflowDeployer):
@@ -17,27 +19,48 @@ class ModflowDesktopDeployer(IModflowDeployer):
         self.path = path
         self.name_file = name_file
         self.proc = None
+        # every run logs to its own file (renamed to LOG_FILE when it finishes), so concurrent runs don't mix logs
+        self.run_log_file = f"simulation-{uuid.uuid4().hex}.log"
 
     def run(self):
-        current_dir = os.getcwd()
-        os.chdir(self.path)
         print(f"Starting Modflow calculations for: {path_formatter.convert_backslashes_to_slashes(self.path)}")
 
-        with open(self._get_path_to_log(), 'w') as handle:
-            self.proc = subprocess.Popen([self.modflow_exe_path, self.name_file], shell=True, text=True,
-                                         stdin=subprocess.PIPE, stdout=handle, stderr=handle)
-        os.chdir(current_dir)
+        # Modflow reads files relative to its working directory - it's set for the process only (not by chdir
+        # of the whole application), so simulations can start concurrently
+        with open(self._get_path_to_run_log(), 'w') as handle:
+            self.proc = subprocess.Popen([self._get_executable(), self.name_file], cwd=self.path, text=True,
+                                         stdin=subprocess.PIPE, stdout=handle, stderr=handle,
+                                         **process_utils.get_process_group_options())
 
-    def wait_for_termination(self) -> Optional[SimulationError]:
-        self.proc.communicate(input="\n")  # Press enter to close program (blocking)
+    def wait_for_termination(self, cancellation_token: Optional[CancellationToken] = None,
+                             timeout: Optional[float] = None) -> Optional[SimulationError]:
+        """
+        @param cancellation_token: Token of the simulation - the process is killed when it's cancelled
+        @param timeout: Time limit of the simulation (in seconds), no limit if None
+        @return: Error of the simulation (also if it was cancelled or timed out), None if it was successful
+        """
+        cancellation_token = cancellation_token or CancellationToken()
+        with cancellation_token.on_cancel(lambda: process_utils.kill_process_tree(self.proc)):
+            try:
+                self.proc.communicate(input="\n", timeout=timeout)  # Press enter to close program (blocking)
+            except subprocess.TimeoutExpired:
+                process_utils.kill_process_tree(self.proc)
+                self.proc.communicate()
+                self._keep_log()
+                return SimulationError(self._get_model_name(), f"Modflow simulation timed out after {timeout} seconds")
+        if cancellation_token.is_cancelled():
+            self._keep_log()
+            return SimulationError(self._get_model_name(), f"Modflow simulation was cancelled: "
+                                                           f"{cancellation_token.reason}")
 
         # analyze output and return SimulationError if made
-        with open(self._get_path_to_log(), 'r') as handle:
+        with open(self._get_path_to_run_log(), 'r') as handle:
             log_lines = handle.readlines()
-            simulation_error = modflow_log_analyzer.analyze_log(self._get_model_name(), log_lines)
-            if simulation_error:
-                print(f"{self.path}: error occurred: {simulation_error.error_description}")
-                return simulation_error
+        self._keep_log()
+        simulation_error = modflow_log_analyzer.analyze_log(self._get_model_name(), log_lines)
+        if simulation_error:
+            print(f"{self.path}: error occurred: {simulation_error.error_description}")
+            return simulation_error
 
         # successful scenario
         print(f"{self.name_file}: calculations completed successfully")
@@ -46,5 +69,26 @@ class ModflowDesktopDeployer(IModflowDeployer):
     def _get_model_name(self) -> str:
         return path_formatter.convert_backslashes_to_slashes(self.path).split('/modflow/')[1]
 
+    def _get_executable(self) -> str:
+        """
+        @return: Path to Modflow executable - relative paths are resolved against the application's directory,
+            since the process starts in the model directory
+        """
+        if os.path.dirname(self.modflow_exe_path):
+            return os.path.abspath(self.modflow_exe_path)
+        return self.modflow_exe_path  # found on PATH
+
+    def _keep_log(self) -> None:
+        """
+        Keep the log of the finished run as LOG_FILE of the model.
+        """
+        try:
+            os.replace(self._get_path_to_run_log(), self._get_path_to_log())
+        except OSError as err:
+            print(f"Log of Modflow simulation can't be kept: {err}")  # TODO: Logger
+
+    def _get_path_to_run_log(self) -> str:
+        return os.path.join(self.path, self.run_log_file)
+
     def _get_path_to_log(self) -> str:
         return os.path.join(self.path, ModflowDesktopDeployer.LOG_FILE)
@@ -3,9 +3,12 @@ from typing import TYPE_CHECKING, Optional
 
 from docker import APIClient
 from docker.errors import APIError
+from requests.exceptions import RequestException
 
+from deployment import resource_packer
 from modflow import modflow_log_analyzer
 from modflow.modflow_deployer_interface import IModflowDeployer
+from simulation.cancellation import CancellationToken
 from simulation.simulation_error import SimulationError
 
 if TYPE_CHECKING:
@@ -33,7 +36,8 @@ class ModflowContainerDeployer(IModflowDeployer):
         if not self.container_data:
             print("Container %s does not exist. Creating it..." % self.container_name)
             volume_mount_path = f"{self.path}:{ModflowContainerDeployer.MODFLOW_VOLUME_MOUNT}"
-            host_config = self._get_docker_client().create_host_config(binds=[volume_mount_path])
+            host_config = self._get_docker_client().create_host_config(
+                binds=[volume_mount_path], **self._get_resource_limits())
 
             self.container_data = self._get_docker_client().create_container(image=self._get_modflow_image(),
                                                                              volumes=[self.path],
@@ -45,8 +49,24 @@ class ModflowContainerDeployer(IModflowDeployer):
 
         return self.container_data
 
-    def wait_for_termination(self) -> Optional[SimulationError]:
-        self._get_docker_client().wait(self.container_data)
+    def wait_for_termination(self, cancellation_token: Optional[CancellationToken] = None,
+                             timeout: Optional[float] = None) -> Optional[SimulationError]:
+        """
+        @param cancellation_token: Token of the simulation - the container is killed when it's cancelled
+        @param timeout: Time limit of the simulation (in seconds), no limit if None
+        @return: Error of the simulation (also if it was cancelled or timed out), None if it was successful
+        """
+        cancellation_token = cancellation_token or CancellationToken()
+        with cancellation_token.on_cancel(lambda: self._get_docker_client().kill(self.container_data)):
+            try:
+                self._get_docker_client().wait(self.container_data, timeout=timeout)
+            except RequestException:
+                self._get_docker_client().remove_container(self.container_data, force=True)
+                return SimulationError(self._get_model_name(), f"Modflow simulation timed out after {timeout} seconds")
+        if cancellation_token.is_cancelled():
+            self._get_docker_client().remove_container(self.container_data, force=True)
+            return SimulationError(self._get_model_name(), f"Modflow simulation was cancelled: "
+                                                           f"{cancellation_token.reason}")
 
         # analyze output and return SimulationError if made
         # if log_lines with '\n' are needed: stream=True creates line generator (lines are bytes) - decode each
@@ -68,6 +88,9 @@ class ModflowContainerDeployer(IModflowDeployer):
     def _get_docker_client(self) -> APIClient:
         return self.docker_deployer.docker_client
 
+    def _get_resource_limits(self) -> dict:
+        return resource_packer.get_host_config_limits(self.docker_deployer.modflow_resources)
+
     def _get_modflow_image(self) -> str:
         return self.docker_deployer.modflow_image
 
@@ -7,7 +7,7 @@ from kubernetes.client.rest import ApiException
 from deployment.kubernetes_job_interface import IKubernetesJob
 from utils.yaml_data import YamlData
 from utils.yaml_job_generator import YamlJobGenerator
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Dict, Optional
 
 if TYPE_CHECKING:
     from deployment.kubernetes_deployer import KubernetesDeployer
@@ -20,8 +20,9 @@ class ModflowJobDeployer(IKubernetesJob):
     SHORTENED_UUID_LENGTH = 21
 
     def __init__(self, kubernetes_deployer: KubernetesDeployer, sub_path: str, name_file: str,
-                 job_name: str, description: str, namespace: str = "default"):
-        super().__init__(kubernetes_deployer, job_name, sub_path, description, namespace)
+                 job_name: str, description: str, namespace: str = "default",
+                 labels: Optional[Dict[str, str]] = None):
+        super().__init__(kubernetes_deployer, job_name, sub_path, description, namespace, labels)
         self.name_file = name_file
 
     def run(self):
@@ -50,7 +51,8 @@ class ModflowJobDeployer(IKubernetesJob):
                                    self.name_file],
                              sub_path=self.sub_path,
                              hydro_program=ModflowJobDeployer.PROGRAMME_NAME,
-                             description=self.description)
+                             description=self.description,
+                             labels=self.labels)
 
         yaml_gen = YamlJobGenerator(yaml_data)
         job_manifest = yaml_gen.prepare_kubernetes_job()
@@ -1,10 +1,219 @@
-from typing import Tuple, Optional, List
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Tuple, Optional, List, FrozenSet, Dict
 
 import flopy
 import os
+import threading
 
 import numpy as np
-from collections import deque
+
+from modflow import recharge_zones
+from modflow.recharge_zones import RechargeZones
+
+
+# models are cached while the total size of their package files is below this limit
+MODEL_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+ModelCacheKey = Tuple[str, str]
+FileFingerprint = Tuple[str, int, int]  # (file name, mtime, size)
+
+
+@dataclass
+class _ModelCacheEntry:
+    model: flopy.modflow.Modflow
+    packages: Optional[FrozenSet[str]]  # None - whole model
+    fingerprint: Tuple[FileFingerprint, ...]
+    size: int
+
+
+class _ModelCache:
+    """
+    Process-wide LRU cache of loaded Modflow models. Entries are valid as long as input files of the model
+    are not modified (same fingerprint). Model loaded with a set of packages serves requests for any subset.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: Dict[Tuple[ModelCacheKey, Optional[FrozenSet[str]]], _ModelCacheEntry] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: ModelCacheKey, packages: Optional[FrozenSet[str]],
+            fingerprint: Tuple[FileFingerprint, ...], take: bool = False) -> Optional[flopy.modflow.Modflow]:
+        """
+        @param take: True if the model is removed from the cache - nobody else gets it (ex. it's going to be modified)
+        @return: Cached model with the packages and fingerprint, None if there is none
+        """
+        with self._lock:
+            for entry_key, entry in list(self._entries.items()):
+                if entry_key[0] != key:
+                    continue
+                if entry.fingerprint != fingerprint:
+                    # files were modified - entry is outdated
+                    self._remove(entry_key)
+                elif entry.packages is None or (packages is not None and packages <= entry.packages):
+                    if take:
+                        self._remove(entry_key)
+                    else:
+                        self._entries.move_to_end(entry_key)
+                    self.hits += 1
+                    return entry.model
+            self.misses += 1
+            return None
+
+    def put(self, key: ModelCacheKey, entry: _ModelCacheEntry) -> None:
+        with self._lock:
+            entry_key = (key, entry.packages)
+            if entry_key in self._entries:
+                self._remove(entry_key)
+            self._entries[entry_key] = entry
+            self._size += entry.size
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, key: Optional[ModelCacheKey] = None) -> None:
+        with self._lock:
+            for entry_key in list(self._entries):
+                if key is None or entry_key[0] == key:
+                    self._remove(entry_key)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._size
+            }
+
+    def _remove(self, entry_key) -> None:
+        self._size -= self._entries.pop(entry_key).size
+
+
+_model_cache = _ModelCache(MODEL_CACHE_MAX_BYTES)
+
+
+def load_model(project_path: str, nam_file_name: str, load_only: Optional[List[str]] = None,
+               check: bool = False, exclusive: bool = False) -> flopy.modflow.Modflow:
+    """
+    Load Modflow model through the process-wide model cache. Returned model is shared - it mustn't be modified
+    unless it's loaded with exclusive=True.
+
+    @param project_path: Path to Modflow project main directory
+    @param nam_file_name: Name of .nam file inside the Modflow project
+    @param load_only: Packages to load (ex. ["rch", "dis"]), whole model if None
+    @param check: Check model input for common errors
+    @param exclusive: True if the caller modifies the model (or its files) - the model is taken out of the cache,
+        so no other caller gets it, and a newly loaded one isn't cached
+    @return: Loaded Modflow model
+    """
+    key = _model_cache_key(project_path, nam_file_name)
+    packages = frozenset(package.upper() for package in load_only) if load_only is not None else None
+    fingerprint = get_model_fingerprint(project_path, nam_file_name)
+
+    modflow_model = _model_cache.get(key, packages, fingerprint, take=exclusive)
+    if modflow_model is None:
+        modflow_model = flopy.modflow.Modflow.load(nam_file_name, model_ws=project_path,
+                                                   load_only=load_only, forgive=True, check=False)
+        if not exclusive:
+            size = sum(os.path.getsize(path) for (file_type, path, _) in _read_nam_file(project_path, nam_file_name)
+                       if os.path.isfile(path) and _is_loaded_package(file_type, packages))
+            _model_cache.put(key, _ModelCacheEntry(modflow_model, packages, fingerprint, size))
+
+    if check:
+        modflow_model.check(f=f"{modflow_model.name}.chk", verbose=modflow_model.verbose, level=0)
+    return modflow_model
+
+
+def invalidate_model_cache(project_path: Optional[str] = None, nam_file_name: Optional[str] = None) -> None:
+    """
+    Remove models from the cache - should be called after modifying model files or cached model.
+
+    @param project_path: Path to Modflow project main directory, all models are removed if None
+    @param nam_file_name: Name of .nam file inside the Modflow project
+    """
+    _model_cache.invalidate(_model_cache_key(project_path, nam_file_name) if project_path is not None else None)
+
+
+def get_model_cache_stats() -> Dict[str, int]:
+    """
+    @return: Counters of the model cache - hits, misses, evictions, amount of cached models and their size (bytes)
+    """
+    return _model_cache.stats()
+
+
+def _model_cache_key(project_path: str, nam_file_name: str) -> ModelCacheKey:
+    return os.path.abspath(project_path), nam_file_name
+
+
+def get_model_fingerprint(project_path: str, nam_file_name: str) -> Tuple[FileFingerprint, ...]:
+    """
+    Fingerprint of the model input files - any change of .nam file or files it lists (except output files)
+    changes the fingerprint.
+
+    @param project_path: Path to Modflow project main directory
+    @param nam_file_name: Name of .nam file inside the Modflow project
+    @return: Tuple of (file name, mtime, size) of every input file, (-1, -1) for missing files
+    """
+    fingerprint = []
+    for file_name in get_model_input_files(project_path, nam_file_name):
+        try:
+            stat = os.stat(os.path.join(project_path, file_name))
+            fingerprint.append((file_name, stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            fingerprint.append((file_name, -1, -1))
+    return tuple(fingerprint)
+
+
+def get_model_input_files(project_path: str, nam_file_name: str) -> List[str]:
+    """
+    @param project_path: Path to Modflow project main directory
+    @param nam_file_name: Name of .nam file inside the Modflow project
+    @return: Names of .nam file and files it lists (except output files), relative to the project directory
+    """
+    return [nam_file_name] + [os.path.relpath(path, project_path)
+                              for (file_type, path, status) in _read_nam_file(project_path, nam_file_name)
+                              if file_type != "LIST" and status != "REPLACE"]
+
+
+def get_package_path(project_path: str, nam_file_name: str, file_type: str) -> Optional[str]:
+    """
+    @param project_path: Path to Modflow project main directory
+    @param nam_file_name: Name of .nam file inside the Modflow project
+    @param file_type: Type of the package file (ex. "RCH")
+    @return: Path to the package file, None if the .nam file doesn't list such package
+    """
+    for (listed_type, path, _) in _read_nam_file(project_path, nam_file_name):
+        if listed_type == file_type.upper():
+            return path
+    return None
+
+
+def _read_nam_file(project_path: str, nam_file_name: str) -> List[Tuple[str, str, str]]:
+    """
+    @return: List of (file type, file path, file status) of files listed in the .nam file
+    """
+    package_files = []
+    with open(os.path.join(project_path, nam_file_name), 'r') as nam_file:
+        for line in nam_file:
+            tokens = line.split()
+            if len(tokens) < 3 or tokens[0].startswith('#'):
+                continue
+            status = tokens[3].upper() if len(tokens) > 3 else ""
+            package_files.append((tokens[0].upper(), os.path.join(project_path, tokens[2].strip('\'"')), status))
+    return package_files
+
+
+def _is_loaded_package(file_type: str, packages: Optional[FrozenSet[str]]) -> bool:
+    if file_type.startswith("DATA") or file_type == "LIST":
+        return False
+    return packages is None or file_type in packages or file_type == "DIS"
 
 
 # TODO: return object?
@@ -24,8 +233,7 @@ def get_model_data(project_path: str, nam_file_name: str) -> dict:
     @return: A dictionary of info as described above.
     """
 
-    modflow_model = flopy.modflow.Modflow \
-        .load(nam_file_name, model_ws=project_path, load_only=["rch", "dis"], forgive=True)
+    modflow_model = load_model(project_path, nam_file_name, load_only=["rch", "dis"])
     return {
         "rows": modflow_model.nrow,
         "cols": modflow_model.ncol,
@@ -74,7 +282,7 @@ def validate_model(project_path: str, nam_file_name: str) -> bool:
 
     try:
         # load whole model and validate it
-        m = flopy.modflow.Modflow.load(nam_file_name, model_ws=project_path, forgive=True, check=True)
+        m = load_model(project_path, nam_file_name, check=True)
         if m.rch is None:
             print("Model doesn't contain .rch file")
             return False
@@ -89,38 +297,23 @@ def validate_model(project_path: str, nam_file_name: str) -> bool:
     return True
 
 
-def get_shapes_from_rch(project_path: str, nam_file_name: str, project_shape: Tuple[int, int]) -> List[np.ndarray]:
+def get_shapes_from_rch(project_path: str, nam_file_name: str, project_shape: Tuple[int, int]) -> RechargeZones:
     """
     Defines shapes masks for uploaded Modflow model based on recharge
 
     @param project_path: Path to Modflow project main directory
     @param nam_file_name: Name of .nam file inside the Modflow project
     @param project_shape: Tuple representing size of the Modflow project (rows, cols)
-    @return: List of shapes read from Modflow project
+    @return: Recharge zones (shapes) read from Modflow project, masks of the shapes are created on demand
     """
 
-    modflow_model = flopy.modflow.Modflow \
-        .load(nam_file_name, model_ws=project_path, load_only=["rch"], forgive=True)
+    modflow_model = load_model(project_path, nam_file_name, load_only=["rch"])
 
     stress_period = 0
     layer = 0
 
-    recharge_masks = []
-    is_checked_array = np.full(project_shape, False)
-    recharge_array = modflow_model.rch.rech.array[stress_period][layer]
-    modflow_rows, modflow_cols = project_shape
-
-    for row in range(modflow_rows):
-        for col in range(modflow_cols):
-            if not is_checked_array[row][col]:
-                recharge_masks.append(np.zeros(project_shape))
-                _fill_mask_iterative(mask=recharge_masks[-1], recharge_array=recharge_array,
-                                     is_checked_array=is_checked_array,
-                                     project_shape=project_shape,
-                                     row=row, col=col,
-                                     value=recharge_array[row][col])
-
-    return recharge_masks
+    recharge_array = np.reshape(modflow_model.rch.rech.array[stress_period][layer], project_shape)
+    return recharge_zones.label_recharge_zones(recharge_array)
 
 
 def get_nam_file(project_path: str) -> Optional[str]:
@@ -132,39 +325,3 @@ def get_nam_file(project_path: str) -> Optional[str]:
     print("ERROR: invalid modflow model; missing .nam file")    # TODO: Logger
     return None
 
-
-def _fill_mask_iterative(mask: np.ndarray, recharge_array: np.ndarray, is_checked_array: np.ndarray,
-                         project_shape: Tuple[int, int], row: int, col: int, value: float):
-    """
-    Fill given mask with 1's according to recharge array (using DFS)
-
-    @param mask: Binary mask of current shape - initially filled with 0's
-    @param recharge_array: 2d array filled with modflow model recharge values
-    @param is_checked_array: Control array - 'True' means that given cell was already used in one of the masks
-    @param project_shape: Tuple representing shape of the Modflow project (rows, cols)
-    @param row: Current column index
-    @param col: Current row index
-    @param value: Recharge value of current mask
-    @return: None (result inside variable @mask)
-    """
-    modflow_rows, modflow_cols = project_shape
-
-    stack = deque()
-    stack.append((row, col))
-
-    while stack:
-        cur_row, cur_col = stack.pop()
-        # return condition - out of bounds or given cell was already used
-        if cur_row < 0 or cur_row >= modflow_rows or cur_col < 0 or cur_col >= modflow_cols or \
-                is_checked_array[cur_row][cur_col]:
-            continue
-
-        if recharge_array[cur_row][cur_col] == value:
-            is_checked_array[cur_row][cur_col] = True
-            mask[cur_row][cur_col] = 1
-            stack.append((cur_row - 1, cur_col))
-            stack.append((cur_row + 1, cur_col))
-            stack.append((cur_row, cur_col - 1))
-            stack.append((cur_row, cur_col + 1))
-
-    return
@@ -0,0 +1,212 @@
+from typing import List, Optional, Sequence, TextIO
+
+import numpy as np
+
+# Writer of MODFLOW-2005 RCH package files - arrays are formatted with NumPy (fixed width, as flopy does)
+# and written stress period by stress period.
+
+HEADING = "# RCH package for MODFLOW-2005 generated by Hydrus-Modflow Synergy Engine"
+REAL_FORMAT = "(10E15.6)"
+REAL_WIDTH = 15
+REAL_DECIMALS = 6
+INT_FORMAT = "(10I10)"
+INT_WIDTH = 10
+VALUES_PER_LINE = 10
+REUSE_PREVIOUS = -1
+PERIOD_COMMENT = " # Stress period "
+
+_SPACE = ord(' ')
+_ZERO = ord('0')
+
+
+def write_rch(path: str, nrchop: int, ipakcb: int, recharge: Sequence[np.ndarray],
+              irch: Optional[Sequence[np.ndarray]] = None, changed_periods: Optional[Sequence[bool]] = None) -> None:
+    """
+    Write RCH package file. Uniform arrays are written as CONSTANT records, arrays equal to the ones
+    of previous stress period are not written again (INRECH/INIRCH < 0).
+
+    @param path: Path to the .rch file
+    @param nrchop: Recharge option code
+    @param ipakcb: Cell-by-cell budget unit (0 - budget is not saved)
+    @param recharge: 2D recharge arrays (rows, cols) of consecutive stress periods
+    @param irch: 2D arrays of layer numbers (1-based) receiving recharge in consecutive stress periods,
+        used only if nrchop == 2
+    @param changed_periods: True for stress periods whose arrays differ from the ones in the existing file -
+        records of other periods are copied from the file (if it was written by write_rch with the same options),
+        None if all periods should be written
+    @return: None
+    """
+    previous_records = None
+    if changed_periods is not None and not all(changed_periods):
+        previous_records = _read_period_records(path, nrchop, ipakcb, len(recharge))
+
+    with open(path, 'w') as rch_file:
+        rch_file.write(f"{HEADING}\n")
+        rch_file.write(f"{nrchop:10d}{ipakcb:10d}\n")
+
+        for kper in range(len(recharge)):
+            if previous_records is not None and not changed_periods[kper] and \
+                    (kper == 0 or not changed_periods[kper - 1] or not _depends_on_previous(previous_records[kper])):
+                rch_file.write(previous_records[kper])
+            else:
+                _write_period(rch_file, kper, recharge, irch if nrchop == 2 else None)
+
+
+def _write_period(rch_file: TextIO, kper: int, recharge: Sequence[np.ndarray],
+                  irch: Optional[Sequence[np.ndarray]]) -> None:
+    period_recharge = np.asarray(recharge[kper])
+    inrech = REUSE_PREVIOUS if kper > 0 and _is_same(np.asarray(recharge[kper - 1]), period_recharge) else 1
+
+    inirch = REUSE_PREVIOUS
+    period_irch = None
+    if irch is not None:
+        period_irch = np.asarray(irch[kper])
+        inirch = REUSE_PREVIOUS if kper > 0 and _is_same(np.asarray(irch[kper - 1]), period_irch) else 1
+
+    rch_file.write(f"{inrech:10d}{inirch:10d}{PERIOD_COMMENT}{kper + 1}\n")
+    if inrech >= 0:
+        _write_real_array(rch_file, period_recharge, f"rech_{kper + 1}")
+    if irch is not None and inirch >= 0:
+        _write_int_array(rch_file, period_irch, f"irch_{kper + 1}")
+
+
+def _read_period_records(path: str, nrchop: int, ipakcb: int, nper: int) -> Optional[List[str]]:
+    """
+    @return: Records (INRECH/INIRCH line with arrays) of consecutive stress periods of file written by write_rch,
+        None if the file wasn't written by write_rch with given options
+    """
+    try:
+        with open(path, 'r') as rch_file:
+            content = rch_file.read()
+    except OSError:
+        return None
+    if not content.startswith(f"{HEADING}\n{nrchop:10d}{ipakcb:10d}\n"):
+        return None
+
+    starts = []
+    position = content.find(PERIOD_COMMENT)
+    while position >= 0:
+        starts.append(content.rfind("\n", 0, position) + 1)
+        if position - starts[-1] != 20:     # INRECH and INIRCH precede the comment
+            return None
+        position = content.find(PERIOD_COMMENT, position + len(PERIOD_COMMENT))
+    if len(starts) != nper:
+        return None
+    return [content[begin:end] for (begin, end) in zip(starts, starts[1:] + [len(content)])]
+
+
+def _depends_on_previous(record: str) -> bool:
+    """
+    @return: True if the record reuses arrays of previous stress period
+    """
+    return int(record[:10]) < 0 or int(record[10:20]) < 0
+
+
+def format_reals(values: np.ndarray) -> np.ndarray:
+    """
+    Format values as Fortran E15.6 (same text as Python '{:15.6E}') without formatting them one by one.
+    @param values: Array of values
+    @return: 2D uint8 array (values, 15) - ASCII characters of every value
+    """
+    with np.errstate(invalid='ignore', over='ignore'):
+        return _format_reals(np.asarray(values, dtype=np.float64).ravel())
+
+
+def _format_reals(values: np.ndarray) -> np.ndarray:
+    characters = np.full((len(values), REAL_WIDTH), _SPACE, dtype=np.uint8)
+    magnitudes = np.abs(values)
+    finite = np.isfinite(values)
+    non_zero = finite & (magnitudes != 0)
+
+    # decimal exponent - corrected when log10 is off by one near powers of ten
+    exponents = np.zeros(len(values), dtype=np.int64)
+    exponents[non_zero] = np.floor(np.log10(magnitudes[non_zero]))
+    scaled = _scale(magnitudes, REAL_DECIMALS - exponents)
+    exponents[non_zero & (scaled < 10 ** REAL_DECIMALS - 0.5)] -= 1
+    exponents[non_zero & (scaled >= 10 ** (REAL_DECIMALS + 1))] += 1
+    scaled = _scale(magnitudes, REAL_DECIMALS - exponents)
+
+    mantissas = np.rint(scaled).astype(np.int64)
+    rounded_up = mantissas >= 10 ** (REAL_DECIMALS + 1)
+    mantissas[rounded_up] //= 10
+    exponents[rounded_up] += 1
+    mantissas[~non_zero] = 0
+    exponents[~non_zero] = 0
+
+    # exact formatting where float rounding could differ from Python's: ties, 3-digit exponents, inf and NaN
+    scales = REAL_DECIMALS - exponents
+    python_formatted = ~finite | (np.abs(exponents) >= 100) | (np.abs(scales) > 22) | \
+        (non_zero & (np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6))
+
+    # layout of '  -d.ddddddE+ee'
+    characters[:, REAL_WIDTH - REAL_DECIMALS - 7] = np.where(np.signbit(values), ord('-'), _SPACE)
+    for digit in range(REAL_DECIMALS + 1):
+        column = REAL_WIDTH - REAL_DECIMALS - 6 + digit + (1 if digit > 0 else 0)
+        characters[:, column] = _ZERO + (mantissas // 10 ** (REAL_DECIMALS - digit)) % 10
+    characters[:, REAL_WIDTH - REAL_DECIMALS - 5] = ord('.')
+    characters[:, REAL_WIDTH - 4] = ord('E')
+    characters[:, REAL_WIDTH - 3] = np.where(exponents < 0, ord('-'), ord('+'))
+    characters[:, REAL_WIDTH - 2] = _ZERO + np.abs(exponents) // 10 % 10
+    characters[:, REAL_WIDTH - 1] = _ZERO + np.abs(exponents) % 10
+
+    for idx in np.flatnonzero(python_formatted):
+        text = f"{values[idx]:{REAL_WIDTH}.{REAL_DECIMALS}E}"
+        characters[idx] = np.frombuffer(text.rjust(REAL_WIDTH)[-REAL_WIDTH:].encode(), dtype=np.uint8)
+    return characters
+
+
+def _scale(magnitudes: np.ndarray, powers: np.ndarray) -> np.ndarray:
+    """
+    @return: magnitudes * 10^powers, computed with a single rounding (powers of ten up to 10^22 are exact)
+    """
+    powers = np.clip(powers, -22, 22)
+    return np.where(powers >= 0, magnitudes * 10.0 ** np.abs(powers), magnitudes / 10.0 ** np.abs(powers))
+
+
+def _is_same(previous: np.ndarray, current: np.ndarray) -> bool:
+    return previous.shape == current.shape and np.array_equal(previous, current)
+
+
+def _write_real_array(rch_file: TextIO, array: np.ndarray, name: str) -> None:
+    first_value = array.flat[0]
+    if np.all(array == first_value) and np.isfinite(first_value):
+        value = format_reals(np.array([first_value])).tobytes().decode()
+        rch_file.write(f"CONSTANT {value}  #{name}\n")
+        return
+
+    rch_file.write(f"INTERNAL               1  {REAL_FORMAT} -1 #{name}\n")
+    rows, cols = array.shape
+    _write_lines(rch_file, format_reals(array).reshape(rows, cols, REAL_WIDTH))
+
+
+def _write_int_array(rch_file: TextIO, array: np.ndarray, name: str) -> None:
+    first_value = array.flat[0]
+    if np.all(array == first_value):
+        rch_file.write(f"CONSTANT {int(first_value):{INT_WIDTH}d}  #{name}\n")
+        return
+
+    rch_file.write(f"INTERNAL               1  {INT_FORMAT} -1 #{name}\n")
+    rows, cols = array.shape
+    text = np.char.mod(f"%{INT_WIDTH}d", array.astype(np.int64).ravel()).astype(f"S{INT_WIDTH}")
+    _write_lines(rch_file, text.view(np.uint8).reshape(rows, cols, INT_WIDTH))
+
+
+def _write_lines(rch_file: TextIO, characters: np.ndarray) -> None:
+    """
+    Write formatted array - every row starts a new line, lines hold VALUES_PER_LINE values (as Fortran format
+    reads them row by row).
+    @param characters: 3D uint8 array (rows, cols, width) of formatted values
+    """
+    rows, cols, width = characters.shape
+    full_lines, last_line_values = divmod(cols, VALUES_PER_LINE)
+    newline = np.full((rows, 1), ord('\n'), dtype=np.uint8)
+
+    parts = []
+    if full_lines > 0:
+        lines = characters[:, :full_lines * VALUES_PER_LINE].reshape(rows, full_lines, VALUES_PER_LINE * width)
+        parts.append(np.concatenate([lines, np.full((rows, full_lines, 1), ord('\n'), dtype=np.uint8)],
+                                    axis=2).reshape(rows, -1))
+    if last_line_values > 0:
+        parts.append(characters[:, full_lines * VALUES_PER_LINE:].reshape(rows, -1))
+        parts.append(newline)
+    rch_file.write(np.concatenate(parts, axis=1).tobytes().decode())
@@ -0,0 +1,139 @@
+from typing import Sequence, Tuple
+
+import numpy as np
+
+NO_ZONE_LABEL = -1
+
+
+class RechargeZones:
+    """
+    Recharge zones of a Modflow model - 4-connected areas of cells with equal recharge value.
+    Zones are stored as a single label raster, masks of the zones are created only when needed.
+    Zones are ordered by their first cell (row-major order).
+    """
+
+    def __init__(self, label_raster: np.ndarray, values: np.ndarray, cells_counts: np.ndarray,
+                 bounding_boxes: np.ndarray):
+        """
+        @param label_raster: 2D int32 array - index of the zone of every cell
+        @param values: Recharge value of every zone
+        @param cells_counts: Amount of cells of every zone
+        @param bounding_boxes: 2D array (zones, 4) - (min row, min col, max row, max col) of every zone
+        """
+        self.label_raster = label_raster
+        self.values = values
+        self.cells_counts = cells_counts
+        self.bounding_boxes = bounding_boxes
+
+    @staticmethod
+    def empty(project_shape: Tuple[int, int]) -> 'RechargeZones':
+        return RechargeZones(np.full(project_shape, NO_ZONE_LABEL, dtype=np.int32),
+                             np.zeros(0), np.zeros(0, dtype=np.int64), np.zeros((0, 4), dtype=np.int64))
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __getitem__(self, zone_id: int) -> np.ndarray:
+        return self.get_mask(zone_id)
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.label_raster.shape
+
+    def get_mask(self, zone_id: int) -> np.ndarray:
+        """
+        @param zone_id: Index of the zone
+        @return: Binary mask (float64, same as shape masks) of the zone
+        """
+        if zone_id < 0 or zone_id >= len(self):
+            raise IndexError("Recharge zone " + str(zone_id) + " does not exist")
+        return (self.label_raster == zone_id).astype(np.float64)
+
+    def get_union_mask(self, zone_ids: Sequence[int]) -> np.ndarray:
+        """
+        @param zone_ids: Indices of the zones
+        @return: Binary mask (float64) of all given zones
+        """
+        return np.isin(self.label_raster, np.asarray(zone_ids, dtype=np.int32)).astype(np.float64)
+
+
+def label_recharge_zones(recharge_array: np.ndarray) -> RechargeZones:
+    """
+    Find recharge zones - 4-connected areas of cells with equal recharge value. Cells are first grouped into runs
+    (horizontal sequences of equal values), then runs touching vertically are merged with a vectorized union-find.
+
+    @param recharge_array: 2D array of recharge values (single stress period and layer)
+    @return: RechargeZones of the given array
+    """
+    rows, cols = recharge_array.shape
+    if rows == 0 or cols == 0:
+        return RechargeZones.empty((rows, cols))
+    values = recharge_array.ravel()
+
+    # horizontal runs - a new run starts at the beginning of every row and at every change of value
+    run_starts = np.ones((rows, cols), dtype=bool)
+    run_starts[:, 1:] = recharge_array[:, 1:] != recharge_array[:, :-1]
+    run_ids = np.cumsum(run_starts.ravel(), dtype=np.int64) - 1
+    runs_count = int(run_ids[-1]) + 1
+
+    # runs of neighbouring rows having equal values in the same column
+    vertical = (recharge_array[1:, :] == recharge_array[:-1, :]).ravel()
+    upper_runs = run_ids[:-cols][vertical]
+    lower_runs = run_ids[cols:][vertical]
+    edges = np.unique(np.stack([upper_runs, lower_runs], axis=1), axis=0) if len(upper_runs) > 0 \
+        else np.zeros((0, 2), dtype=np.int64)
+
+    root_runs = _merge_runs(runs_count, edges[:, 0], edges[:, 1])
+
+    # runs are numbered in row-major order, so root of every zone is its first run (same order as flood fill)
+    roots, run_labels = np.unique(root_runs, return_inverse=True)
+    label_raster = run_labels.reshape(-1)[run_ids].astype(np.int32)
+
+    zones_count = len(roots)
+    cells_counts = np.bincount(label_raster, minlength=zones_count)
+    zone_values = values[np.flatnonzero(run_starts.ravel())[roots]]
+
+    # bounding boxes - cells sorted by label keep row-major order inside every zone
+    cells_order = np.argsort(label_raster, kind="stable")
+    zone_begins = np.concatenate(([0], np.cumsum(cells_counts)[:-1]))
+    zone_ends = zone_begins + cells_counts - 1
+    cells_rows, cells_cols = np.divmod(cells_order, cols)
+    bounding_boxes = np.stack([cells_rows[zone_begins],
+                               np.minimum.reduceat(cells_cols, zone_begins),
+                               cells_rows[zone_ends],
+                               np.maximum.reduceat(cells_cols, zone_begins)], axis=1)
+
+    return RechargeZones(label_raster.reshape(rows, cols), zone_values, cells_counts, bounding_boxes)
+
+
+def _merge_runs(runs_count: int, first_runs: np.ndarray, second_runs: np.ndarray) -> np.ndarray:
+    """
+    Union-find over all runs at once - every connected pair is hooked to the smaller root, then paths are compressed
+    by pointer jumping, until every pair shares the root.
+
+    @param runs_count: Amount of runs
+    @param first_runs: First runs of the connected pairs
+    @param second_runs: Second runs of the connected pairs
+    @return: Root (smallest run index) of every run
+    """
+    parents = np.arange(runs_count, dtype=np.int64)
+    while True:
+        first_roots = parents[first_runs]
+        second_roots = parents[second_runs]
+        not_merged = first_roots != second_roots
+        if not np.any(not_merged):
+            return parents
+
+        first_roots = first_roots[not_merged]
+        second_roots = second_roots[not_merged]
+        new_roots = np.minimum(first_roots, second_roots)
+        np.minimum.at(parents, first_roots, new_roots)
+        np.minimum.at(parents, second_roots, new_roots)
+
+        # pointer jumping
+        while True:
+            grandparents = parents[parents]
+            if np.array_equal(grandparents, parents):
+                break
+            parents = grandparents
+
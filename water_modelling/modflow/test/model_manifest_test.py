@@ -0,0 +1,62 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from modflow import model_manifest
+
+modflow_project = "simple1"
+nam_file = "simple1.nam"
+
+
+class ModelManifestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workspace = tempfile.mkdtemp()
+        self.project_path = os.path.join(self.workspace, modflow_project)
+        shutil.copytree(modflow_project, self.project_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.workspace)
+
+    def test_create_and_read(self):
+        manifest = model_manifest.create(self.project_path, nam_file)
+        self.assertEqual(model_manifest.read(self.project_path), manifest)
+        self.assertEqual((manifest.rows, manifest.cols, manifest.nper), (10, 10, 4))
+        self.assertEqual(manifest.perlen, [365.0, 30.0, 30.0, 30.0])
+        self.assertEqual(manifest.head_file, "simple1.fhd")
+
+        zones = model_manifest.read_recharge_zones(self.project_path)
+        self.assertEqual(len(zones), 3)
+        np.testing.assert_array_equal(zones.cells_counts, [10, 10, 80])
+
+    def test_modified_model(self):
+        manifest = model_manifest.create(self.project_path, nam_file)
+
+        # output files don't invalidate the manifest
+        with open(os.path.join(self.project_path, "simple1.fhd"), 'a') as fhd_file:
+            fhd_file.write("\n")
+        self.assertIsNotNone(model_manifest.read(self.project_path))
+
+        with open(os.path.join(self.project_path, "simple1.rch"), 'a') as rch_file:
+            rch_file.write("\n")
+        self.assertIsNone(model_manifest.read(self.project_path))
+
+        model_manifest.update_fingerprint(self.project_path, manifest)
+        self.assertEqual(model_manifest.read(self.project_path), manifest)
+
+    def test_failed_save_keeps_manifest(self):
+        manifest = model_manifest.create(self.project_path, nam_file)
+        files = sorted(os.listdir(self.project_path))
+
+        with mock.patch.object(model_manifest.json, "dump", side_effect=OSError("No space left on device")):
+            self.assertRaises(OSError, model_manifest.update_fingerprint, self.project_path, manifest)
+        self.assertEqual(model_manifest.read(self.project_path), manifest)
+        self.assertEqual(sorted(os.listdir(self.project_path)), files)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import threading
+import unittest
+
+from app_config import deployment_config  # noqa: F401 - imported first like in the application (circular import)
+from modflow.modflow_desktop_deployer import ModflowDesktopDeployer
+
+# Stands in for Modflow - reads the nam file relative to its working directory (like Modflow), writes its name
+# to the log and waits for enter like Modflow
+FAKE_MODFLOW = """#!{python}
+import sys, time
+with open(sys.argv[1]) as nam_file:
+    model_name = nam_file.read()
+time.sleep(0.2)
+sys.stdin.readline()
+print(model_name)
+print("Normal termination of simulation")
+"""
+
+
+@unittest.skipIf(sys.platform == "win32", "fake Modflow executable is a script")
+class ModflowDesktopDeployerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workspace = tempfile.mkdtemp()
+        self.modflow_exe = os.path.join(self.workspace, "modflow_exe")
+        with open(self.modflow_exe, "w") as exe_file:
+            exe_file.write(FAKE_MODFLOW.format(python=sys.executable))
+        os.chmod(self.modflow_exe, os.stat(self.modflow_exe).st_mode | stat.S_IEXEC)
+
+    def tearDown(self):
+        shutil.rmtree(self.workspace)
+
+    def _create_model(self, model_name: str) -> str:
+        model_dir = os.path.join(self.workspace, "modflow", model_name)
+        os.makedirs(model_dir)
+        with open(os.path.join(model_dir, "model.nam"), "w") as nam_file:
+            nam_file.write(model_name)
+        return model_dir
+
+    def test_concurrent_runs(self):
+        model_dirs = {f"model{idx}": self._create_model(f"model{idx}") for idx in range(8)}
+        cwd = os.getcwd()
+        results = {}
+
+        def run_model(model_name: str):
+            deployer = ModflowDesktopDeployer(self.modflow_exe, model_dirs[model_name], "model.nam")
+            deployer.run()
+            results[model_name] = deployer.wait_for_termination()
+
+        threads = [threading.Thread(target=run_model, args=[model_name]) for model_name in model_dirs]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(os.getcwd(), cwd)
+        self.assertEqual(results, {model_name: None for model_name in model_dirs})
+        for model_name, model_dir in model_dirs.items():
+            self.assertEqual(sorted(os.listdir(model_dir)), sorted(["model.nam", ModflowDesktopDeployer.LOG_FILE]))
+            with open(os.path.join(model_dir, ModflowDesktopDeployer.LOG_FILE)) as log_file:
+                self.assertEqual(log_file.readline().strip(), model_name)
+
+    def test_relative_executable(self):
+        model_dir = self._create_model("model")
+        cwd = os.getcwd()
+        os.chdir(self.workspace)
+        try:
+            deployer = ModflowDesktopDeployer("./modflow_exe", model_dir, "model.nam")
+            deployer.run()
+            self.assertIsNone(deployer.wait_for_termination())
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == '__main__':
+    unittest.main()
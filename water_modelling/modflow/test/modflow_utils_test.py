@@ -1,3 +1,6 @@
+import os
+import shutil
+import tempfile
 import unittest
 import numpy as np
 
@@ -75,6 +78,45 @@ class ModflowUtilsTest(unittest.TestCase):
             [0, 0, 1, 1, 1, 1, 1, 1, 1, 1]
         ]))
 
+    def test_model_cache(self):
+        with tempfile.TemporaryDirectory() as workspace:
+            project_path = os.path.join(workspace, modflow_project)
+            shutil.copytree(modflow_project, project_path)
+            utils.invalidate_model_cache()
+            stats = utils.get_model_cache_stats()
+
+            model = utils.load_model(project_path, nam_file, load_only=["rch", "dis"])
+            self.assertIs(utils.load_model(project_path, nam_file, load_only=["rch"]), model)
+            self.assertIsNot(utils.load_model(project_path, nam_file), model)
+
+            # modified package file - model is loaded again
+            with open(os.path.join(project_path, modflow_project + ".rch"), 'a') as rch_file:
+                rch_file.write("\n")
+            self.assertIsNot(utils.load_model(project_path, nam_file, load_only=["rch"]), model)
+
+            new_stats = utils.get_model_cache_stats()
+            self.assertEqual(new_stats["hits"] - stats["hits"], 1)
+            self.assertEqual(new_stats["misses"] - stats["misses"], 3)
+            self.assertEqual(new_stats["entries"], 1)
+            utils.invalidate_model_cache(project_path, nam_file)
+            self.assertEqual(utils.get_model_cache_stats()["entries"], 0)
+
+    def test_model_cache_exclusive(self):
+        with tempfile.TemporaryDirectory() as workspace:
+            project_path = os.path.join(workspace, modflow_project)
+            shutil.copytree(modflow_project, project_path)
+            utils.invalidate_model_cache()
+
+            # an exclusive load takes the cached model, so it's never shared with a writer
+            model = utils.load_model(project_path, nam_file, load_only=["rch"])
+            self.assertIs(utils.load_model(project_path, nam_file, load_only=["rch"], exclusive=True), model)
+            self.assertEqual(utils.get_model_cache_stats()["entries"], 0)
+
+            exclusive_model = utils.load_model(project_path, nam_file, load_only=["rch"], exclusive=True)
+            self.assertIsNot(exclusive_model, model)
+            self.assertEqual(utils.get_model_cache_stats()["entries"], 0)
+            self.assertIsNot(utils.load_model(project_path, nam_file, load_only=["rch"]), exclusive_model)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,73 @@
+import os
+import tempfile
+import unittest
+
+import flopy
+import numpy as np
+
+from modflow import rch_writer
+
+
+class RchWriterTest(unittest.TestCase):
+
+    def test_format_reals(self):
+        values = np.array([0.0, -0.0, 1.0, -2.7497, 1.028137e-3, 9.9999996e-4, 3.4e38, 1e-40, np.nan],
+                          dtype=np.float32)
+        formatted = rch_writer.format_reals(values).tobytes().decode()
+        self.assertEqual(formatted, "".join(f"{float(value):15.6E}" for value in values))
+
+    def test_write_rch(self):
+        rng = np.random.default_rng(0)
+        nper, nrow, ncol = 5, 3, 12
+        recharge = rng.random((nper, nrow, ncol)).astype(np.float32)
+        recharge[1] = recharge[0]
+        recharge[2] = 0.001
+        irch = np.ones((nper, nrow, ncol), dtype=np.int32)
+        irch[3:, 0, :] = 2
+
+        with tempfile.TemporaryDirectory() as workspace:
+            path = os.path.join(workspace, "model.rch")
+            rch_writer.write_rch(path, nrchop=2, ipakcb=9, recharge=recharge, irch=irch)
+
+            with open(path) as rch_file:
+                content = rch_file.read()
+            self.assertIn("        -1        -1 # Stress period 2", content)
+            self.assertIn("CONSTANT    1.000000E-03", content)
+
+            model = flopy.modflow.Modflow(model_ws=workspace)
+            flopy.modflow.ModflowDis(model, nlay=2, nrow=nrow, ncol=ncol, nper=nper)
+            rch_package = flopy.modflow.ModflowRch.load(path, model, check=False)
+
+        self.assertEqual((rch_package.nrchop, rch_package.ipakcb), (2, 9))
+        np.testing.assert_allclose(rch_package.rech.array[:, 0], recharge, rtol=1e-6)  # E15.6 - 7 significant digits
+        np.testing.assert_array_equal(rch_package.irch.array[:, 0] + 1, irch)
+
+    def test_write_changed_periods(self):
+        rng = np.random.default_rng(0)
+        recharge = rng.random((4, 3, 12)).astype(np.float32)
+        recharge[2] = recharge[1]
+
+        with tempfile.TemporaryDirectory() as workspace:
+            path = os.path.join(workspace, "model.rch")
+            expected_path = os.path.join(workspace, "expected.rch")
+            rch_writer.write_rch(path, nrchop=3, ipakcb=0, recharge=recharge)
+
+            # period 2 changed - period 3 reused its arrays, so it has to be written again
+            recharge[1, 0, 0] = 5.0
+            changed_periods = [False, True, False, False]
+            rch_writer.write_rch(path, nrchop=3, ipakcb=0, recharge=recharge, changed_periods=changed_periods)
+            rch_writer.write_rch(expected_path, nrchop=3, ipakcb=0, recharge=recharge)
+
+            with open(path) as rch_file, open(expected_path) as expected_file:
+                content = rch_file.read()
+                self.assertEqual(content, expected_file.read())
+            self.assertIn("   5.000000E+00", content)
+
+            # file written with different options isn't reused
+            rch_writer.write_rch(path, nrchop=1, ipakcb=0, recharge=recharge, changed_periods=[False] * 4)
+            with open(path) as rch_file:
+                self.assertEqual(rch_file.read().count("INTERNAL"), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
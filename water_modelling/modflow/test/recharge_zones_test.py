@@ -0,0 +1,46 @@
+import unittest
+
+import numpy as np
+
+from modflow.recharge_zones import label_recharge_zones
+
+
+class RechargeZonesTest(unittest.TestCase):
+
+    def test_zones_order_and_table(self):
+        recharge = np.array([[1.0, 1.0, 2.0, 2.0],
+                             [3.0, 1.0, 1.0, 2.0],
+                             [3.0, 3.0, 1.0, 1.0]], dtype=np.float32)
+        zones = label_recharge_zones(recharge)
+
+        self.assertEqual(len(zones), 3)
+        np.testing.assert_array_equal(zones.label_raster, [[0, 0, 1, 1],
+                                                           [2, 0, 0, 1],
+                                                           [2, 2, 0, 0]])
+        np.testing.assert_array_equal(zones.values, [1.0, 2.0, 3.0])
+        np.testing.assert_array_equal(zones.cells_counts, [6, 3, 3])
+        np.testing.assert_array_equal(zones.bounding_boxes, [[0, 0, 2, 3], [0, 2, 1, 3], [1, 0, 2, 1]])
+
+    def test_equal_values_not_connected(self):
+        recharge = np.array([[1.0, 2.0, 1.0],
+                             [2.0, 2.0, 1.0],
+                             [1.0, 2.0, 2.0]])
+        zones = label_recharge_zones(recharge)
+
+        self.assertEqual(len(zones), 4)
+        np.testing.assert_array_equal(zones[2], [[0, 0, 1], [0, 0, 1], [0, 0, 0]])
+        np.testing.assert_array_equal(zones.get_union_mask([0, 3]), [[1, 0, 0], [0, 0, 0], [1, 0, 0]])
+        self.assertRaises(IndexError, zones.get_mask, 4)
+
+    def test_u_shaped_zone(self):
+        recharge = np.array([[1, 2, 1, 2, 1],
+                             [1, 2, 1, 2, 1],
+                             [1, 1, 1, 1, 1]])
+        zones = label_recharge_zones(recharge)
+
+        self.assertEqual(len(zones), 3)
+        np.testing.assert_array_equal(zones.cells_counts, [11, 2, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
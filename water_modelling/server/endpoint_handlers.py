@@ -1,7 +1,8 @@
+from dataclasses import asdict
 from typing import Tuple
 from app_config import deployment_config
 from datapassing.shape_data import ShapeMetadata
-from flask import render_template, redirect, abort, jsonify, send_file, request
+from flask import render_template, redirect, abort, jsonify, send_file, request, Response
 from flask_paginate import Pagination, get_page_args
 
 from deployment import daos
@@ -9,8 +10,13 @@ from hydrus import hydrus_utils
 from metadata import project_metadata_loader
 from metadata.hydrological_model_enum import HydrologicalModelEnum
 from metadata.project_metadata import ProjectMetadata
-from modflow import modflow_utils
+from modflow import modflow_utils, model_manifest
 from server import endpoints, template
+from simulation import ensemble, simulation_cache, simulation_events, simulation_metrics, simulation_registry, \
+    simulation_scheduler, simulation_service
+from simulation.ensemble import Scenario
+from simulation.exceptions import SimulationQueueFullException
+from simulation.simulation_service import SimulationService
 from zipfile import ZipFile
 from utils import path_formatter
 
@@ -20,6 +26,7 @@ import json
 import numpy as np
 import os
 import shutil
+import uuid
 import local_configuration_dao as lcd
 
 
@@ -239,11 +246,9 @@ def upload_modflow_handler():
             shutil.rmtree(model_path, ignore_errors=True)  # remove invalid model dir
             return abort(500)
 
-        # if model is valid, read its parameters and store them
-        model_data = modflow_utils.get_model_data(model_path, nam_file_name)
-
-        state.recharge_masks = modflow_utils.get_shapes_from_rch(model_path, nam_file_name,
-                                                                 (model_data["rows"], model_data["cols"]))
+        # if model is valid, read its parameters and store them (with recharge zones) in model manifest
+        model_data = model_manifest.create(model_path, nam_file_name).get_model_data()
+        state.recharge_zones = model_manifest.read_recharge_zones(model_path)
 
         # update project JSON
         project_metadata = state.loaded_project
@@ -438,7 +443,7 @@ def next_model_redirect_handler(hydrus_model_index, error_flag):
 def next_shape_redirect_handler(rch_shape_index: int):
     state = app_utils.get_user_by_cookie(request.cookies.get(app_utils.COOKIE_NAME))
 
-    if rch_shape_index >= len(state.recharge_masks):
+    if state.recharge_zones is None or rch_shape_index >= len(state.recharge_zones):
         state.get_shapes_from_masks_ids()
         for key in state.loaded_shapes:
             print(key, '->\n', state.loaded_shapes[key].shape_mask)  # TODO: Logger
@@ -448,7 +453,7 @@ def next_shape_redirect_handler(rch_shape_index: int):
         rows_height, cols_width = modflow_utils.scale_cells_size(state.loaded_project.row_cells,
                                                                  state.loaded_project.col_cells, 500)
         return render_template(template.RCH_SHAPES, hydrus_models=state.loaded_project.hydrus_models,
-                               shape_mask=state.recharge_masks[rch_shape_index], rch_shape_index=rch_shape_index,
+                               shape_mask=state.recharge_zones.get_mask(rch_shape_index), rch_shape_index=rch_shape_index,
                                rows_height=rows_height, cols_width=cols_width, current_model=current_model)
 
 
@@ -500,3 +505,151 @@ def simulation_summary_handler():
         cols_width=cols_width,
         rows_height=rows_height,
     )
+
+
+def simulation_cache_handler():
+    cache = simulation_cache.get_simulation_cache()
+    if cache is None:
+        return jsonify(error=str("Simulation cache is disabled")), 404
+
+    return jsonify(stats=cache.get_stats(), entries=[asdict(entry) for entry in cache.get_entries()])
+
+
+def purge_simulation_cache_handler(cache_key=None):
+    cache = simulation_cache.get_simulation_cache()
+    if cache is None:
+        return jsonify(error=str("Simulation cache is disabled")), 404
+
+    return jsonify(removed=cache.purge(cache_key))
+
+
+def simulation_history_handler():
+    project_name = request.args.get('project')
+    limit = request.args.get('limit', default=100, type=int)
+    simulations = simulation_registry.get_registry().get_simulations(project_name, limit)
+
+    return jsonify(simulations=[{
+        'id': record.simulation_id,
+        'project': record.project,
+        'input_fingerprint': record.input_fingerprint,
+        'created': record.created,
+        'stages': {stage: {
+            'started': stage_record.started,
+            'ended': stage_record.ended,
+            'timings': stage_record.timings,
+            'errors': [str(sim_error) for sim_error in stage_record.errors]
+        } for stage, stage_record in record.stages.items()},
+        'artifacts': record.artifacts,
+        'measurements': [asdict(measurement) for measurement in record.measurements]
+    } for record in simulations])
+
+
+def metrics_handler():
+    return Response(simulation_metrics.get_metrics().to_prometheus(), mimetype='text/plain; version=0.0.4')
+
+
+def ensemble_run_handler():
+    state = app_utils.get_user_by_cookie(request.cookies.get(app_utils.COOKIE_NAME))
+    body = request.json or {}
+    if not body.get('scenarios'):
+        return jsonify(error=str("No scenarios given")), 400
+
+    # weather files are applied when the ensemble runs - they're kept with ensembles of the project
+    inputs_dir = os.path.join(os.path.dirname(state.get_modflow_dir()), simulation_service.ENSEMBLES_DIR_NAME,
+                              "inputs-" + uuid.uuid4().hex)
+    scenarios = []
+    for scenario_data in body['scenarios']:
+        weather_files = {}
+        for model_name, weather_csv in scenario_data.get('weather', {}).items():
+            os.makedirs(inputs_dir, exist_ok=True)
+            filepath = os.path.join(inputs_dir, f"{len(scenarios)}-{len(weather_files)}.csv")
+            with open(filepath, 'w') as weather_file:
+                weather_file.write(weather_csv)
+            weather_files[model_name] = filepath
+        masks = scenario_data.get('masks')
+        scenarios.append(Scenario(
+            name=str(scenario_data.get('name', '')),
+            weather_files=weather_files,
+            hydrus_files=scenario_data.get('hydrus_files', {}),
+            spin_up=scenario_data.get('spin_up'),
+            masks={model_name: np.array(mask) for model_name, mask in masks.items()} if masks is not None else None
+        ))
+
+    if state.simulation_service is None:
+        state.set_simulation_service(SimulationService(state.get_hydrus_dir(), state.get_modflow_dir()))
+    project_masks = {model_name: shape.shape_mask for model_name, shape in state.loaded_shapes.items()
+                     if shape is not None}
+    try:
+        ensemble_id, queue_status = state.simulation_service.submit_ensemble(
+            state.loaded_project.name, state.loaded_project.modflow_model, project_masks,
+            int(state.loaded_project.spin_up), scenarios, request.cookies.get(app_utils.COOKIE_NAME),
+            max(simulation_scheduler.MIN_USER_PRIORITY, int(body.get('priority', 0))), inputs_dir)
+    except ValueError as err:
+        shutil.rmtree(inputs_dir, ignore_errors=True)
+        return jsonify(error=str(err)), 400
+    except SimulationQueueFullException as err:
+        shutil.rmtree(inputs_dir, ignore_errors=True)
+        return jsonify(error=str(err)), 503
+    return jsonify(id=ensemble_id, queue=asdict(queue_status) if queue_status else None)
+
+
+def ensemble_handler(ensemble_id):
+    record = simulation_registry.get_registry().get_simulation(int(ensemble_id))
+    if record is None:
+        return jsonify(error=str("There is no ensemble with this ID")), 404
+
+    # the ensemble finished (also if it failed or was cancelled) when all its stages ended
+    stage_errors = [str(sim_error) for stage_record in record.stages.values() for sim_error in stage_record.errors]
+    if not all(stage_record.ended is not None for stage_record in record.stages.values()):
+        return jsonify(finished=False, errors=stage_errors)
+
+    scenarios = {'scenarios': [], 'errors': {}}
+    if ensemble.SCENARIOS_ARTIFACT in record.artifacts:
+        with open(record.artifacts[ensemble.SCENARIOS_ARTIFACT]) as handle:
+            scenarios = json.load(handle)
+    return jsonify(finished=True, heads=ensemble.HEADS_ARTIFACT in record.artifacts,
+                   scenarios=scenarios['scenarios'], errors=scenarios['errors'], stage_errors=stage_errors,
+                   timings={stage: stage_record.timings for stage, stage_record in record.stages.items()})
+
+
+def ensemble_heads_handler(ensemble_id):
+    record = simulation_registry.get_registry().get_simulation(int(ensemble_id))
+    if record is None or ensemble.HEADS_ARTIFACT not in record.artifacts:
+        return jsonify(error=str("There are no heads of an ensemble with this ID")), 404
+
+    return send_file(record.artifacts[ensemble.HEADS_ARTIFACT], as_attachment=True,
+                     download_name=f"ensemble_{ensemble_id}_heads.npy")
+
+
+def simulation_events_handler(simulation_id):
+    simulation_id = int(simulation_id)
+    registry = simulation_registry.get_registry()
+    if registry.get_simulation(simulation_id) is None:
+        return jsonify(error=str("There is no simulation with this ID")), 404
+
+    # reconnecting EventSource sends ID of the last event it received - the stream resumes after it
+    after_sequence = request.headers.get('Last-Event-ID', default=request.args.get('after', default=0, type=int),
+                                         type=int)
+    event_bus = simulation_events.get_event_bus()
+
+    def stream():
+        last_sequence = after_sequence
+        while True:
+            events = event_bus.wait_for_events(simulation_id, last_sequence,
+                                               timeout=deployment_config.SIMULATION_EVENTS_KEEPALIVE)
+            for event in events:
+                last_sequence = event.sequence
+                yield f"id: {event.sequence}\nevent: {event.kind}\ndata: {json.dumps(asdict(event))}\n\n"
+                if event.kind == simulation_events.SIMULATION_FINISHED:
+                    return
+
+            if not events:
+                # events of simulations run by other processes (or before a restart) aren't on this bus
+                stage_statuses = registry.get_stage_statuses(simulation_id)
+                if all(stage_status.has_ended() for stage_status in stage_statuses.values()):
+                    yield f"event: {simulation_events.SIMULATION_FINISHED}\n" \
+                          f"data: {json.dumps({'simulation_id': simulation_id})}\n\n"
+                    return
+                yield ": keep-alive\n\n"
+
+    return Response(stream(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
@@ -19,4 +19,12 @@ MANUAL_SHAPES = '/manual-shapes/<hydrus_model_index>'
 SIMULATION = '/simulation'
 SIMULATION_RUN = '/simulation-run'
 SIMULATION_CHECK = '/simulation-check/<simulation_id>'
-
+SIMULATION_HISTORY = '/simulation-history'
+SIMULATION_CANCEL = '/simulation-cancel/<simulation_id>'
+SIMULATION_EVENTS = '/simulation-events/<simulation_id>'
+METRICS = '/metrics'
+SIMULATION_CACHE = '/simulation-cache'
+SIMULATION_CACHE_ENTRY = '/simulation-cache/<cache_key>'
+ENSEMBLE_RUN = '/ensemble-run'
+ENSEMBLE = '/ensemble/<ensemble_id>'
+ENSEMBLE_HEADS = '/ensemble-heads/<ensemble_id>'
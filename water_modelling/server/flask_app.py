@@ -1,11 +1,13 @@
 import uuid
+from dataclasses import asdict
 
 from flask import Flask, render_template, request, redirect, jsonify, make_response
 from server import endpoints, template, path_checker
 import app_utils
-import threading
 import endpoint_handlers
 import local_configuration_dao as lcd
+from simulation import simulation_scheduler
+from simulation.exceptions import SimulationAccessDeniedException, SimulationQueueFullException
 from simulation.simulation_service import SimulationService
 
 app = Flask("App")
@@ -255,38 +257,119 @@ def run_simulation():
 
     simulation_service = SimulationService(state.get_hydrus_dir(), state.get_modflow_dir())
     state.set_simulation_service(simulation_service)
-    sim = state.simulation_service.prepare_simulation()
+    sim = state.simulation_service.prepare_simulation(state.loaded_project.name)
 
     sim.set_modflow_project(modflow_project=state.loaded_project.modflow_model)
     sim.set_loaded_shapes(loaded_shapes=state.loaded_shapes)
     sim.set_spin_up(spin_up=int(state.loaded_project.spin_up))
+    # ?resume=1 starts from the first stage (and reruns only Hydrus models) without a valid checkpoint
+    sim.set_resume(resume=bool(request.args.get('resume', default=0, type=int)))
 
     sim_id = sim.get_id()
+    # ?priority=N (lower runs first) - users can't request priorities reserved for internal submissions
+    priority = max(simulation_scheduler.MIN_USER_PRIORITY, request.args.get('priority', default=0, type=int))
 
-    thread = threading.Thread(target=state.simulation_service.run_simulation, args=[sim_id])
-    thread.start()
-    return jsonify(id=sim_id)
+    try:
+        queue_status = state.simulation_service.submit_simulation(sim_id, request.cookies.get(app_utils.COOKIE_NAME),
+                                                                  priority)
+    except SimulationQueueFullException as err:
+        return jsonify(error=str(err)), 503
+    return jsonify(id=sim_id, queue=asdict(queue_status) if queue_status else None)
 
 
 @app.route(endpoints.SIMULATION_CHECK, methods=['GET'])
 def check_simulation_status(simulation_id: int):
     state = app_utils.get_user_by_cookie(request.cookies.get(app_utils.COOKIE_NAME))
-    hydrus_stage_status, passing_stage_status, modflow_stage_status = state.simulation_service.check_simulation_status(
-        int(simulation_id))
+    # simulations are kept in the registry - they can be checked after a restart or by another process too
+    simulation_service = state.simulation_service or SimulationService(state.get_hydrus_dir(),
+                                                                        state.get_modflow_dir())
+    stage_statuses = simulation_service.check_simulation_status(int(simulation_id))
+    if stage_statuses is None:
+        return jsonify(error=str("There is no simulation with this ID")), 404
+    hydrus_stage_status, passing_stage_status, modflow_stage_status = stage_statuses
+    queue_status = simulation_service.get_queue_status(int(simulation_id))
 
     response = {
         'hydrus': {
             'finished': hydrus_stage_status.has_ended(),
-            'errors': [str(sim_error) for sim_error in hydrus_stage_status.get_errors()]
+            'errors': [str(sim_error) for sim_error in hydrus_stage_status.get_errors()],
+            'timings': hydrus_stage_status.get_timings()
         },
         'passing': {
             'finished': passing_stage_status.has_ended(),
-            'errors': [str(sim_error) for sim_error in passing_stage_status.get_errors()]
+            'errors': [str(sim_error) for sim_error in passing_stage_status.get_errors()],
+            'timings': passing_stage_status.get_timings()
         },
         'modflow': {
             'finished': modflow_stage_status.has_ended(),
-            'errors': [str(sim_error) for sim_error in modflow_stage_status.get_errors()]
-        }
+            'errors': [str(sim_error) for sim_error in modflow_stage_status.get_errors()],
+            'timings': modflow_stage_status.get_timings()
+        },
+        'queue': asdict(queue_status) if queue_status else None
     }
 
     return jsonify(response)
+
+
+@app.route(endpoints.SIMULATION_CANCEL, methods=['POST'])
+def cancel_simulation(simulation_id: int):
+    state = app_utils.get_user_by_cookie(request.cookies.get(app_utils.COOKIE_NAME))
+    simulation_service = state.simulation_service or SimulationService(state.get_hydrus_dir(),
+                                                                        state.get_modflow_dir())
+    if simulation_service.check_simulation_status(int(simulation_id)) is None:
+        return jsonify(error=str("There is no simulation with this ID")), 404
+    try:
+        if not simulation_service.cancel_simulation(int(simulation_id), request.cookies.get(app_utils.COOKIE_NAME)):
+            return jsonify(error=str("The simulation is neither queued nor running")), 409
+    except SimulationAccessDeniedException as err:
+        return jsonify(error=str(err)), 403
+    return jsonify(id=int(simulation_id), cancelled=True)
+
+
+@app.route(endpoints.SIMULATION_EVENTS, methods=['GET'])
+def simulation_events(simulation_id):
+    # Server-Sent Events stream of stage transitions and finished models - replaces polling of SIMULATION_CHECK
+    return endpoint_handlers.simulation_events_handler(simulation_id)
+
+
+@app.route(endpoints.METRICS, methods=['GET'])
+def metrics():
+    # Prometheus text format - wall time, CPU time and I/O of simulation stages and deployer operations
+    return endpoint_handlers.metrics_handler()
+
+
+@app.route(endpoints.ENSEMBLE_RUN, methods=['POST'])
+def run_ensemble():
+    state = app_utils.get_user_by_cookie(request.cookies.get(app_utils.COOKIE_NAME))
+    check_previous_steps = path_checker.path_check_define_shapes_method(state)
+    if check_previous_steps:
+        return check_previous_steps
+
+    return endpoint_handlers.ensemble_run_handler()
+
+
+@app.route(endpoints.ENSEMBLE, methods=['GET'])
+def ensemble(ensemble_id):
+    return endpoint_handlers.ensemble_handler(ensemble_id)
+
+
+@app.route(endpoints.ENSEMBLE_HEADS, methods=['GET'])
+def ensemble_heads(ensemble_id):
+    return endpoint_handlers.ensemble_heads_handler(ensemble_id)
+
+
+@app.route(endpoints.SIMULATION_CACHE, methods=['GET', 'DELETE'])
+def inspect_simulation_cache():
+    if request.method == 'DELETE':
+        return endpoint_handlers.purge_simulation_cache_handler()
+    return endpoint_handlers.simulation_cache_handler()
+
+
+@app.route(endpoints.SIMULATION_CACHE_ENTRY, methods=['DELETE'])
+def purge_simulation_cache_entry(cache_key):
+    return endpoint_handlers.purge_simulation_cache_handler(cache_key)
+
+
+@app.route(endpoints.SIMULATION_HISTORY, methods=['GET'])
+def simulation_history():
+    return endpoint_handlers.simulation_history_handler()
@@ -11,6 +11,7 @@ var Config = {
     "rchShapes": "/rch-shapes/",
     "simulation": "/simulation",
     "simulationCheck": "/simulation-check/",
+    "simulationEvents": "/simulation-events/",
     "simulationRun": "/simulation-run",
     "uploadHydrus": "/upload-hydrus",
     "uploadModflow": "/upload-modflow",
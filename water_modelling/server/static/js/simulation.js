@@ -23,7 +23,7 @@
                 $('#download').attr('hidden', true);
                 $('#start-alert').toast('show');
                 _hydrusCalc.removeAttr('hidden');
-                checkSimulationStatus(content["id"]);
+                watchSimulationStatus(content["id"]);
             },
             error: function (e) {
                 $('#error-alert').toast('show')
@@ -34,7 +34,37 @@
         });
     });
 
+    // status is refreshed when the server pushes a stage transition - polling is left for browsers without SSE
+    function watchSimulationStatus(id) {
+        if (!window.EventSource) {
+            checkSimulationStatus(id);
+            return;
+        }
+
+        // EventSource reconnects by itself and the stream resumes after the last received event
+        const events = new EventSource(Config.simulationEvents + id);
+        events.addEventListener("stage_ended", function () {
+            fetchSimulationStatus(id, function (stopCheckingSimulation) {
+                if (stopCheckingSimulation) {
+                    events.close();
+                }
+            });
+        });
+        events.addEventListener("simulation_finished", function () {
+            events.close();
+            fetchSimulationStatus(id, function () {});
+        });
+    }
+
     function checkSimulationStatus(id) {
+        fetchSimulationStatus(id, function (stopCheckingSimulation) {
+            if (!stopCheckingSimulation) {
+                setTimeout(checkSimulationStatus, 2000, id);
+            }
+        });
+    }
+
+    function fetchSimulationStatus(id, onStatus) {
         const url = Config.simulationCheck + id;
 
         ($).ajax({
@@ -45,13 +75,10 @@
                 const stopCheckingSimulation = handleHydrusResponse(data)
                                                 || handlePassingResponse(data)
                                                 || handleModflowResponse(data);
-
-                if (!stopCheckingSimulation) {
-                    setTimeout(checkSimulationStatus, 2000,[id]);
-                }
+                onStatus(stopCheckingSimulation);
             },
             error: function (e) {
-                setTimeout(checkSimulationStatus, 2000, [id]);
+                onStatus(false);
             }
         });
     }
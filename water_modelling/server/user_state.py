@@ -8,6 +8,7 @@ import numpy as np
 from app_config import deployment_config
 from datapassing.shape_data import ShapeMetadata
 from deployment import daos
+from modflow.recharge_zones import RechargeZones
 
 from simulation.exceptions import NoLoadedProjectException
 
@@ -33,7 +34,7 @@ class UserState:
         self.loaded_project: Optional[ProjectMetadata] = None
         self.simulation_service: Optional[SimulationService] = None
         self.current_method = None
-        self.recharge_masks: List[np.ndarray] = []  # masks from .rch file
+        self.recharge_zones: Optional[RechargeZones] = None  # shapes from .rch file
         self.models_masks_ids: Dict[HydrusModelName, HydrusModelIndices] = {}
         self.loaded_shapes: Dict[HydrusModelName, ShapeMetadata] = {}
         self._error_flag = False
@@ -70,7 +71,7 @@ class UserState:
         self.loaded_project = None
         self.simulation_service = None
         self.current_method = None
-        self.recharge_masks = []
+        self.recharge_zones = None
         self.models_masks_ids = {}
         self.loaded_shapes = {}
         self._error_flag = False
@@ -122,26 +123,15 @@ class UserState:
     def get_shapes_from_masks_ids(self):
         """
         models_masks_ids dictionary contains hydrus models names as a key and array of indexes as values.
-        Array stores indexes of shapes in the recharge_mask array.
+        Array stores indexes of shapes in the recharge_zones.
         This method for each hydrus model evaluates array of indexes to the shape mask and creates
         ShapeFileData object.
         :return: None
         """
 
         for hydrus_model in self.loaded_shapes:
-            shapes_count = -1
             if self.models_masks_ids[hydrus_model]:
-                shapes_count = len(self.models_masks_ids[hydrus_model])
-
-            if shapes_count == 1:
-                shape_mask = self.recharge_masks[self.models_masks_ids[hydrus_model][0]]
-
-            elif shapes_count > 1:
-                shape_mask = self.recharge_masks[self.models_masks_ids[hydrus_model][0]]
-                for idx in range(1, shapes_count):
-                    another_mask = self.recharge_masks[self.models_masks_ids[hydrus_model][idx]]
-                    shape_mask = np.logical_or(shape_mask, another_mask)
-
+                shape_mask = self.recharge_zones.get_union_mask(self.models_masks_ids[hydrus_model])
             else:
                 shape_mask = self.create_empty_mask()
 
@@ -0,0 +1,121 @@
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+from simulation.exceptions import UnsuccessfulSimulationException
+
+# Cancellation of running simulations - deployers register how to stop what they've started (kill a process,
+# stop a container, delete a job) on the token of the simulation, cancelling the token stops all of it at once.
+# Tokens are process-wide and looked up by simulation ID, so deployers don't need any new parameters.
+
+
+class CancellationToken:
+
+    def __init__(self):
+        self._cancelled = threading.Event()
+        self._callbacks: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+        self.reason: Optional[str] = None
+
+    def cancel(self, reason: str) -> bool:
+        """
+        Cancel the simulation - registered callbacks are called (once, in the calling thread).
+        @param reason: Description of the cancellation (ex. "Cancelled by user", "Hydrus stage timed out")
+        @return: False if the token was already cancelled
+        """
+        with self._lock:
+            if self._cancelled.is_set():
+                return False
+            self.reason = reason
+            self._cancelled.set()
+            callbacks, self._callbacks = self._callbacks, []
+
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as err:
+                print(f"Stopping cancelled simulation failed: {err}")  # TODO: Logger
+        return True
+
+    def is_cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        @param timeout: Maximal waiting time (in seconds), no limit if None
+        @return: True if the token was cancelled (before the timeout passed)
+        """
+        return self._cancelled.wait(timeout)
+
+    def raise_if_cancelled(self) -> None:
+        """
+        @raise UnsuccessfulSimulationException: if the token was cancelled
+        """
+        if self.is_cancelled():
+            raise UnsuccessfulSimulationException(f"Simulation was cancelled: {self.reason}")
+
+    @contextmanager
+    def on_cancel(self, callback: Callable[[], None]) -> Iterator[None]:
+        """
+        Call the callback if the token is cancelled inside the with statement (immediately if it already was).
+        """
+        with self._lock:
+            registered = not self._cancelled.is_set()
+            if registered:
+                self._callbacks.append(callback)
+        if not registered:
+            callback()
+        try:
+            yield
+        finally:
+            with self._lock:
+                if callback in self._callbacks:
+                    self._callbacks.remove(callback)
+
+    @contextmanager
+    def timeout(self, seconds: Optional[float], reason: str) -> Iterator[None]:
+        """
+        Cancel the token if the code inside the with statement doesn't finish in time.
+        @param seconds: Time limit, no limit if None
+        @param reason: Reason of the cancellation if the time limit passes
+        """
+        if seconds is None:
+            yield
+            return
+        timer = threading.Timer(seconds, self.cancel, args=[reason])
+        timer.daemon = True
+        timer.start()
+        try:
+            yield
+        finally:
+            timer.cancel()
+
+
+_tokens: Dict[int, CancellationToken] = {}
+_tokens_lock = threading.Lock()
+
+
+def get_token(simulation_id: int) -> CancellationToken:
+    """
+    @param simulation_id: ID of the simulation
+    @return: Token of the simulation (created if needed)
+    """
+    with _tokens_lock:
+        return _tokens.setdefault(simulation_id, CancellationToken())
+
+
+def cancel(simulation_id: int, reason: str) -> bool:
+    """
+    @param simulation_id: ID of the simulation
+    @param reason: Description of the cancellation
+    @return: False if the simulation was already cancelled
+    """
+    return get_token(simulation_id).cancel(reason)
+
+
+def release(simulation_id: int) -> None:
+    """
+    Forget the token of a simulation which won't run anymore.
+    """
+    with _tokens_lock:
+        _tokens.pop(simulation_id, None)
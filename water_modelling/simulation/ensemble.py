@@ -0,0 +1,309 @@
+import csv
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from datapassing.hydrus_modflow_passing import HydrusModflowPassing
+from datapassing.shape_data import Shape
+from deployment import daos
+from deployment.app_deployer_interface import IAppDeployer
+from modflow import model_manifest
+from server import weather_util
+from simulation import cancellation, simulation_cache, simulation_events
+from simulation.exceptions import UnsuccessfulSimulationException
+from simulation.simulation import Simulation
+from simulation.simulation_error import SimulationError
+from simulation.simulation_registry import SimulationRegistry, MODFLOW_STAGE
+
+# Ensemble runs one Modflow model against many scenarios (variants of weather, Hydrus input files, spin up or masks).
+# Identical Hydrus models of all scenarios are simulated once, then passing and Modflow run for every scenario
+# in parallel, each on its own copy of the Modflow model. Heads of all scenarios are stacked into one array.
+HYDRUS_DIR_NAME = "hydrus"
+SCENARIOS_DIR_NAME = "scenarios"
+MODFLOW_DIR_NAME = "modflow"  # deployers name a Modflow model by its path - scenarios/<name>/modflow/<model>
+HEADS_FILE_NAME = "heads.npy"
+SCENARIOS_FILE_NAME = "scenarios.json"
+HEADS_ARTIFACT = "ensemble_heads"
+SCENARIOS_ARTIFACT = "ensemble_scenarios"  # names and errors of scenarios, written however the ensemble ends
+HYDRUS_OUTPUT_PATTERNS = ("*.out", "*.OUT")
+SCENARIO_NAME_PATTERN = re.compile(r"^[\w\-]+$")
+
+
+@dataclass
+class Scenario:
+    name: str                                                           # unique name (letters, digits, _ and -)
+    weather_files: Dict[str, str] = field(default_factory=dict)         # hydrus model -> path to weather .csv
+    hydrus_files: Dict[str, Dict[str, str]] = field(default_factory=dict)  # hydrus model -> file name -> content
+    spin_up: Optional[int] = None                                       # hydrus spin up period, project's if None
+    masks: Optional[Dict[str, np.ndarray]] = None                       # hydrus model -> mask, project's if None
+
+
+@dataclass
+class EnsembleResult:
+    scenario_names: List[str]               # names of consecutive scenarios
+    heads: Optional[np.ndarray]             # (scenarios, stress periods, layers, rows, cols), NaN for failed ones
+    heads_path: Optional[str]               # path to saved heads (.npy)
+    errors: Dict[str, str]                  # scenario name -> description of its error
+
+
+def _validate_names(scenarios: List[Scenario]) -> None:
+    names = [scenario.name for scenario in scenarios]
+    if not scenarios or len(set(names)) != len(names) \
+            or not all(SCENARIO_NAME_PATTERN.match(name) for name in names):
+        raise ValueError("Scenario names must be unique and contain only letters, digits, _ and -")
+
+
+def validate_scenarios(scenarios: List[Scenario], hydrus_dir: str, masks: Dict[str, np.ndarray]) -> None:
+    """
+    Check the scenarios before the ensemble is submitted - their names, Hydrus models, Hydrus files and weather files.
+    @param scenarios: Scenarios of the ensemble
+    @param hydrus_dir: Directory containing Hydrus projects of the project
+    @param masks: Hydrus model name -> its mask (shapes of the project)
+    @raise ValueError: if a scenario is invalid
+    """
+    _validate_names(scenarios)
+    for scenario in scenarios:
+        model_names = set(scenario.masks if scenario.masks is not None else masks)
+        for model_name in model_names | set(scenario.weather_files) | set(scenario.hydrus_files):
+            if model_name not in model_names or not os.path.isdir(os.path.join(hydrus_dir, model_name)):
+                raise ValueError(f"Unknown hydrus model in scenario {scenario.name}: {model_name}")
+        for hydrus_files in scenario.hydrus_files.values():
+            for file_name in hydrus_files:
+                if os.path.basename(file_name) != file_name:
+                    raise ValueError(f"Invalid hydrus file name in scenario {scenario.name}: {file_name}")
+        for model_name, weather_file in scenario.weather_files.items():
+            try:
+                weather_util.read_weather_csv(weather_file)
+            except (OSError, ValueError, TypeError, csv.Error) as err:
+                raise ValueError(f"Invalid weather of hydrus model {model_name} in scenario {scenario.name}: {err}")
+
+
+class Ensemble:
+
+    def __init__(self, ensemble_id: int, ensemble_dir: str, hydrus_dir: str, modflow_dir: str, modflow_project: str,
+                 masks: Dict[str, np.ndarray], spin_up: int, scenarios: List[Scenario], deployer: IAppDeployer,
+                 registry: Optional[SimulationRegistry] = None, workers: int = 4, inputs_dir: Optional[str] = None):
+        """
+        @param ensemble_id: ID of the ensemble (in the registry)
+        @param ensemble_dir: Directory where models of the scenarios and the results are stored
+        @param hydrus_dir: Directory containing Hydrus projects of the project
+        @param modflow_dir: Directory containing Modflow project of the project
+        @param modflow_project: Name of Modflow project
+        @param masks: Hydrus model name -> its mask (shapes of the project)
+        @param spin_up: Hydrus spin up period of the project (in days)
+        @param scenarios: Scenarios of the ensemble
+        @param deployer: Deployer running Hydrus and Modflow
+        @param registry: Registry the ensemble is recorded in
+        @param workers: Maximal amount of scenarios passed and simulated by Modflow at once
+        @param inputs_dir: Directory with input files of the scenarios (ex. weather), removed when the ensemble finishes
+        """
+        _validate_names(scenarios)
+        self.ensemble_id = ensemble_id
+        self.ensemble_dir = ensemble_dir
+        self.hydrus_dir = hydrus_dir
+        self.modflow_dir = modflow_dir
+        self.modflow_project = modflow_project
+        self.masks = masks
+        self.spin_up = spin_up
+        self.scenarios = scenarios
+        self.deployer = deployer
+        self.workers = workers
+        self.inputs_dir = inputs_dir
+        self.result: Optional[EnsembleResult] = None
+
+        # stages of the ensemble are reported like stages of a simulation
+        self.simulation = Simulation(ensemble_id, deployer, registry)
+
+    def run(self) -> EnsembleResult:
+        """
+        Run Hydrus models of all scenarios (each distinct model once), then passing and Modflow of every scenario.
+        @return: Heads of all scenarios
+        """
+        success = False
+        try:
+            result = self._run()
+            success = result.heads is not None
+            return result
+        except Exception as err:
+            # ex. invalid weather of a scenario or cancellation - stages which didn't end won't run
+            if self.simulation.cancellation_token.is_cancelled():
+                self.record_cancellation()
+            else:
+                self.record_failure(f"Ensemble failed: {err}")
+            raise
+        finally:
+            self.remove_inputs()
+            cancellation.release(self.ensemble_id)
+            self.simulation.store_measurements()
+            self.simulation.event_bus.publish(self.ensemble_id, simulation_events.SIMULATION_FINISHED, success=success)
+
+    def record_cancellation(self) -> None:
+        """
+        Record the cancellation as the error of every scenario - stages which didn't end are ended.
+        """
+        self.record_failure(f"Simulation was cancelled: {self.simulation.cancellation_token.reason}")
+
+    def record_failure(self, error_description: str) -> None:
+        """
+        Record the error of the whole ensemble as the error of every scenario - stages which didn't end are ended.
+        @param error_description: Description of the error
+        """
+        try:
+            self._save_scenarios({scenario.name: error_description for scenario in self.scenarios})
+        except OSError as err:
+            print(f"Saving scenarios of ensemble {self.ensemble_id} failed: {err}")  # TODO: Logger
+        self.simulation.record_failure(error_description)
+
+    def remove_inputs(self) -> None:
+        """
+        Remove input files of the scenarios (if they were given in inputs_dir).
+        """
+        if self.inputs_dir is not None:
+            shutil.rmtree(self.inputs_dir, ignore_errors=True)
+
+    def _run(self) -> EnsembleResult:
+        variants = self._prepare_hydrus_variants()
+        unique_variants = sorted(set(variants.values()))
+        print(f"Ensemble {self.ensemble_id}: {len(unique_variants)} distinct hydrus models "
+              f"in {len(self.scenarios)} scenarios")  # TODO: Logger
+
+        passing_stage_status = self.simulation.get_passing_stage_status()
+        modflow_stage_status = self.simulation.get_modflow_stage_status()
+
+        self.simulation.set_loaded_shapes({variant: None for variant in unique_variants})
+        try:
+            self.simulation.run_hydrus(os.path.join(self.ensemble_dir, HYDRUS_DIR_NAME))
+        except UnsuccessfulSimulationException:
+            passing_stage_status.set_ended(True)
+            modflow_stage_status.set_ended(True)
+            raise
+
+        passing_stage_status.set_started()
+        modflow_stage_status.set_started()
+
+        heads = {}
+        errors = {}
+        with ThreadPoolExecutor(max_workers=max(1, self.workers)) as executor:
+            futures = {scenario.name: executor.submit(self._run_scenario, scenario, variants)
+                       for scenario in self.scenarios}
+            for scenario_name, future in futures.items():
+                try:
+                    heads[scenario_name] = future.result()
+                except Exception as err:  # a failed scenario doesn't stop the other ones
+                    errors[scenario_name] = str(err)
+                    modflow_stage_status.add_error(SimulationError(scenario_name, str(err)))
+
+        # stages end after the result is saved - the ensemble is reported as finished with its result
+        self.result = self._save_result(heads, errors)
+        passing_stage_status.set_ended(True)
+        modflow_stage_status.set_ended(True)
+        return self.result
+
+    def _prepare_hydrus_variants(self) -> Dict[Tuple[str, str], str]:
+        """
+        Create Hydrus model of every scenario - models with the same input files are created once.
+        @return: (scenario name, hydrus model name) -> name of the model in the ensemble Hydrus directory
+        """
+        ensemble_hydrus_dir = os.path.join(self.ensemble_dir, HYDRUS_DIR_NAME)
+        os.makedirs(ensemble_hydrus_dir, exist_ok=True)
+
+        variants = {}
+        for scenario in self.scenarios:
+            masks = scenario.masks if scenario.masks is not None else self.masks
+            for model_name in masks:
+                variant_dir = os.path.join(ensemble_hydrus_dir, "tmp-" + uuid.uuid4().hex)
+                shutil.copytree(os.path.join(self.hydrus_dir, model_name), variant_dir,
+                                ignore=shutil.ignore_patterns(*HYDRUS_OUTPUT_PATTERNS))
+                self._apply_scenario(scenario, model_name, variant_dir)
+
+                # models are named by hash of their inputs - identical models of many scenarios share a directory
+                variant = simulation_cache.get_hydrus_model_key(variant_dir, hydrus_version="")
+                if os.path.isdir(os.path.join(ensemble_hydrus_dir, variant)):
+                    shutil.rmtree(variant_dir)
+                else:
+                    os.rename(variant_dir, os.path.join(ensemble_hydrus_dir, variant))
+                variants[(scenario.name, model_name)] = variant
+        return variants
+
+    @staticmethod
+    def _apply_scenario(scenario: Scenario, model_name: str, model_dir: str) -> None:
+        for file_name, content in scenario.hydrus_files.get(model_name, {}).items():
+            if os.path.basename(file_name) != file_name:
+                raise ValueError(f"Invalid hydrus file name in scenario {scenario.name}: {file_name}")
+            with open(os.path.join(model_dir, file_name), "w") as hydrus_file:
+                hydrus_file.write(content)
+
+        if model_name in scenario.weather_files:
+            length_unit = daos.project_metadata_dao.read_hydrus_length_unit(model_dir)
+            weather_data = weather_util.adapt_data(weather_util.read_weather_csv(scenario.weather_files[model_name]),
+                                                   length_unit)
+            if not daos.project_metadata_dao.add_weather_to_model_dir(model_dir, weather_data):
+                raise ValueError(f"Weather of scenario {scenario.name} doesn't match hydrus model {model_name}")
+
+    def _run_scenario(self, scenario: Scenario, variants: Dict[Tuple[str, str], str]) -> np.ndarray:
+        """
+        Pass Hydrus results to a copy of the Modflow model and simulate it.
+        @return: Heads of the scenario - array (stress periods, layers, rows, cols)
+        """
+        self.simulation.cancellation_token.raise_if_cancelled()
+        scenario_start = time.perf_counter()
+        modflow_project_dir = os.path.join(self.ensemble_dir, SCENARIOS_DIR_NAME, scenario.name, MODFLOW_DIR_NAME,
+                                           self.modflow_project)
+        if os.path.isdir(modflow_project_dir):
+            shutil.rmtree(modflow_project_dir)
+        shutil.copytree(os.path.join(self.modflow_dir, self.modflow_project), modflow_project_dir)
+        manifest = model_manifest.read_or_create(modflow_project_dir)
+        if manifest is None:
+            raise UnsuccessfulSimulationException("Modflow model doesn't contain .nam file!")
+
+        masks = scenario.masks if scenario.masks is not None else self.masks
+        ensemble_hydrus_dir = os.path.join(self.ensemble_dir, HYDRUS_DIR_NAME)
+        shapes = [Shape(mask, os.path.join(ensemble_hydrus_dir, variants[(scenario.name, model_name)], "T_Level.out"))
+                  for model_name, mask in masks.items()]
+        spin_up = scenario.spin_up if scenario.spin_up is not None else self.spin_up
+        HydrusModflowPassing(modflow_project_dir, manifest.nam_file, shapes).update_rch(spin_up=spin_up)
+        model_manifest.update_fingerprint(modflow_project_dir, manifest)
+        self.simulation.get_passing_stage_status().add_timing(scenario.name, time.perf_counter() - scenario_start)
+
+        modflow_start = time.perf_counter()
+        simulation_error = self.deployer.run_modflow(modflow_project_dir, manifest.nam_file, self.ensemble_id)
+        self.simulation.publish_model_finished(MODFLOW_STAGE, scenario.name, simulation_error)
+        if simulation_error:
+            raise UnsuccessfulSimulationException(simulation_error.error_description)
+        self.simulation.get_modflow_stage_status().add_timing(scenario.name, time.perf_counter() - modflow_start)
+        return Simulation.read_heads(modflow_project_dir, manifest)
+
+    def _save_result(self, heads: Dict[str, np.ndarray], errors: Dict[str, str]) -> EnsembleResult:
+        scenario_names = [scenario.name for scenario in self.scenarios]
+        self._save_scenarios(errors)
+        if not heads:
+            return EnsembleResult(scenario_names, None, None, errors)
+
+        heads_shape = next(iter(heads.values())).shape
+        stacked_heads = np.stack([heads[name] if name in heads else np.full(heads_shape, np.nan, dtype=np.float32)
+                                  for name in scenario_names])
+        heads_path = os.path.join(self.ensemble_dir, HEADS_FILE_NAME)
+        np.save(heads_path, stacked_heads)
+        if self.simulation.registry is not None:
+            self.simulation.registry.add_artifact(self.ensemble_id, HEADS_ARTIFACT, heads_path)
+        return EnsembleResult(scenario_names, stacked_heads, heads_path, errors)
+
+    def _save_scenarios(self, errors: Dict[str, str]) -> None:
+        """
+        Save names of the scenarios with their errors (SCENARIOS_FILE_NAME) and register the file.
+        @param errors: Scenario name -> description of its error
+        """
+        os.makedirs(self.ensemble_dir, exist_ok=True)
+        scenarios_path = os.path.join(self.ensemble_dir, SCENARIOS_FILE_NAME)
+        with open(scenarios_path, "w") as handle:
+            json.dump({"scenarios": [scenario.name for scenario in self.scenarios], "errors": errors}, handle)
+        if self.simulation.registry is not None:
+            self.simulation.registry.add_artifact(self.ensemble_id, SCENARIOS_ARTIFACT, scenarios_path)
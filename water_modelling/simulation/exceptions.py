@@ -5,3 +5,11 @@ class UnsuccessfulSimulationException(Exception):
 
 class NoLoadedProjectException(Exception):
     pass
+
+
+class SimulationQueueFullException(Exception):
+    pass
+
+
+class SimulationAccessDeniedException(Exception):
+    pass
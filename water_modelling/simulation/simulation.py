@@ -1,13 +1,27 @@
 import json
 import os.path
-import flopy.modflow
+import time
+from typing import Dict, List, Optional
+
+import flopy
 import numpy as np
 
+from app_config import deployment_config
+from datapassing import hydrus_output_loader, passing_cache, recharge_engine
 from datapassing.hydrus_modflow_passing import HydrusModflowPassing
+from datapassing.pipelined_passing import PipelinedPassing
 from datapassing.shape_data import Shape
-from deployment.app_deployer_interface import IAppDeployer
-from modflow import modflow_utils
+from deployment.app_deployer_interface import HydrusCompletionCallback, IAppDeployer
+from modflow import model_manifest, modflow_utils
+from modflow.model_manifest import ModelManifest
+from simulation import cancellation, simulation_cache, simulation_checkpoint, simulation_events, simulation_metrics
 from simulation.exceptions import UnsuccessfulSimulationException
+from simulation.simulation_cache import SimulationCache
+from simulation.simulation_checkpoint import SimulationCheckpoint
+from simulation.simulation_error import SimulationError
+from simulation.simulation_events import SimulationEventBus
+from simulation.simulation_metrics import measured_method
+from simulation.simulation_registry import SimulationRegistry, HYDRUS_STAGE, PASSING_STAGE, MODFLOW_STAGE, STAGES
 from simulation.simulation_stage_status import SimulationStageStatus
 
 
@@ -15,34 +29,359 @@ class Simulation:
     SIMULATION_FINISHED_FLAG_FILE = "finished.0"
     MODFLOW_OUTPUT_JSON = "results.json"
 
-    def __init__(self, simulation_id: int, deployer: IAppDeployer):
+    def __init__(self, simulation_id: int, deployer: IAppDeployer, registry: Optional[SimulationRegistry] = None,
+                 event_bus: Optional[SimulationEventBus] = None):
+        """
+        @param simulation_id: ID of the simulation
+        @param deployer: Deployer running Hydrus and Modflow
+        @param registry: Registry the simulation is recorded in (see SimulationRegistry.create_simulation())
+        @param event_bus: Bus the progress of the simulation is published to, the process-wide one if None
+        """
         self.simulation_id = simulation_id
         self.deployer = deployer
+        self.registry = registry
         self.spin_up = 0
         self.modflow_project = None
         self.loaded_shapes = None
         self.finished = False
+        self.pipelined = deployment_config.PIPELINED_SIMULATION
+        self.resume = False
+        self.checkpoint: Optional[SimulationCheckpoint] = None  # set when the simulation runs (if enabled)
+        self.simulation_cache: Optional[SimulationCache] = simulation_cache.get_simulation_cache()
+        self.event_bus = event_bus if event_bus is not None else simulation_events.get_event_bus()
+        self.metrics = simulation_metrics.get_metrics()
+        self.cancellation_token = cancellation.get_token(simulation_id)
 
-        self._hydrus_stage_status = SimulationStageStatus()
-        self._passing_stage_status = SimulationStageStatus()
-        self._modflow_stage_status = SimulationStageStatus()
+        self._hydrus_stage_status = SimulationStageStatus(registry, simulation_id, HYDRUS_STAGE, self.event_bus)
+        self._passing_stage_status = SimulationStageStatus(registry, simulation_id, PASSING_STAGE, self.event_bus)
+        self._modflow_stage_status = SimulationStageStatus(registry, simulation_id, MODFLOW_STAGE, self.event_bus)
 
     def run_simulation(self, modflow_dir: str, hydrus_dir: str):
+        success = False
+        try:
+            self._run_simulation(modflow_dir, hydrus_dir)
+            success = True
+        except UnsuccessfulSimulationException:
+            if self.cancellation_token.is_cancelled():
+                self.record_cancellation()
+            raise
+        except Exception as err:
+            # ex. model files which can't be read - stages which didn't end won't run
+            self.record_failure(f"Simulation failed: {err}")
+            raise
+        finally:
+            cancellation.release(self.simulation_id)
+            self.store_measurements()
+            self.event_bus.publish(self.simulation_id, simulation_events.SIMULATION_FINISHED, success=success)
+
+    def record_cancellation(self) -> None:
+        """
+        Record the cancellation in the status of the stage which was stopped - stages which won't run are ended too.
+        """
+        self.record_failure(f"Simulation was cancelled: {self.cancellation_token.reason}")
+
+    def record_failure(self, error_description: str) -> None:
+        """
+        Record the error in the status of the stage which was stopped by it - stages which won't run are ended too.
+        @param error_description: Description of the error
+        """
+        unfinished_stage_statuses = [stage_status for stage_status in [self._hydrus_stage_status,
+                                                                       self._passing_stage_status,
+                                                                       self._modflow_stage_status]
+                                     if not stage_status.has_ended()]
+        if unfinished_stage_statuses:
+            unfinished_stage_statuses[0].add_error(SimulationError("simulation", error_description))
+        for stage_status in unfinished_stage_statuses:
+            stage_status.set_ended(True)
+
+    def store_measurements(self) -> None:
+        """
+        Store performance measurements of the simulation (recorded so far) in the registry.
+        """
+        measurements = self.metrics.take_measurements(self.simulation_id)
+        if measurements and self.registry is not None:
+            self.registry.add_measurements(self.simulation_id, measurements)
+
+    def publish_model_finished(self, stage: str, model_name: str, error: Optional[SimulationError] = None,
+                               **data) -> None:
+        """
+        Publish completion of one model (ex. Hydrus model) to the event bus.
+        @param stage: Stage the model belongs to
+        @param model_name: Name of the model
+        @param error: Error of the model, None if it was successful
+        @param data: Other details of the event
+        """
+        self.event_bus.publish(self.simulation_id, simulation_events.MODEL_FINISHED, stage=stage, model=model_name,
+                               error=error.error_description if error is not None else None, **data)
+
+    def _run_simulation(self, modflow_dir: str, hydrus_dir: str):
+        self.cancellation_token.raise_if_cancelled()
         self.unset_finished_flag(modflow_dir)  # Mark project as not simulated
+        if deployment_config.SIMULATION_CHECKPOINTS:
+            self.checkpoint = SimulationCheckpoint(os.path.dirname(os.path.abspath(modflow_dir)))
+
+        # ===== RESTORE RESULTS OF THE SAME SIMULATION ======
+        simulation_key = None
+        if self.simulation_cache is not None or self.registry is not None:
+            key_manifest = model_manifest.read_or_create(os.path.join(modflow_dir, self.modflow_project))
+            if key_manifest is not None:
+                simulation_key = self._get_simulation_key(hydrus_dir, modflow_dir, key_manifest)
+            if simulation_key is not None and self.registry is not None:
+                self.registry.set_input_fingerprint(self.simulation_id, simulation_key)
+            if simulation_key is not None and self.simulation_cache is not None \
+                    and self._restore_cached_results(simulation_key, modflow_dir, key_manifest):
+                return
 
-        # ===== RUN HYDRUS INSTANCES ======
-        self.run_hydrus(hydrus_dir)
+        # a resumed simulation skips stages with valid checkpoints - up to the first stage which has to run
+        resume = self.resume and self.checkpoint is not None
+        if self.pipelined:
+            # ===== RUN HYDRUS INSTANCES AND COPY THEIR RESULTS TO MODFLOW AS THEY FINISH ======
+            manifest = self._read_manifest(modflow_dir)
+            resume = resume and self._is_checkpoint_valid(HYDRUS_STAGE, self._get_hydrus_fingerprint(hydrus_dir)) \
+                and self._is_checkpoint_valid(PASSING_STAGE,
+                                              self._get_passing_fingerprint(hydrus_dir, modflow_dir, manifest))
+            if resume:
+                self._set_resumed(self._hydrus_stage_status, self._passing_stage_status)
+            else:
+                with self.cancellation_token.timeout(deployment_config.HYDRUS_STAGE_TIMEOUT,
+                                                     self._get_timeout_reason(HYDRUS_STAGE)):
+                    self.run_hydrus_pipelined(hydrus_dir, modflow_dir, manifest)
+        else:
+            # ===== RUN HYDRUS INSTANCES ======
+            resume = resume and self._is_checkpoint_valid(HYDRUS_STAGE, self._get_hydrus_fingerprint(hydrus_dir))
+            if resume:
+                self._set_resumed(self._hydrus_stage_status)
+            else:
+                with self.cancellation_token.timeout(deployment_config.HYDRUS_STAGE_TIMEOUT,
+                                                     self._get_timeout_reason(HYDRUS_STAGE)):
+                    self.run_hydrus(hydrus_dir)
 
-        # ===== COPY RESULTS OF HYDRUS TO MODFLOW ======
-        nam_file = modflow_utils.get_nam_file(os.path.join(modflow_dir, self.modflow_project))
-        self.pass_data_from_hydrus_to_modflow(hydrus_dir, modflow_dir, nam_file)
+            # ===== COPY RESULTS OF HYDRUS TO MODFLOW ======
+            self.cancellation_token.raise_if_cancelled()
+            manifest = self._read_manifest(modflow_dir)
+            resume = resume and self._is_checkpoint_valid(
+                PASSING_STAGE, self._get_passing_fingerprint(hydrus_dir, modflow_dir, manifest))
+            if resume:
+                self._set_resumed(self._passing_stage_status)
+            else:
+                passing_start = time.perf_counter()
+                self.pass_data_from_hydrus_to_modflow(hydrus_dir, modflow_dir, manifest)
+                self._passing_stage_status.add_timing("after_hydrus", time.perf_counter() - passing_start)
 
         # ===== RUN MODFLOW INSTANCE ======
-        self.run_modflow(modflow_dir, nam_file)
+        self.cancellation_token.raise_if_cancelled()
+        resume = resume and self._is_checkpoint_valid(MODFLOW_STAGE, self._get_modflow_fingerprint(modflow_dir,
+                                                                                                   manifest))
+        if resume:
+            self._set_resumed(self._modflow_stage_status)
+        else:
+            with self.cancellation_token.timeout(deployment_config.MODFLOW_STAGE_TIMEOUT,
+                                                 self._get_timeout_reason(MODFLOW_STAGE)):
+                self.run_modflow(modflow_dir, manifest)
+        self.set_finished_flag(modflow_dir)  # Mark project as simulated
+        self._register_artifacts(modflow_dir, manifest)
+
+        if simulation_key is not None and self.simulation_cache is not None:
+            self._cache_results(simulation_key, hydrus_dir, modflow_dir, manifest)
+
+    def _is_checkpoint_valid(self, name: str, input_fingerprint: Optional[str]) -> bool:
+        return self.checkpoint is not None and self.checkpoint.is_valid(name, input_fingerprint)
+
+    @staticmethod
+    def _set_resumed(*stage_statuses: SimulationStageStatus) -> None:
+        """
+        Mark stages skipped by a resumed simulation as successfully finished.
+        """
+        for stage_status in stage_statuses:
+            stage_status.set_started()
+            stage_status.add_timing("resumed_from_checkpoint", 0.0)
+            stage_status.set_ended(True)
+        print("Stages resumed from checkpoint")  # TODO: Logger
+
+    def _invalidate_checkpoints(self, first_stage: str, hydrus_models: Optional[List[str]] = None) -> None:
+        """
+        Invalidate checkpoints of the stage which starts and of all following stages.
+        @param first_stage: Stage which starts
+        @param hydrus_models: Names of Hydrus models which are run again
+        """
+        if self.checkpoint is not None:
+            self.checkpoint.invalidate(STAGES[STAGES.index(first_stage):]
+                                       + [simulation_checkpoint.get_hydrus_model_name(model_name)
+                                          for model_name in hydrus_models or []])
+
+    def _get_hydrus_fingerprint(self, hydrus_dir: str) -> Optional[str]:
+        """
+        @return: Fingerprint of inputs of the Hydrus stage, None if they can't be read
+        """
+        model_keys = self._get_hydrus_model_keys(hydrus_dir)
+        if len(model_keys) < len(self.loaded_shapes):
+            return None
+        return simulation_checkpoint.get_hydrus_fingerprint(model_keys)
+
+    def _get_passing_fingerprint(self, hydrus_dir: str, modflow_dir: str, manifest: ModelManifest) -> Optional[str]:
+        """
+        @return: Fingerprint of inputs of the passing stage, None if they can't be read
+        """
+        model_names = list(self.loaded_shapes)
+        modflow_project_dir = os.path.join(modflow_dir, self.modflow_project)
+        try:
+            # RCH file is written by the passing - it's an output, not an input
+            rch_path = modflow_utils.get_package_path(modflow_project_dir, manifest.nam_file, "RCH")
+            input_files = [file_name for file_name in modflow_utils.get_model_input_files(modflow_project_dir,
+                                                                                          manifest.nam_file)
+                           if rch_path is None or os.path.normpath(os.path.join(modflow_project_dir, file_name))
+                           != os.path.normpath(rch_path)]
+            return simulation_checkpoint.get_passing_fingerprint(
+                [os.path.join(hydrus_dir, model_name, "T_Level.out") for model_name in model_names],
+                [self.loaded_shapes[model_name].shape_mask for model_name in model_names], self.spin_up,
+                modflow_project_dir, input_files)
+        except OSError:
+            return None
+
+    def _get_modflow_fingerprint(self, modflow_dir: str, manifest: ModelManifest) -> Optional[str]:
+        """
+        @return: Fingerprint of inputs of the Modflow stage, None if they can't be read
+        """
+        modflow_project_dir = os.path.join(modflow_dir, self.modflow_project)
+        try:
+            return simulation_checkpoint.get_modflow_fingerprint(
+                modflow_project_dir, modflow_utils.get_model_input_files(modflow_project_dir, manifest.nam_file),
+                self.deployer.get_engine_versions()["modflow"])
+        except OSError:
+            return None
+
+    @staticmethod
+    def _get_timeout_reason(stage: str) -> str:
+        timeout = {HYDRUS_STAGE: deployment_config.HYDRUS_STAGE_TIMEOUT,
+                   MODFLOW_STAGE: deployment_config.MODFLOW_STAGE_TIMEOUT}[stage]
+        return f"{stage} stage exceeded its time limit of {timeout} seconds"
+
+    def _get_simulation_key(self, hydrus_dir: str, modflow_dir: str, manifest: ModelManifest) -> Optional[str]:
+        """
+        @return: Hash of all inputs of the simulation, None if they can't be read (simulation isn't cached then)
+        """
+        model_names = list(self.loaded_shapes)
+        modflow_project_dir = os.path.join(modflow_dir, self.modflow_project)
+        try:
+            return simulation_cache.get_simulation_key(
+                hydrus_dir, model_names, [self.loaded_shapes[model_name].shape_mask for model_name in model_names],
+                modflow_project_dir, modflow_utils.get_model_input_files(modflow_project_dir, manifest.nam_file),
+                self.spin_up, self.deployer.get_engine_versions())
+        except OSError as err:
+            print("Simulation inputs can't be read, simulation won't be cached: " + str(err))  # TODO: Logger
+            return None
+
+    def _restore_cached_results(self, simulation_key: str, modflow_dir: str, manifest: ModelManifest) -> bool:
+        """
+        @return: True if the same simulation was cached and its results were restored
+        """
+        restore_start = time.perf_counter()
+        modflow_project_dir = os.path.join(modflow_dir, self.modflow_project)
+        rch_path = modflow_utils.get_package_path(modflow_project_dir, manifest.nam_file, "RCH")
+        results_path = os.path.join(modflow_dir, Simulation.MODFLOW_OUTPUT_JSON)
+        destinations = {simulation_cache.RESULTS_FILE: results_path, simulation_cache.RCH_FILE: rch_path}
+        if rch_path is None or not self.simulation_cache.restore(simulation_key, destinations.get):
+            return False
+
+        # RCH file was replaced - cached model is outdated, manifest still describes the model
+        modflow_utils.invalidate_model_cache(modflow_project_dir, manifest.nam_file)
+        model_manifest.update_fingerprint(modflow_project_dir, manifest)
+
+        for stage_status in [self._hydrus_stage_status, self._passing_stage_status, self._modflow_stage_status]:
+            stage_status.set_started()
+            stage_status.set_ended(True)
+        self._modflow_stage_status.add_timing("cache_restore", time.perf_counter() - restore_start)
         self.set_finished_flag(modflow_dir)  # Mark project as simulated
+        self._register_artifacts(modflow_dir, manifest, with_heads=False)  # heads file isn't cached
+        print("Simulation results restored from cache")
+        return True
+
+    def _cache_results(self, simulation_key: str, hydrus_dir: str, modflow_dir: str, manifest: ModelManifest) -> None:
+        modflow_project_dir = os.path.join(modflow_dir, self.modflow_project)
+        rch_path = modflow_utils.get_package_path(modflow_project_dir, manifest.nam_file, "RCH")
+        results_path = os.path.join(modflow_dir, Simulation.MODFLOW_OUTPUT_JSON)
+        files = {simulation_cache.RESULTS_FILE: results_path, simulation_cache.RCH_FILE: rch_path}
+        try:
+            self.simulation_cache.store(simulation_key, files)
+
+            # the next run starts from RCH file written by this one - with binary masks the passing writes
+            # the same file again, so the results are valid for current inputs too
+            masks = [self.loaded_shapes[model_name].shape_mask for model_name in self.loaded_shapes]
+            if all(np.all((mask == 0) | (mask == 1)) for mask in masks):
+                current_key = self._get_simulation_key(hydrus_dir, modflow_dir, manifest)
+                if current_key is not None and current_key != simulation_key:
+                    self.simulation_cache.store(current_key, files)
+        except OSError as err:
+            print("Caching simulation results failed: " + str(err))  # TODO: Logger
+
+    def _register_artifacts(self, modflow_dir: str, manifest: ModelManifest, with_heads: bool = True) -> None:
+        """
+        Record paths to files produced by the simulation in the registry.
+        @param with_heads: False if the heads file wasn't produced (ex. results were restored from cache)
+        """
+        if self.registry is None:
+            return
+        modflow_project_dir = os.path.join(modflow_dir, self.modflow_project)
+        artifacts = {
+            "results": os.path.join(modflow_dir, Simulation.MODFLOW_OUTPUT_JSON),
+            "rch": modflow_utils.get_package_path(modflow_project_dir, manifest.nam_file, "RCH"),
+            "head": os.path.join(modflow_project_dir, manifest.head_file) if with_heads else None
+        }
+        for name, path in artifacts.items():
+            if path is not None:
+                self.registry.add_artifact(self.simulation_id, name, path)
+
+    def _read_manifest(self, modflow_dir: str) -> ModelManifest:
+        manifest = model_manifest.read_or_create(os.path.join(modflow_dir, self.modflow_project))
+        if manifest is None:
+            self._passing_stage_status.set_ended(True)
+            raise UnsuccessfulSimulationException("Modflow model doesn't contain .nam file!")
+        return manifest
+
+    @measured_method(HYDRUS_STAGE)
+    def run_hydrus(self, hydrus_dir: str, on_model_finished: Optional[HydrusCompletionCallback] = None):
+        hydrus_start = time.perf_counter()
+        self._hydrus_stage_status.set_started()
+        model_keys = self._get_hydrus_model_keys(hydrus_dir)
+        models_to_run = []
+        for model_name in self.loaded_shapes:
+            model_key = model_keys.get(model_name)
+            if model_key is not None and self.resume and self._is_checkpoint_valid(
+                    simulation_checkpoint.get_hydrus_model_name(model_name), model_key):
+                self.publish_model_finished(HYDRUS_STAGE, model_name, resumed=True)
+                if on_model_finished:
+                    on_model_finished(model_name, None)
+            elif model_key is not None and self._restore_hydrus_outputs(hydrus_dir, model_name, model_key):
+                self._save_hydrus_model_checkpoint(hydrus_dir, model_name, model_key)
+                self.publish_model_finished(HYDRUS_STAGE, model_name, cached=True)
+                if on_model_finished:
+                    on_model_finished(model_name, None)
+            else:
+                models_to_run.append(model_name)
+        self._invalidate_checkpoints(HYDRUS_STAGE, models_to_run)
+        print(f"Running {len(models_to_run)} of {len(self.loaded_shapes)} hydrus models")  # TODO: Logger
+
+        model_starts: Dict[str, float] = {}  # model name -> time when it was deployed
+
+        def on_hydrus_model_started(model_name: str) -> None:
+            model_starts[model_name] = time.perf_counter()
+
+        def on_hydrus_model_finished(model_name: str, error: Optional[SimulationError]) -> None:
+            # a model which wasn't reported as deployed (ex. it failed to start) is timed from the start of the stage
+            self._hydrus_stage_status.add_timing(model_name,
+                                                 time.perf_counter() - model_starts.get(model_name, hydrus_start))
+            self.publish_model_finished(HYDRUS_STAGE, model_name, error)
+            if error is None and model_name in model_keys:
+                self._cache_hydrus_outputs(hydrus_dir, model_name, model_keys[model_name])
+                self._save_hydrus_model_checkpoint(hydrus_dir, model_name, model_keys[model_name])
+            if on_model_finished:
+                on_model_finished(model_name, error)
 
-    def run_hydrus(self, hydrus_dir: str):
-        simulation_errors = self.deployer.run_hydrus(hydrus_dir, self.loaded_shapes, self.simulation_id)
+        simulation_errors = []
+        if models_to_run:
+            simulation_errors = self.deployer.run_hydrus(hydrus_dir, models_to_run, self.simulation_id,
+                                                         on_hydrus_model_finished, on_hydrus_model_started)
+        self._hydrus_stage_status.add_timing("wall_time", time.perf_counter() - hydrus_start)
         contains_errors = False
 
         for error in simulation_errors:
@@ -52,52 +391,226 @@ class Simulation:
         if contains_errors:
             self._hydrus_stage_status.set_ended(True)
             raise UnsuccessfulSimulationException("Hydrus simulations failed! Check full logs for details.")
+        if self.checkpoint is not None and len(model_keys) == len(self.loaded_shapes):
+            self.checkpoint.save(HYDRUS_STAGE, simulation_checkpoint.get_hydrus_fingerprint(model_keys),
+                                 [os.path.join(hydrus_dir, model_name, file_name) for model_name in self.loaded_shapes
+                                  for file_name in self._get_hydrus_output_files(hydrus_dir, model_name)])
         self._hydrus_stage_status.set_ended(True)
         print('Hydrus simulations finished successfully')
 
-    def pass_data_from_hydrus_to_modflow(self, hydrus_dir, modflow_dir, nam_file: str):
-        # Add hydrus result file paths (T_Level.out) to loaded_shapes (shape_file_info)
-        shapes = []
-        for model_name_key in self.loaded_shapes:
-            t_level_path = os.path.join(hydrus_dir, model_name_key, "T_Level.out")
-            shapes.append(Shape(self.loaded_shapes[model_name_key].shape_mask, t_level_path))
+    def _get_hydrus_model_keys(self, hydrus_dir: str) -> Dict[str, str]:
+        """
+        @return: Model name -> hash of inputs of the model, models whose inputs can't be read aren't cached
+        """
+        if self.simulation_cache is None and self.checkpoint is None:
+            return {}
+        hydrus_version = self.deployer.get_engine_versions()["hydrus"]
+        model_keys = {}
+        for model_name in self.loaded_shapes:
+            try:
+                model_keys[model_name] = simulation_cache.get_hydrus_model_key(os.path.join(hydrus_dir, model_name),
+                                                                               hydrus_version)
+            except OSError as err:
+                print(f"Inputs of hydrus model {model_name} can't be read, it won't be cached: {err}")  # TODO: Logger
+        return model_keys
 
-        # Shapes list initialization from shape_file_info list
-        print("Nam file", nam_file)
-        result = HydrusModflowPassing(os.path.join(modflow_dir, self.modflow_project), nam_file, shapes)
+    def _restore_hydrus_outputs(self, hydrus_dir: str, model_name: str, model_key: str) -> bool:
+        """
+        @return: True if the model with the same inputs was simulated before and its outputs were restored
+        """
+        if self.simulation_cache is None:
+            return False
+        model_dir = os.path.join(hydrus_dir, model_name)
+
+        def remove_outputs() -> None:
+            # outputs of the previous run which the cached run didn't write mustn't be mixed with the restored ones
+            for file_name in simulation_cache.get_hydrus_output_files(model_dir):
+                os.remove(os.path.join(model_dir, file_name))
+
+        try:
+            return self.simulation_cache.restore(model_key, lambda file_name: os.path.join(model_dir, file_name),
+                                                 remove_outputs)
+        except OSError as err:
+            print(f"Restoring outputs of hydrus model {model_name} failed: {err}")  # TODO: Logger
+            return False
+
+    def _cache_hydrus_outputs(self, hydrus_dir: str, model_name: str, model_key: str) -> None:
+        if self.simulation_cache is None:
+            return
+        model_dir = os.path.join(hydrus_dir, model_name)
+        try:
+            output_files = simulation_cache.get_hydrus_output_files(model_dir)
+            if output_files:
+                self.simulation_cache.store(model_key, {file_name: os.path.join(model_dir, file_name)
+                                                        for file_name in output_files},
+                                            kind=simulation_cache.HYDRUS_MODEL_ENTRY)
+        except OSError as err:
+            print(f"Caching outputs of hydrus model {model_name} failed: {err}")  # TODO: Logger
+
+    def _save_hydrus_model_checkpoint(self, hydrus_dir: str, model_name: str, model_key: str) -> None:
+        if self.checkpoint is not None:
+            self.checkpoint.save(simulation_checkpoint.get_hydrus_model_name(model_name), model_key,
+                                 [os.path.join(hydrus_dir, model_name, file_name)
+                                  for file_name in self._get_hydrus_output_files(hydrus_dir, model_name)])
+
+    @staticmethod
+    def _get_hydrus_output_files(hydrus_dir: str, model_name: str) -> List[str]:
+        try:
+            return simulation_cache.get_hydrus_output_files(os.path.join(hydrus_dir, model_name))
+        except OSError:
+            return []
+
+    def _save_passing_checkpoint(self, hydrus_dir: str, modflow_dir: str, manifest: ModelManifest) -> None:
+        if self.checkpoint is None:
+            return
+        input_fingerprint = self._get_passing_fingerprint(hydrus_dir, modflow_dir, manifest)
+        rch_path = modflow_utils.get_package_path(os.path.join(modflow_dir, self.modflow_project), manifest.nam_file,
+                                                  "RCH")
+        if input_fingerprint is not None and rch_path is not None:
+            self.checkpoint.save(PASSING_STAGE, input_fingerprint, [rch_path])
+
+    @measured_method(PASSING_STAGE)
+    def run_hydrus_pipelined(self, hydrus_dir: str, modflow_dir: str, manifest: ModelManifest):
+        """
+        Run Hydrus simulations and pass output of every model to Modflow as soon as the model finishes -
+        Modflow RCH package is loaded while Hydrus is running and only the write of RCH file is left at the end.
+        @param hydrus_dir: Directory containing Hydrus projects
+        @param modflow_dir: Directory containing Modflow project
+        @param manifest: Manifest of Modflow model
+        """
+        self._passing_stage_status.set_started()
+        self._invalidate_checkpoints(PASSING_STAGE)
+        model_names = list(self.loaded_shapes)
+        modflow_project_dir = os.path.join(modflow_dir, self.modflow_project)
+        passing = PipelinedPassing(
+            modflow_project_dir, manifest.nam_file, model_names,
+            masks=[self.loaded_shapes[model_name].shape_mask for model_name in model_names],
+            t_level_paths=[os.path.join(hydrus_dir, model_name, "T_Level.out") for model_name in model_names],
+            perlen=manifest.perlen, spin_up=self.spin_up, workers=deployment_config.HYDRUS_OUTPUT_READ_WORKERS)
+        passing.start()
+
+        def on_model_finished(model_name: str, error: Optional[SimulationError]) -> None:
+            if error is None:
+                passing.add_hydrus_output(model_name)
+
+        try:
+            self.run_hydrus(hydrus_dir, on_model_finished)
+        except Exception:
+            passing.cancel()
+            raise
+
+        passing_start = time.perf_counter()
+        try:
+            rch_written = passing.finish()
+        finally:  # errors are recorded on the stage also when finish() raises an unexpected error
+            for name, seconds in passing.timings.items():
+                self._passing_stage_status.add_timing(name, seconds)
+            for model_name, description in passing.errors.items():
+                self._passing_stage_status.add_error(SimulationError(model_name, description))
+        if not rch_written:
+            self._passing_stage_status.set_ended(True)
+            raise UnsuccessfulSimulationException("Reading hydrus results failed! Check full logs for details.")
+        self._passing_stage_status.add_timing("after_hydrus", time.perf_counter() - passing_start)
+
+        # only recharge values were changed - manifest still describes the model
+        model_manifest.update_fingerprint(modflow_project_dir, manifest)
+
+        self._save_passing_checkpoint(hydrus_dir, modflow_dir, manifest)
+        self._passing_stage_status.set_ended(True)
+        print("Passing successful")
+
+    @measured_method(PASSING_STAGE)
+    def pass_data_from_hydrus_to_modflow(self, hydrus_dir, modflow_dir, manifest: ModelManifest):
+        self._passing_stage_status.set_started()
+        self._invalidate_checkpoints(PASSING_STAGE)
+        model_names = list(self.loaded_shapes)
+        t_level_paths = [os.path.join(hydrus_dir, model_name, "T_Level.out") for model_name in model_names]
+        masks = [self.loaded_shapes[model_name].shape_mask for model_name in model_names]
+        modflow_project_dir = os.path.join(modflow_dir, self.modflow_project)
+
+        # Shapes list initialization from loaded_shapes - hydrus results are loaded only for shapes not cached
+        # by the previous passing (Hydrus output, mask or spin up changed)
+        shape_keys = passing_cache.get_shape_keys(t_level_paths, masks, self.spin_up,
+                                                  deployment_config.HYDRUS_OUTPUT_READ_WORKERS)
+        shapes = [Shape(mask, t_level_path) for (mask, t_level_path) in zip(masks, t_level_paths)]
+        result = HydrusModflowPassing(modflow_project_dir, manifest.nam_file, shapes, shape_keys)
+        uncached_shapes = result.get_uncached_shapes(manifest.perlen, self.spin_up)
+        print(f"Reading hydrus results of {len(uncached_shapes)} of {len(shapes)} shapes")  # TODO: Logger
+
+        # Read hydrus results (T_Level.out) of uncached shapes concurrently
+        hydrus_outputs = hydrus_output_loader.load_sum_v_bot(
+            [t_level_paths[idx] for idx in uncached_shapes],
+            recharge_engine.required_values_count(manifest.perlen, self.spin_up),
+            deployment_config.HYDRUS_OUTPUT_READ_WORKERS)
+
+        for output_idx, shape_idx in enumerate(uncached_shapes):
+            t_level_path = t_level_paths[shape_idx]
+            if t_level_path in hydrus_outputs.errors:
+                self._passing_stage_status.add_error(SimulationError(
+                    model_names[shape_idx], "Reading hydrus output failed: " + hydrus_outputs.errors[t_level_path]))
+            else:
+                self._passing_stage_status.add_timing(model_names[shape_idx], hydrus_outputs.timings[t_level_path])
+                shapes[shape_idx].recharge = hydrus_outputs.get_values(output_idx)
+
+        if hydrus_outputs.errors:
+            self._passing_stage_status.set_ended(True)
+            raise UnsuccessfulSimulationException("Reading hydrus results failed! Check full logs for details.")
+
+        print("Nam file", manifest.nam_file)
         result.update_rch(spin_up=self.spin_up)
 
+        # only recharge values were changed - manifest still describes the model
+        model_manifest.update_fingerprint(modflow_project_dir, manifest)
+
+        self._save_passing_checkpoint(hydrus_dir, modflow_dir, manifest)
         self._passing_stage_status.set_ended(True)
         print("Passing successful")
 
-    def run_modflow(self, modflow_dir: str, nam_file: str):
+    @measured_method(MODFLOW_STAGE)
+    def run_modflow(self, modflow_dir: str, manifest: ModelManifest):
         assert self.modflow_project is not None
+        self._modflow_stage_status.set_started()
+        self._invalidate_checkpoints(MODFLOW_STAGE)
         modflow_project_dir = os.path.join(modflow_dir, self.modflow_project)
-        simulation_error = self.deployer.run_modflow(modflow_project_dir, nam_file, self.simulation_id)
+        simulation_error = self.deployer.run_modflow(modflow_project_dir, manifest.nam_file, self.simulation_id)
+        self.publish_model_finished(MODFLOW_STAGE, self.modflow_project, simulation_error)
 
         if simulation_error:
             self._modflow_stage_status.add_error(simulation_error)
             self._modflow_stage_status.set_ended(True)
             raise UnsuccessfulSimulationException("Modflow simulation failed! Check full logs for details.")
         
-        self.convert_results_to_json(modflow_dir, nam_file)
+        self.convert_results_to_json(modflow_dir, manifest)
+        if self.checkpoint is not None:
+            input_fingerprint = self._get_modflow_fingerprint(modflow_dir, manifest)
+            if input_fingerprint is not None:
+                self.checkpoint.save(MODFLOW_STAGE, input_fingerprint,
+                                     [os.path.join(modflow_project_dir, manifest.head_file),
+                                      os.path.join(modflow_dir, Simulation.MODFLOW_OUTPUT_JSON)])
         self._modflow_stage_status.set_ended(True)
         print('Modflow simulation finished')
 
-    def convert_results_to_json(self, modflow_dir: str, nam_file: str) -> None:
+    @measured_method(MODFLOW_STAGE)
+    def convert_results_to_json(self, modflow_dir: str, manifest: ModelManifest) -> None:
         modflow_project_dir = os.path.join(modflow_dir, self.modflow_project)
-        modflow_model = flopy.modflow.Modflow.load(nam_file, model_ws=modflow_project_dir, forgive=True)
-        modflow_output = flopy.utils.formattedfile.FormattedHeadFile(
-            os.path.join(modflow_project_dir, Simulation._create_fhd_filename(nam_file)),
-            precision="single")
-
-        result_fhd = np.array([modflow_output.get_data(idx=stress_period)
-                               for stress_period in range(modflow_model.nper)])
+        result_fhd = Simulation.read_heads(modflow_project_dir, manifest)
 
         result_path = os.path.join(modflow_dir, Simulation.MODFLOW_OUTPUT_JSON)
         with open(result_path, 'w') as handle:
             json.dump(result_fhd.tolist(), handle)
 
+    @staticmethod
+    def read_heads(modflow_project_dir: str, manifest: ModelManifest) -> np.ndarray:
+        """
+        @param modflow_project_dir: Path to Modflow project main directory
+        @param manifest: Manifest of Modflow model
+        @return: Heads (Modflow output) of every stress period - array (stress periods, layers, rows, cols)
+        """
+        modflow_output = flopy.utils.formattedfile.FormattedHeadFile(
+            os.path.join(modflow_project_dir, manifest.head_file),
+            precision="single")
+        return np.array([modflow_output.get_data(idx=stress_period) for stress_period in range(manifest.nper)])
+
     def set_modflow_project(self, modflow_project) -> None:
         self.modflow_project = modflow_project
 
@@ -107,6 +620,18 @@ class Simulation:
     def set_spin_up(self, spin_up: int) -> None:
         self.spin_up = spin_up
 
+    def set_pipelined(self, pipelined: bool) -> None:
+        self.pipelined = pipelined
+
+    def set_resume(self, resume: bool) -> None:
+        """
+        @param resume: Skip stages (and Hydrus models) whose checkpoints of the previous simulation are valid
+        """
+        self.resume = resume
+
+    def set_simulation_cache(self, cache: Optional[SimulationCache]) -> None:
+        self.simulation_cache = cache
+
     def get_hydrus_stage_status(self) -> SimulationStageStatus:
         return self._hydrus_stage_status
 
@@ -119,10 +644,6 @@ class Simulation:
     def get_id(self) -> int:
         return self.simulation_id
 
-    @staticmethod
-    def _create_fhd_filename(nam_file: str):
-        return nam_file[:-4] + ".fhd"
-
     @staticmethod
     def set_finished_flag(modflow_dir: str) -> None:
         finished_file_path = os.path.join(modflow_dir, Simulation.SIMULATION_FINISHED_FLAG_FILE)
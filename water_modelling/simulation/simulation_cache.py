@@ -0,0 +1,310 @@
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, asdict
+from typing import Callable, Dict, Iterator, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows - the cache is used by a single (desktop) process
+    fcntl = None
+
+import numpy as np
+
+from app_config import deployment_config
+from datapassing import passing_cache
+
+# Cache of simulations - results of a successful simulation are stored under a key computed from all its
+# inputs (Hydrus input files, Modflow input files, shape masks, spin up and versions of the engines), so running
+# the same simulation again only restores the results. Outputs of every Hydrus model are cached the same way (by its
+# input files and Hydrus version), so only edited models are simulated again. Files are stored content-addressed
+# (by hash of the content), entries refer to them - identical files of many entries are stored once.
+CACHE_DIR_NAME = ".simulation_cache"
+OBJECTS_DIR_NAME = "objects"
+ENTRIES_DIR_NAME = "entries"
+LOCK_FILE_NAME = ".lock"
+TEMPORARY_SUFFIX = ".tmp"                   # files being copied into the cache
+KEY_VERSION = 1
+HYDRUS_INPUT_EXTENSIONS = (".in", ".dat")
+HYDRUS_OUTPUT_EXTENSIONS = (".out",)
+
+SIMULATION_ENTRY = "simulation"
+HYDRUS_MODEL_ENTRY = "hydrus_model"
+RESULTS_FILE = "results"                    # files of simulation entries
+RCH_FILE = "rch"
+
+
+@dataclass
+class CacheEntry:
+    key: str                                # hash of simulation inputs
+    files: Dict[str, str]                   # name of stored file -> hash of its content
+    size: int                               # total size of the stored files (in bytes)
+    created: float                          # time of creation (seconds since the epoch)
+    last_used: float                        # time of the last store or restore (seconds since the epoch)
+    kind: str = SIMULATION_ENTRY            # SIMULATION_ENTRY or HYDRUS_MODEL_ENTRY
+
+
+def get_simulation_key(hydrus_dir: str, model_names: List[str], masks: List[np.ndarray], modflow_project_dir: str,
+                       modflow_input_files: List[str], spin_up: int, engine_versions: Dict[str, str]) -> str:
+    """
+    @param hydrus_dir: Directory containing Hydrus projects
+    @param model_names: Names of Hydrus models used by the simulation
+    @param masks: Masks of consecutive Hydrus models
+    @param modflow_project_dir: Path to Modflow project main directory
+    @param modflow_input_files: Modflow input files, relative to modflow_project_dir (see get_model_input_files())
+    @param spin_up: Hydrus spin up period (in days)
+    @param engine_versions: Versions of Hydrus and Modflow (see IAppDeployer.get_engine_versions())
+    @return: Hash of all inputs of the simulation
+    """
+    hydrus_models = [[model_name, passing_cache.get_mask_fingerprint(mask),
+                      _hash_hydrus_inputs(os.path.join(hydrus_dir, model_name))]
+                     for model_name, mask in zip(model_names, masks)]
+
+    modflow_files = [[file_name, passing_cache.hash_file(os.path.join(modflow_project_dir, file_name))]
+                     for file_name in modflow_input_files]
+    inputs = {"version": KEY_VERSION, "hydrus": hydrus_models, "modflow": modflow_files, "spin_up": spin_up,
+              "engines": engine_versions}
+    return hashlib.blake2b(json.dumps(inputs, sort_keys=True).encode(), digest_size=16).hexdigest()
+
+
+def get_hydrus_model_key(model_dir: str, hydrus_version: str) -> str:
+    """
+    @param model_dir: Directory of Hydrus model
+    @param hydrus_version: Version of Hydrus (see IAppDeployer.get_engine_versions())
+    @return: Hash of all inputs of Hydrus model
+    """
+    inputs = {"version": KEY_VERSION, "kind": HYDRUS_MODEL_ENTRY, "hydrus": _hash_hydrus_inputs(model_dir),
+              "engine": hydrus_version}
+    return hashlib.blake2b(json.dumps(inputs, sort_keys=True).encode(), digest_size=16).hexdigest()
+
+
+def get_hydrus_output_files(model_dir: str) -> List[str]:
+    """
+    @param model_dir: Directory of Hydrus model
+    @return: Names of Hydrus output files (ex. T_Level.out) inside the directory
+    """
+    return sorted(file_name for file_name in os.listdir(model_dir)
+                  if file_name.lower().endswith(HYDRUS_OUTPUT_EXTENSIONS))
+
+
+def _hash_hydrus_inputs(model_dir: str) -> List[List[str]]:
+    """
+    @return: List of (file name, hash of the content) of every Hydrus input file of the model
+    """
+    input_files = sorted(file_name for file_name in os.listdir(model_dir)
+                         if file_name.lower().endswith(HYDRUS_INPUT_EXTENSIONS))
+    return [[file_name, passing_cache.hash_file(os.path.join(model_dir, file_name))] for file_name in input_files]
+
+
+class SimulationCache:
+    """
+    Size-bounded cache of simulation results - least recently used entries are removed when stored files
+    exceed max_bytes. The cache directory is locked by every operation, so it can be shared by many processes
+    (ex. workers of the web server).
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        """
+        @param cache_dir: Directory of the cache (created if needed)
+        @param max_bytes: Maximal total size of stored files
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()       # threads of the process, the lock file excludes other processes
+
+    def restore(self, key: str, get_destination: Callable[[str], str],
+                before_restore: Optional[Callable[[], None]] = None) -> bool:
+        """
+        Copy stored files of the entry to their places.
+        @param key: Key of the entry
+        @param get_destination: Returns path where the stored file of given name is restored
+        @param before_restore: Called before the files are copied if the entry is cached (ex. removes stale files)
+        @return: True if the entry was cached and its files were restored
+        """
+        with self._locked():
+            entry = self._read_entry(key)
+            if entry is None:
+                return False
+            if before_restore:
+                before_restore()
+            for file_name, file_hash in entry.files.items():
+                _copy_atomically(self._get_object_path(file_hash), get_destination(file_name))
+            entry.last_used = time.time()
+            self._write_entry(entry)
+            return True
+
+    def store(self, key: str, file_paths: Dict[str, str], kind: str = SIMULATION_ENTRY) -> None:
+        """
+        Store files under the key and remove least recently used entries if the cache is too big.
+        @param key: Key of the entry (see get_simulation_key() and get_hydrus_model_key())
+        @param file_paths: Name of the stored file -> path to the file
+        @param kind: SIMULATION_ENTRY or HYDRUS_MODEL_ENTRY
+        """
+        with self._locked():
+            files = {}
+            for file_name, path in file_paths.items():
+                files[file_name] = passing_cache.hash_file(path)
+                object_path = self._get_object_path(files[file_name])
+                if not os.path.isfile(object_path):
+                    _copy_atomically(path, object_path)
+
+            now = time.time()
+            size = sum(os.path.getsize(self._get_object_path(file_hash)) for file_hash in set(files.values()))
+            self._write_entry(CacheEntry(key, files, size, created=now, last_used=now, kind=kind))
+            self._evict()
+
+    def get_entries(self) -> List[CacheEntry]:
+        """
+        @return: Cached simulations and Hydrus models, most recently used first
+        """
+        with self._locked():
+            return sorted(self._read_entries(), key=lambda entry: entry.last_used, reverse=True)
+
+    def get_stats(self) -> dict:
+        """
+        @return: Amount of entries, size of stored files (in bytes) and the size limit
+        """
+        with self._locked():
+            return {
+                "entries": len(self._read_entries()),
+                "bytes": self._get_objects_size(),
+                "max_bytes": self.max_bytes
+            }
+
+    def purge(self, key: Optional[str] = None) -> int:
+        """
+        Remove entries and files which aren't used by remaining entries.
+        @param key: Key of the entry to remove, all entries are removed if None
+        @return: Amount of removed entries
+        """
+        with self._locked():
+            entries = self._read_entries()
+            removed_entries = [entry for entry in entries if key is None or entry.key == key]
+            for entry in removed_entries:
+                os.remove(self._get_entry_path(entry.key))
+            self._remove_unused_objects([entry for entry in entries if entry not in removed_entries])
+            if key is None:  # no copy is in progress while the cache is locked - leftovers of interrupted ones
+                for temporary_path in self._list_objects(temporary=True):
+                    os.remove(temporary_path)
+            return len(removed_entries)
+
+    @contextlib.contextmanager
+    def _locked(self) -> Iterator[None]:
+        with self._lock:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(os.path.join(self.cache_dir, LOCK_FILE_NAME), "a") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)  # released when the file is closed
+                yield
+
+    def _evict(self) -> None:
+        entries = sorted(self._read_entries(), key=lambda entry: entry.last_used)
+        object_sizes = {os.path.basename(object_path): os.path.getsize(object_path)
+                        for object_path in self._list_objects()}
+        size = sum(object_sizes.values())
+        if size <= self.max_bytes:
+            return
+
+        references = Counter(file_hash for entry in entries for file_hash in set(entry.files.values()))
+        for object_hash in [object_hash for object_hash in object_sizes if object_hash not in references]:
+            os.remove(self._get_object_path(object_hash))
+            size -= object_sizes.pop(object_hash)
+        # the newest entry is kept even if it exceeds the limit itself
+        while size > self.max_bytes and len(entries) > 1:
+            entry = entries.pop(0)
+            os.remove(self._get_entry_path(entry.key))
+            for object_hash in set(entry.files.values()):
+                references[object_hash] -= 1
+                if references[object_hash] == 0 and object_hash in object_sizes:
+                    os.remove(self._get_object_path(object_hash))
+                    size -= object_sizes.pop(object_hash)
+
+    def _remove_unused_objects(self, entries: List[CacheEntry]) -> None:
+        used_objects = {file_hash for entry in entries for file_hash in entry.files.values()}
+        for object_path in self._list_objects():
+            if os.path.basename(object_path) not in used_objects:
+                os.remove(object_path)
+
+    def _get_objects_size(self) -> int:
+        return sum(os.path.getsize(object_path) for object_path in self._list_objects())
+
+    def _list_objects(self, temporary: bool = False) -> List[str]:
+        """
+        @param temporary: List files being copied (or leftovers of interrupted copies) instead of stored files
+        @return: Paths to stored files
+        """
+        objects_dir = os.path.join(self.cache_dir, OBJECTS_DIR_NAME)
+        if not os.path.isdir(objects_dir):
+            return []
+        return [os.path.join(objects_dir, prefix, file_name) for prefix in os.listdir(objects_dir)
+                for file_name in os.listdir(os.path.join(objects_dir, prefix))
+                if file_name.endswith(TEMPORARY_SUFFIX) == temporary]
+
+    def _read_entries(self) -> List[CacheEntry]:
+        entries_dir = os.path.join(self.cache_dir, ENTRIES_DIR_NAME)
+        if not os.path.isdir(entries_dir):
+            return []
+        entries = [self._read_entry(os.path.splitext(file_name)[0]) for file_name in os.listdir(entries_dir)
+                   if not file_name.endswith(TEMPORARY_SUFFIX)]
+        return [entry for entry in entries if entry is not None]
+
+    def _read_entry(self, key: str) -> Optional[CacheEntry]:
+        entry_path = self._get_entry_path(key)
+        if not os.path.isfile(entry_path):
+            return None
+        try:
+            with open(entry_path) as handle:
+                entry = CacheEntry(**json.load(handle))
+        except (ValueError, TypeError):
+            print("Invalid simulation cache entry, it will be removed: " + entry_path)  # TODO: Logger
+            os.remove(entry_path)
+            return None
+
+        if not all(os.path.isfile(self._get_object_path(file_hash)) for file_hash in entry.files.values()):
+            print("Simulation cache entry refers to missing files, it will be removed: " + entry_path)  # TODO: Logger
+            os.remove(entry_path)
+            return None
+        return entry
+
+    def _write_entry(self, entry: CacheEntry) -> None:
+        entry_path = self._get_entry_path(entry.key)
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        with tempfile.NamedTemporaryFile("w", dir=os.path.dirname(entry_path), suffix=TEMPORARY_SUFFIX,
+                                         delete=False) as handle:
+            json.dump(asdict(entry), handle)
+        os.replace(handle.name, entry_path)
+
+    def _get_entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, ENTRIES_DIR_NAME, key + ".json")
+
+    def _get_object_path(self, object_hash: str) -> str:
+        return os.path.join(self.cache_dir, OBJECTS_DIR_NAME, object_hash[:2], object_hash)
+
+
+_simulation_cache = SimulationCache(os.path.join(deployment_config.WORKSPACE_DIR, CACHE_DIR_NAME),
+                                   deployment_config.SIMULATION_CACHE_MAX_BYTES)
+
+
+def get_simulation_cache() -> Optional[SimulationCache]:
+    """
+    @return: Process-wide cache of simulations stored in the workspace, None if caching is disabled
+    """
+    return _simulation_cache if deployment_config.SIMULATION_CACHE_MAX_BYTES > 0 else None
+
+
+def _copy_atomically(source_path: str, destination_path: str) -> None:
+    """
+    Copy the file, so the destination is never partially written.
+    """
+    destination_dir = os.path.dirname(destination_path)
+    os.makedirs(destination_dir, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=destination_dir, suffix=TEMPORARY_SUFFIX, delete=False) as handle:
+        temporary_path = handle.name
+    shutil.copyfile(source_path, temporary_path)
+    os.replace(temporary_path, destination_path)
@@ -0,0 +1,168 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from datapassing import passing_cache
+
+# Checkpoints of simulation stages - every stage (and every Hydrus model) which finishes successfully records
+# the fingerprint of its inputs and hashes of its output files in the project directory. A resumed simulation
+# skips stages whose checkpoint is still valid (same inputs, outputs unchanged) up to the first invalid one,
+# and reruns only Hydrus models without a valid checkpoint.
+CHECKPOINT_FILE_NAME = "checkpoint.json"  # inside the project directory (next to hydrus and modflow directories)
+CHECKPOINT_VERSION = 1
+
+HYDRUS_MODEL_PREFIX = "hydrus_model:"  # checkpoint name of a Hydrus model - prefix + model name
+
+
+@dataclass
+class StageCheckpoint:
+    input_fingerprint: str                  # hash of all inputs of the stage
+    outputs: Dict[str, str]                 # output file (relative to the project directory) -> hash of its content
+    completed: float                        # time of completion (seconds since the epoch)
+
+
+class SimulationCheckpoint:
+    """
+    Checkpoints of the last simulation of a project, stored in CHECKPOINT_FILE_NAME.
+    """
+
+    def __init__(self, project_dir: str):
+        """
+        @param project_dir: Project directory - hydrus and modflow directories are inside it
+        """
+        self.project_dir = project_dir
+        self.path = os.path.join(project_dir, CHECKPOINT_FILE_NAME)
+        self._lock = threading.Lock()
+        self._checkpoints: Dict[str, StageCheckpoint] = self._read()
+
+    def get(self, name: str) -> Optional[StageCheckpoint]:
+        """
+        @param name: Name of the stage (ex. HYDRUS_STAGE) or get_hydrus_model_name() of a Hydrus model
+        @return: Checkpoint of the stage, None if the stage didn't complete
+        """
+        with self._lock:
+            return self._checkpoints.get(name)
+
+    def is_valid(self, name: str, input_fingerprint: Optional[str]) -> bool:
+        """
+        @param name: Name of the stage or of a Hydrus model
+        @param input_fingerprint: Fingerprint of current inputs of the stage, None if they can't be read
+        @return: True if the stage completed with the same inputs and its outputs weren't changed since
+        """
+        checkpoint = self.get(name)
+        if checkpoint is None or input_fingerprint is None or checkpoint.input_fingerprint != input_fingerprint:
+            return False
+        try:
+            return all(passing_cache.hash_file(os.path.join(self.project_dir, output)) == output_hash
+                       for output, output_hash in checkpoint.outputs.items())
+        except OSError:
+            return False
+
+    def save(self, name: str, input_fingerprint: str, output_paths: List[str]) -> None:
+        """
+        Record completion of the stage.
+        @param name: Name of the stage or of a Hydrus model
+        @param input_fingerprint: Fingerprint of inputs the stage was run with
+        @param output_paths: Paths to output files of the stage
+        """
+        try:
+            outputs = {os.path.relpath(path, self.project_dir): passing_cache.hash_file(path)
+                       for path in output_paths}
+        except OSError as err:
+            print(f"Outputs of {name} can't be read, its checkpoint isn't saved: {err}")  # TODO: Logger
+            return
+        with self._lock:
+            self._checkpoints[name] = StageCheckpoint(input_fingerprint, outputs, time.time())
+            self._write()
+
+    def invalidate(self, names: List[str]) -> None:
+        """
+        Remove checkpoints of stages which are run again (the stages are invalid until they complete).
+        @param names: Names of the stages or of Hydrus models
+        """
+        with self._lock:
+            removed = [self._checkpoints.pop(name, None) for name in names]
+            if any(checkpoint is not None for checkpoint in removed):
+                self._write()
+
+    def _read(self) -> Dict[str, StageCheckpoint]:
+        if not os.path.isfile(self.path):
+            return {}
+        try:
+            with open(self.path) as handle:
+                data = json.load(handle)
+            if data.get("version") != CHECKPOINT_VERSION:
+                return {}
+            return {name: StageCheckpoint(**checkpoint) for name, checkpoint in data["checkpoints"].items()}
+        except (OSError, ValueError, KeyError, TypeError):
+            print("Invalid simulation checkpoint, it will be recreated: " + self.path)  # TODO: Logger
+            return {}
+
+    def _write(self) -> None:
+        data = {"version": CHECKPOINT_VERSION,
+                "checkpoints": {name: asdict(checkpoint) for name, checkpoint in self._checkpoints.items()}}
+        try:
+            with tempfile.NamedTemporaryFile("w", dir=self.project_dir, delete=False) as handle:
+                json.dump(data, handle)
+            os.replace(handle.name, self.path)
+        except OSError as err:
+            print("Saving simulation checkpoint failed: " + str(err))  # TODO: Logger
+
+
+def get_hydrus_model_name(model_name: str) -> str:
+    """
+    @return: Checkpoint name of the Hydrus model
+    """
+    return HYDRUS_MODEL_PREFIX + model_name
+
+
+def get_hydrus_fingerprint(model_keys: Dict[str, str]) -> str:
+    """
+    @param model_keys: Name of every Hydrus model of the simulation -> hash of its inputs
+    @return: Fingerprint of inputs of the Hydrus stage
+    """
+    return _hash({"version": CHECKPOINT_VERSION, "hydrus": sorted(model_keys.items())})
+
+
+def get_passing_fingerprint(t_level_paths: List[str], masks: List[np.ndarray], spin_up: int,
+                            modflow_project_dir: str, modflow_input_files: List[str]) -> str:
+    """
+    @param t_level_paths: Paths to T_Level.out files of consecutive Hydrus models
+    @param masks: Masks of consecutive Hydrus models
+    @param spin_up: Hydrus spin up period (in days)
+    @param modflow_project_dir: Path to Modflow project main directory
+    @param modflow_input_files: Modflow input files read by the passing (without the RCH file it writes)
+    @return: Fingerprint of inputs of the passing stage
+    @raise OSError: if inputs can't be read
+    """
+    shapes = [[passing_cache.hash_file(t_level_path), passing_cache.get_mask_fingerprint(mask)]
+              for t_level_path, mask in zip(t_level_paths, masks)]
+    return _hash({"version": CHECKPOINT_VERSION, "shapes": shapes, "spin_up": spin_up,
+                  "modflow": _hash_files(modflow_project_dir, modflow_input_files)})
+
+
+def get_modflow_fingerprint(modflow_project_dir: str, modflow_input_files: List[str], modflow_version: str) -> str:
+    """
+    @param modflow_project_dir: Path to Modflow project main directory
+    @param modflow_input_files: Modflow input files (see modflow_utils.get_model_input_files())
+    @param modflow_version: Version of Modflow (see IAppDeployer.get_engine_versions())
+    @return: Fingerprint of inputs of the Modflow stage
+    @raise OSError: if inputs can't be read
+    """
+    return _hash({"version": CHECKPOINT_VERSION, "modflow": _hash_files(modflow_project_dir, modflow_input_files),
+                  "engine": modflow_version})
+
+
+def _hash_files(directory: str, file_names: List[str]) -> List[List[str]]:
+    return [[file_name, passing_cache.hash_file(os.path.join(directory, file_name))] for file_name in file_names]
+
+
+def _hash(inputs: dict) -> str:
+    return hashlib.blake2b(json.dumps(inputs, sort_keys=True).encode(), digest_size=16).hexdigest()
@@ -0,0 +1,109 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional
+
+from app_config import deployment_config
+
+# In-process bus of simulation progress events - simulations publish stage transitions and completion of models,
+# clients (ex. Server-Sent Events stream) read events after the last sequence number they've seen, so a client
+# which reconnects resumes where it stopped
+STAGE_STARTED = "stage_started"
+STAGE_ENDED = "stage_ended"
+STAGE_ERROR = "stage_error"
+MODEL_FINISHED = "model_finished"
+SIMULATION_FINISHED = "simulation_finished"
+
+
+@dataclass
+class SimulationEvent:
+    sequence: int                           # number of the event in its simulation (starting with 1)
+    simulation_id: int                      # ID of the simulation
+    kind: str                               # STAGE_STARTED, STAGE_ENDED, STAGE_ERROR, MODEL_FINISHED, ...
+    time: float                             # publication time (seconds since the epoch)
+    data: Dict = field(default_factory=dict)  # details (ex. stage, model name, error description)
+
+
+class _EventStream:
+
+    def __init__(self, history_size: int):
+        self.events: Deque[SimulationEvent] = deque(maxlen=history_size)
+        self.last_sequence = 0
+
+
+class SimulationEventBus:
+
+    def __init__(self, history_size: int, max_simulations: int):
+        """
+        @param history_size: Amount of the latest events kept for every simulation (for resuming clients)
+        @param max_simulations: Amount of simulations whose events are kept - events of the oldest are dropped
+        """
+        self.history_size = history_size
+        self.max_simulations = max_simulations
+        self._streams: OrderedDict[int, _EventStream] = OrderedDict()
+        self._condition = threading.Condition()
+
+    def publish(self, simulation_id: int, kind: str, **data) -> SimulationEvent:
+        """
+        @param simulation_id: ID of the simulation
+        @param kind: Kind of the event
+        @param data: Details of the event (JSON serializable)
+        @return: Published event
+        """
+        with self._condition:
+            stream = self._streams.get(simulation_id)
+            if stream is None:
+                stream = self._streams[simulation_id] = _EventStream(self.history_size)
+                while len(self._streams) > self.max_simulations:
+                    self._streams.popitem(last=False)
+            stream.last_sequence += 1
+            event = SimulationEvent(stream.last_sequence, simulation_id, kind, time.time(), data)
+            stream.events.append(event)
+            self._condition.notify_all()
+        return event
+
+    def get_events(self, simulation_id: int, after_sequence: int = 0) -> List[SimulationEvent]:
+        """
+        @param simulation_id: ID of the simulation
+        @param after_sequence: Sequence number of the last event seen by the client
+        @return: Kept events of the simulation published after the given one
+        """
+        with self._condition:
+            stream = self._streams.get(simulation_id)
+            if stream is None:
+                return []
+            return [event for event in stream.events if event.sequence > after_sequence]
+
+    def wait_for_events(self, simulation_id: int, after_sequence: int = 0,
+                        timeout: Optional[float] = None) -> List[SimulationEvent]:
+        """
+        Block until the simulation publishes an event after the given one.
+        @param simulation_id: ID of the simulation
+        @param after_sequence: Sequence number of the last event seen by the client
+        @param timeout: Maximal waiting time (in seconds), no limit if None
+        @return: Events published after the given one, empty if the timeout passed
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._get_last_sequence(simulation_id) > after_sequence, timeout)
+            return self.get_events(simulation_id, after_sequence)
+
+    def _get_last_sequence(self, simulation_id: int) -> int:
+        stream = self._streams.get(simulation_id)
+        return stream.last_sequence if stream is not None else 0
+
+
+_event_bus: Optional[SimulationEventBus] = None
+_event_bus_lock = threading.Lock()
+
+
+def get_event_bus() -> SimulationEventBus:
+    """
+    @return: Process-wide event bus configured in deployment_config
+    """
+    global _event_bus
+    with _event_bus_lock:
+        if _event_bus is None:
+            _event_bus = SimulationEventBus(deployment_config.SIMULATION_EVENTS_HISTORY,
+                                            deployment_config.SIMULATION_EVENTS_MAX_SIMULATIONS)
+        return _event_bus
@@ -0,0 +1,207 @@
+import functools
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+# Performance metrics of simulations - every measured operation (ex. Hydrus run, passing, waiting for a Modflow
+# container) records its wall time, CPU time and bytes read and written by the application thread running it.
+# CPU time of Hydrus and Modflow themselves (processes, containers or jobs) isn't taken from process-wide counters
+# shared by concurrent simulations - only CPU time of a reaped desktop Hydrus process is recorded (on its model's
+# measurement), unmeasured values are None. Measurements are
+# aggregated per stage and operation for the Prometheus /metrics endpoint and kept per simulation until
+# the simulation stores them in the registry.
+DURATION_BUCKETS = (0.1, 1, 5, 15, 60, 300, 900, 3600)  # upper bounds (in seconds) of the duration histogram
+MAX_PENDING_SIMULATIONS = 200  # measurements of the oldest simulations which didn't take them are dropped
+
+T = TypeVar("T")
+
+
+@dataclass
+class Measurement:
+    stage: str                              # stage of the simulation (ex. hydrus) or "queue"
+    operation: str                          # measured operation (ex. run_hydrus, wait_for_termination)
+    model: Optional[str]                    # name of the measured model, None for the whole stage
+    wall_seconds: float                     # elapsed time
+    cpu_seconds: Optional[float]            # CPU time of the measuring thread, None if it wasn't measured
+    read_bytes: Optional[int]               # bytes read by the measuring thread (including network filesystems),
+                                            # None if they weren't measured
+    written_bytes: Optional[int]            # bytes written by the measuring thread, None if they weren't measured
+
+
+class _Usage:
+    """
+    Resources used so far by the current thread.
+    """
+
+    def __init__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.thread_time()
+        self.read_bytes, self.written_bytes = _read_thread_io()
+
+
+def _read_thread_io() -> Tuple[Optional[int], Optional[int]]:
+    """
+    @return: Bytes read and written by the current thread, None if the system doesn't report them (Linux only)
+    """
+    try:
+        with open("/proc/thread-self/io") as io_file:
+            counters = dict(line.split(":") for line in io_file if ":" in line)
+        return int(counters["rchar"]), int(counters["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+def _difference(start: Optional[int], end: Optional[int]) -> Optional[int]:
+    return end - start if start is not None and end is not None else None
+
+
+class _Aggregate:
+
+    def __init__(self):
+        self.count = 0
+        self.wall_seconds = 0.0
+        self.cpu_seconds: Optional[float] = None  # None if CPU time of no measurement was measured
+        self.read_bytes: Optional[int] = None  # None if bytes of no measurement were measured
+        self.written_bytes: Optional[int] = None
+        self.buckets = [0] * len(DURATION_BUCKETS)
+
+
+class SimulationMetrics:
+
+    def __init__(self, max_pending_simulations: int = MAX_PENDING_SIMULATIONS):
+        """
+        @param max_pending_simulations: Amount of simulations whose measurements are kept until they're taken
+        """
+        self.max_pending_simulations = max_pending_simulations
+        self._aggregates: Dict[Tuple[str, str], _Aggregate] = {}
+        self._pending: OrderedDict[int, List[Measurement]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def measure(self, simulation_id: int, stage: str, operation: str,
+                model: Optional[str] = None) -> Iterator[None]:
+        """
+        Measure the code inside the with statement (also if it raises).
+        @param simulation_id: ID of the simulation
+        @param stage: Stage of the simulation
+        @param operation: Name of the measured operation
+        @param model: Name of the measured model, None for the whole stage
+        """
+        start = _Usage()
+        try:
+            yield
+        finally:
+            end = _Usage()
+            self.record(simulation_id, Measurement(stage, operation, model, end.wall - start.wall,
+                                                   end.cpu - start.cpu, _difference(start.read_bytes, end.read_bytes),
+                                                   _difference(start.written_bytes, end.written_bytes)))
+
+    def measured(self, function: Callable[[], T], simulation_id: int, stage: str, operation: str,
+                 model: Optional[str] = None) -> Callable[[], T]:
+        """
+        @return: Function calling the given one inside measure() - ex. to be submitted to an executor
+        """
+        def measured_function() -> T:
+            with self.measure(simulation_id, stage, operation, model):
+                return function()
+        return measured_function
+
+    def record(self, simulation_id: int, measurement: Measurement) -> None:
+        with self._lock:
+            aggregate = self._aggregates.setdefault((measurement.stage, measurement.operation), _Aggregate())
+            aggregate.count += 1
+            aggregate.wall_seconds += measurement.wall_seconds
+            if measurement.cpu_seconds is not None:
+                aggregate.cpu_seconds = (aggregate.cpu_seconds or 0.0) + measurement.cpu_seconds
+            if measurement.read_bytes is not None:
+                aggregate.read_bytes = (aggregate.read_bytes or 0) + measurement.read_bytes
+            if measurement.written_bytes is not None:
+                aggregate.written_bytes = (aggregate.written_bytes or 0) + measurement.written_bytes
+            for idx, upper_bound in enumerate(DURATION_BUCKETS):
+                if measurement.wall_seconds <= upper_bound:
+                    aggregate.buckets[idx] += 1
+
+            self._pending.setdefault(simulation_id, []).append(measurement)
+            self._pending.move_to_end(simulation_id)
+            while len(self._pending) > self.max_pending_simulations:
+                self._pending.popitem(last=False)
+
+    def take_measurements(self, simulation_id: int) -> List[Measurement]:
+        """
+        @param simulation_id: ID of the simulation
+        @return: Measurements of the simulation recorded since the last call (they're removed)
+        """
+        with self._lock:
+            return self._pending.pop(simulation_id, [])
+
+    def to_prometheus(self) -> str:
+        """
+        @return: Aggregated metrics in Prometheus text exposition format
+        """
+        with self._lock:
+            aggregates = sorted(self._aggregates.items())
+            lines = []
+            for name, help_text, metric_type, get_value in [
+                ("simulation_operations_total", "Measured simulation operations", "counter",
+                 lambda aggregate: aggregate.count),
+                ("simulation_operation_cpu_seconds_total", "CPU time of application threads running simulation "
+                                                           "operations and of desktop Hydrus processes", "counter",
+                 lambda aggregate: aggregate.cpu_seconds),
+                ("simulation_operation_read_bytes_total", "Bytes read by simulation operations", "counter",
+                 lambda aggregate: aggregate.read_bytes),
+                ("simulation_operation_written_bytes_total", "Bytes written by simulation operations", "counter",
+                 lambda aggregate: aggregate.written_bytes)]:
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+                lines += [f"{name}{{{_labels(stage, operation)}}} {get_value(aggregate)}"
+                          for (stage, operation), aggregate in aggregates if get_value(aggregate) is not None]
+
+            name = "simulation_operation_duration_seconds"
+            lines += [f"# HELP {name} Wall time of simulation operations", f"# TYPE {name} histogram"]
+            for (stage, operation), aggregate in aggregates:
+                labels = _labels(stage, operation)
+                for upper_bound, count in zip(DURATION_BUCKETS, aggregate.buckets):
+                    lines.append(f"{name}_bucket{{{labels},le=\"{upper_bound}\"}} {count}")
+                lines.append(f"{name}_bucket{{{labels},le=\"+Inf\"}} {aggregate.count}")
+                lines.append(f"{name}_sum{{{labels}}} {aggregate.wall_seconds}")
+                lines.append(f"{name}_count{{{labels}}} {aggregate.count}")
+            return "\n".join(lines) + "\n"
+
+
+def _labels(stage: str, operation: str) -> str:
+    return f"stage=\"{_escape(stage)}\",operation=\"{_escape(operation)}\""
+
+
+def _escape(label_value: str) -> str:
+    return label_value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def measured_method(stage: str):
+    """
+    Measure every call of the decorated method - the method's object needs metrics and simulation_id attributes.
+    @param stage: Stage of the simulation the method belongs to
+    """
+    def decorator(method: Callable[..., T]) -> Callable[..., T]:
+        @functools.wraps(method)
+        def measured_method_call(self, *args, **kwargs) -> T:
+            with self.metrics.measure(self.simulation_id, stage, method.__name__):
+                return method(self, *args, **kwargs)
+        return measured_method_call
+    return decorator
+
+
+_metrics: Optional[SimulationMetrics] = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics() -> SimulationMetrics:
+    """
+    @return: Process-wide metrics
+    """
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = SimulationMetrics()
+        return _metrics
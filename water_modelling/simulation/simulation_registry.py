@@ -0,0 +1,248 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional
+
+from app_config import deployment_config
+from simulation.simulation_error import SimulationError
+from simulation.simulation_metrics import Measurement
+from simulation.simulation_stage_status import SimulationStageStatus
+
+# Registry of simulation runs - SQLite database in the workspace, so IDs are unique and status of the runs survives
+# restarts of the application and is shared by all its processes
+REGISTRY_FILE_NAME = "simulation_registry.sqlite"
+CONNECTION_TIMEOUT = 30  # seconds to wait for a lock held by another process
+
+HYDRUS_STAGE = "hydrus"
+PASSING_STAGE = "passing"
+MODFLOW_STAGE = "modflow"
+STAGES = [HYDRUS_STAGE, PASSING_STAGE, MODFLOW_STAGE]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS simulations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    project TEXT NOT NULL,
+    input_fingerprint TEXT,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS simulations_project ON simulations (project, created);
+CREATE INDEX IF NOT EXISTS simulations_fingerprint ON simulations (input_fingerprint);
+
+CREATE TABLE IF NOT EXISTS stages (
+    simulation_id INTEGER NOT NULL REFERENCES simulations (id),
+    stage TEXT NOT NULL,
+    started REAL,
+    ended REAL,
+    PRIMARY KEY (simulation_id, stage)
+);
+
+CREATE TABLE IF NOT EXISTS timings (
+    simulation_id INTEGER NOT NULL REFERENCES simulations (id),
+    stage TEXT NOT NULL,
+    name TEXT NOT NULL,
+    seconds REAL NOT NULL,
+    PRIMARY KEY (simulation_id, stage, name)
+);
+
+CREATE TABLE IF NOT EXISTS errors (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    simulation_id INTEGER NOT NULL REFERENCES simulations (id),
+    stage TEXT NOT NULL,
+    model_name TEXT NOT NULL,
+    description TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS errors_simulation ON errors (simulation_id, stage);
+
+CREATE TABLE IF NOT EXISTS measurements (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    simulation_id INTEGER NOT NULL REFERENCES simulations (id),
+    stage TEXT NOT NULL,
+    operation TEXT NOT NULL,
+    model TEXT,
+    wall_seconds REAL NOT NULL,
+    cpu_seconds REAL,
+    read_bytes INTEGER,
+    written_bytes INTEGER
+);
+CREATE INDEX IF NOT EXISTS measurements_simulation ON measurements (simulation_id);
+
+CREATE TABLE IF NOT EXISTS artifacts (
+    simulation_id INTEGER NOT NULL REFERENCES simulations (id),
+    name TEXT NOT NULL,
+    path TEXT NOT NULL,
+    PRIMARY KEY (simulation_id, name)
+);
+"""
+
+
+@dataclass
+class StageRecord:
+    started: Optional[float]                # start time (seconds since the epoch), None if it didn't start
+    ended: Optional[float]                  # end time (seconds since the epoch), None if it didn't end
+    timings: Dict[str, float]               # duration (in seconds) of parts of the stage (ex. Hydrus models)
+    errors: List[SimulationError]           # errors which occurred in the stage
+
+
+@dataclass
+class SimulationRecord:
+    simulation_id: int                      # ID of the simulation
+    project: str                            # name of the simulated project
+    input_fingerprint: Optional[str]        # hash of all inputs of the simulation (see get_simulation_key())
+    created: float                          # creation time (seconds since the epoch)
+    stages: Dict[str, StageRecord] = field(default_factory=dict)  # stage name -> its record
+    artifacts: Dict[str, str] = field(default_factory=dict)       # artifact name -> path (ex. results)
+    measurements: List[Measurement] = field(default_factory=list)  # performance of operations of the simulation
+
+
+class SimulationRegistry:
+
+    def __init__(self, db_path: str):
+        """
+        @param db_path: Path to the database file (created if needed)
+        """
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")  # readers don't block the writer
+            connection.executescript(_SCHEMA)
+
+    def create_simulation(self, project: str) -> int:
+        """
+        @param project: Name of the simulated project
+        @return: Unique ID of the new simulation
+        """
+        with self._connect() as connection:
+            cursor = connection.execute("INSERT INTO simulations (project, created) VALUES (?, ?)",
+                                        (project, time.time()))
+            connection.executemany("INSERT INTO stages (simulation_id, stage) VALUES (?, ?)",
+                                   [(cursor.lastrowid, stage) for stage in STAGES])
+            return cursor.lastrowid
+
+    def set_input_fingerprint(self, simulation_id: int, input_fingerprint: str) -> None:
+        with self._connect() as connection:
+            connection.execute("UPDATE simulations SET input_fingerprint = ? WHERE id = ?",
+                               (input_fingerprint, simulation_id))
+
+    def set_stage_started(self, simulation_id: int, stage: str) -> None:
+        with self._connect() as connection:
+            connection.execute("UPDATE stages SET started = ? WHERE simulation_id = ? AND stage = ?",
+                               (time.time(), simulation_id, stage))
+
+    def set_stage_ended(self, simulation_id: int, stage: str, ended: bool = True) -> None:
+        with self._connect() as connection:
+            connection.execute("UPDATE stages SET ended = ? WHERE simulation_id = ? AND stage = ?",
+                               (time.time() if ended else None, simulation_id, stage))
+
+    def add_timing(self, simulation_id: int, stage: str, name: str, seconds: float) -> None:
+        with self._connect() as connection:
+            connection.execute("INSERT OR REPLACE INTO timings (simulation_id, stage, name, seconds) "
+                               "VALUES (?, ?, ?, ?)", (simulation_id, stage, name, seconds))
+
+    def add_error(self, simulation_id: int, stage: str, error: SimulationError) -> None:
+        with self._connect() as connection:
+            connection.execute("INSERT INTO errors (simulation_id, stage, model_name, description) "
+                               "VALUES (?, ?, ?, ?)", (simulation_id, stage, error.model_name,
+                                                       error.error_description))
+
+    def add_artifact(self, simulation_id: int, name: str, path: str) -> None:
+        with self._connect() as connection:
+            connection.execute("INSERT OR REPLACE INTO artifacts (simulation_id, name, path) VALUES (?, ?, ?)",
+                               (simulation_id, name, path))
+
+    def add_measurements(self, simulation_id: int, measurements: List[Measurement]) -> None:
+        with self._connect() as connection:
+            connection.executemany("INSERT INTO measurements (simulation_id, stage, operation, model, wall_seconds, "
+                                   "cpu_seconds, read_bytes, written_bytes) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                   [(simulation_id, measurement.stage, measurement.operation, measurement.model,
+                                     measurement.wall_seconds, measurement.cpu_seconds, measurement.read_bytes,
+                                     measurement.written_bytes) for measurement in measurements])
+
+    def get_stage_statuses(self, simulation_id: int) -> Optional[Dict[str, SimulationStageStatus]]:
+        """
+        @param simulation_id: ID of the simulation
+        @return: Stage name -> status of the stage, None if there is no such simulation
+        """
+        record = self.get_simulation(simulation_id)
+        if record is None:
+            return None
+
+        statuses = {}
+        for stage, stage_record in record.stages.items():
+            status = SimulationStageStatus()
+            status.set_ended(stage_record.ended is not None)
+            for name, seconds in stage_record.timings.items():
+                status.add_timing(name, seconds)
+            for error in stage_record.errors:
+                status.add_error(error)
+            statuses[stage] = status
+        return statuses
+
+    def get_simulation(self, simulation_id: int) -> Optional[SimulationRecord]:
+        """
+        @param simulation_id: ID of the simulation
+        @return: Record of the simulation, None if there is no such simulation
+        """
+        records = self._read_records("WHERE id = ?", (simulation_id,))
+        return records[0] if records else None
+
+    def get_simulations(self, project: Optional[str] = None, limit: int = 100) -> List[SimulationRecord]:
+        """
+        @param project: Name of the project, simulations of all projects if None
+        @param limit: Maximal amount of returned simulations
+        @return: Records of the latest simulations, newest first
+        """
+        if project is None:
+            return self._read_records("ORDER BY created DESC LIMIT ?", (limit,))
+        return self._read_records("WHERE project = ? ORDER BY created DESC LIMIT ?", (project, limit))
+
+    def _read_records(self, condition: str, parameters: tuple) -> List[SimulationRecord]:
+        with self._connect() as connection:
+            records = [SimulationRecord(*row) for row in connection.execute(
+                "SELECT id, project, input_fingerprint, created FROM simulations " + condition, parameters)]
+            for record in records:
+                for stage, started, ended in connection.execute(
+                        "SELECT stage, started, ended FROM stages WHERE simulation_id = ?", (record.simulation_id,)):
+                    record.stages[stage] = StageRecord(started, ended, {}, [])
+                for stage, name, seconds in connection.execute(
+                        "SELECT stage, name, seconds FROM timings WHERE simulation_id = ?", (record.simulation_id,)):
+                    record.stages[stage].timings[name] = seconds
+                for stage, model_name, description in connection.execute(
+                        "SELECT stage, model_name, description FROM errors WHERE simulation_id = ? ORDER BY id",
+                        (record.simulation_id,)):
+                    record.stages[stage].errors.append(SimulationError(model_name, description))
+                record.measurements = [Measurement(*row) for row in connection.execute(
+                    "SELECT stage, operation, model, wall_seconds, cpu_seconds, read_bytes, written_bytes "
+                    "FROM measurements WHERE simulation_id = ? ORDER BY id", (record.simulation_id,))]
+                record.artifacts = dict(connection.execute(
+                    "SELECT name, path FROM artifacts WHERE simulation_id = ?", (record.simulation_id,)))
+            return records
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """
+        Connection per operation - the registry is used by many threads and processes.
+        """
+        connection = sqlite3.connect(self.db_path, timeout=CONNECTION_TIMEOUT)
+        try:
+            with connection:  # commits (or rolls back) the transaction
+                yield connection
+        finally:
+            connection.close()
+
+
+_registry: Optional[SimulationRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> SimulationRegistry:
+    """
+    @return: Process-wide registry stored in the workspace
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = SimulationRegistry(os.path.join(deployment_config.WORKSPACE_DIR, REGISTRY_FILE_NAME))
+        return _registry
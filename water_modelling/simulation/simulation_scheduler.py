@@ -0,0 +1,234 @@
+import bisect
+import itertools
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from app_config import deployment_config
+from simulation import simulation_metrics
+from simulation.exceptions import SimulationQueueFullException
+from simulation.simulation_metrics import Measurement
+
+QUEUED = "queued"
+RUNNING = "running"
+FINISHED = "finished"
+
+QUEUE_STAGE = "queue"  # stage of measurements of waiting in the queue
+MIN_USER_PRIORITY = 0  # the highest priority users can request - lower ones are reserved for internal submissions
+
+
+@dataclass(order=True)
+class _QueuedSimulation:
+    priority: int                                       # lower priority runs first
+    sequence: int                                       # order of submission (FIFO within the same priority)
+    simulation_id: int = field(compare=False)           # ID of the simulation
+    user: str = field(compare=False)                    # user who submitted the simulation
+    slots: int = field(compare=False)                   # part of the slot budget used while running
+    run: Callable[[], None] = field(compare=False)      # runs the simulation
+    submitted: float = field(compare=False, default_factory=time.perf_counter)  # submission time
+
+
+@dataclass
+class QueueStatus:
+    state: str                              # QUEUED, RUNNING or FINISHED
+    position: Optional[int]                 # 1-based position in the queue (only if queued)
+
+
+class SimulationScheduler:
+    """
+    Central queue of simulations run by a bounded pool of worker threads. Simulations are admitted in order of
+    priority (FIFO within the same priority) while the workers, the user's concurrency limit and the slot budget
+    allow - simulations of users at their limit are passed over, but a simulation not fitting into free slots
+    holds the ones behind it (so big simulations aren't starved by small ones).
+    """
+
+    def __init__(self, workers: int, max_queue_size: int, max_per_user: int, slots: int, max_finished: int = 1000):
+        """
+        @param workers: Maximal amount of simulations running at once
+        @param max_queue_size: Maximal amount of queued (not running) simulations
+        @param max_per_user: Maximal amount of simulations of one user running at once
+        @param slots: Slot budget (ex. CPUs) shared by running simulations
+        @param max_finished: Amount of the latest finished simulations whose state is kept - older ones are unknown
+            to the scheduler (their state is in the registry)
+        """
+        self.workers = workers
+        self.max_queue_size = max_queue_size
+        self.max_per_user = max_per_user
+        self.slots = slots
+        self.max_finished = max(1, max_finished)
+
+        self._queue: List[_QueuedSimulation] = []  # sorted - the first simulation runs first
+        self._sequence = itertools.count()
+        self._running: Dict[int, _QueuedSimulation] = {}
+        self._draining: Dict[int, _QueuedSimulation] = {}  # cancelled, still stopping - they don't use capacity
+        self._finished: OrderedDict[int, None] = OrderedDict()  # IDs of finished simulations, the oldest first
+        self._condition = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._shutdown = False
+
+    def submit(self, simulation_id: int, user: str, run: Callable[[], None], priority: int = 0,
+               slots: int = 1) -> QueueStatus:
+        """
+        @param simulation_id: ID of the simulation
+        @param user: User who submitted the simulation
+        @param run: Runs the simulation (in a worker thread)
+        @param priority: Lower priority runs first
+        @param slots: Part of the slot budget used by the simulation (limited to the whole budget)
+        @return: Status of the simulation in the queue
+        @raise SimulationQueueFullException: if the queue is full
+        """
+        with self._condition:
+            if len(self._queue) >= self.max_queue_size:
+                raise SimulationQueueFullException(f"Simulation queue is full ({self.max_queue_size} simulations)")
+            bisect.insort(self._queue, _QueuedSimulation(priority, next(self._sequence), simulation_id, user,
+                                                         max(1, min(slots, self.slots)), run))
+            self._start_workers()
+            self._condition.notify_all()
+        return self.get_status(simulation_id)
+
+    def get_status(self, simulation_id: int) -> Optional[QueueStatus]:
+        """
+        @param simulation_id: ID of the simulation
+        @return: Status of the simulation in the queue, None if it wasn't submitted to this scheduler
+        """
+        with self._condition:
+            if simulation_id in self._running or simulation_id in self._draining:
+                return QueueStatus(RUNNING, None)
+            if simulation_id in self._finished:
+                return QueueStatus(FINISHED, None)
+            for position, queued in enumerate(self._queue, start=1):
+                if queued.simulation_id == simulation_id:
+                    return QueueStatus(QUEUED, position)
+            return None
+
+    def get_user(self, simulation_id: int) -> Optional[str]:
+        """
+        @param simulation_id: ID of the simulation
+        @return: User who submitted the simulation, None if it isn't queued nor running
+        """
+        with self._condition:
+            queued = self._running.get(simulation_id) or self._draining.get(simulation_id)
+            if queued is None:
+                queued = next((queued for queued in self._queue if queued.simulation_id == simulation_id), None)
+            return queued.user if queued is not None else None
+
+    def cancel(self, simulation_id: int) -> Optional[str]:
+        """
+        Remove the queued simulation from the queue or free capacity of the running one - its worker is replaced
+        by a new one at once, so other simulations don't wait until the cancelled one stops (cancel the simulation
+        through simulation.cancellation to stop it).
+        @param simulation_id: ID of the simulation
+        @return: State of the simulation before the cancellation, None if it wasn't submitted to this scheduler
+        """
+        with self._condition:
+            for queued in self._queue:
+                if queued.simulation_id == simulation_id:
+                    self._queue.remove(queued)
+                    self._add_finished(simulation_id)
+                    return QUEUED
+            if simulation_id in self._running:
+                self._draining[simulation_id] = self._running.pop(simulation_id)
+                self._start_workers()
+                self._condition.notify_all()
+                return RUNNING
+            if simulation_id in self._draining:
+                return RUNNING
+            if simulation_id in self._finished:
+                return FINISHED
+            return None
+
+    def shutdown(self) -> None:
+        """
+        Stop the workers after running simulations finish - queued simulations are dropped.
+        """
+        with self._condition:
+            self._shutdown = True
+            self._queue.clear()
+            self._condition.notify_all()
+        for thread in list(self._threads):
+            thread.join()
+
+    def _start_workers(self) -> None:
+        while len(self._threads) < self.workers + len(self._draining):
+            thread = threading.Thread(target=self._work, name=f"simulation-worker-{len(self._threads)}",
+                                      daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def _work(self) -> None:
+        while True:
+            with self._condition:
+                queued = self._admit()
+                while queued is None and not self._shutdown and not self._is_surplus_worker():
+                    self._condition.wait()
+                    queued = self._admit()
+                if queued is None:
+                    if not self._shutdown:
+                        self._threads.remove(threading.current_thread())
+                    return
+                self._running[queued.simulation_id] = queued
+
+            simulation_metrics.get_metrics().record(queued.simulation_id, Measurement(
+                QUEUE_STAGE, "queue_wait", None, time.perf_counter() - queued.submitted, None, None, None))
+            try:
+                queued.run()
+            except Exception:
+                print(f"Simulation {queued.simulation_id} failed:")  # TODO: Logger
+                traceback.print_exc()
+            finally:
+                with self._condition:
+                    self._running.pop(queued.simulation_id, None)
+                    self._draining.pop(queued.simulation_id, None)
+                    self._add_finished(queued.simulation_id)
+                    self._condition.notify_all()
+
+    def _add_finished(self, simulation_id: int) -> None:
+        self._finished[simulation_id] = None
+        self._finished.move_to_end(simulation_id)
+        while len(self._finished) > self.max_finished:
+            self._finished.popitem(last=False)
+
+    def _is_surplus_worker(self) -> bool:
+        """
+        @return: True if there are more workers than needed - workers started in place of the ones stopping cancelled
+            simulations exit once those finish
+        """
+        return len(self._threads) > self.workers + len(self._draining)
+
+    def _admit(self) -> Optional[_QueuedSimulation]:
+        """
+        @return: The first queued simulation which can run now (removed from the queue), None if there is none
+        """
+        if self._shutdown or len(self._running) >= self.workers:
+            return None
+        free_slots = self.slots - sum(running.slots for running in self._running.values())
+        for queued in self._queue:
+            if sum(running.user == queued.user for running in self._running.values()) >= self.max_per_user:
+                continue
+            if queued.slots > free_slots:
+                return None
+            self._queue.remove(queued)
+            return queued
+        return None
+
+
+_scheduler: Optional[SimulationScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> SimulationScheduler:
+    """
+    @return: Process-wide scheduler configured in deployment_config
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = SimulationScheduler(deployment_config.SIMULATION_WORKERS,
+                                             deployment_config.SIMULATION_QUEUE_SIZE,
+                                             deployment_config.SIMULATION_MAX_PER_USER,
+                                             deployment_config.SIMULATION_SLOTS,
+                                             deployment_config.SIMULATION_MAX_FINISHED)
+        return _scheduler
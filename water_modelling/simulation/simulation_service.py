@@ -1,40 +1,161 @@
-from typing import Tuple, List
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
 
 from app_config import deployment_config
+from simulation import cancellation, simulation_registry, simulation_scheduler
+from simulation.ensemble import Ensemble, EnsembleResult, Scenario, validate_scenarios
+from simulation.exceptions import SimulationAccessDeniedException, SimulationQueueFullException
 from simulation.simulation import Simulation
+from simulation.simulation_registry import SimulationRegistry, HYDRUS_STAGE, PASSING_STAGE, MODFLOW_STAGE
+from simulation.simulation_scheduler import QueueStatus, SimulationScheduler
 from simulation.simulation_stage_status import SimulationStageStatus
 
+ENSEMBLES_DIR_NAME = "ensembles"  # next to hydrus and modflow directories of the project
+CANCELLED_BY_USER = "Cancelled by user"
+
 
 class SimulationService:
-    def __init__(self, hydrus_dir: str, modflow_dir: str):
+    def __init__(self, hydrus_dir: str, modflow_dir: str, registry: Optional[SimulationRegistry] = None,
+                 scheduler: Optional[SimulationScheduler] = None):
+        """
+        @param hydrus_dir: Directory containing Hydrus projects of the project
+        @param modflow_dir: Directory containing Modflow project of the project
+        @param registry: Registry of simulations, the one stored in the workspace if None
+        @param scheduler: Scheduler running submitted simulations, the process-wide one if None
+        """
         self.hydrus_dir = hydrus_dir
         self.modflow_dir = modflow_dir
         self.deployer = deployment_config.DEPLOYER
-        self.simulations: List[Simulation] = []
+        self.registry = registry if registry is not None else simulation_registry.get_registry()
+        self.scheduler = scheduler if scheduler is not None else simulation_scheduler.get_scheduler()
+        self.simulations: Dict[int, Simulation] = {}  # simulations prepared by this service
+        self.ensembles: Dict[int, Ensemble] = {}  # ensembles submitted by this service
 
-    def prepare_simulation(self) -> Simulation:
-        sim_id = len(self.simulations)
-        simulation = Simulation(simulation_id=sim_id, deployer=self.deployer)
-        self.simulations.append(simulation)
+    def prepare_simulation(self, project_name: str) -> Simulation:
+        """
+        @param project_name: Name of the simulated project
+        @return: New simulation with unique ID (registered in the registry)
+        """
+        sim_id = self.registry.create_simulation(project_name)
+        simulation = Simulation(simulation_id=sim_id, deployer=self.deployer, registry=self.registry)
+        self.simulations[sim_id] = simulation
         return simulation
 
     def run_simulation(self, simulation_id: int) -> None:
         self.simulations[simulation_id].run_simulation(self.modflow_dir, self.hydrus_dir)
 
-    def check_simulation_status(self, simulation_id: int) -> Tuple[SimulationStageStatus,
-                                                                   SimulationStageStatus,
-                                                                   SimulationStageStatus]:
+    def submit_simulation(self, simulation_id: int, user: str, priority: int = 0) -> QueueStatus:
+        """
+        Queue the simulation - it's run by the scheduler when its user's limit and the slot budget allow.
+        @param simulation_id: Id of the prepared simulation
+        @param user: User who runs the simulation
+        @param priority: Lower priority runs first
+        @return: Status of the simulation in the queue
+        @raise SimulationQueueFullException: if the queue is full
+        """
+        hydrus_models_count = len(self.simulations[simulation_id].loaded_shapes or [])
+        return self.scheduler.submit(simulation_id, user, lambda: self.run_simulation(simulation_id), priority,
+                                     slots=hydrus_models_count)
+
+    def submit_ensemble(self, project_name: str, modflow_project: str, masks: Dict[str, np.ndarray], spin_up: int,
+                        scenarios: List[Scenario], user: str, priority: int = 0,
+                        inputs_dir: Optional[str] = None) -> Tuple[int, QueueStatus]:
+        """
+        Queue the ensemble of scenarios - it's run by the scheduler as one simulation.
+        @param project_name: Name of the simulated project
+        @param modflow_project: Name of Modflow project
+        @param masks: Hydrus model name -> its mask (shapes of the project)
+        @param spin_up: Hydrus spin up period of the project (in days)
+        @param scenarios: Scenarios of the ensemble
+        @param user: User who runs the ensemble
+        @param priority: Lower priority runs first
+        @param inputs_dir: Directory with input files of the scenarios (ex. weather), removed when the ensemble finishes
+        @return: ID of the ensemble and its status in the queue
+        @raise ValueError: if a scenario is invalid (ex. its name, hydrus model or weather)
+        @raise SimulationQueueFullException: if the queue is full
+        """
+        validate_scenarios(scenarios, self.hydrus_dir, masks)
+        ensemble_id = self.registry.create_simulation(project_name)
+        ensemble_dir = os.path.join(os.path.dirname(self.modflow_dir), ENSEMBLES_DIR_NAME, str(ensemble_id))
+        ensemble = Ensemble(ensemble_id, ensemble_dir, self.hydrus_dir, self.modflow_dir, modflow_project, masks,
+                            spin_up, scenarios, self.deployer, self.registry,
+                            workers=deployment_config.ENSEMBLE_SCENARIO_WORKERS, inputs_dir=inputs_dir)
+        self.ensembles[ensemble_id] = ensemble
+
+        # hydrus models of all scenarios and a few Modflow models run at once
+        slots = len(masks) * len(scenarios)
+        try:
+            return ensemble_id, self.scheduler.submit(ensemble_id, user, ensemble.run, priority, slots=slots)
+        except SimulationQueueFullException as err:
+            ensemble.record_failure(str(err))
+            raise
+
+    def cancel_simulation(self, simulation_id: int, user: str) -> bool:
+        """
+        Cancel the simulation (or ensemble) - a queued one is removed from the queue, a running one is stopped
+        (its processes, containers or jobs) and its capacity in the scheduler is freed at once.
+        @param simulation_id: ID of the simulation submitted in this process
+        @param user: User cancelling the simulation - only the user who submitted it can cancel it
+        @return: False if the simulation isn't queued nor running
+        @raise SimulationAccessDeniedException: if the simulation was submitted by another user
+        """
+        submitting_user = self.scheduler.get_user(simulation_id)
+        if submitting_user is None:
+            return False
+        if submitting_user != user:
+            raise SimulationAccessDeniedException("The simulation was submitted by another user")
+        cancellation.cancel(simulation_id, CANCELLED_BY_USER)
+        previous_state = self.scheduler.cancel(simulation_id)
+        if previous_state == simulation_scheduler.QUEUED:
+            # the simulation won't run - nothing else records the cancellation
+            if simulation_id in self.ensembles:
+                self.ensembles[simulation_id].record_cancellation()
+                self.ensembles[simulation_id].remove_inputs()
+            else:
+                simulation = self.simulations.get(simulation_id)
+                if simulation is None:  # submitted by another service - its stages are recorded in the same registry
+                    simulation = Simulation(simulation_id, self.deployer, self.registry)
+                simulation.record_cancellation()
+            cancellation.release(simulation_id)
+        return previous_state in [simulation_scheduler.QUEUED, simulation_scheduler.RUNNING]
+
+    def get_ensemble_result(self, ensemble_id: int) -> Optional[EnsembleResult]:
+        """
+        @param ensemble_id: ID of the ensemble submitted by this service
+        @return: Heads of all scenarios, None if the ensemble didn't finish (or isn't known)
+        """
+        ensemble = self.ensembles.get(ensemble_id)
+        return ensemble.result if ensemble is not None else None
+
+    def get_queue_status(self, simulation_id: int) -> Optional[QueueStatus]:
+        """
+        @param simulation_id: Id of the simulation to check
+        @return: Status of the simulation in the queue, None if it wasn't submitted in this process
+        """
+        return self.scheduler.get_status(simulation_id)
+
+    def check_simulation_status(self, simulation_id: int) -> Optional[Tuple[SimulationStageStatus,
+                                                                            SimulationStageStatus,
+                                                                            SimulationStageStatus]]:
         """
-        Return status of each step in particular simulation.
+        Return status of each step in particular simulation - read from the registry, so simulations run by other
+        services (and processes) are visible too.
         @param simulation_id: Id of the simulation to check
-        @return: Status of hydrus stage, passing stage and modflow stage (in this exact order)
+        @return: Status of hydrus stage, passing stage and modflow stage (in this exact order),
+            None if there is no such simulation
         """
+        stage_statuses = self.registry.get_stage_statuses(simulation_id)
+        if stage_statuses is None:
+            return None
 
-        hydrus_stage_status = self.simulations[simulation_id].get_hydrus_stage_status()
-        passing_stage_status = self.simulations[simulation_id].get_passing_stage_status()
-        modflow_stage_status = self.simulations[simulation_id].get_modflow_stage_status()
+        hydrus_stage_status = stage_statuses[HYDRUS_STAGE]
+        passing_stage_status = stage_statuses[PASSING_STAGE]
+        modflow_stage_status = stage_statuses[MODFLOW_STAGE]
 
-        if hydrus_stage_status.has_ended() and passing_stage_status.has_ended() and modflow_stage_status.has_ended():
+        if simulation_id in self.simulations and hydrus_stage_status.has_ended() \
+                and passing_stage_status.has_ended() and modflow_stage_status.has_ended():
             self.simulations[simulation_id].finished = True
 
         return hydrus_stage_status, passing_stage_status, modflow_stage_status
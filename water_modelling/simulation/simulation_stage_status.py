@@ -1,13 +1,32 @@
-from typing import List
+from __future__ import annotations
 
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+from simulation import simulation_events
 from simulation.simulation_error import SimulationError
+from simulation.simulation_events import SimulationEventBus
+
+if TYPE_CHECKING:
+    from simulation.simulation_registry import SimulationRegistry
 
 
 class SimulationStageStatus:
 
-    def __init__(self):
+    def __init__(self, registry: Optional[SimulationRegistry] = None, simulation_id: Optional[int] = None,
+                 stage: Optional[str] = None, event_bus: Optional[SimulationEventBus] = None):
+        """
+        @param registry: Registry the status is written to (as it changes), not persisted if None
+        @param simulation_id: ID of the simulation in the registry
+        @param stage: Name of the stage in the registry
+        @param event_bus: Bus the changes of the status are published to, not published if None
+        """
         self._ended = False
         self._errors: List[SimulationError] = []
+        self._timings: Dict[str, float] = {}  # duration (in seconds) of parts of the stage
+        self._registry = registry
+        self._simulation_id = simulation_id
+        self._stage = stage
+        self._event_bus = event_bus
 
     def get_errors(self) -> List[SimulationError]:
         return self._errors
@@ -15,10 +34,32 @@ class SimulationStageStatus:
     def has_ended(self) -> bool:
         return self._ended
 
+    def set_started(self):
+        if self._registry is not None:
+            self._registry.set_stage_started(self._simulation_id, self._stage)
+        if self._event_bus is not None:
+            self._event_bus.publish(self._simulation_id, simulation_events.STAGE_STARTED, stage=self._stage)
+
     def add_error(self, error: SimulationError):
         self._errors.append(error)
+        if self._registry is not None:
+            self._registry.add_error(self._simulation_id, self._stage, error)
+        if self._event_bus is not None:
+            self._event_bus.publish(self._simulation_id, simulation_events.STAGE_ERROR, stage=self._stage,
+                                    model=error.model_name, error=error.error_description)
 
     def set_ended(self, ended: bool):
         self._ended = ended
+        if self._registry is not None:
+            self._registry.set_stage_ended(self._simulation_id, self._stage, ended)
+        if self._event_bus is not None and ended:
+            self._event_bus.publish(self._simulation_id, simulation_events.STAGE_ENDED, stage=self._stage,
+                                    errors=len(self._errors))
 
+    def get_timings(self) -> Dict[str, float]:
+        return self._timings
 
+    def add_timing(self, name: str, seconds: float):
+        self._timings[name] = seconds
+        if self._registry is not None:
+            self._registry.add_timing(self._simulation_id, self._stage, name, seconds)
@@ -0,0 +1,138 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+
+from app_config import deployment_config  # noqa: F401 - imported first like in the application (circular import)
+from deployment.app_deployer_interface import IAppDeployer
+from simulation import cancellation
+from simulation.cancellation import CancellationToken
+from simulation.exceptions import UnsuccessfulSimulationException
+from simulation.simulation import Simulation
+from simulation.simulation_error import SimulationError
+from simulation.test.simulation_cache_test import FakeHydrusDeployer
+from utils import process_utils
+
+MODFLOW_PROJECT = "../../datapassing/test/simple1"
+T_LEVEL_PATH = "../../datapassing/test/hydrus_out/t_level1.out"
+
+
+class CancellationTokenTest(unittest.TestCase):
+
+    def test_cancel_calls_callbacks_once(self):
+        token = CancellationToken()
+        calls = []
+        with token.on_cancel(lambda: calls.append("registered")):
+            self.assertTrue(token.cancel("Cancelled by user"))
+            self.assertFalse(token.cancel("Cancelled again"))
+        with token.on_cancel(lambda: calls.append("after cancellation")):
+            pass
+
+        self.assertEqual(calls, ["registered", "after cancellation"])
+        self.assertEqual(token.reason, "Cancelled by user")
+        self.assertRaises(UnsuccessfulSimulationException, token.raise_if_cancelled)
+
+    def test_callback_is_unregistered(self):
+        token = CancellationToken()
+        calls = []
+        with token.on_cancel(lambda: calls.append("finished")):
+            pass
+        token.cancel("Cancelled by user")
+        self.assertEqual(calls, [])
+
+    def test_timeout(self):
+        token = CancellationToken()
+        with token.timeout(None, "no limit"):
+            pass
+        with token.timeout(10, "not reached"):
+            pass
+        self.assertFalse(token.wait(0.05))
+
+        with token.timeout(0.05, "Hydrus stage timed out"):
+            self.assertTrue(token.wait(10))
+        self.assertEqual(token.reason, "Hydrus stage timed out")
+
+    def test_process_tree_is_killed(self):
+        # a shell running a long child process - like desktop Hydrus and Modflow deployers
+        command = f"\"{sys.executable}\" -c \"import time; time.sleep(60)\""
+        proc = subprocess.Popen(command, shell=True, **process_utils.get_process_group_options())
+        token = CancellationToken()
+        start = time.perf_counter()
+        with token.on_cancel(lambda: process_utils.kill_process_tree(proc)):
+            threading.Timer(0.1, token.cancel, args=["Cancelled by user"]).start()
+            proc.wait(10)
+        self.assertLess(time.perf_counter() - start, 10)
+        self.assertIsNotNone(proc.poll())
+
+
+class SimulationCancellationTest(unittest.TestCase):
+
+    def test_cancellation_is_recorded(self):
+        simulation = Simulation(1, FakeHydrusDeployer())
+        cancellation.cancel(1, "Cancelled by user")
+        self.assertRaises(UnsuccessfulSimulationException, simulation.run_simulation, "modflow", "hydrus")
+
+        stage_statuses = [simulation.get_hydrus_stage_status(), simulation.get_passing_stage_status(),
+                          simulation.get_modflow_stage_status()]
+        self.assertTrue(all(stage_status.has_ended() for stage_status in stage_statuses))
+        self.assertEqual([str(error) for error in stage_statuses[0].get_errors()],
+                         [str(SimulationError("simulation", "Simulation was cancelled: Cancelled by user"))])
+        self.assertFalse(cancellation.get_token(1).is_cancelled())  # the token was released
+
+    def test_pipelined_passing_is_cancelled(self):
+        with tempfile.TemporaryDirectory() as workspace:
+            hydrus_dir = os.path.join(workspace, "hydrus")
+            modflow_dir = os.path.join(workspace, "modflow")
+            model_names = ["model1", "model2"]
+            for model_name in model_names:
+                os.makedirs(os.path.join(hydrus_dir, model_name))
+            shutil.copytree(MODFLOW_PROJECT, os.path.join(modflow_dir, "simple1"))
+            rch_path = os.path.join(modflow_dir, "simple1", "simple1.rch")
+            with open(rch_path) as rch_file:
+                rch_content = rch_file.read()
+
+            simulation = Simulation(2, CancellingHydrusDeployer(cancelled_after=1))
+            simulation.set_simulation_cache(None)
+            simulation.set_pipelined(True)
+            simulation.set_modflow_project("simple1")
+            simulation.set_spin_up(105)
+            simulation.set_loaded_shapes({model_name: SimpleNamespace(shape_mask=np.ones((10, 10)))
+                                          for model_name in model_names})
+            self.assertRaises(UnsuccessfulSimulationException, simulation.run_simulation, modflow_dir, hydrus_dir)
+
+            passing_stage_status = simulation.get_passing_stage_status()
+            self.assertTrue(passing_stage_status.has_ended())
+            self.assertEqual([str(error) for error in simulation.get_hydrus_stage_status().get_errors()],
+                             [str(SimulationError("simulation", "Simulation was cancelled: Cancelled by user"))])
+            self.assertEqual([name for name in passing_stage_status.get_timings() if name in model_names], [])
+            self.assertEqual(passing_stage_status.get_errors(), [])
+            with open(rch_path) as rch_file:
+                self.assertEqual(rch_file.read(), rch_content)
+
+
+class CancellingHydrusDeployer(IAppDeployer):
+
+    def __init__(self, cancelled_after: int):
+        self.cancelled_after = cancelled_after
+
+    def run_hydrus(self, hydrus_dir, hydrus_projects, sim_id, on_model_finished=None, on_model_started=None):
+        # like desktop deployer - models which finished before the cancellation are passed
+        for model_name in hydrus_projects[:self.cancelled_after]:
+            shutil.copy(T_LEVEL_PATH, os.path.join(hydrus_dir, model_name, "T_Level.out"))
+            on_model_finished(model_name, None)
+        cancellation.cancel(sim_id, "Cancelled by user")
+        cancellation.get_token(sim_id).raise_if_cancelled()
+
+    def get_engine_versions(self):
+        return {"hydrus": "h1", "modflow": "m1"}
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,187 @@
+import json
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+from app_config import deployment_config  # noqa: F401 - imported first like in the application (circular import)
+from deployment.app_deployer_interface import IAppDeployer
+from modflow import modflow_utils
+from modflow.modflow_desktop_deployer import ModflowDesktopDeployer
+from simulation import ensemble
+from simulation.ensemble import Ensemble, Scenario
+from simulation.simulation_error import SimulationError
+from simulation.simulation_registry import SimulationRegistry
+
+MODFLOW_PROJECT = "../../datapassing/test/simple1"
+T_LEVEL_PATH = "../../datapassing/test/hydrus_out/t_level1.out"
+
+# Stands in for Modflow - heads of the model (simple1.fhd) are already in its directory
+FAKE_MODFLOW = """#!{python}
+import sys
+sys.stdin.readline()
+print("Normal termination of simulation")
+"""
+
+
+class FakeDeployer(IAppDeployer):
+
+    def __init__(self, failing_modflow_dirs=()):
+        self.simulated_models = []
+        self.failing_modflow_dirs = failing_modflow_dirs
+
+    def run_hydrus(self, hydrus_dir, hydrus_projects, sim_id, on_model_finished=None, on_model_started=None):
+        for model_name in hydrus_projects:
+            shutil.copy(T_LEVEL_PATH, os.path.join(hydrus_dir, model_name, "T_Level.out"))
+            self.simulated_models.append(model_name)
+            if on_model_finished:
+                on_model_finished(model_name, None)
+        return []
+
+    def run_modflow(self, modflow_dir, nam_file, sim_id):
+        # heads of the model (simple1.fhd) are already in its directory - scenarios/<name>/modflow/<model>
+        if os.path.normpath(modflow_dir).split(os.sep)[-3] in self.failing_modflow_dirs:
+            return SimulationError("modflow", "Modflow failed")
+        return None
+
+    def get_engine_versions(self):
+        return {"hydrus": "h1", "modflow": "m1"}
+
+
+class DesktopModflowDeployer(FakeDeployer):
+
+    def __init__(self, modflow_exe):
+        super().__init__()
+        self.modflow_exe = modflow_exe
+
+    def run_modflow(self, modflow_dir, nam_file, sim_id):
+        modflow_deployer = ModflowDesktopDeployer(self.modflow_exe, modflow_dir, nam_file)
+        modflow_deployer.run()
+        return modflow_deployer.wait_for_termination()
+
+
+class EnsembleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workspace = tempfile.mkdtemp()
+        self.hydrus_dir = os.path.join(self.workspace, "hydrus")
+        self.modflow_dir = os.path.join(self.workspace, "modflow")
+        for model_name in ["model1", "model2"]:
+            os.makedirs(os.path.join(self.hydrus_dir, model_name))
+            with open(os.path.join(self.hydrus_dir, model_name, "SELECTOR.IN"), "w") as selector_file:
+                selector_file.write("selector")
+        shutil.copytree(MODFLOW_PROJECT, os.path.join(self.modflow_dir, "simple1"))
+
+        model = modflow_utils.load_model(MODFLOW_PROJECT, "simple1.nam", load_only=["dis"])
+        left_half = np.zeros((model.nrow, model.ncol))
+        left_half[:, :model.ncol // 2] = 1
+        self.masks = {"model1": left_half, "model2": 1 - left_half}
+
+    def tearDown(self):
+        shutil.rmtree(self.workspace)
+
+    def _create_ensemble(self, scenarios, deployer, registry=None) -> Ensemble:
+        ensemble_id = registry.create_simulation("project") if registry is not None else 1
+        ensemble = Ensemble(ensemble_id, os.path.join(self.workspace, "ensemble"), self.hydrus_dir, self.modflow_dir,
+                            "simple1", self.masks, 105, scenarios, deployer, registry, workers=2)
+        ensemble.simulation.set_simulation_cache(None)
+        return ensemble
+
+    def test_identical_hydrus_models_run_once(self):
+        deployer = FakeDeployer()
+        scenarios = [Scenario("base"),
+                     Scenario("same", spin_up=0),
+                     Scenario("edited", hydrus_files={"model1": {"SELECTOR.IN": "edited selector"}})]
+        result = self._create_ensemble(scenarios, deployer).run()
+
+        # model2 of all scenarios and model1 of the first two are the same model
+        self.assertEqual(len(deployer.simulated_models), 2)
+        self.assertEqual(result.scenario_names, ["base", "same", "edited"])
+        self.assertEqual(result.errors, {})
+        self.assertEqual(result.heads.shape[0], 3)
+        self.assertTrue(os.path.isfile(result.heads_path))
+        np.testing.assert_array_equal(np.load(result.heads_path), result.heads)
+
+        # every scenario has its own recharge
+        base_rch, same_rch = [
+            modflow_utils.load_model(os.path.join(self.workspace, "ensemble", "scenarios", name, "modflow", "simple1"),
+                                     "simple1.nam", load_only=["rch"]).rch.rech.array for name in ["base", "same"]]
+        self.assertFalse(np.allclose(base_rch, same_rch))
+
+    def test_failed_scenario_has_no_heads(self):
+        result = self._create_ensemble([Scenario("ok"), Scenario("failing")],
+                                       FakeDeployer(failing_modflow_dirs=["failing"])).run()
+
+        self.assertEqual(list(result.errors), ["failing"])
+        self.assertFalse(np.isnan(result.heads[0]).any())
+        self.assertTrue(np.isnan(result.heads[1]).all())
+
+    @unittest.skipIf(sys.platform == "win32", "fake Modflow executable is a script")
+    def test_desktop_modflow(self):
+        modflow_exe = os.path.join(self.workspace, "modflow_exe")
+        with open(modflow_exe, "w") as exe_file:
+            exe_file.write(FAKE_MODFLOW.format(python=sys.executable))
+        os.chmod(modflow_exe, os.stat(modflow_exe).st_mode | stat.S_IEXEC)
+
+        result = self._create_ensemble([Scenario("a"), Scenario("b")], DesktopModflowDeployer(modflow_exe)).run()
+        self.assertEqual(result.errors, {})
+        self.assertFalse(np.isnan(result.heads).any())
+        self.assertTrue(os.path.isfile(os.path.join(self.workspace, "ensemble", "scenarios", "a", "modflow",
+                                                    "simple1", ModflowDesktopDeployer.LOG_FILE)))
+
+    def test_invalid_scenario_names(self):
+        for scenarios in [[], [Scenario("a"), Scenario("a")], [Scenario("../a")]]:
+            with self.assertRaises(ValueError):
+                self._create_ensemble(scenarios, FakeDeployer())
+
+    def test_invalid_scenarios(self):
+        weather_path = os.path.join(self.workspace, "weather.csv")
+        with open(weather_path, "w") as weather_file:
+            weather_file.write("Date,Precipitation\n2000-01-01,not a number\n")
+        for scenario in [Scenario("a", hydrus_files={"model3": {"SELECTOR.IN": ""}}),
+                         Scenario("a", hydrus_files={"model1": {"../SELECTOR.IN": ""}}),
+                         Scenario("a", weather_files={"model1": os.path.join(self.workspace, "missing.csv")}),
+                         Scenario("a", weather_files={"model1": weather_path}),
+                         Scenario("a", masks={"model3": self.masks["model1"]})]:
+            with self.assertRaises(ValueError):
+                ensemble.validate_scenarios([scenario], self.hydrus_dir, self.masks)
+        ensemble.validate_scenarios([Scenario("a", masks={"model1": self.masks["model1"]})], self.hydrus_dir,
+                                    self.masks)
+
+    def test_failed_ensemble_ends_stages(self):
+        inputs_dir = os.path.join(self.workspace, "inputs")
+        os.makedirs(inputs_dir)
+        registry = SimulationRegistry(os.path.join(self.workspace, "registry.sqlite"))
+        failing_ensemble = self._create_ensemble(
+            [Scenario("a", weather_files={"model1": os.path.join(inputs_dir, "missing.csv")})], FakeDeployer(),
+            registry)
+        failing_ensemble.inputs_dir = inputs_dir
+
+        with self.assertRaises(LookupError):  # SELECTOR.IN of test models has no length unit
+            failing_ensemble.run()
+        record = registry.get_simulation(failing_ensemble.ensemble_id)
+        self.assertTrue(all(stage_record.ended is not None for stage_record in record.stages.values()))
+        self.assertFalse(os.path.isdir(inputs_dir))
+        with open(record.artifacts[ensemble.SCENARIOS_ARTIFACT]) as handle:
+            self.assertIn("Ensemble failed", json.load(handle)["errors"]["a"])
+
+    def test_ensemble_without_heads_saves_scenarios(self):
+        registry = SimulationRegistry(os.path.join(self.workspace, "registry.sqlite"))
+        failing_ensemble = self._create_ensemble([Scenario("failing")], FakeDeployer(failing_modflow_dirs=["failing"]),
+                                                 registry)
+        result = failing_ensemble.run()
+
+        self.assertIsNone(result.heads)
+        record = registry.get_simulation(failing_ensemble.ensemble_id)
+        self.assertTrue(all(stage_record.ended is not None for stage_record in record.stages.values()))
+        self.assertNotIn(ensemble.HEADS_ARTIFACT, record.artifacts)
+        with open(record.artifacts[ensemble.SCENARIOS_ARTIFACT]) as handle:
+            self.assertEqual(json.load(handle), {"scenarios": ["failing"], "errors": {"failing": "Modflow failed"}})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,217 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+import numpy as np
+
+from deployment.app_deployer_interface import IAppDeployer
+from simulation import simulation_cache
+from simulation.simulation import Simulation
+from simulation.simulation_cache import SimulationCache
+
+
+class SimulationCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workspace = tempfile.mkdtemp()
+        self.hydrus_dir = os.path.join(self.workspace, "hydrus")
+        self.modflow_dir = os.path.join(self.workspace, "modflow")
+        os.makedirs(os.path.join(self.hydrus_dir, "model1"))
+        os.makedirs(self.modflow_dir)
+        self._write(os.path.join(self.hydrus_dir, "model1", "SELECTOR.IN"), "selector")
+        self._write(os.path.join(self.hydrus_dir, "model1", "T_Level.out"), "output")
+        self._write(os.path.join(self.modflow_dir, "model.nam"), "nam")
+        self._write(os.path.join(self.modflow_dir, "model.rch"), "rch")
+        self.cache = SimulationCache(os.path.join(self.workspace, simulation_cache.CACHE_DIR_NAME), max_bytes=1024)
+
+    def tearDown(self):
+        shutil.rmtree(self.workspace)
+
+    @staticmethod
+    def _write(path: str, content: str):
+        with open(path, "w") as file:
+            file.write(content)
+
+    @staticmethod
+    def _read(path: str) -> str:
+        with open(path) as file:
+            return file.read()
+
+    def _get_key(self, mask=np.ones((2, 2)), spin_up=0, engine_versions=None):
+        return simulation_cache.get_simulation_key(self.hydrus_dir, ["model1"], [mask], self.modflow_dir,
+                                                   ["model.nam", "model.rch"], spin_up,
+                                                   engine_versions or {"hydrus": "h1", "modflow": "m1"})
+
+    def test_simulation_key(self):
+        key = self._get_key()
+        self.assertEqual(self._get_key(), key)
+
+        # Hydrus outputs aren't inputs of the simulation
+        self._write(os.path.join(self.hydrus_dir, "model1", "T_Level.out"), "other output")
+        self.assertEqual(self._get_key(), key)
+
+        self.assertNotEqual(self._get_key(mask=np.zeros((2, 2))), key)
+        self.assertNotEqual(self._get_key(spin_up=10), key)
+        self.assertNotEqual(self._get_key(engine_versions={"hydrus": "h2", "modflow": "m1"}), key)
+        self._write(os.path.join(self.hydrus_dir, "model1", "SELECTOR.IN"), "other selector")
+        self.assertNotEqual(self._get_key(), key)
+        self._write(os.path.join(self.hydrus_dir, "model1", "SELECTOR.IN"), "selector")
+        self._write(os.path.join(self.modflow_dir, "model.rch"), "other rch")
+        self.assertNotEqual(self._get_key(), key)
+
+    def test_store_and_restore(self):
+        results_path = os.path.join(self.workspace, "results.json")
+        rch_path = os.path.join(self.modflow_dir, "model.rch")
+        self._write(results_path, "[1, 2]")
+        destinations = {"results": results_path, "rch": rch_path}
+        self.assertFalse(self.cache.restore("key", destinations.get))
+
+        self.cache.store("key", destinations)
+        self.cache.store("alias", destinations)
+        self.assertEqual(self.cache.get_stats()["bytes"], len("[1, 2]") + len("rch"))  # files are stored once
+
+        self._write(results_path, "[]")
+        self._write(rch_path, "written rch")
+        self.assertTrue(self.cache.restore("key", destinations.get))
+        self.assertEqual(self._read(results_path), "[1, 2]")
+        self.assertEqual(self._read(rch_path), "rch")
+
+        self.assertEqual(self.cache.purge("key"), 1)
+        self.assertEqual([entry.key for entry in self.cache.get_entries()], ["alias"])
+        self.assertEqual(self.cache.purge(), 1)
+        self.assertEqual(self.cache.get_stats(), {"entries": 0, "bytes": 0, "max_bytes": 1024})
+
+    def test_lru_eviction(self):
+        results_path = os.path.join(self.workspace, "results.json")
+        rch_path = os.path.join(self.modflow_dir, "model.rch")
+        for idx in range(3):
+            self._write(results_path, str(idx) * 400)
+            self.cache.store("key" + str(idx), {"results": results_path, "rch": rch_path})
+            time.sleep(0.01)
+            if idx == 1:
+                self.assertTrue(self.cache.restore("key0", lambda name: os.path.join(self.workspace, name)))  # key1 is the oldest now
+                time.sleep(0.01)
+
+        self.assertEqual([entry.key for entry in self.cache.get_entries()], ["key2", "key0"])
+        self.assertLessEqual(self.cache.get_stats()["bytes"], 1024)
+        self.assertFalse(self.cache.restore("key1", lambda name: os.path.join(self.workspace, name)))
+
+    def test_temporary_files_are_skipped(self):
+        results_path = os.path.join(self.workspace, "results.json")
+        self._write(results_path, "[1, 2]")
+        objects_dir = os.path.join(self.workspace, simulation_cache.CACHE_DIR_NAME, simulation_cache.OBJECTS_DIR_NAME)
+        temporary_path = os.path.join(objects_dir, "ab", "copied" + simulation_cache.TEMPORARY_SUFFIX)
+        os.makedirs(os.path.dirname(temporary_path))
+        self._write(temporary_path, "x" * 2000)  # a copy in progress (ex. in another process)
+
+        self.cache.store("key", {"results": results_path})
+        self.assertEqual(self.cache.get_stats()["bytes"], len("[1, 2]"))
+        self.assertTrue(os.path.isfile(temporary_path))
+        self.assertEqual(self.cache.purge(), 1)
+        self.assertFalse(os.path.isfile(temporary_path))  # leftover of an interrupted copy
+
+    @unittest.skipIf(sys.platform == "win32", "cache is locked only by threads on Windows")
+    def test_cache_is_locked_by_other_process(self):
+        self.cache.get_stats()  # creates the lock file
+        lock_path = os.path.join(self.workspace, simulation_cache.CACHE_DIR_NAME, simulation_cache.LOCK_FILE_NAME)
+        script = ("import fcntl, sys, time\n"
+                  "with open(sys.argv[1], 'a') as lock_file:\n"
+                  "    fcntl.flock(lock_file, fcntl.LOCK_EX)\n"
+                  "    print('locked', flush=True)\n"
+                  "    time.sleep(0.5)\n")
+        with subprocess.Popen([sys.executable, "-c", script, lock_path], stdout=subprocess.PIPE, text=True) as proc:
+            self.assertEqual(proc.stdout.readline().strip(), "locked")
+            start = time.perf_counter()
+            self.cache.get_stats()
+            self.assertGreater(time.perf_counter() - start, 0.2)
+
+
+class FakeHydrusDeployer(IAppDeployer):
+
+    def __init__(self):
+        self.simulated_models = []
+
+    def run_hydrus(self, hydrus_dir, hydrus_projects, sim_id, on_model_finished=None, on_model_started=None):
+        for model_name in hydrus_projects:
+            with open(os.path.join(hydrus_dir, model_name, "SELECTOR.IN")) as selector_file:
+                output = "output of " + selector_file.read()
+            with open(os.path.join(hydrus_dir, model_name, "T_Level.out"), "w") as output_file:
+                output_file.write(output)
+            self.simulated_models.append(model_name)
+            if on_model_finished:
+                on_model_finished(model_name, None)
+        return []
+
+    def get_engine_versions(self):
+        return {"hydrus": "h1", "modflow": "m1"}
+
+
+class HydrusModelMemoizationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workspace = tempfile.mkdtemp()
+        self.hydrus_dir = os.path.join(self.workspace, "hydrus")
+        self.model_names = ["model1", "model2", "model3"]
+        for model_name in self.model_names:
+            os.makedirs(os.path.join(self.hydrus_dir, model_name))
+            self._write_selector(model_name, model_name)
+
+        self.deployer = FakeHydrusDeployer()
+        self.cache = SimulationCache(os.path.join(self.workspace, simulation_cache.CACHE_DIR_NAME),
+                                     max_bytes=1024 * 1024)
+
+    def tearDown(self):
+        shutil.rmtree(self.workspace)
+
+    def _write_selector(self, model_name: str, content: str):
+        with open(os.path.join(self.hydrus_dir, model_name, "SELECTOR.IN"), "w") as selector_file:
+            selector_file.write(content)
+
+    def _run_hydrus(self):
+        self.deployer.simulated_models = []
+        simulation = Simulation(0, self.deployer)
+        simulation.set_simulation_cache(self.cache)
+        simulation.set_loaded_shapes({model_name: None for model_name in self.model_names})
+        finished_models = []
+        simulation.run_hydrus(self.hydrus_dir, lambda model_name, error: finished_models.append(model_name))
+        self.assertEqual(sorted(finished_models), self.model_names)
+
+    def test_only_changed_models_are_simulated(self):
+        self._run_hydrus()
+        self.assertEqual(self.deployer.simulated_models, self.model_names)
+
+        self._run_hydrus()
+        self.assertEqual(self.deployer.simulated_models, [])
+
+        # outputs of unchanged models are restored, only the edited model is simulated again
+        self._write_selector("model2", "edited model2")
+        for model_name in self.model_names:
+            os.remove(os.path.join(self.hydrus_dir, model_name, "T_Level.out"))
+        self._run_hydrus()
+        self.assertEqual(self.deployer.simulated_models, ["model2"])
+        for model_name, output in [("model1", "output of model1"), ("model2", "output of edited model2")]:
+            with open(os.path.join(self.hydrus_dir, model_name, "T_Level.out")) as output_file:
+                self.assertEqual(output_file.read(), output)
+
+    def test_stale_outputs_are_removed(self):
+        self._run_hydrus()
+        # outputs of another run (ex. of edited inputs, with an output file the cached run didn't write)
+        model_dir = os.path.join(self.hydrus_dir, "model1")
+        with open(os.path.join(model_dir, "T_Level.out"), "w") as output_file:
+            output_file.write("stale output")
+        with open(os.path.join(model_dir, "Obs_Node.out"), "w") as output_file:
+            output_file.write("stale output")
+
+        self._run_hydrus()
+        self.assertEqual(self.deployer.simulated_models, [])
+        self.assertEqual(simulation_cache.get_hydrus_output_files(model_dir), ["T_Level.out"])
+        with open(os.path.join(model_dir, "T_Level.out")) as output_file:
+            self.assertEqual(output_file.read(), "output of model1")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from simulation import simulation_checkpoint
+from simulation.exceptions import UnsuccessfulSimulationException
+from simulation.simulation import Simulation
+from simulation.simulation_checkpoint import SimulationCheckpoint
+from simulation.simulation_error import SimulationError
+from simulation.simulation_registry import HYDRUS_STAGE, PASSING_STAGE
+from simulation.test.simulation_cache_test import FakeHydrusDeployer
+
+
+class SimulationCheckpointTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workspace = tempfile.mkdtemp()
+        self.output_path = os.path.join(self.workspace, "output")
+        self._write(self.output_path, "output")
+
+    def tearDown(self):
+        shutil.rmtree(self.workspace)
+
+    @staticmethod
+    def _write(path: str, content: str):
+        with open(path, "w") as file:
+            file.write(content)
+
+    def test_validity(self):
+        checkpoint = SimulationCheckpoint(self.workspace)
+        self.assertFalse(checkpoint.is_valid(HYDRUS_STAGE, "inputs"))
+        checkpoint.save(HYDRUS_STAGE, "inputs", [self.output_path])
+
+        self.assertTrue(checkpoint.is_valid(HYDRUS_STAGE, "inputs"))
+        self.assertFalse(checkpoint.is_valid(HYDRUS_STAGE, "other inputs"))
+        self.assertFalse(checkpoint.is_valid(HYDRUS_STAGE, None))
+        self._write(self.output_path, "changed output")
+        self.assertFalse(checkpoint.is_valid(HYDRUS_STAGE, "inputs"))
+        os.remove(self.output_path)
+        self.assertFalse(checkpoint.is_valid(HYDRUS_STAGE, "inputs"))
+
+    def test_persistence_and_invalidation(self):
+        checkpoint = SimulationCheckpoint(self.workspace)
+        checkpoint.save(HYDRUS_STAGE, "hydrus inputs", [self.output_path])
+        checkpoint.save(PASSING_STAGE, "passing inputs", [])
+        checkpoint.invalidate([PASSING_STAGE])
+
+        checkpoint = SimulationCheckpoint(self.workspace)
+        self.assertEqual(checkpoint.get(HYDRUS_STAGE).outputs.keys(), {"output"})
+        self.assertTrue(checkpoint.is_valid(HYDRUS_STAGE, "hydrus inputs"))
+        self.assertIsNone(checkpoint.get(PASSING_STAGE))
+
+    def test_invalid_file(self):
+        self._write(os.path.join(self.workspace, simulation_checkpoint.CHECKPOINT_FILE_NAME), "not json")
+        self.assertIsNone(SimulationCheckpoint(self.workspace).get(HYDRUS_STAGE))
+
+
+class FailingHydrusDeployer(FakeHydrusDeployer):
+
+    def __init__(self, failing_models):
+        super().__init__()
+        self.failing_models = failing_models
+
+    def run_hydrus(self, hydrus_dir, hydrus_projects, sim_id, on_model_finished=None, on_model_started=None):
+        errors = []
+        for model_name in hydrus_projects:
+            if model_name in self.failing_models:
+                self.simulated_models.append(model_name)
+                errors.append(SimulationError(model_name, "Hydrus failed"))
+                if on_model_finished:
+                    on_model_finished(model_name, errors[-1])
+            else:
+                super().run_hydrus(hydrus_dir, [model_name], sim_id, on_model_finished)
+        return errors
+
+
+class HydrusResumeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workspace = tempfile.mkdtemp()
+        self.hydrus_dir = os.path.join(self.workspace, "hydrus")
+        self.model_names = ["model1", "model2", "model3"]
+        for model_name in self.model_names:
+            os.makedirs(os.path.join(self.hydrus_dir, model_name))
+            with open(os.path.join(self.hydrus_dir, model_name, "SELECTOR.IN"), "w") as selector_file:
+                selector_file.write(model_name)
+
+    def tearDown(self):
+        shutil.rmtree(self.workspace)
+
+    def _run_hydrus(self, deployer: FakeHydrusDeployer, resume: bool) -> Simulation:
+        simulation = Simulation(1, deployer)
+        simulation.set_simulation_cache(None)
+        simulation.checkpoint = SimulationCheckpoint(self.workspace)
+        simulation.set_loaded_shapes({model_name: None for model_name in self.model_names})
+        simulation.set_resume(resume)
+        simulation.run_hydrus(self.hydrus_dir)
+        return simulation
+
+    def test_only_failed_models_rerun(self):
+        self.assertRaises(UnsuccessfulSimulationException, self._run_hydrus, FailingHydrusDeployer(["model2"]), False)
+
+        deployer = FakeHydrusDeployer()
+        simulation = self._run_hydrus(deployer, resume=True)
+        self.assertEqual(deployer.simulated_models, ["model2"])
+        self.assertIsNotNone(simulation.checkpoint.get(HYDRUS_STAGE))
+
+        # without resume all models run again
+        deployer = FakeHydrusDeployer()
+        self._run_hydrus(deployer, resume=False)
+        self.assertEqual(deployer.simulated_models, self.model_names)
+
+    def test_changed_output_reruns_model(self):
+        self._run_hydrus(FakeHydrusDeployer(), resume=False)
+        with open(os.path.join(self.hydrus_dir, "model3", "T_Level.out"), "w") as output_file:
+            output_file.write("truncated")
+
+        deployer = FakeHydrusDeployer()
+        self._run_hydrus(deployer, resume=True)
+        self.assertEqual(deployer.simulated_models, ["model3"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from simulation import simulation_events
+from simulation.simulation import Simulation
+from simulation.simulation_events import SimulationEventBus
+from simulation.simulation_registry import HYDRUS_STAGE
+from simulation.test.simulation_cache_test import FakeHydrusDeployer
+
+MODEL_DURATION = 0.2  # seconds
+
+
+class FailingHydrusDeployer(FakeHydrusDeployer):
+
+    def run_hydrus(self, hydrus_dir, hydrus_projects, sim_id, on_model_finished=None, on_model_started=None):
+        raise RuntimeError("Hydrus crashed")
+
+
+class SequentialHydrusDeployer(FakeHydrusDeployer):
+
+    def run_hydrus(self, hydrus_dir, hydrus_projects, sim_id, on_model_finished=None, on_model_started=None):
+        # one model at a time - every model waits for the previous one before it's deployed
+        for model_name in hydrus_projects:
+            on_model_started(model_name)
+            time.sleep(MODEL_DURATION)
+            on_model_finished(model_name, None)
+        return []
+
+
+class SimulationEventBusTest(unittest.TestCase):
+
+    def test_resume_after_sequence(self):
+        event_bus = SimulationEventBus(history_size=10, max_simulations=10)
+        for stage in ["hydrus", "passing", "modflow"]:
+            event_bus.publish(1, simulation_events.STAGE_STARTED, stage=stage)
+        event_bus.publish(2, simulation_events.STAGE_STARTED, stage="hydrus")
+
+        self.assertEqual([event.sequence for event in event_bus.get_events(1)], [1, 2, 3])
+        self.assertEqual([event.data["stage"] for event in event_bus.get_events(1, after_sequence=1)],
+                         ["passing", "modflow"])
+        self.assertEqual(event_bus.get_events(1, after_sequence=3), [])
+        self.assertEqual(len(event_bus.get_events(2)), 1)
+        self.assertEqual(event_bus.get_events(3), [])
+
+    def test_history_is_bounded(self):
+        event_bus = SimulationEventBus(history_size=2, max_simulations=2)
+        for simulation_id in [1, 2, 3]:
+            for _ in range(3):
+                event_bus.publish(simulation_id, simulation_events.STAGE_STARTED)
+
+        self.assertEqual(event_bus.get_events(1), [])  # the oldest simulation is dropped
+        self.assertEqual([event.sequence for event in event_bus.get_events(3)], [2, 3])
+
+    def test_wait_for_events(self):
+        event_bus = SimulationEventBus(history_size=10, max_simulations=10)
+        self.assertEqual(event_bus.wait_for_events(1, timeout=0.01), [])
+
+        publisher = threading.Timer(0.05, lambda: event_bus.publish(1, simulation_events.SIMULATION_FINISHED))
+        publisher.start()
+        events = event_bus.wait_for_events(1, timeout=5)
+        publisher.join()
+        self.assertEqual([event.kind for event in events], [simulation_events.SIMULATION_FINISHED])
+
+
+class SimulationPublishingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workspace = tempfile.mkdtemp()
+        for model_name in ["model1", "model2"]:
+            os.makedirs(os.path.join(self.workspace, model_name))
+            with open(os.path.join(self.workspace, model_name, "SELECTOR.IN"), "w") as selector_file:
+                selector_file.write(model_name)
+
+    def tearDown(self):
+        shutil.rmtree(self.workspace)
+
+    def test_hydrus_stage_events(self):
+        simulation = Simulation(1, FakeHydrusDeployer(), event_bus=SimulationEventBus(history_size=100,
+                                                                                      max_simulations=10))
+        simulation.set_simulation_cache(None)
+        simulation.set_loaded_shapes({"model1": None, "model2": None})
+        simulation.run_hydrus(self.workspace)
+
+        events = simulation.event_bus.get_events(1)
+        self.assertEqual([(event.kind, event.data.get("model")) for event in events],
+                         [(simulation_events.STAGE_STARTED, None),
+                          (simulation_events.MODEL_FINISHED, "model1"),
+                          (simulation_events.MODEL_FINISHED, "model2"),
+                          (simulation_events.STAGE_ENDED, None)])
+        self.assertTrue(all(event.data["stage"] == HYDRUS_STAGE for event in events))
+
+    def test_hydrus_model_timings(self):
+        simulation = Simulation(1, SequentialHydrusDeployer(), event_bus=SimulationEventBus(history_size=100,
+                                                                                            max_simulations=10))
+        simulation.set_simulation_cache(None)
+        simulation.set_loaded_shapes({"model1": None, "model2": None})
+        simulation.run_hydrus(self.workspace)
+
+        # models are timed from their deployment, not from the start of the stage
+        timings = simulation.get_hydrus_stage_status().get_timings()
+        self.assertGreaterEqual(timings["wall_time"], 2 * MODEL_DURATION)
+        for model_name in ["model1", "model2"]:
+            self.assertGreaterEqual(timings[model_name], MODEL_DURATION)
+            self.assertLess(timings[model_name], 1.5 * MODEL_DURATION)
+
+    def test_failed_simulation_events(self):
+        simulation = Simulation(1, FailingHydrusDeployer(), event_bus=SimulationEventBus(history_size=100,
+                                                                                         max_simulations=10))
+        simulation.set_simulation_cache(None)
+        simulation.set_loaded_shapes({"model1": None, "model2": None})
+        simulation.pipelined = False
+        with self.assertRaises(RuntimeError):
+            simulation.run_simulation(self.workspace, self.workspace)
+
+        # stages which didn't end are ended with the error and the end of the simulation is published
+        for stage_status in [simulation.get_hydrus_stage_status(), simulation.get_passing_stage_status(),
+                             simulation.get_modflow_stage_status()]:
+            self.assertTrue(stage_status.has_ended())
+        self.assertIn("Hydrus crashed", simulation.get_hydrus_stage_status().get_errors()[0].error_description)
+        finished_events = [event for event in simulation.event_bus.get_events(1)
+                           if event.kind == simulation_events.SIMULATION_FINISHED]
+        self.assertEqual([event.data["success"] for event in finished_events], [False])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from simulation.simulation import Simulation
+from simulation.simulation_metrics import Measurement, SimulationMetrics
+from simulation.simulation_registry import SimulationRegistry, HYDRUS_STAGE
+from simulation.test.simulation_cache_test import FakeHydrusDeployer
+
+
+class SimulationMetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workspace = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.workspace)
+
+    def test_measure(self):
+        metrics = SimulationMetrics()
+        path = os.path.join(self.workspace, "file")
+        with metrics.measure(1, "passing", "write", "model1"):
+            with open(path, "wb") as file:
+                file.write(b"0" * 4096)
+
+        measurements = metrics.take_measurements(1)
+        self.assertEqual(len(measurements), 1)
+        self.assertEqual((measurements[0].stage, measurements[0].operation, measurements[0].model),
+                         ("passing", "write", "model1"))
+        self.assertGreaterEqual(measurements[0].wall_seconds, 0)
+        if os.path.exists("/proc/thread-self/io"):
+            self.assertGreaterEqual(measurements[0].written_bytes, 4096)
+        self.assertEqual(metrics.take_measurements(1), [])  # measurements are taken once
+
+    def test_prometheus_format(self):
+        metrics = SimulationMetrics()
+        for wall_seconds in [0.5, 2, 4000]:
+            metrics.record(1, Measurement("hydrus", "wait_for_termination", "model1", wall_seconds, 1.0, 10, 20))
+        metrics.record(1, Measurement("queue", "queue_wait", None, 1, None, None, None))
+
+        lines = metrics.to_prometheus().splitlines()
+        labels = 'stage="hydrus",operation="wait_for_termination"'
+        self.assertIn(f"simulation_operations_total{{{labels}}} 3", lines)
+        self.assertIn(f"simulation_operation_cpu_seconds_total{{{labels}}} 3.0", lines)
+        # CPU time and bytes which weren't measured aren't exported
+        self.assertIn('simulation_operations_total{stage="queue",operation="queue_wait"} 1', lines)
+        for name in ["cpu_seconds", "read_bytes", "written_bytes"]:
+            self.assertFalse(any(line.startswith(f'simulation_operation_{name}_total{{stage="queue"') for line in lines))
+        self.assertIn(f"simulation_operation_read_bytes_total{{{labels}}} 30", lines)
+        self.assertIn(f'simulation_operation_duration_seconds_bucket{{{labels},le="1"}} 1', lines)
+        self.assertIn(f'simulation_operation_duration_seconds_bucket{{{labels},le="5"}} 2', lines)
+        self.assertIn(f'simulation_operation_duration_seconds_bucket{{{labels},le="+Inf"}} 3', lines)
+        self.assertIn(f"simulation_operation_duration_seconds_sum{{{labels}}} 4002.5", lines)
+
+    def test_simulation_stores_measurements(self):
+        model_dir = os.path.join(self.workspace, "hydrus", "model1")
+        os.makedirs(model_dir)
+        with open(os.path.join(model_dir, "SELECTOR.IN"), "w") as selector_file:
+            selector_file.write("selector")
+        registry = SimulationRegistry(os.path.join(self.workspace, "registry.sqlite"))
+        simulation_id = registry.create_simulation("project")
+
+        simulation = Simulation(simulation_id, FakeHydrusDeployer(), registry)
+        simulation.metrics = SimulationMetrics()
+        simulation.set_simulation_cache(None)
+        simulation.set_loaded_shapes({"model1": None})
+        simulation.run_hydrus(os.path.join(self.workspace, "hydrus"))
+        simulation.metrics.record(simulation_id, Measurement(HYDRUS_STAGE, "wait_for_termination", "model1", 1.0,
+                                                             None, None, None))
+        simulation.store_measurements()
+
+        measurements = registry.get_simulation(simulation_id).measurements
+        self.assertEqual([(measurement.stage, measurement.operation) for measurement in measurements],
+                         [(HYDRUS_STAGE, "run_hydrus"), (HYDRUS_STAGE, "wait_for_termination")])
+        self.assertIsNotNone(measurements[0].cpu_seconds)
+        self.assertIsNone(measurements[1].cpu_seconds)
+        self.assertIsNone(measurements[1].read_bytes)
+
+
+if __name__ == '__main__':
+    unittest.main()
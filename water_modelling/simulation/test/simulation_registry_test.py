@@ -0,0 +1,61 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from simulation.simulation_error import SimulationError
+from simulation.simulation_registry import SimulationRegistry, HYDRUS_STAGE, PASSING_STAGE, MODFLOW_STAGE
+from simulation.simulation_stage_status import SimulationStageStatus
+
+
+class SimulationRegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workspace = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.workspace, "registry.sqlite")
+
+    def tearDown(self):
+        shutil.rmtree(self.workspace)
+
+    def test_unique_ids(self):
+        first_registry = SimulationRegistry(self.db_path)
+        second_registry = SimulationRegistry(self.db_path)  # ex. another web worker
+        ids = [first_registry.create_simulation("project"), second_registry.create_simulation("project"),
+               first_registry.create_simulation("other project")]
+        self.assertEqual(len(set(ids)), 3)
+
+        # registry survives restarts of the application
+        self.assertEqual([record.simulation_id for record in SimulationRegistry(self.db_path).get_simulations()],
+                         list(reversed(ids)))
+        self.assertEqual(len(second_registry.get_simulations(project="project")), 2)
+
+    def test_stage_statuses(self):
+        registry = SimulationRegistry(self.db_path)
+        simulation_id = registry.create_simulation("project")
+        hydrus_stage_status = SimulationStageStatus(registry, simulation_id, HYDRUS_STAGE)
+        hydrus_stage_status.set_started()
+        hydrus_stage_status.add_timing("model1", 1.5)
+        hydrus_stage_status.add_error(SimulationError("model2", "failed"))
+        hydrus_stage_status.set_ended(True)
+        registry.set_input_fingerprint(simulation_id, "fingerprint")
+        registry.add_artifact(simulation_id, "results", "/results.json")
+
+        stage_statuses = SimulationRegistry(self.db_path).get_stage_statuses(simulation_id)
+        self.assertTrue(stage_statuses[HYDRUS_STAGE].has_ended())
+        self.assertEqual(stage_statuses[HYDRUS_STAGE].get_timings(), {"model1": 1.5})
+        self.assertEqual([str(error) for error in stage_statuses[HYDRUS_STAGE].get_errors()], ["model2: failed"])
+        self.assertFalse(stage_statuses[PASSING_STAGE].has_ended())
+        self.assertFalse(stage_statuses[MODFLOW_STAGE].has_ended())
+
+        record = registry.get_simulation(simulation_id)
+        self.assertEqual(record.input_fingerprint, "fingerprint")
+        self.assertEqual(record.artifacts, {"results": "/results.json"})
+        self.assertIsNotNone(record.stages[HYDRUS_STAGE].started)
+        self.assertIsNone(record.stages[PASSING_STAGE].started)
+
+        self.assertIsNone(registry.get_stage_statuses(simulation_id + 1))
+        self.assertIsNone(registry.get_simulation(simulation_id + 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
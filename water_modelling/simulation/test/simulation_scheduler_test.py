@@ -0,0 +1,155 @@
+import threading
+import unittest
+
+from simulation.exceptions import SimulationQueueFullException
+from simulation.simulation_scheduler import SimulationScheduler, QUEUED, RUNNING, FINISHED
+
+TIMEOUT = 10
+
+
+class SimulationSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.schedulers = []
+        self.started = []
+        self.release_events = {}
+        self.lock = threading.Lock()
+
+    def tearDown(self):
+        for event in self.release_events.values():
+            event.set()
+        for scheduler in self.schedulers:
+            scheduler.shutdown()
+
+    def _create_scheduler(self, workers=2, max_queue_size=10, max_per_user=1, slots=4,
+                          max_finished=1000) -> SimulationScheduler:
+        scheduler = SimulationScheduler(workers, max_queue_size, max_per_user, slots, max_finished)
+        self.schedulers.append(scheduler)
+        return scheduler
+
+    def _submit(self, scheduler: SimulationScheduler, simulation_id: int, user: str, priority=0, slots=1):
+        self.release_events[simulation_id] = threading.Event()
+
+        def run():
+            with self.lock:
+                self.started.append(simulation_id)
+            self.release_events[simulation_id].wait(TIMEOUT)
+
+        return scheduler.submit(simulation_id, user, run, priority, slots)
+
+    def _finish(self, scheduler: SimulationScheduler, simulation_id: int):
+        self.release_events[simulation_id].set()
+        for _ in range(TIMEOUT * 100):
+            if scheduler.get_status(simulation_id).state == FINISHED:
+                return
+            threading.Event().wait(0.01)
+        self.fail(f"Simulation {simulation_id} didn't finish")
+
+    def _wait_for_start(self, count: int):
+        for _ in range(TIMEOUT * 100):
+            with self.lock:
+                if len(self.started) >= count:
+                    return
+            threading.Event().wait(0.01)
+        self.fail(f"{count} simulations didn't start")
+
+    def test_priority_and_queue_position(self):
+        scheduler = self._create_scheduler(workers=1)
+        self._submit(scheduler, 0, "user0")
+        self._wait_for_start(1)
+        self.assertEqual(scheduler.get_status(0).state, RUNNING)
+
+        self._submit(scheduler, 1, "user1")
+        self._submit(scheduler, 2, "user2")
+        self._submit(scheduler, 3, "user3", priority=-1)
+        self.assertEqual([scheduler.get_status(sim_id).position for sim_id in [1, 2, 3]], [2, 3, 1])
+        self.assertEqual(scheduler.get_status(1).state, QUEUED)
+        self.assertIsNone(scheduler.get_status(4))
+
+        for idx, sim_id in enumerate([0, 3, 1]):
+            self._finish(scheduler, sim_id)
+            self._wait_for_start(idx + 2)
+        self.assertEqual(self.started, [0, 3, 1, 2])
+
+    def test_user_limit(self):
+        scheduler = self._create_scheduler(workers=2, max_per_user=1)
+        self._submit(scheduler, 0, "user0")
+        self._submit(scheduler, 1, "user0")
+        self._submit(scheduler, 2, "user1")
+        self._wait_for_start(2)
+        self.assertEqual(sorted(self.started), [0, 2])  # second simulation of user0 waits, user1 isn't blocked
+        self.assertEqual(scheduler.get_status(1).position, 1)
+
+        self._finish(scheduler, 0)
+        self._wait_for_start(3)
+        self.assertEqual(self.started[2], 1)
+
+    def test_slot_budget(self):
+        scheduler = self._create_scheduler(workers=3, max_per_user=3, slots=4)
+        self._submit(scheduler, 0, "user0", slots=3)
+        self._submit(scheduler, 1, "user0", slots=2)
+        self._submit(scheduler, 2, "user0", slots=1)
+        self._wait_for_start(1)
+        # simulation 1 doesn't fit into free slots and holds simulation 2 behind it
+        threading.Event().wait(0.1)
+        self.assertEqual(self.started, [0])
+
+        self._finish(scheduler, 0)
+        self._wait_for_start(3)
+        self.assertEqual(self.started, [0, 1, 2])
+
+    def test_full_queue(self):
+        scheduler = self._create_scheduler(workers=1, max_queue_size=1)
+        self._submit(scheduler, 0, "user0")
+        self._wait_for_start(1)
+        self._submit(scheduler, 1, "user1")
+        self.assertRaises(SimulationQueueFullException, self._submit, scheduler, 2, "user2")
+
+    def test_finished_states_are_bounded(self):
+        scheduler = self._create_scheduler(workers=1, max_finished=2)
+        for simulation_id in range(3):
+            self._submit(scheduler, simulation_id, "user0")
+            self._finish(scheduler, simulation_id)
+
+        self.assertIsNone(scheduler.get_status(0))  # the oldest finished simulation is dropped
+        self.assertEqual(scheduler.get_status(1).state, FINISHED)
+        self.assertEqual(scheduler.get_status(2).state, FINISHED)
+
+    def test_cancel_queued(self):
+        scheduler = self._create_scheduler(workers=1)
+        self._submit(scheduler, 0, "user0")
+        self._wait_for_start(1)
+        self._submit(scheduler, 1, "user1")
+        self._submit(scheduler, 2, "user2")
+
+        self.assertEqual((scheduler.get_user(0), scheduler.get_user(1)), ("user0", "user1"))
+        self.assertEqual(scheduler.cancel(1), QUEUED)
+        self.assertIsNone(scheduler.get_user(1))
+        self.assertEqual(scheduler.get_status(1).state, FINISHED)
+        self.assertEqual(scheduler.get_status(2).position, 1)
+        self.assertEqual(scheduler.cancel(1), FINISHED)
+        self.assertIsNone(scheduler.cancel(3))
+
+        self._finish(scheduler, 0)
+        self._wait_for_start(2)
+        self.assertEqual(self.started, [0, 2])
+
+    def test_cancel_running_frees_capacity(self):
+        scheduler = self._create_scheduler(workers=1, slots=1)
+        self._submit(scheduler, 0, "user0")
+        self._wait_for_start(1)
+        self._submit(scheduler, 1, "user1")
+
+        # simulation 0 is still stopping, but simulation 1 doesn't wait for it
+        self.assertEqual(scheduler.cancel(0), RUNNING)
+        self._wait_for_start(2)
+        self.assertEqual(scheduler.get_status(0).state, RUNNING)
+
+        self._finish(scheduler, 0)
+        self._finish(scheduler, 1)
+        self._submit(scheduler, 2, "user2")
+        self._wait_for_start(3)
+        self.assertEqual(self.started, [0, 1, 2])
+
+if __name__ == '__main__':
+    unittest.main()
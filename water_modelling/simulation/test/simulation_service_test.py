@@ -0,0 +1,51 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from app_config import deployment_config  # noqa: F401 - imported first like in the application (circular import)
+from simulation.exceptions import SimulationAccessDeniedException
+from simulation.simulation_registry import SimulationRegistry, HYDRUS_STAGE
+from simulation.simulation_scheduler import SimulationScheduler
+from simulation.simulation_service import SimulationService
+
+TIMEOUT = 10
+
+
+class SimulationServiceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workspace = tempfile.mkdtemp()
+        self.scheduler = SimulationScheduler(workers=1, max_queue_size=10, max_per_user=1, slots=4)
+        self.registry = SimulationRegistry(os.path.join(self.workspace, "registry.sqlite"))
+        self.service = SimulationService(os.path.join(self.workspace, "hydrus"),
+                                         os.path.join(self.workspace, "modflow"), self.registry, self.scheduler)
+        self.release = threading.Event()
+
+    def tearDown(self):
+        self.release.set()
+        self.scheduler.shutdown()
+        shutil.rmtree(self.workspace)
+
+    def test_only_submitting_user_cancels(self):
+        # the only worker is busy, so the submitted simulation stays queued
+        started = threading.Event()
+        self.scheduler.submit(0, "other", lambda: started.set() or self.release.wait(TIMEOUT))
+        self.assertTrue(started.wait(TIMEOUT))
+        simulation_id = self.service.prepare_simulation("project").get_id()
+        self.service.submit_simulation(simulation_id, "user")
+
+        with self.assertRaises(SimulationAccessDeniedException):
+            self.service.cancel_simulation(simulation_id, "other")
+        with self.assertRaises(SimulationAccessDeniedException):
+            self.service.cancel_simulation(simulation_id, None)
+        self.assertIsNone(self.registry.get_simulation(simulation_id).stages[HYDRUS_STAGE].ended)
+
+        self.assertTrue(self.service.cancel_simulation(simulation_id, "user"))
+        self.assertIsNotNone(self.registry.get_simulation(simulation_id).stages[HYDRUS_STAGE].ended)
+        self.assertFalse(self.service.cancel_simulation(simulation_id, "user"))
+
+
+if __name__ == '__main__':
+    unittest.main()
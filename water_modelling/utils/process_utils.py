@@ -0,0 +1,145 @@
+import os
+import selectors
+import signal
+import subprocess
+import time
+from sys import platform
+from typing import Dict, List, Optional
+
+POLL_INTERVAL = 0.05  # seconds between checks of processes where the system can't notify about their exit
+
+
+def get_process_group_options() -> dict:
+    """
+    Options of subprocess.Popen starting the process in its own process group - so the process started through
+    a shell can be killed together with the shell (see kill_process_tree())
+    @return: Keyword arguments for subprocess.Popen
+    """
+    if platform == "win32":
+        return {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {"start_new_session": True}
+
+
+def kill_process_tree(proc: Optional[subprocess.Popen]) -> None:
+    """
+    Kill the process and all processes it started (if it's still running).
+    @param proc: Process started with get_process_group_options()
+    """
+    if proc is None or proc.poll() is not None:
+        return
+    if platform == "win32":
+        subprocess.run(["taskkill", "/F", "/T", "/PID", str(proc.pid)], capture_output=True)
+    else:
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass  # finished meanwhile
+
+
+def get_physical_cpu_count() -> int:
+    """
+    @return: Amount of physical CPU cores (Linux), amount of logical CPUs where it can't be determined
+    """
+    try:
+        with open("/proc/cpuinfo") as cpuinfo:
+            cores = set()
+            physical_id = core_id = None
+            for line in cpuinfo:
+                key, _, value = line.partition(":")
+                key = key.strip()
+                if key == "physical id":
+                    physical_id = value.strip()
+                elif key == "core id":
+                    core_id = value.strip()
+                elif not key:  # end of one processor's block
+                    if core_id is not None:
+                        cores.add((physical_id, core_id))
+                    physical_id = core_id = None
+            if core_id is not None:
+                cores.add((physical_id, core_id))
+        if cores:
+            return len(cores)
+    except OSError:
+        pass
+    return os.cpu_count() or 1
+
+
+def wait_for_any(procs: List[subprocess.Popen], timeout: Optional[float] = None,
+                 cpu_seconds: Optional[Dict[subprocess.Popen, float]] = None) -> List[subprocess.Popen]:
+    """
+    Wait until at least one of the processes exits - the system notifies about the exit where it can (Linux pidfd,
+    Windows process handles), so no thread waits for every process.
+    @param procs: Running processes
+    @param timeout: Maximal waiting time (in seconds), no limit if None
+    @param cpu_seconds: Filled with CPU time (user and system, including waited children) of every process reaped
+        by the call - processes are reaped with os.wait4 (not on Windows), so their resource usage is known
+    @return: Processes which exited (and were reaped), empty if the timeout passed
+    """
+    finished = [proc for proc in procs if _reap(proc, cpu_seconds)]
+    if finished or not procs:
+        return finished
+
+    try:
+        if hasattr(os, "pidfd_open"):
+            _wait_for_pidfds(procs, timeout)
+        elif platform == "win32" and len(procs) <= 64:
+            import _winapi
+            handles = [int(proc._handle) for proc in procs]  # Popen keeps the process handle privately
+            _winapi.WaitForMultipleObjects(handles, False, _winapi.INFINITE if timeout is None
+                                           else max(0, int(timeout * 1000)))
+        else:
+            _poll(procs, timeout, cpu_seconds)
+    except OSError:  # ex. kernel without pidfd support
+        _poll(procs, timeout, cpu_seconds)
+    return [proc for proc in procs if _reap(proc, cpu_seconds)]
+
+
+def _reap(proc: subprocess.Popen, cpu_seconds: Optional[Dict[subprocess.Popen, float]]) -> bool:
+    """
+    @return: True if the process exited (it's reaped)
+    """
+    if proc.returncode is not None or cpu_seconds is None or not hasattr(os, "wait4"):
+        return proc.poll() is not None
+    if not proc._waitpid_lock.acquire(False):  # Popen reaps the process under its private lock
+        return False  # reaped by another thread meanwhile (ex. by Popen.wait())
+    try:
+        if proc.returncode is not None:
+            return True
+        try:
+            pid, status, rusage = os.wait4(proc.pid, os.WNOHANG)
+        except ChildProcessError:
+            proc.returncode = 0  # reaped elsewhere - like Popen.poll() does
+            return True
+        if pid == 0:
+            return False
+        proc.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+        cpu_seconds[proc] = rusage.ru_utime + rusage.ru_stime
+        return True
+    finally:
+        proc._waitpid_lock.release()
+
+
+def _poll(procs: List[subprocess.Popen], timeout: Optional[float],
+          cpu_seconds: Optional[Dict[subprocess.Popen, float]] = None) -> None:
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while not any(_reap(proc, cpu_seconds) for proc in procs):
+        if deadline is not None and time.monotonic() >= deadline:
+            return
+        time.sleep(POLL_INTERVAL)
+
+
+def _wait_for_pidfds(procs: List[subprocess.Popen], timeout: Optional[float]) -> None:
+    pidfds = []
+    try:
+        with selectors.DefaultSelector() as selector:
+            for proc in procs:
+                try:
+                    pidfd = os.pidfd_open(proc.pid)
+                except ProcessLookupError:
+                    return  # already reaped
+                pidfds.append(pidfd)
+                selector.register(pidfd, selectors.EVENT_READ)
+            selector.select(timeout)
+    finally:
+        for pidfd in pidfds:
+            os.close(pidfd)
@@ -1,11 +1,11 @@
-from typing import List
+from typing import Dict, List, Optional
 
 
 class YamlData:
 
     def __init__(self, job_name: str, container_image: str, container_name: str,
                  mount_path: str, args: List[str], sub_path: str,
-                 hydro_program: str, description: str):
+                 hydro_program: str, description: str, labels: Optional[Dict[str, str]] = None):
 
         self.job_name = job_name
         self.container_image = container_image
@@ -15,3 +15,4 @@ class YamlData:
         self.sub_path = sub_path
         self.hydro_program = hydro_program
         self.description = description
+        self.labels = labels or {}
@@ -56,4 +56,9 @@ class YamlJobGenerator:
             }
         }
 
+        if self.data.labels:
+            # pods are labeled as well, so they can be watched together with the job
+            config['metadata']['labels'] = self.data.labels
+            config['spec']['template']['metadata'] = {'labels': self.data.labels}
+
         return config